@@ -6,7 +6,7 @@ import os
 
 import imswitch
 def main(is_headless:bool=None, default_config:str=None, http_port:int=None, ssl:bool=None, config_folder:str=None,
-         data_folder: str=None):
+         data_folder: str=None, profile_startup: bool=None):
     '''
     To start imswitch in headless using the arguments, you can call the main file with the following arguments:
         python main.py --headless or
@@ -39,11 +39,16 @@ def main(is_headless:bool=None, default_config:str=None, http_port:int=None, ssl
             parser.add_argument('--ext-data-folder', dest='data_folder', type=str, default=None, 
                                 help='point to a folder to store the data. This overrides the ImSwitchConfig, useful for docker volumes')
 
+            # print the time spent importing and initializing each module, controller and manager
+            parser.add_argument('--profile-startup', dest='profile_startup', default=False, action='store_true',
+                                help='print the import and init time of the modules, controllers and managers')
+
             args = parser.parse_args()
             
             imswitch.IS_HEADLESS = args.headless            # if True, no QT will be loaded   
             imswitch.__httpport__ = args.http_port          # e.g. 8001
             imswitch.__ssl__ = args.ssl                     # if True, ssl will be used (e.g. https)
+            imswitch.PROFILE_STARTUP = args.profile_startup # if True, the startup times will be printed
             
             if type(args.config_file)==str and args.config_file.find("json")>=0:  # e.g. example_virtual_microscope.json
                 imswitch.DEFAULT_SETUP_FILE = args.config_file  
@@ -74,11 +79,14 @@ def main(is_headless:bool=None, default_config:str=None, http_port:int=None, ssl
         if data_folder is not None:
             print("We use the user-provided data path: " + data_folder)
             imswitch.DEFAULT_DATA_PATH = data_folder
+        if profile_startup is not None:
+            imswitch.PROFILE_STARTUP = profile_startup
 
         # FIXME: !!!! This is because the headless flag is loaded after commandline input
         from imswitch.imcommon import prepareApp, launchApp
         from imswitch.imcommon.controller import ModuleCommunicationChannel, MultiModuleWindowController
-        from imswitch.imcommon.model import modulesconfigtools, pythontools, initLogger
+        from imswitch.imcommon.model import modulesconfigtools, pythontools, initLogger, startupProfiler
+        startupProfiler.enabled = imswitch.PROFILE_STARTUP
 
         logger = initLogger('main')
         logger.info(f'Starting ImSwitch {imswitch.__version__}')
@@ -109,8 +117,11 @@ def main(is_headless:bool=None, default_config:str=None, http_port:int=None, ssl
                 logger.error('QtWebEngineWidgets not found, disabling imnotebook')
                 enabledModuleIds.remove('imnotebook')
 
-        modulePkgs = [importlib.import_module(pythontools.joinModulePath('imswitch', moduleId))
-                    for moduleId in enabledModuleIds]
+        modulePkgs = []
+        for moduleId in enabledModuleIds:
+            modulePath = pythontools.joinModulePath('imswitch', moduleId)
+            with startupProfiler.measure('import', modulePath):
+                modulePkgs.append(importlib.import_module(modulePath))
 
         moduleCommChannel = ModuleCommunicationChannel()
 
@@ -143,11 +154,12 @@ def main(is_headless:bool=None, default_config:str=None, http_port:int=None, ssl
             moduleName = modulePkg.__title__ if hasattr(modulePkg, '__title__') else moduleId
 
             try:
-                view, controller = modulePkg.getMainViewAndController(
-                    moduleCommChannel=moduleCommChannel,
-                    multiModuleWindowController=multiModuleWindowController,
-                    moduleMainControllers=moduleMainControllers
-                )
+                with startupProfiler.measure('init', moduleId):
+                    view, controller = modulePkg.getMainViewAndController(
+                        moduleCommChannel=moduleCommChannel,
+                        multiModuleWindowController=multiModuleWindowController,
+                        moduleMainControllers=moduleMainControllers
+                    )
                 logger.info(f'initialize module {moduleId}')
             except Exception as e:
                 logger.error(f'Failed to initialize module {moduleId}')
@@ -167,6 +179,8 @@ def main(is_headless:bool=None, default_config:str=None, http_port:int=None, ssl
                     multiModuleWindow.updateLoadingProgress(i / len(modulePkgs))
                     app.processEvents()  # Draw window before continuing
         logger.info(f'init done')
+        if imswitch.PROFILE_STARTUP:
+            print(startupProfiler.report())
         if not imswitch.IS_HEADLESS:
             launchApp(app, multiModuleWindow, moduleMainControllers.values())
     except Exception as e:
@@ -4,3 +4,4 @@ from .api import APIExport, generateAPI
 from .logging import initLogger
 from .shortcut import shortcut, generateShortcuts
 from .mathutils import angleToSteps, stepsToAngle
+from .startup import LazyRegistry, startupProfiler
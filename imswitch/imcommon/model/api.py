@@ -5,17 +5,21 @@ from imswitch.imcommon.framework import Mutex, Signal, SignalInterface
 
 
 class APIExport:
-    """ Decorator for methods that should be exported to API. """
+    """ Decorator for methods that should be exported to API. Methods with
+    webSocket=True are served as WebSocket endpoints and must be coroutines
+    that take the WebSocket as their first argument. """
 
-    def __init__(self, *, runOnUIThread=False, asyncExecution=False):
+    def __init__(self, *, runOnUIThread=False, asyncExecution=False, webSocket=False):
         self._APIExport = True
         self._APIRunOnUIThread = runOnUIThread
         self._APIAsyncExecution = asyncExecution
+        self._APIWebSocket = webSocket
 
     def __call__(self, func):
         func._APIExport = self._APIExport
         func._APIRunOnUIThread = self._APIRunOnUIThread
         func._APIAsyncExecution = self._APIAsyncExecution
+        func._APIWebSocket = self._APIWebSocket
         return func
 
 
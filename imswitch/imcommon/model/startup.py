@@ -0,0 +1,115 @@
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupProfiler:
+    """ Collects the time spent importing and initializing the parts of
+    ImSwitch while it starts, enabled with the --profile-startup command line
+    flag. The times of nested steps are included in the time of the step that
+    contains them, e.g. a controller module that imports a manager module. """
+
+    def __init__(self):
+        self.enabled = False
+        self._records = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, kind, name):
+        """ Context manager that records the time spent in it as a step of
+        the given kind (e.g. "import" or "init") if profiling is enabled. """
+        if not self.enabled:
+            yield
+            return
+
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._records.append((kind, name, time.perf_counter() - startTime))
+
+    @property
+    def records(self):
+        """ The recorded steps as a list of (kind, name, seconds). """
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def report(self):
+        """ Returns the recorded steps as a table, slowest first. """
+        records = sorted(self.records, key=lambda record: record[2], reverse=True)
+        if not records:
+            return 'No startup steps recorded'
+
+        nameWidth = max(len(name) for _, name, _ in records)
+        lines = [f'{"Step":<6} {"Name":<{nameWidth}} {"Time (ms)":>10}']
+        for kind, name, seconds in records:
+            lines.append(f'{kind:<6} {name:<{nameWidth}} {1e3 * seconds:>10.1f}')
+        return '\n'.join(lines)
+
+
+startupProfiler = StartupProfiler()
+
+
+class LazyRegistry:
+    """ Maps the names of classes (or modules) of a package to the submodules
+    that define them, so that a submodule is only imported once one of its
+    names is requested through load(). This keeps the import of the package
+    cheap when it holds many modules of which a setup only uses a few.
+
+    The names can also be accessed as attributes of the package by using
+    moduleGetattr as the package's __getattr__, but load() should be
+    preferred, as importing a submodule of the same name as a class binds the
+    submodule to the package attribute. """
+
+    def __init__(self, packageName, modules):
+        self.packageName = packageName
+        self.modules = dict(modules)
+
+    def __contains__(self, name):
+        return name in self.modules
+
+    def __iter__(self):
+        return iter(self.modules)
+
+    def load(self, name):
+        """ Imports the submodule that defines name and returns the class.
+        If the submodule does not define name, e.g. for a registered helper
+        module, the submodule itself is returned. """
+        if name not in self.modules:
+            raise AttributeError(f'module {self.packageName!r} has no attribute {name!r}')
+
+        moduleName = f'{self.packageName}.{self.modules[name]}'
+        with startupProfiler.measure('import', moduleName):
+            module = importlib.import_module(moduleName)
+
+        value = getattr(module, name, module)
+        setattr(sys.modules[self.packageName], name, value)
+        return value
+
+    def moduleGetattr(self, name):
+        """ Module-level __getattr__ (PEP 562) for the package. """
+        return self.load(name)
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,311 @@
+""" End-to-end throughput benchmark of the recording path
+
+Builds a setup with a virtual microscope (VirtualCameraManager and
+VirtualStageManager) without any widgets and records through
+DetectorsManager → RecordingManager → Storer for every combination of
+recording mode, save format and frame size. For each run the sustained
+throughput, dropped frames, peak RSS and per-stage latencies are reported as
+JSON, so that the results can be compared against a baseline:
+
+    python -m imswitch.imcontrol._test.benchmark.recording --output results.json
+    python -m imswitch.imcontrol._test.benchmark.recording --baseline results.json
+
+The process exits with a non-zero status if a run is slower than the baseline
+by more than the given tolerance or drops frames that the baseline did not.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import psutil
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imcontrol.model import (
+    DetectorInfo, DetectorsManager, PositionerInfo, PositionersManager, RecordingManager,
+    RecMode, RS232sManager, SaveFormat, SaveMode
+)
+from imswitch.imcontrol.model.SetupInfo import RS232Info
+
+
+defaultRecModes = [RecMode.SpecFrames, RecMode.SpecTime, RecMode.UntilStop]
+defaultSaveFormats = [SaveFormat.TIFF, SaveFormat.HDF5, SaveFormat.ZARR]
+defaultFrameSizes = [(256, 256), (512, 512), (1024, 1024)]
+
+
+class BenchmarkCommChannel(SignalInterface):
+    """ The part of the CommunicationChannel that the virtual stage emits
+    to. """
+    sigUpdateMotorPosition = Signal()
+
+
+class RSSMonitor:
+    """ Samples the resident set size of this process in a background thread
+    and keeps its peak. """
+
+    def __init__(self, interval=0.01):
+        self._process = psutil.Process()
+        self._interval = interval
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self.peak = 0
+
+    def __enter__(self):
+        self.peak = self._process.memory_info().rss
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopEvent.set()
+        self._thread.join()
+        self._sample()
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            if self._stopEvent.wait(self._interval):
+                break
+
+
+class VirtualSetup:
+    """ Managers of a virtual microscope with one camera of the given frame
+    size, as built by MasterController. """
+
+    detectorName = 'WidefieldCamera'
+    positionerName = 'VirtualStage'
+
+    def __init__(self, frameSize, frameRate=0):
+        height, width = frameSize
+        self.commChannel = BenchmarkCommChannel()
+        self.rs232sManager = RS232sManager({
+            'VirtualMicroscope': RS232Info(
+                managerName='VirtualMicroscopeManager',
+                managerProperties={'frameRate': frameRate,
+                                   'sensorHeight': height,
+                                   'sensorWidth': width}
+            )
+        })
+        lowLevelManagers = {'rs232sManager': self.rs232sManager}
+        self.detectorsManager = DetectorsManager({
+            self.detectorName: DetectorInfo(
+                analogChannel=None,
+                digitalLine=None,
+                managerName='VirtualCameraManager',
+                managerProperties={'virtcam': {'image_width': width,
+                                               'image_height': height}},
+                forAcquisition=True
+            )
+        }, updatePeriod=100, **lowLevelManagers)
+        self.positionersManager = PositionersManager({
+            self.positionerName: PositionerInfo(
+                analogChannel=None,
+                digitalLine=None,
+                managerName='VirtualStageManager',
+                managerProperties={},
+                axes=['X', 'Y', 'Z', 'A'],
+                forPositioning=True
+            )
+        }, self.commChannel, **lowLevelManagers)
+        self.recordingManager = RecordingManager(self.detectorsManager)
+
+    @property
+    def camera(self):
+        return self.rs232sManager['VirtualMicroscope']._camera
+
+    def scanStage(self, stopEvent, step=5, interval=0.01):
+        """ Moves the stage in X until stopEvent is set, so that every frame
+        shows a different part of the sample. """
+        positioner = self.positionersManager[self.positionerName]
+        while not stopEvent.wait(interval):
+            positioner.move(value=step, axis='X', is_absolute=False)
+
+    def finalize(self):
+        self.rs232sManager['VirtualMicroscope'].finalize()
+
+
+def runRecording(setup, recMode, saveFormat, savename, numFrames=100, recTime=2.0,
+                 timeout=120):
+    """ Records with the given mode and format and returns the results of the
+    run as a dict. """
+    camera = setup.camera
+    recordingManager = setup.recordingManager
+    droppedBefore = camera.droppedFrames
+    stopEvent = threading.Event()
+    stageThread = threading.Thread(target=setup.scanStage, args=(stopEvent,), daemon=True)
+
+    with RSSMonitor() as rssMonitor:
+        stageThread.start()
+        start = time.perf_counter()
+        recordingManager.startRecording(
+            detectorNames=[setup.detectorName],
+            recMode=recMode,
+            savename=savename,
+            saveMode=SaveMode.Disk,
+            attrs={setup.detectorName: {}},
+            saveFormat=saveFormat,
+            recFrames=numFrames if recMode == RecMode.SpecFrames else None,
+            recTime=recTime if recMode == RecMode.SpecTime else None
+        )
+        if recMode == RecMode.UntilStop:
+            time.sleep(recTime)
+            recordingManager.endRecording(emitSignal=False, wait=True)
+        while recordingManager.record:
+            if time.perf_counter() - start > timeout:
+                recordingManager.endRecording(emitSignal=False, wait=True)
+                raise TimeoutError(f'Recording in {recMode.name} mode did not finish within'
+                                   f' {timeout} s')
+            time.sleep(0.01)
+        recordingManager.endRecording(emitSignal=False, wait=True)
+        duration = time.perf_counter() - start
+        stopEvent.set()
+        stageThread.join()
+
+    stats = recordingManager.getRecordingStats()[setup.detectorName]
+    frameBytes = camera.SensorHeight * camera.SensorWidth * np.dtype(np.uint16).itemsize
+    return {
+        'recMode': recMode.name,
+        'saveFormat': saveFormat.name,
+        'frameSize': [camera.SensorHeight, camera.SensorWidth],
+        'durationS': duration,
+        'framesWritten': stats['framesWritten'],
+        'framesPerSecond': stats['framesWritten'] / duration,
+        'megabytesPerSecond': stats['framesWritten'] * frameBytes / duration / 1024 ** 2,
+        'framesDroppedRecording': stats['framesDropped'],
+        'framesDroppedCamera': camera.droppedFrames - droppedBefore,
+        'peakQueued': stats['peakQueued'],
+        'peakRSSMB': rssMonitor.peak / 1024 ** 2,
+        'latency': stats['latency']
+    }
+
+
+def runBenchmark(recModes=None, saveFormats=None, frameSizes=None, numFrames=100,
+                 recTime=2.0, frameRate=0, directory=None):
+    """ Runs every combination of recording mode, save format and frame size
+    and returns the results as a JSON-serializable dict. """
+    recModes = recModes or defaultRecModes
+    saveFormats = saveFormats or defaultSaveFormats
+    frameSizes = frameSizes or defaultFrameSizes
+
+    runs = []
+    with tempfile.TemporaryDirectory(dir=directory) as tmpDir:
+        for frameSize in frameSizes:
+            setup = VirtualSetup(frameSize, frameRate=frameRate)
+            try:
+                for recMode in recModes:
+                    for saveFormat in saveFormats:
+                        savename = os.path.join(
+                            tmpDir, f'{recMode.name}_{saveFormat.name}_{frameSize[0]}x{frameSize[1]}'
+                        )
+                        runs.append(runRecording(setup, recMode, saveFormat, savename,
+                                                 numFrames=numFrames, recTime=recTime))
+            finally:
+                setup.finalize()
+
+    return {
+        'system': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpuCount': os.cpu_count()
+        },
+        'settings': {
+            'numFrames': numFrames,
+            'recTime': recTime,
+            'frameRate': frameRate
+        },
+        'runs': runs
+    }
+
+
+def compareResults(results, baseline, tolerance=0.2):
+    """ Compares the runs in results with the matching runs in baseline and
+    returns a list of regressions: runs whose throughput fell by more than
+    tolerance (a fraction) or that dropped frames that the baseline did
+    not. """
+    def runKey(run):
+        return run['recMode'], run['saveFormat'], tuple(run['frameSize'])
+
+    baselineRuns = {runKey(run): run for run in baseline['runs']}
+    regressions = []
+    for run in results['runs']:
+        baselineRun = baselineRuns.get(runKey(run))
+        if baselineRun is None:
+            continue
+
+        name = '{} {} {}x{}'.format(*runKey(run)[:2], *run['frameSize'])
+        if run['framesPerSecond'] < baselineRun['framesPerSecond'] * (1 - tolerance):
+            regressions.append(f'{name}: {run["framesPerSecond"]:.1f} frames/s, baseline'
+                               f' {baselineRun["framesPerSecond"]:.1f} frames/s')
+        dropped = run['framesDroppedRecording'] + run['framesDroppedCamera']
+        baselineDropped = (baselineRun['framesDroppedRecording'] +
+                           baselineRun['framesDroppedCamera'])
+        if dropped > 0 and baselineDropped == 0:
+            regressions.append(f'{name}: dropped {dropped} frames, baseline dropped none')
+    return regressions
+
+
+def parseFrameSize(value):
+    height, width = value.lower().split('x')
+    return int(height), int(width)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rec-modes', nargs='+', choices=[m.name for m in defaultRecModes],
+                        default=[m.name for m in defaultRecModes])
+    parser.add_argument('--save-formats', nargs='+',
+                        choices=[f.name for f in defaultSaveFormats],
+                        default=[f.name for f in defaultSaveFormats])
+    parser.add_argument('--frame-sizes', nargs='+', type=parseFrameSize,
+                        default=defaultFrameSizes, metavar='HEIGHTxWIDTH')
+    parser.add_argument('--frames', type=int, default=100,
+                        help='number of frames to record in SpecFrames mode')
+    parser.add_argument('--rec-time', type=float, default=2.0,
+                        help='recording time in seconds in SpecTime and UntilStop mode')
+    parser.add_argument('--frame-rate', type=float, default=0,
+                        help='frame rate of the virtual camera, 0 renders as fast as possible')
+    parser.add_argument('--directory', default=None,
+                        help='directory to record into, defaults to the system temp directory')
+    parser.add_argument('--output', default=None, help='file to write the JSON results to')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative throughput loss compared to the baseline')
+    args = parser.parse_args(argv)
+
+    from qtpy import QtCore
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+    results = runBenchmark(recModes=[RecMode[name] for name in args.rec_modes],
+                           saveFormats=[SaveFormat[name] for name in args.save_formats],
+                           frameSizes=args.frame_sizes,
+                           numFrames=args.frames,
+                           recTime=args.rec_time,
+                           frameRate=args.frame_rate,
+                           directory=args.directory)
+
+    resultsJSON = json.dumps(results, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            file.write(resultsJSON)
+    else:
+        print(resultsJSON)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            regressions = compareResults(results, json.load(file), tolerance=args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
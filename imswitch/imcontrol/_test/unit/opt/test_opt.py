@@ -1,9 +1,12 @@
+from concurrent.futures import wait
+
 import pytest
 import napari
 import numpy as np
 from imswitch.imcontrol.controller.controllers.OptController import (
     OptController,
     FBPliveRecon,
+    FBPVolumeRecon,
 )
 from imswitch.imcontrol.view.widgets.OptWidget import OptWidget
 from imswitch.imcontrol.controller.CommunicationChannel import CommunicationChannel
@@ -22,7 +25,7 @@ from . import detectorInfosNonSquare, setupInfoOPTBasic
     [({'OptStepsEdit': 2}, {'optSteps': np.array([0, 1600])}),
      ],
 )
-def test_opt_scan_controller(opt_settings, expected):
+def test_opt_scan_controller(qtbot, opt_settings, expected):
     self = MainController()
     # Create the scan controller
     self._setupInfo = setupInfoOPTBasic
@@ -32,6 +35,9 @@ def test_opt_scan_controller(opt_settings, expected):
                                     self._moduleCommChannel)
     viewer = napari.Viewer(show=False)
     widget = OptWidget(options=None, napariViewer=viewer)
+    # let pytest-qt delete the widget with its pyqtgraph views at teardown,
+    # instead of the garbage collector at some later point, which segfaults
+    qtbot.addWidget(widget)
 
     optController = OptController(
                         self._setupInfo,
@@ -49,11 +55,26 @@ def test_opt_scan_controller(opt_settings, expected):
     for k, v in opt_settings.items():
         widget.scanPar[k].setValue(v)
 
+    # volume reconstruction band around the reconstruction index
+    optController.setLiveReconBand(8)
+    optWorker = optController.optWorker
+    assert optWorker.reconBand == 8
+    optWorker.reconIdx = 2
+    assert optWorker.getReconRows((16, 24)) == (0, 8)
+    optWorker.reconIdx = 100  # invalid, falls back to the middle row
+    assert optWorker.getReconRows((16, 24)) == (4, 12)
+    optWorker.maxVolumeBytes = 3 * 24 ** 2 * 4
+    assert optWorker.getReconRows((16, 24)) == (7, 10)
+
     optController.prepareOPTScan()
 
     assert optController.optSteps == opt_settings['OptStepsEdit']
     assert optController.optWorker.optSteps.all() == expected['optSteps'].all()
 
+    # let the scan finish before the viewer is torn down
+    qtbot.waitUntil(lambda: not optController.optThread.isRunning(), timeout=30000)
+    viewer.close()
+
 
 # unit live recon test
 # TODO: expand this test
@@ -75,3 +96,37 @@ def test_FBP_live_recon(init_vals, expected):
                                         len(expected[0]),
                                         len(expected[0]),
                                         )
+
+
+@pytest.mark.parametrize('rows', [None, (3, 9)])
+def test_FBP_volume_recon(rows):
+    steps = 12
+    frames = np.random.default_rng(0).random((steps, 16, 24))
+    volumeRecon = FBPVolumeRecon(frames[0], steps, rows=rows, displayRow=5,
+                                 numWorkers=2)
+    for step in range(1, steps):
+        volumeRecon.update_recon(frames[step], step)
+    volume = volumeRecon.finish()
+
+    first, last = rows or (0, 16)
+    assert volume.shape == (last - first, 24, 24)
+    # every row matches the single line reconstruction
+    for row in [first, 5, last - 1]:
+        lineRecon = FBPliveRecon(frames[0, row], steps)
+        for step in range(1, steps):
+            lineRecon.update_recon(frames[step, row], step)
+        np.testing.assert_allclose(volume[row - first], lineRecon.recon,
+                                   atol=1e-5)
+    np.testing.assert_array_equal(volumeRecon.recon, volume[5 - first])
+
+
+def test_FBP_volume_recon_raises_worker_errors():
+    frames = np.random.default_rng(0).random((3, 16, 24))
+    volumeRecon = FBPVolumeRecon(frames[0], 3, numWorkers=2)
+    volumeRecon.update_recon(frames[1, :, :20], 1)  # wrong frame width
+    wait(volumeRecon._futures)
+    # the next projection reports the failed one
+    with pytest.raises(ValueError):
+        volumeRecon.update_recon(frames[2], 2)
+    with pytest.raises(ValueError):
+        volumeRecon.finish()
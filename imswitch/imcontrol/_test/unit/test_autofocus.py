@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+from imswitch.imcontrol.controller.controllers.AufofocusController import (
+    AutofocusController, FocusMetrics, FocusSweep, findFocusPeak, goldenSectionSearch
+)
+from imswitch.imcontrol.model.interfaces.framebuffer import FrameRingBuffer
+
+
+focusPosition = 12.
+sample = np.random.default_rng(0).random((96, 96)) * 1000
+
+
+def blurred(position):
+    return gaussian_filter(sample, 0.5 + abs(position - focusPosition) / 10)
+
+
+class MovingStage:
+    """ Moves at constant speed in blocking moves. """
+
+    def __init__(self, speed=400.):
+        self.speed = speed
+        self._position = 0.
+        self._target = 0.
+        self._moveStart = self._moveStop = time.time()
+
+    def position(self):
+        now = time.time()
+        if now >= self._moveStop:
+            return self._target
+        fraction = (now - self._moveStart) / (self._moveStop - self._moveStart)
+        return self._position + fraction * (self._target - self._position)
+
+    def move(self, value, axis, is_absolute, is_blocking, speed=None):
+        self._position = self.position()
+        self._target = value
+        self._moveStart = time.time()
+        self._moveStop = self._moveStart + abs(value - self._position) / (speed or self.speed)
+        time.sleep(self._moveStop - self._moveStart)
+
+    def getPosition(self):
+        return {'Z': self.position()}
+
+
+class StreamingCamera:
+    """ Pushes frames of the sample blurred according to the stage position. """
+
+    def __init__(self, stage, withFrameBuffer=True):
+        self.stage = stage
+        self.frameBuffer = FrameRingBuffer(8)
+        self.withFrameBuffer = withFrameBuffer
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            self.frameBuffer.push(blurred(self.stage.position()).astype(np.uint16))
+            time.sleep(0.005)
+
+    def getFrameBuffer(self):
+        return self.frameBuffer if self.withFrameBuffer else None
+
+    def getLatestFrame(self):
+        return self.frameBuffer.getLast()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+
+
+@pytest.mark.parametrize('name', ['laplacian', 'brenner', 'tenengrad'])
+def test_focus_metrics(name):
+    metric = FocusMetrics.get(name)
+    stack = np.stack([blurred(position) for position in [-20, 0, 6, 12, 18, 40]])
+    values = metric(stack)
+    assert values.shape == (6,)
+    assert np.argmax(values) == 3
+    assert values[3] == pytest.approx(metric(stack[3]))
+    with pytest.raises(ValueError):
+        FocusMetrics.get('jpeg-size')
+
+
+def test_peak_search():
+    positions = np.linspace(-10, 10, 11)
+    assert findFocusPeak(positions, -(positions - 1.3) ** 2) == pytest.approx(1.3)
+
+    best, evaluations = goldenSectionSearch(lambda z: -(z - 3.7) ** 2, -50, 50, tolerance=0.1)
+    assert best == pytest.approx(3.7, abs=0.1)
+    assert len(evaluations) < 20
+
+
+@pytest.mark.parametrize('withFrameBuffer', [True, False])
+def test_focus_sweep(withFrameBuffer):
+    stage = MovingStage()
+    camera = StreamingCamera(stage, withFrameBuffer)
+    try:
+        sweep = FocusSweep(camera, stage, axis='Z', cropSize=64)
+        positions, crops = sweep.run(-40, 60, speed=200)
+    finally:
+        camera.stop()
+
+    assert len(crops) > 20
+    assert crops[0].shape == (64, 64)
+    assert np.all(np.diff(positions) >= 0)
+    assert positions[0] >= -40 and positions[-1] <= 60
+    values = FocusMetrics.laplacianVariance(np.stack(crops))
+    assert findFocusPeak(positions, values) == pytest.approx(focusPosition, abs=3)
+
+
+def test_grab_frame_after_move():
+    stage = MovingStage()
+    camera = StreamingCamera(stage)
+    controller = SimpleNamespace(camera=camera,
+                                 _AutofocusController__logger=logging.getLogger(__name__))
+    try:
+        frameCount = camera.frameBuffer.frameCount
+        frame = AutofocusController.grabFrameAfterMove(controller, timeout=1)
+        assert camera.frameBuffer.frameCount >= frameCount + 2
+        assert frame.shape == sample.shape
+    finally:
+        camera.stop()
+
+    # no stale frame from before the move once the camera stopped
+    with pytest.raises(TimeoutError):
+        AutofocusController.grabFrameAfterMove(controller, timeout=0.05)
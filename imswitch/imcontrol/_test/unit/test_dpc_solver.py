@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+from imswitch.imcontrol.controller.controllers.DPCController import DPCSolver
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(0)
+    stack = 1000 + 200 * gaussian_filter(rng.random((8, 64, 48)), (0, 2, 2))
+    return stack.astype(np.uint16)
+
+
+def createSolver(shape, reg_p=5e-3):
+    solver = DPCSolver(shape=shape, wavelength=.53, na=.3, NAi=.1, pixelsize=.2,
+                       rotation=[0, 180, 90, 270])
+    solver.setTikhonovRegularization(reg_u=1e-1, reg_p=reg_p)
+    return solver
+
+
+@pytest.mark.parametrize('shape', [(64, 48), (63, 47)])
+def test_fast_solver_matches_reference(images, shape):
+    images = images[:, :shape[0], :shape[1]]
+    solver = createSolver(shape)
+    expected = solver.solve(images)
+    result = solver.solveFast(images)
+    assert result.shape == expected.shape == (2, *shape)
+    assert result.dtype == np.complex64
+    assert np.all(np.isfinite(expected))
+    scale = np.abs(expected).max()
+    np.testing.assert_allclose(result.real, expected.real, atol=1e-4 * scale)
+    np.testing.assert_allclose(result.imag, expected.imag, atol=1e-4 * scale)
+
+
+def test_inverse_filters_are_cached(images):
+    DPCSolver.clearCache()
+    computedBefore = DPCSolver.numFiltersComputed
+    solver = createSolver((64, 48))
+    filters = solver.getInverseFilters()
+    assert filters.shape == (2, 4, 64, 25)
+    assert createSolver((64, 48)).getInverseFilters() is filters
+    createSolver((64, 48), reg_p=1e-2).getInverseFilters()
+    assert DPCSolver.numFiltersComputed == computedBefore + 2
+
+    with pytest.raises(ValueError):
+        solver.solveFast(images[:, :32])
+
+
+def test_solve_stream(images):
+    solver = createSolver((64, 48))
+    results = list(solver.solveStream(iter(images)))
+    assert len(results) == 2
+    for (result, latency), expected in zip(results, solver.solveFast(images)):
+        np.testing.assert_array_equal(result, expected)
+        assert latency > 0
+    stats = solver.getLatencyStats()
+    assert stats['numSolved'] == 4
+    assert stats['maxLatencyMs'] >= stats['meanLatencyMs'] > 0
@@ -0,0 +1,114 @@
+import textwrap
+import time
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.controller.controllers.etsted import (
+    EventPipelineWorker, LatencyHistogram, LatencyMetrics, LatestFrameSlot
+)
+
+pipelineSource = '''
+import time
+import numpy as np
+
+def brightest_pixel(img, prevFrames, binary_mask, testmode, exinfo, threshold, delay):
+    time.sleep(delay)
+    exinfo = (exinfo or 0) + 1
+    coords = np.argwhere(img > threshold)
+    if testmode:
+        return coords, exinfo, img * 2
+    return coords, exinfo
+'''
+
+
+@pytest.fixture
+def worker(tmp_path):
+    (tmp_path / 'brightest_pixel.py').write_text(textwrap.dedent(pipelineSource))
+    worker = EventPipelineWorker('brightest_pixel', [str(tmp_path)], (16, 16), np.uint16)
+    worker.start()
+    yield worker
+    worker.stop()
+
+
+def getResults(worker, number, timeout=60):
+    results = []
+    deadline = time.time() + timeout
+    while len(results) < number and time.time() < deadline:
+        result = worker.getResult(timeout=0.1)
+        if result is not None:
+            assert result.error is None, result.error
+            results.append(result)
+    return results
+
+
+def test_latest_frame_slot():
+    slot = LatestFrameSlot((4, 4), np.uint16)
+    try:
+        assert slot.take(timeout=0.01) is None
+        slot.put(np.full((4, 4), 1, dtype=np.uint16), frameId=1)
+        slot.put(np.full((4, 4), 2, dtype=np.uint16), frameId=2, numCommands=3)
+        frame, frameId, putTime, numCommands = slot.take(timeout=0.01)
+        assert frameId == 2 and frame[0, 0] == 2 and numCommands == 3
+        assert putTime <= time.perf_counter()
+        assert slot.numDropped == 1
+        assert slot.take(timeout=0.01) is None
+        with pytest.raises(ValueError):
+            slot.put(np.zeros((4, 5), dtype=np.uint16), frameId=3)
+        slot.close()
+        assert slot.take() is None
+    finally:
+        slot.release()
+
+
+def test_worker_runs_pipeline(worker):
+    worker.configure(None, True, [100, 0])
+    frame = np.zeros((16, 16), dtype=np.uint16)
+    frame[3, 7] = 500
+    worker.submit(frame, 0)
+    result, = getResults(worker, 1)
+    assert result.frameId == 0
+    np.testing.assert_array_equal(result.coords, [[3, 7]])
+    assert result.exinfo == 1
+    np.testing.assert_array_equal(result.analysedImage, frame * 2)
+    assert result.putTime <= result.startTime <= result.endTime
+
+    # exinfo is passed on to the next frame until the worker is reset
+    worker.submit(frame, 1)
+    assert getResults(worker, 1)[0].exinfo == 2
+    worker.reset()
+    worker.configure(None, False, [1000, 0])
+    worker.submit(frame, 2)
+    result, = getResults(worker, 1)
+    assert result.exinfo == 1 and result.coords.size == 0 and result.analysedImage is None
+
+
+def test_busy_worker_gets_newest_frame(worker):
+    worker.configure(None, False, [100, 0.2])
+    worker.submit(np.zeros((16, 16), dtype=np.uint16), 0)
+    getResults(worker, 1)
+    worker.submit(np.zeros((16, 16), dtype=np.uint16), 1)
+    time.sleep(0.05)  # the pipeline is busy with frame 1 now
+    for frameId in range(2, 6):
+        worker.submit(np.zeros((16, 16), dtype=np.uint16), frameId)
+    assert [result.frameId for result in getResults(worker, 2)] == [1, 5]
+    assert worker.numDropped == 3
+
+
+def test_latency_metrics():
+    histogram = LatencyHistogram()
+    for latency in np.linspace(0.001, 0.1, 100):
+        histogram.record(latency)
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['meanMs'] == pytest.approx(50.5)
+    assert summary['minMs'] == pytest.approx(1) and summary['maxMs'] == pytest.approx(100)
+    assert summary['p50Ms'] == pytest.approx(50, rel=0.15)
+    assert summary['p99Ms'] <= summary['maxMs']
+
+    metrics = LatencyMetrics()
+    metrics.record('pipeline', 0.01)
+    metrics.setDroppedFrames(2)
+    summary = metrics.summary()
+    assert summary['pipeline']['count'] == 1 and summary['scanStart'] == {'count': 0}
+    assert summary['droppedFrames'] == 2
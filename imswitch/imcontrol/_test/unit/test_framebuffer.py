@@ -0,0 +1,90 @@
+import threading
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.interfaces import FrameRingBuffer
+
+
+def pushFrames(buffer, start, stop, shape=(4, 6)):
+    for i in range(start, stop):
+        buffer.push(np.full(shape, i, dtype=np.uint16), frameId=i, timestamp=float(i))
+
+
+def test_get_last_returns_copy():
+    buffer = FrameRingBuffer(1)
+    assert buffer.getLast() is None
+
+    pushFrames(buffer, 0, 3)
+    frame, frameId = buffer.getLast(returnFrameId=True)
+    assert frameId == 2
+    assert np.all(frame == 2)
+    # frames kept by the caller do not change when the slot is overwritten
+    pushFrames(buffer, 3, 4)
+    assert np.all(frame == 2)
+    frame[0, 0] = 0
+
+
+def test_get_last_view_is_read_only():
+    buffer = FrameRingBuffer(4)
+    pushFrames(buffer, 0, 3)
+    frame = buffer.getLast(copy=False)
+    assert np.all(frame == 2) and not frame.flags.owndata
+    with pytest.raises(ValueError):
+        frame[0, 0] = 0
+
+
+def test_wait_for_new_frame():
+    buffer = FrameRingBuffer(4)
+    pushFrames(buffer, 0, 2)
+    frameCount = buffer.frameCount
+    assert buffer.waitForNewFrame(frameCount, timeout=0.01) is None
+    timer = threading.Timer(0.05, pushFrames, (buffer, 2, 3))
+    timer.start()
+    frame, frameId = buffer.waitForNewFrame(frameCount, timeout=5, returnFrameId=True)
+    timer.join()
+    assert frameId == 2 and np.all(frame == 2)
+    # returns right away if the frame has arrived already
+    assert np.all(buffer.waitForNewFrame(frameCount, timeout=0) == 2)
+
+
+def test_get_chunk_returns_pending_frames():
+    buffer = FrameRingBuffer(8)
+    pushFrames(buffer, 0, 5)
+    chunk, frameIds, timestamps = buffer.getChunk()
+    assert chunk.shape == (5, 4, 6)
+    assert not chunk.flags.owndata and not chunk.flags.writeable
+    np.testing.assert_array_equal(frameIds, np.arange(5))
+    np.testing.assert_array_equal(timestamps, np.arange(5))
+    np.testing.assert_array_equal(chunk[:, 0, 0], np.arange(5))
+
+    # only new frames are returned, also when they wrap around the end
+    pushFrames(buffer, 5, 11)
+    chunk, frameIds, _ = buffer.getChunk()
+    np.testing.assert_array_equal(frameIds, np.arange(5, 11))
+    np.testing.assert_array_equal(chunk[:, 0, 0], np.arange(5, 11))
+    assert buffer.numPending == 0
+    assert buffer.getChunk()[0].shape == (0, 4, 6)
+
+
+def test_overflow_drops_oldest_frames():
+    buffer = FrameRingBuffer(4)
+    pushFrames(buffer, 0, 10)
+    assert buffer.numOverflowed == 6
+    chunk, frameIds, _ = buffer.getChunk()
+    np.testing.assert_array_equal(frameIds, np.arange(6, 10))
+    np.testing.assert_array_equal(chunk[:, 0, 0], np.arange(6, 10))
+
+
+def test_flush_and_reallocation():
+    buffer = FrameRingBuffer(4)
+    pushFrames(buffer, 0, 3)
+    buffer.flush()
+    assert buffer.numPending == 0
+
+    # a new frame shape discards the old frames
+    pushFrames(buffer, 3, 5, shape=(2, 2))
+    assert buffer.frameShape == (2, 2)
+    chunk, frameIds, _ = buffer.getChunk()
+    assert chunk.shape == (2, 2, 2)
+    np.testing.assert_array_equal(frameIds, [3, 4])
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+import zarr
+
+from imswitch.imcontrol.controller.controllers.HistoScanController import (
+    ImageStitcher, PyramidCanvas
+)
+
+
+def test_pyramid_levels(tmp_path):
+    canvas = PyramidCanvas(str(tmp_path / 'canvas.zarr'), shape=(300, 520), tileSize=64)
+    try:
+        assert canvas.numLevels == 5  # down to one tile
+        assert canvas.levelShape(1) == (150, 260)
+        assert canvas.levelForScale(1) == 0 and canvas.levelForScale(0.25) == 2
+
+        tile = np.random.default_rng(0).integers(1, 60000, (100, 120), dtype=np.uint16)
+        canvas.addTile(tile, (10, 30))
+        canvas.addTile(tile, (250, 500))  # Partially outside, clipped
+        canvas.flush()
+    finally:
+        canvas.close()
+
+    np.testing.assert_array_equal(canvas.getRegion(0, 10, 30, 100, 120), tile)
+    np.testing.assert_array_equal(canvas.getRegion(0, 250, 500, 50, 20), tile[:50, :20])
+    assert canvas.numTiles == 2 and canvas.maxValue == tile.max()
+
+    # every level is the 2x2 mean of the one above
+    level0 = canvas.levels[0][:].astype(float)
+    level1 = level0.reshape(150, 2, 260, 2).mean(axis=(1, 3))
+    np.testing.assert_allclose(canvas.levels[1][:], level1, atol=1)
+
+    # regions outside the canvas are zero
+    region = canvas.getRegion(1, -5, -5, 20, 20)
+    assert region.shape == (20, 20) and np.all(region[:5] == 0)
+
+    multiscales = zarr.open_group(str(tmp_path / 'canvas.zarr'), mode='r').attrs['multiscales']
+    assert [dataset['path'] for dataset in multiscales[0]['datasets']] == ['0', '1', '2', '3', '4']
+
+
+@pytest.mark.parametrize('blending, expected', [('max', 200), ('overwrite', 100)])
+def test_pyramid_blending(tmp_path, blending, expected):
+    canvas = PyramidCanvas(str(tmp_path / 'canvas.zarr'), shape=(64, 128), tileSize=32,
+                           blending=blending)
+    canvas.addTile(np.full((64, 80), 200, dtype=np.uint16), (0, 0))
+    canvas.addTile(np.full((64, 80), 100, dtype=np.uint16), (0, 48))
+    canvas.close()
+    assert canvas.getRegion(0, 32, 60, 1, 1)[0, 0] == expected
+
+
+def test_pyramid_feather_blending(tmp_path):
+    canvas = PyramidCanvas(str(tmp_path / 'canvas.zarr'), shape=(64, 128), tileSize=32,
+                           blendWidth=16)
+    canvas.addTile(np.full((64, 80), 200, dtype=np.uint16), (0, 0))
+    canvas.addTile(np.full((64, 80), 100, dtype=np.uint16), (0, 48))
+    canvas.close()
+    row = canvas.getRegion(0, 32, 0, 1, 128)[0].astype(int)
+    assert np.all(row[:48] == 200) and np.all(row[80:] == 100)
+    # cross-fade from the edge of the new tile inwards
+    assert np.all(np.diff(row[48:64]) <= 0) and 100 < row[50] < 200 and row[70] == 100
+
+
+def test_image_stitcher(tmp_path):
+    stitcher = ImageStitcher(None, origin_coords=(0, 0), max_coords=(100, 60), folder=str(tmp_path),
+                             file_name='scan', extension='.ome.tif', image_dims=(64, 48),
+                             pixel_size=1, flipX=False, flipY=False, resolution_scale=0.5)
+    tile = np.full((48, 64), 1000, dtype=np.uint16)
+    for position in [(0, 0), (50, 0), (100, 60)]:
+        stitcher.add_image(tile, np.array(position), {})
+    stitched = stitcher.get_stitched_image()
+
+    assert stitcher.canvas.levelShape(0) == (108, 164)
+    assert stitched.shape == (54, 82)  # Level 1, half resolution
+    assert stitched[0, 0] == 1000 and stitched[53, 81] == 1000 and stitched[40, 10] == 0
+    assert (tmp_path / 'scan.ome.tif').exists()
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from imswitch.imcontrol.controller.controllers.HoloController import HoloController, HoloPropagator
+
+
+pixelsize = 3.45e-6
+wavelength = 488e-9
+
+
+def test_propagation_is_reversible():
+    propagator = HoloPropagator()
+    rng = np.random.default_rng(0)
+    field = rng.random((64, 80)) * np.exp(1j * rng.random((64, 80)))
+
+    propagated = propagator.propagate(field, pixelsize, 1e-3, wavelength)
+    assert propagated.shape == field.shape
+    assert not np.allclose(propagated, field, atol=1e-3)
+    np.testing.assert_allclose(propagator.propagate(propagated, pixelsize, -1e-3, wavelength),
+                               field, atol=1e-4)
+
+
+def test_kernel_cache():
+    propagator = HoloPropagator(maxCachedKernels=2)
+    kernel = propagator.getKernel((32, 32), pixelsize, 1e-3, wavelength)
+    assert propagator.getKernel((32, 32), pixelsize, 1e-3, wavelength) is kernel
+    assert propagator.numKernelsComputed == 1
+
+    propagator.getKernel((32, 32), pixelsize, 2e-3, wavelength)
+    propagator.getKernel((32, 32), pixelsize, 3e-3, wavelength)  # Evicts the one for 1e-3
+    assert propagator.numKernelsComputed == 3
+    propagator.getKernel((32, 32), pixelsize, 1e-3, wavelength)
+    assert propagator.numKernelsComputed == 4
+
+
+def test_propagate_stack_matches_single_planes():
+    propagator = HoloPropagator()
+    hologram = np.random.default_rng(1).random((48, 48)) * 1000
+    field = propagator.extractInlineField(hologram, roiSize=32)
+    assert field.shape == (32, 32)
+
+    dzs = [-1e-3, 0, 2e-3]
+    stack = propagator.propagateStack(field, pixelsize, dzs, wavelength, NA=0.3)
+    assert stack.shape == (3, 32, 32)
+    for dz, plane in zip(dzs, stack):
+        np.testing.assert_allclose(plane, propagator.propagate(field, pixelsize, dz, wavelength,
+                                                               NA=0.3), atol=1e-4)
+
+
+def test_off_axis_reconstruction():
+    propagator = HoloPropagator()
+    hologram = np.random.default_rng(2).random((64, 64))
+    field, spectrum = propagator.reconstructOffAxis(hologram, pixelsize, 0, wavelength,
+                                                    ccCenter=(20, 40), ccRadius=16,
+                                                    returnSpectrum=True)
+    assert field.shape == (16, 16)
+    assert spectrum.shape == (64, 64)
+    _, fieldPixelsize = propagator.extractOffAxisField(hologram, pixelsize, (20, 40), 16)
+    assert fieldPixelsize == pixelsize * 4
+
+
+def test_worker_thread_stops_when_deactivated():
+    worker = HoloController.HoloImageComputationWorker()
+    computed = []
+    worker.computeHoloImage = computed.append
+    worker.setActive(True)
+    worker.prepareForNewImage(np.zeros((8, 8)))
+    thread = worker._computeThread
+    thread.join(0.2)
+    assert thread.is_alive() and len(computed) == 1
+
+    worker.setActive(False)
+    assert not thread.is_alive() and worker._computeThread is None
+
+    # the next image after reactivating starts a new thread
+    worker.setActive(True)
+    worker.prepareForNewImage(np.zeros((8, 8)))
+    worker.stop()
+    assert worker._computeThread is None
+
+
+def test_refocus_stack_uses_slider_units():
+    worker = HoloController.HoloImageComputationWorker()
+    worker._image = np.zeros((8, 8))
+    worker.setReconstructionMode("inline")
+    distances = []
+    worker.computeRefocusStack = lambda image, dzs: distances.append(dzs) or np.ones((len(dzs), 8, 8))
+    controller = SimpleNamespace(imageComputationWorker=worker, _widget=None,
+                                 offAxisDzScale=HoloController.offAxisDzScale,
+                                 inLineDzScale=HoloController.inLineDzScale)
+
+    result = HoloController.computeRefocusStack(controller, 10, 30, numSteps=3)
+    assert result['dz'] == [10, 20, 30]
+    np.testing.assert_allclose(distances[-1], [10e-3, 20e-3, 30e-3])
+
+    worker.setReconstructionMode("offaxis")
+    HoloController.computeRefocusStack(controller, 10, 30, numSteps=3)
+    np.testing.assert_allclose(distances[-1], [10e-4, 20e-4, 30e-4])
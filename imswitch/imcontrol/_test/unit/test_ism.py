@@ -0,0 +1,96 @@
+import threading
+import time
+
+import numpy as np
+import tifffile as tif
+
+from imswitch.imcontrol.controller.controllers.ISMController import (
+    ISMReconstructor, ISMStackWriter
+)
+from imswitch.imcontrol.model.interfaces.framebuffer import FrameRingBuffer
+
+shape = (64, 64)
+sigma = 1.5
+pitch = 8
+
+
+def gaussians(centers, sigma):
+    rows, columns = np.indices(shape)
+    image = np.zeros(shape)
+    for row, column in centers:
+        image += np.exp(-((rows - row) ** 2 + (columns - column) ** 2) / (2 * sigma ** 2))
+    return image
+
+
+def spotLattice(index):
+    offset = np.array(divmod(index, pitch)) + 0.25
+    return np.array([(row, column) for row in range(0, shape[0], pitch)
+                     for column in range(0, shape[1], pitch)]) + offset
+
+
+def width(image, upsampling=1):
+    """ Standard deviation of the intensity distribution, in camera pixels. """
+    rows, columns = np.indices(image.shape)
+    total = image.sum()
+    centerRow, centerColumn = (image * rows).sum() / total, (image * columns).sum() / total
+    variance = (image * ((rows - centerRow) ** 2 + (columns - centerColumn) ** 2)).sum() / total
+    return np.sqrt(variance / 2) / upsampling
+
+
+def test_reassignment_sharpens_point_emitter():
+    emitter = np.array([32.3, 31.6])
+    reconstructor = ISMReconstructor(shape, pinholeRadius=3)
+    for index in range(pitch * pitch):
+        spots = spotLattice(index)
+        excitation = np.exp(-((spots - emitter) ** 2).sum(axis=1) / (2 * sigma ** 2))
+        frame = excitation.sum() * gaussians([emitter], sigma)
+        reconstructor.add(frame, spots=spots)
+
+    assert reconstructor.numFrames == pitch * pitch
+    assert reconstructor.ism.shape == (128, 128)
+    np.testing.assert_allclose(width(reconstructor.widefield), sigma, rtol=0.05)
+    # equal excitation and emission PSFs give a sqrt(2) narrower image
+    np.testing.assert_allclose(width(reconstructor.ism, upsampling=2), sigma / np.sqrt(2), rtol=0.15)
+    peak = np.unravel_index(np.argmax(reconstructor.ism), reconstructor.ism.shape)
+    np.testing.assert_allclose(np.array(peak) / 2, emitter, atol=0.5)
+
+    # the displayed image does not change with the frames added later
+    snapshot = reconstructor.getISM()
+    reconstructor.add(frame, spots=spots)
+    assert snapshot.sum() < reconstructor.ism.sum()
+
+
+def test_find_spots():
+    spots = spotLattice(19)
+    reconstructor = ISMReconstructor(shape)
+    found = reconstructor.findSpots(100 * gaussians(spots, sigma))
+    found = found[np.lexsort(found.T[::-1])]
+    np.testing.assert_allclose(found, spots, atol=0.1)
+
+
+def test_wait_for_frame_after_pattern():
+    frameBuffer = FrameRingBuffer(4)
+    frameBuffer.push(np.zeros((4, 4), dtype=np.uint16))
+
+    def pushFrames():
+        for value in range(1, 4):
+            time.sleep(0.02)
+            frameBuffer.push(np.full((4, 4), value, dtype=np.uint16))
+
+    pusher = threading.Thread(target=pushFrames)
+    pusher.start()
+    # skip the frame that is being exposed, take the next one
+    frame = frameBuffer.waitForNewFrame(frameBuffer.frameCount + 1, timeout=1)
+    pusher.join()
+    assert frame[0, 0] >= 2
+    assert frameBuffer.waitForNewFrame(frameBuffer.frameCount, timeout=0.05) is None
+
+
+def test_stack_writer(tmp_path):
+    filePath = str(tmp_path / 'ism.tif')
+    frames = np.random.randint(0, 4096, (5, 16, 24)).astype(np.uint16)
+    writer = ISMStackWriter(filePath)
+    for frame in frames:
+        writer.append(frame)
+    writer.close()
+    np.testing.assert_array_equal(tif.imread(filePath), frames)
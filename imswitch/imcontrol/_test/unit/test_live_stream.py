@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+
+from imswitch.imcontrol._test.benchmark.recording import VirtualSetup
+from imswitch.imcontrol.controller.server import LiveStreamer
+
+
+def test_live_stream_shared_encoding(qtbot):
+    setup = VirtualSetup((120, 160), frameRate=50)
+    streamer = LiveStreamer(setup.detectorsManager)
+    try:
+        client1 = streamer.addClient(quality=70, maxWidth=80, maxHeight=80)
+        client2 = streamer.addClient(quality=70, maxWidth=80, maxHeight=80)
+        client3 = streamer.addClient(quality=30)
+        assert streamer.numClients == 3
+
+        encoded1, frameNumber1 = client1.nextFrame(timeout=10)
+        assert encoded1 is not None
+        image = cv2.imdecode(np.frombuffer(encoded1, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        assert image.shape == (60, 80)  # scaled down to fit, keeping the aspect ratio
+
+        encoded2, _ = client2.nextFrame(timeout=10)
+        assert encoded2 is not None
+
+        encoded3, _ = client3.nextFrame(timeout=10)
+        image = cv2.imdecode(np.frombuffer(encoded3, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        assert image.shape == (120, 160)
+
+        # no frame is sent twice to the same client
+        for _ in range(5):
+            _, frameNumber = client1.nextFrame(timeout=10)
+            assert frameNumber > frameNumber1
+            frameNumber1 = frameNumber
+
+        stats = streamer.getStats()
+        assert stats['clients'] == 3
+        assert stats['framesSent'] >= 8
+        assert stats['framesEncoded'] <= stats['framesSent']
+        assert stats['encoderCPUTimeS'] >= 0
+        assert stats['meanLatencyMs'] is not None
+
+        for client in [client1, client2, client3]:
+            client.close()
+        assert streamer.numClients == 0
+        assert client1.nextFrame(timeout=0.1) == (None, None)
+    finally:
+        streamer.stop()
+        setup.finalize()
+
+
+class FakeDetectorsManager:
+    """ Passes on only the frames that the test hands to the streamer. """
+
+    def subscribeLiveView(self, callback, maxRate=None, direct=False):
+        return object()
+
+    def unsubscribeLiveView(self, subscription):
+        pass
+
+    def startAcquisition(self, liveView=False):
+        return 0
+
+    def stopAcquisition(self, handle, liveView=False):
+        pass
+
+
+def test_live_stream_encodes_every_frame_once():
+    streamer = LiveStreamer(FakeDetectorsManager())
+    client1 = streamer.addClient(quality=70)
+    client2 = streamer.addClient(quality=70)
+    frame = np.arange(64 * 48, dtype=np.uint16).reshape(48, 64)
+
+    # clients with the same settings get the bytes that were encoded for the first one
+    streamer._onLiveViewImage('Camera', frame, False, [1, 1], True)
+    encoded1, frameNumber1 = client1.nextFrame(timeout=1)
+    encoded2, frameNumber2 = client2.nextFrame(timeout=1)
+    assert frameNumber1 == frameNumber2 == 1
+    assert encoded2 is encoded1
+    assert streamer.getStats()['framesEncoded'] == 1
+
+    # a new frame is encoded anew
+    streamer._onLiveViewImage('Camera', frame[::-1].copy(), False, [1, 1], True)
+    encoded3, frameNumber3 = client2.nextFrame(timeout=1)
+    encoded4, _ = client1.nextFrame(timeout=1)
+    assert frameNumber3 == 2
+    assert encoded3 != encoded1
+    assert encoded4 is encoded3
+    assert streamer.getStats()['framesEncoded'] == 2
+    streamer.stop()
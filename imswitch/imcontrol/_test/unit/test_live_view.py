@@ -0,0 +1,78 @@
+import time
+
+from imswitch.imcontrol._test.benchmark.recording import VirtualSetup
+
+
+def test_live_view_subscriptions(qtbot):
+    setup = VirtualSetup((64, 96), frameRate=100)
+    detectorsManager = setup.detectorsManager
+    detectorsManager.setUpdatePeriod(5)
+    try:
+        fastFrames = []
+        slowFrames = []
+        fast = detectorsManager.subscribeLiveView(
+            lambda *args: fastFrames.append(args)
+        )
+        slow = detectorsManager.subscribeLiveView(
+            lambda *args: slowFrames.append(args), maxRate=5
+        )
+
+        handle = detectorsManager.startAcquisition(liveView=True)
+        try:
+            qtbot.waitUntil(lambda: len(fastFrames) >= 10, timeout=10000)
+            time.sleep(0.5)
+            qtbot.waitUntil(lambda: len(slowFrames) >= 2, timeout=10000)
+        finally:
+            detectorsManager.stopAcquisition(handle, liveView=True)
+
+        detectorName, image, init, scale, isCurrentDetector = fastFrames[-1]
+        assert detectorName == setup.detectorName
+        assert image.shape == (64, 96)
+        assert image.flags.writeable  # subscribers get their own copy
+        assert isCurrentDetector
+
+        # the slow subscriber is limited to its max rate
+        assert slow.numSkipped > 0
+        assert len(slowFrames) < len(fastFrames)
+
+        # nothing is passed on once the deliveries queued before stopping have arrived
+        qtbot.wait(200)
+        numFrames = len(fastFrames)
+        qtbot.wait(200)
+        assert len(fastFrames) == numFrames
+        assert setup.camera.frameBuffer.frameCount >= numFrames
+
+        detectorsManager.unsubscribeLiveView(fast)
+        detectorsManager.unsubscribeLiveView(slow)
+    finally:
+        setup.finalize()
+
+
+def test_slow_direct_subscriber_does_not_stall_others():
+    setup = VirtualSetup((64, 96), frameRate=100)
+    detectorsManager = setup.detectorsManager
+    detectorsManager.setUpdatePeriod(5)
+    try:
+        fastFrames = []
+        slowFrames = []
+        fast = detectorsManager.subscribeLiveView(
+            lambda *args: fastFrames.append(args), direct=True
+        )
+        slow = detectorsManager.subscribeLiveView(
+            lambda *args: slowFrames.append(args) or time.sleep(0.2), direct=True
+        )
+
+        handle = detectorsManager.startAcquisition(liveView=True)
+        try:
+            time.sleep(1)
+        finally:
+            detectorsManager.stopAcquisition(handle, liveView=True)
+        detectorsManager.unsubscribeLiveView(fast)
+        detectorsManager.unsubscribeLiveView(slow)
+
+        # frames for the busy subscriber are skipped, the other one gets them
+        assert len(fastFrames) >= 4 * len(slowFrames) > 0
+        assert slow.numSkipped > 0
+        assert fast.numSkipped < slow.numSkipped
+    finally:
+        setup.finalize()
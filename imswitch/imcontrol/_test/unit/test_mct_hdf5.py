@@ -0,0 +1,40 @@
+import h5py
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.controller.controllers.MCTController import HDF5File
+
+
+def test_hdf5file_appends_and_closes(tmp_path):
+    filename = str(tmp_path / 'mct.h5')
+    h5File = HDF5File(filename=filename, init_dims=(1, 2, 3, 16, 24),
+                      max_dims=(None, 3, 3, None, None))
+
+    frames = [np.random.randint(0, 4096, (2, 3, 16, 24)) for _ in range(3)]
+    for timepoint, frame in enumerate(frames):
+        positions = [(timepoint, 1, 2), (timepoint, 3, 4)]
+        h5File.append_data(timepoint, frame, np.array(positions))
+    # frames with X/Y swapped are transposed
+    h5File.append_data(3, np.swapaxes(frames[0], 2, 3), np.array([(0, 0, 0)]))
+    h5File.close()
+
+    with h5py.File(filename, 'r') as file:
+        data = file['ImageData']
+        assert data.shape == (4, 2, 3, 16, 24)
+        for timepoint, frame in enumerate(frames):
+            np.testing.assert_array_equal(data[timepoint], frame)
+        np.testing.assert_array_equal(data[3], frames[0])
+
+        positions = file['Metadata/Positions']
+        assert list(positions.attrs['columns']) == ['timepoint', 'index', 'x', 'y', 'z']
+        assert positions.shape == (7, 5)
+        np.testing.assert_array_equal(positions[2], [1, 0, 1, 1, 2])
+
+
+def test_hdf5file_rejects_wrong_shape(tmp_path):
+    h5File = HDF5File(filename=str(tmp_path / 'mct.h5'), init_dims=(1, 1, 1, 16, 24))
+    try:
+        with pytest.raises(ValueError):
+            h5File.append_data(0, np.zeros((1, 1, 8, 8)), np.array([(0, 0, 0)]))
+    finally:
+        h5File.close()
@@ -1,8 +1,16 @@
+from types import SimpleNamespace
+
 import pytest
+from fastapi import HTTPException
 
 import h5py
+import numpy as np
 
-from imswitch.imcontrol.model import DetectorsManager, RecordingManager, RecMode, SaveMode
+from imswitch.imcontrol._test.benchmark.recording import VirtualSetup
+from imswitch.imcontrol.controller.controllers.RecordingController import RecordingController
+from imswitch.imcontrol.model import DetectorsManager, RecordingManager, RecMode, SaveMode, \
+    SaveFormat, Compression
+from imswitch.imcontrol.model.managers.RecordingManager import FrameQueue
 from . import detectorInfosBasic, detectorInfosMulti, detectorInfosNonSquare
 
 
@@ -90,6 +98,107 @@ def test_recording_spec_time(qtbot, detectorInfos):
         assert savedToDisk is False
 
 
+def test_frame_queue_backpressure():
+    frames = np.zeros((2, 16, 16), dtype=np.uint16)
+    queue = FrameQueue(maxBytes=2 * frames.nbytes, timeout=0.01)
+
+    assert queue.put(frames)
+    assert queue.put(frames)
+    assert not queue.put(frames)  # Full, writer did not catch up in time
+    assert queue.numQueued == 4
+    assert queue.numDropped == 2
+
+    assert queue.get() is frames
+    assert queue.put(frames)
+    queue.close()
+    assert not queue.put(frames)  # Closed queues accept no new chunks
+
+    drained = 0
+    while queue.get() is not None:
+        drained += 1
+    assert drained == 2
+    assert queue.numQueued == 0
+    assert queue.peakQueued == 4
+
+
+def test_snap_compression_level(tmpdir):
+    stores = []
+
+    class FakeStorer:
+        def __init__(self, filepath, detectorManager, compression, compressionLevel):
+            stores.append((compression, compressionLevel))
+
+        def snap(self, images, attrs):
+            pass
+
+    detectorsManager = DetectorsManager(detectorInfosBasic, updatePeriod=100)
+    recordingManager = RecordingManager(detectorsManager,
+                                        storerMap={SaveFormat.TIFF: FakeStorer})
+    recordingManager.snap(list(detectorInfosBasic), savename=str(tmpdir.join('snap')),
+                          saveFormat=SaveFormat.TIFF,
+                          compression=Compression.ZSTD, compressionLevel=7)
+    assert stores == [(Compression.ZSTD, 7)]
+
+
+def test_benchmark_compression_uses_distinct_frames(monkeypatch):
+    setup = VirtualSetup((60, 80), frameRate=100)
+    try:
+        frameBuffer = setup.detectorsManager[setup.detectorName].getFrameBuffer()
+        frameIds = []
+        waitForNewFrame = frameBuffer.waitForNewFrame
+
+        def recordFrameId(frameCount, **kwargs):
+            frame, frameId = waitForNewFrame(frameCount, returnFrameId=True, **kwargs)
+            frameIds.append(frameId)
+            return frame
+
+        monkeypatch.setattr(frameBuffer, 'waitForNewFrame', recordFrameId)
+        results = setup.recordingManager.benchmarkCompression(
+            setup.detectorName, numFrames=5, compressions=[Compression.ZSTD]
+        )
+    finally:
+        setup.finalize()
+
+    assert len(frameIds) == 5
+    assert len(set(frameIds)) == 5
+    assert results['ZSTD']['ratio'] > 0
+
+
+class FrameDetectorsManager:
+    """ Detectors manager with a single detector that returns frame. """
+
+    def __init__(self, frame):
+        self.detector = SimpleNamespace(getFrameBuffer=lambda: None, getLatestFrame=lambda: frame)
+
+    def getCurrentDetectorName(self):
+        return 'Camera'
+
+    def getAllDeviceNames(self):
+        return ['Camera']
+
+    def __getitem__(self, detectorName):
+        return self.detector
+
+    def startAcquisition(self):
+        return 0
+
+    def stopAcquisition(self, handle):
+        pass
+
+
+@pytest.mark.parametrize('kwargs', [{'x': 10}, {'y': 12, 'height': 4}, {'binning': 0}])
+def test_snap_numpy_binary_rejects_invalid_requests(kwargs):
+    controller = SimpleNamespace(_master=SimpleNamespace(
+        detectorsManager=FrameDetectorsManager(np.zeros((12, 10), dtype=np.uint16))
+    ))
+    with pytest.raises(HTTPException) as excInfo:
+        RecordingController.snapNumpyBinary(controller, **kwargs)
+    assert excInfo.value.status_code == 400
+
+    response = RecordingController.snapNumpyBinary(controller, x=8, y=10, width=4)
+    assert response.headers['X-Image-Shape'] == '2,2'
+
+
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -0,0 +1,33 @@
+import copy
+
+from imswitch.imcontrol.model import RecMode, SaveFormat
+from imswitch.imcontrol._test.benchmark.recording import compareResults, runBenchmark
+
+
+def test_benchmark_runs(qtbot, tmp_path):
+    results = runBenchmark(recModes=[RecMode.SpecFrames], saveFormats=[SaveFormat.HDF5],
+                           frameSizes=[(64, 96)], numFrames=20, directory=tmp_path)
+
+    assert len(results['runs']) == 1
+    run = results['runs'][0]
+    assert run['frameSize'] == [64, 96]
+    assert run['framesWritten'] == 20
+    assert run['framesPerSecond'] > 0
+    assert run['peakRSSMB'] > 0
+    for stage in ['grab', 'queue', 'write']:
+        assert run['latency'][stage]['count'] > 0
+
+
+def test_benchmark_compare():
+    baseline = {'runs': [{
+        'recMode': 'SpecFrames', 'saveFormat': 'HDF5', 'frameSize': [64, 96],
+        'framesPerSecond': 100.0, 'framesDroppedRecording': 0, 'framesDroppedCamera': 0
+    }]}
+
+    results = copy.deepcopy(baseline)
+    results['runs'][0]['framesPerSecond'] = 90.0
+    assert compareResults(results, baseline, tolerance=0.2) == []
+
+    results['runs'][0]['framesPerSecond'] = 70.0
+    results['runs'][0]['framesDroppedCamera'] = 5
+    assert len(compareResults(results, baseline, tolerance=0.2)) == 2
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from scipy.ndimage import fourier_shift, gaussian_filter
+
+from imswitch.imcontrol.controller.controllers.camera_stage_mapping.camera_stage_tracker import Tracker
+from imswitch.imcontrol.model.registration import ImageRegistration, registerImages
+
+
+@pytest.fixture(scope='module')
+def sample():
+    return gaussian_filter(np.random.default_rng(0).random((400, 480)), 3) * 1000
+
+
+def shiftImage(image, shift):
+    return np.fft.ifft2(fourier_shift(np.fft.fft2(image), shift)).real
+
+
+@pytest.mark.parametrize('options', [{}, {'numLevels': 3}, {'pad': True, 'window': False}])
+@pytest.mark.parametrize('shift', [(3.3, -7.6), (-20.25, 15.5), (0.1, 0)])
+def test_subpixel_shift(sample, options, shift):
+    reference = sample[50:306, 60:316]
+    noise = np.random.default_rng(1).normal(0, 5, reference.shape)
+    image = shiftImage(sample, shift)[50:306, 60:316] + noise
+    result = registerImages(reference, image, **options)
+    np.testing.assert_allclose(result.shift, shift, atol=0.2)
+    assert 0.5 < result.confidence <= 1
+
+
+def test_multiple_rois(sample):
+    registration = ImageRegistration(sample, rois=[(100, 100), (200, 300), (0, 0)], roiSize=96)
+    assert registration.hasReference
+    results = registration.register(shiftImage(sample, (2.5, -1.5)))
+    assert [result.roi for result in results] == [(100, 100), (200, 300), (48, 48)]
+    for result in results:
+        np.testing.assert_allclose(result.shift, (2.5, -1.5), atol=0.1)
+
+    unrelated = gaussian_filter(np.random.default_rng(2).random(sample.shape), 3) * 1000
+    assert all(result.confidence < 0.5 for result in registration.register(unrelated))
+
+    with pytest.raises(ValueError):
+        registration.register(sample[:200])
+    with pytest.raises(ValueError):
+        ImageRegistration().register(sample)
+
+
+def test_tracker_registration_method(sample):
+    images = [sample[100:228, 100:228], shiftImage(sample, (4, -6))[100:228, 100:228]]
+    tracker = Tracker(lambda: images[0], lambda: np.zeros(3), settle=lambda: None,
+                      method='registration')
+    tracker.acquire_template()
+    np.testing.assert_allclose(tracker.max_displacement, (128, 128))
+    np.testing.assert_allclose(tracker.track_image(images[1]), (-4, 6), atol=0.2)
@@ -0,0 +1,99 @@
+import h5py
+import numpy as np
+import pytest
+from scipy.special import erf
+
+from imswitch.imcontrol.controller.controllers.smlm import (
+    HistogramRenderer, LocalizationStore, SMLMLocalizer
+)
+
+
+def simulateFrame(shape, positions, photons=2000, background=10, sigma=1.3, seed=0):
+    """ Returns a frame with Poisson noise of integrated Gaussian spots. """
+    def integrated(length, position):
+        pixels = np.arange(length)
+        norm = np.sqrt(2) * sigma
+        return 0.5 * (erf((pixels - position + 0.5) / norm) - erf((pixels - position - 0.5) / norm))
+
+    expected = np.full(shape, float(background))
+    for x, y in positions:
+        expected += photons * np.outer(integrated(shape[0], y), integrated(shape[1], x))
+    return np.random.default_rng(seed).poisson(expected).astype(np.uint16)
+
+
+@pytest.mark.parametrize('method', SMLMLocalizer.methods)
+def test_localization_accuracy(method):
+    rng = np.random.default_rng(1)
+    grid = np.stack(np.meshgrid(np.arange(12, 116, 16), np.arange(12, 116, 16)), -1)
+    positions = grid.reshape(-1, 2) + rng.uniform(-0.5, 0.5, (grid.size // 2, 2))
+    frame = simulateFrame((128, 128), positions)
+
+    localizer = SMLMLocalizer(threshold=0.3, roiSize=7, psfSigma=1.3, method=method)
+    localizations = localizer.localize(frame, frameIndex=3)
+    assert set(localizations) == set(SMLMLocalizer.columns)
+    assert len(localizations['x']) == len(positions)
+    assert np.all(localizations['frame'] == 3)
+
+    found = np.stack([localizations['x'], localizations['y']], -1)
+    distances = np.linalg.norm(found[:, None] - positions[None], axis=-1).min(axis=1)
+    assert np.median(distances) < 0.15
+    assert np.all(localizations['crlb'] > 0) and np.all(localizations['crlb'] < 0.1)
+    if method == 'gaussian':
+        assert np.median(localizations['sigma']) == pytest.approx(1.3, abs=0.1)
+        assert np.median(localizations['photons']) == pytest.approx(2000, rel=0.1)
+
+
+def test_localizer_pool():
+    frame = simulateFrame((64, 64), [(20.3, 30.6), (45.1, 12.8)])
+    localizer = SMLMLocalizer()
+    try:
+        futures = [localizer.submit(frame, index) for index in range(4)]
+        results = [future.result(timeout=10) for future in futures]
+    finally:
+        localizer.shutdown()
+    assert [result['frame'][0] for result in results] == [0, 1, 2, 3]
+    np.testing.assert_array_equal(results[0]['x'], results[3]['x'])
+
+
+def test_store_grows_and_flushes(tmp_path):
+    store = LocalizationStore(capacity=4)
+    localizations = {name: np.arange(3, dtype=dtype)
+                     for name, dtype in LocalizationStore.columns.items()}
+    filePath = tmp_path / 'localizations.h5'
+
+    store.append(localizations)
+    assert store.flushHDF5(filePath) == 3
+    store.append(localizations)
+    store.append(localizations)
+    assert len(store) == 9
+    np.testing.assert_array_equal(store['x'], np.tile(np.arange(3), 3))
+    with pytest.raises(ValueError):
+        store['x'][0] = 1  # Columns are read-only views
+
+    assert store.flushHDF5(filePath) == 6
+    assert store.flushHDF5(filePath) == 0
+    with h5py.File(filePath, 'r') as file:
+        np.testing.assert_array_equal(file['localizations/frame'][:], store['frame'])
+        assert file['localizations/x'].dtype == np.float32
+
+    store.clear()
+    assert len(store) == 0
+
+
+def test_histogram_renderer():
+    renderer = HistogramRenderer((10, 20), pixelSize=100, renderPixelSize=25)
+    assert renderer.magnification == 4
+    assert renderer.image.shape == (40, 80)
+
+    renderer.add([0, 0, 19.3], [0, 0, 9.4])
+    renderer.add([-5], [2])  # Outside, ignored
+    assert renderer.image.sum() == 3
+    assert renderer.image[2, 2] == 2
+    assert renderer.image[39, 79] == 1
+
+    store = LocalizationStore()
+    store.append({name: np.array([5, 5], dtype=dtype)
+                  for name, dtype in LocalizationStore.columns.items()})
+    renderer.setRenderPixelSize(50)
+    assert renderer.render(store).shape == (20, 40)
+    assert renderer.image[11, 11] == 2 and renderer.image.sum() == 2
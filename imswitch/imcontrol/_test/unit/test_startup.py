@@ -0,0 +1,53 @@
+import inspect
+
+import pytest
+
+from imswitch.imcommon.model.startup import StartupProfiler, startupProfiler
+from imswitch.imcontrol.controller import controllers
+from imswitch.imcontrol.model import managers
+
+
+@pytest.mark.parametrize('name', list(controllers.controllerRegistry))
+def test_controller_registry_resolves(name):
+    value = controllers.controllerRegistry.load(name)
+    assert inspect.isclass(value) and value.__name__ == name or inspect.ismodule(value)
+    assert getattr(controllers, name) is value
+
+
+@pytest.mark.parametrize('name', list(managers.managerRegistry))
+def test_manager_registry_resolves(name):
+    try:
+        value = managers.managerRegistry.load(name)
+    except ModuleNotFoundError as e:
+        pytest.skip(str(e))
+    assert inspect.isclass(value) and value.__name__ == name
+
+
+def test_unknown_name_raises_attribute_error():
+    with pytest.raises(AttributeError):
+        controllers.controllerRegistry.load('NoSuchController')
+    assert not hasattr(managers, 'NoSuchManager')
+
+
+def test_startup_profiler(monkeypatch):
+    profiler = StartupProfiler()
+    with profiler.measure('import', 'disabled'):
+        pass
+    assert profiler.records == []
+
+    profiler.enabled = True
+    with profiler.measure('init', 'outer'):
+        with profiler.measure('import', 'inner'):
+            pass
+    assert [(kind, name) for kind, name, _ in profiler.records] == [('import', 'inner'),
+                                                                    ('init', 'outer')]
+    assert profiler.records[1][2] >= profiler.records[0][2]
+    report = profiler.report().splitlines()
+    assert report[1].split()[:2] == ['init', 'outer']
+
+    # modules loaded through a registry are recorded by the shared profiler
+    monkeypatch.setattr(startupProfiler, 'enabled', True)
+    monkeypatch.setattr(startupProfiler, '_records', [])
+    managers.managerRegistry.load('MockXXManager')
+    assert startupProfiler.records[0][:2] == ('import',
+                                              'imswitch.imcontrol.model.managers.MockXXManager')
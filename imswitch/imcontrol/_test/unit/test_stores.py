@@ -1,10 +1,13 @@
 from dataclasses import dataclass
 import os
 import pytest
-from imswitch.imcontrol.model.managers.RecordingManager import ZarrStorer, HDF5Storer, TiffStorer
+from imswitch.imcontrol.model.managers.RecordingManager import ZarrStorer, HDF5Storer, TiffStorer, \
+    ChunkedStreamWriter, Compression, CompressorPool, getCompressionCodec, cropAndBinFrame, \
+    encodeFrame, decodeFrame
 from imswitch.imcontrol.model.managers.DetectorsManager import DetectorsManager
 import numpy as np
 import zarr
+import h5py
 
 
 @dataclass
@@ -43,4 +46,87 @@ def test_hdf5_storer(tmpdir, fake_manager):
     path = os.path.join(tmpdir, "test")
     storer = HDF5Storer(path, {"test_channel": fake_manager})
     storer.snap({"test_channel": np.zeros((100,100))}, {"test_channel": {"test": 3}})
-    assert os.path.exists(path + "_test_channel.h5"), "path does not exist"
\ No newline at end of file
+    assert os.path.exists(path + "_test_channel.h5"), "path does not exist"
+
+
+@pytest.mark.parametrize('expectedFrames', [None, 50])
+def test_chunked_stream_writer_hdf5(tmpdir, expectedFrames):
+    """Test that streamed frames keep their dtype and the dataset is trimmed to the written frames"""
+    frames = np.arange(37 * 64 * 48, dtype=np.uint16).reshape(37, 64, 48)
+    with h5py.File(os.path.join(tmpdir, "test.h5"), "w") as file:
+        stream = ChunkedStreamWriter(file, "data", {"detector_name": "test"},
+                                     expectedFrames=expectedFrames)
+        for start in range(0, len(frames), 5):
+            stream.write(frames[start:start + 5])
+        stream.close()
+
+        dataset = file["data"]
+        assert dataset.dtype == np.uint16
+        assert dataset.chunks == ChunkedStreamWriter.getChunkShape((64, 48), np.uint16)
+        assert dataset.attrs["writing"] == False
+        np.testing.assert_array_equal(dataset[:], frames)
+
+
+def test_chunked_stream_writer_zarr(tmpdir):
+    """Test that the stream writer fills and trims a zarr dataset"""
+    frames = np.ones((7, 32, 32), dtype=np.float32)
+    root = zarr.group(store=zarr.storage.DirectoryStore(os.path.join(tmpdir, "test.zarr")))
+    stream = ChunkedStreamWriter(root, "data")
+    stream.write(frames)
+    stream.close()
+    assert root["data"].shape == (7, 32, 32)
+    assert root["data"].dtype == np.float32
+
+
+@pytest.mark.parametrize('compression', [c for c in Compression if c != Compression.DEFAULT])
+def test_chunked_stream_writer_compressed_hdf5(tmpdir, monkeypatch, compression):
+    """Test that chunks compressed on the pool can be read back through the HDF5 filters"""
+    pytest.importorskip("hdf5plugin")
+    frames = np.random.default_rng(0).integers(0, 200, (23, 64, 48), dtype=np.uint16)
+    monkeypatch.setattr(ChunkedStreamWriter, "targetChunkBytes", 64 * 48 * 2 * 4)  # Last chunk partial
+    pool = CompressorPool(getCompressionCodec(compression), numWorkers=4)
+    with h5py.File(os.path.join(tmpdir, "test.h5"), "w") as file:
+        stream = ChunkedStreamWriter(file, "data", compression=compression, pool=pool)
+        for start in range(0, len(frames), 3):
+            stream.write(frames[start:start + 3])
+        stream.close()
+        pool.shutdown()
+        assert file["data"].chunks == (4, 64, 48)
+        np.testing.assert_array_equal(file["data"][:], frames)
+
+
+def test_chunked_stream_writer_compressed_zarr(tmpdir):
+    """Test that zarr datasets use the selected codec"""
+    frames = np.ones((9, 32, 32), dtype=np.uint16)
+    pool = CompressorPool(getCompressionCodec(Compression.ZSTD), numWorkers=2)
+    root = zarr.group(store=zarr.storage.DirectoryStore(os.path.join(tmpdir, "test.zarr")))
+    stream = ChunkedStreamWriter(root, "data", compression=Compression.ZSTD, pool=pool)
+    stream.write(frames)
+    stream.close()
+    pool.shutdown()
+    assert root["data"].compressor.codec_id == "zstd"
+    np.testing.assert_array_equal(root["data"][:], frames)
+
+
+@pytest.mark.parametrize("compression", [Compression.DEFAULT, Compression.LZ4, Compression.ZSTD])
+def test_frame_encoding(compression):
+    """Test that binary snapshots keep the bit depth through cropping, binning and compression"""
+    frame = np.arange(12 * 10, dtype=np.uint16).reshape(12, 10) * 500
+    cropped = cropAndBinFrame(frame, roi=(1, 2, 8, 9), binning=2)
+    assert cropped.dtype == np.uint16
+    assert cropped.shape == (4, 4)  # The last row of the ROI does not fill a block
+    np.testing.assert_array_equal(cropped[0, 0], frame[2:4, 1:3].mean())
+
+    data, applied = encodeFrame(cropped, compression)
+    assert applied == compression
+    np.testing.assert_array_equal(decodeFrame(data, cropped.dtype.str, cropped.shape, applied.name),
+                                  cropped)
+
+    with pytest.raises(ValueError):
+        cropAndBinFrame(frame, binning=20)
+    with pytest.raises(ValueError):
+        cropAndBinFrame(frame, binning=0)
+    with pytest.raises(ValueError):
+        cropAndBinFrame(frame, roi=(10, 0, 4, 4))  # starts right of the frame
+    with pytest.raises(ValueError):
+        cropAndBinFrame(frame, roi=(0, 12, 4, 4))  # starts below the frame
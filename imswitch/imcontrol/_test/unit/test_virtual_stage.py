@@ -0,0 +1,155 @@
+import time
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol._test.benchmark.recording import VirtualSetup
+from imswitch.imcontrol.model.managers.rs232.VirtualMicroscopeManager import TrapezoidalMove
+
+
+@pytest.fixture
+def setup():
+    setup = VirtualSetup((60, 80))
+    yield setup
+    setup.finalize()
+
+
+def test_trapezoidal_move():
+    move = TrapezoidalMove(10.0, 0, 100, speed=50, acceleration=100)
+    # 0.5 s to accelerate over 12.5, 1.5 s at speed over 75, 0.5 s to decelerate
+    assert move.duration == pytest.approx(2.5)
+    np.testing.assert_allclose(move.positionAt([9.0, 10.5, 11.0, 12.0, 12.5, 13.0]),
+                               [0, 12.5, 37.5, 87.5, 100, 100])
+
+    short = TrapezoidalMove(0.0, 10, 8, speed=50, acceleration=100)  # triangular profile
+    assert short.duration == pytest.approx(2 * np.sqrt(2 / 100))
+    assert short.positionAt(short.duration / 2) == pytest.approx(9)
+
+    assert TrapezoidalMove(0.0, 0, 5).duration == 0
+    move.stop(11.0)
+    assert move.endPosition == pytest.approx(37.5)
+
+
+def test_blocking_and_non_blocking_moves(setup):
+    stage = setup.positionersManager[setup.positionerName]
+    positioner = stage._positioner
+    positioner.maxSpeed['X'] = 1000
+    positioner.acceleration['X'] = 10000
+    updates = []
+    setup.commChannel.sigUpdateMotorPosition.connect(lambda: updates.append(time.time()))
+
+    start = time.time()
+    stage.move(value=200, axis='X', is_absolute=False, is_blocking=True)
+    assert time.time() - start >= 0.2
+    assert stage.getPosition()['X'] == pytest.approx(200)
+    assert len(updates) == 1  # once per move, not on every getPosition
+
+    stage.move(value=0, axis='X', is_absolute=True, is_blocking=False)
+    assert stage.isMoving('X')
+    assert 0 < stage.get_abs('X') < 200  # not the target
+    assert 0 < stage.position['X'] < 200
+    stage.stopAll()
+    assert not stage.isMoving()
+    stoppedAt = stage.getPosition()['X']
+    time.sleep(0.05)
+    assert stage.getPosition()['X'] == stoppedAt
+    assert stage.get_abs('X') == stoppedAt
+
+
+def test_moves_of_other_axes(qtbot, setup):
+    stage = setup.positionersManager[setup.positionerName]
+    positioner = stage._positioner
+    positioner.maxSpeed.update({'X': 1000, 'Y': 100})
+    positioner.acceleration.update({'X': 10000, 'Y': 10000})
+    updates = []
+    setup.commChannel.sigUpdateMotorPosition.connect(lambda: updates.append(time.time()))
+
+    # a blocking move only waits for its own axis
+    stage.move(value=50, axis='Y', is_absolute=True, is_blocking=False)
+    stage.move(value=20, axis='X', is_absolute=True, is_blocking=True)
+    assert stage.isMoving('Y')
+    assert len(updates) == 1
+
+    # stopping one axis keeps the pending update of the other
+    stage.stop_x()
+    assert len(updates) == 1
+    stage.stop_y()
+    assert len(updates) == 2
+    assert not stage.isMoving()
+
+    stage.move(value=30, axis='Y', is_absolute=True, is_blocking=False)
+    stage.move(value=0, axis='X', is_absolute=True, is_blocking=False)
+    stage.stop_x()
+    assert stage.isMoving('Y')
+    assert len(updates) == 3
+    # emitted from the timer thread, delivered by the event loop
+    qtbot.waitUntil(lambda: len(updates) == 4, timeout=1000)
+    assert not stage.isMoving('Y')
+
+
+def test_home(setup):
+    stage = setup.positionersManager[setup.positionerName]
+    stage._positioner.maxSpeed['Y'] = 1000
+    stage.move(value=100, axis='Y', is_absolute=True)
+
+    stage.doHome('Y', isBlocking=False)
+    assert stage.isMoving('Y')
+    stage.doHome('Y', isBlocking=True)
+    assert not stage.isMoving('Y')
+    assert stage.get_abs('Y') == 0
+
+
+def test_limits_and_position_history(setup):
+    stage = setup.positionersManager[setup.positionerName]
+    stage._positioner.limits['Y'] = (-50, 50)
+    start = time.time()
+    stage.move(value=(20, 80), axis='XY', is_absolute=True)
+    stop = time.time()
+    assert stage.getPosition()['Y'] == 50
+
+    times, positions = stage.getPositionHistory(start - 0.1, stop, sampleRate=10000)
+    assert positions['X'][0] == 0 and positions['X'][-1] == pytest.approx(20)
+    assert np.all(np.diff(positions['Y']) >= 0)
+    # the positions before the move are still known after later moves
+    stage.move(value=-10, axis='X', is_absolute=True)
+    np.testing.assert_allclose(stage._positioner.getPositionsAt(times, 'X'), positions['X'])
+
+
+def test_camera_samples_positions(setup):
+    camera = setup.camera
+    positioner = setup.positionersManager[setup.positionerName]._positioner
+    positioner.maxSpeed['X'] = 10000
+    positioner.acceleration['X'] = np.inf
+
+    setup.rs232sManager['VirtualMicroscope']._illuminator.set_intensity(intensity=1000)
+
+    sharp, _ = camera.renderFrame()
+    camera.setPropertyValue('exposure', 5)
+    positioner.moveForever({'X': 10000})
+    time.sleep(0.01)  # the exposure ends when the frame is rendered
+    blurred, _ = camera.renderFrame()
+    positioner.stop()
+
+    def anisotropy(frame):
+        frame = frame.astype(float)
+        return np.abs(np.diff(frame, axis=1)).mean() / np.abs(np.diff(frame, axis=0)).mean()
+
+    # the stage moved 50 pixels during the exposure, which smears the image along X
+    assert anisotropy(blurred) < 0.5 * anisotropy(sharp)
+    assert camera.lastFrameTimestamp < time.time()
+
+
+def test_psf_cache(setup, monkeypatch):
+    positioner = setup.rs232sManager['VirtualMicroscope']._positioner
+    computed = []
+    monkeypatch.setattr(positioner, 'compute_psf', lambda dz: computed.append(dz) or dz)
+    positioner.psfCacheSize = 2
+
+    # a slow sweep only computes the PSF once per psfStep
+    for dz in np.linspace(0, 2, 201):
+        positioner.get_psf(dz)
+    assert computed == [0, 1, 2]
+    assert positioner.get_psf() == 2
+    positioner.get_psf(1.2)
+    positioner.get_psf(0.1)  # evicted, the least recently used
+    assert computed == [0, 1, 2, 0]
@@ -46,6 +46,10 @@ class CommunicationChannel(SignalInterface):
 
     sigUpdateRecTime = Signal(int)  # (recTime)
 
+    sigUpdateRecFramesDropped = Signal(int)  # (numDroppedFrames)
+
+    sigUpdateRecFramesQueued = Signal(int)  # (numQueuedFrames)
+
     sigSetSnapVisualization = Signal(bool)  # for handling snap in OPT
 
     sigMemorySnapAvailable = Signal(
@@ -4,7 +4,7 @@ import h5py
 from imswitch import IS_HEADLESS
 from imswitch.imcommon.controller import MainController, PickDatasetsController
 from imswitch.imcommon.model import (
-    ostools, initLogger, generateAPI, generateShortcuts, SharedAttributes
+    ostools, initLogger, generateAPI, generateShortcuts, SharedAttributes, startupProfiler
 )
 from imswitch.imcommon.framework import Thread
 from .server import ImSwitchServer
@@ -29,8 +29,9 @@ class ImConMainController(MainController):
 
         # Init communication channel and master controller
         self.__commChannel = CommunicationChannel(self, self.__setupInfo)
-        self.__masterController = MasterController(self.__setupInfo, self.__commChannel,
-                                                   self._moduleCommChannel)
+        with startupProfiler.measure('init', 'MasterController'):
+            self.__masterController = MasterController(self.__setupInfo, self.__commChannel,
+                                                       self._moduleCommChannel)
 
         # List of Controllers for the GUI Widgets
         self.__factory = ImConWidgetControllerFactory(
@@ -53,11 +54,14 @@ class ImConMainController(MainController):
 
         for widgetKey, widget in self.__mainView.widgets.items():
             try:
-                self.controllers[widgetKey] = self.__factory.createController(
-                    (getattr(controllers, f'{widgetKey}Controller')
-                    if widgetKey != 'Scan' else
-                    getattr(controllers, f'{widgetKey}Controller{self.__setupInfo.scan.scanWidgetType}')), widget
-                )
+                # Only the controllers of the enabled widgets are imported
+                controllerName = (f'{widgetKey}Controller' if widgetKey != 'Scan' else
+                                  f'{widgetKey}Controller{self.__setupInfo.scan.scanWidgetType}')
+                controllerClass = controllers.controllerRegistry.load(controllerName)
+                with startupProfiler.measure('init', controllerName):
+                    self.controllers[widgetKey] = self.__factory.createController(
+                        controllerClass, widget
+                    )
             except Exception as e:
                 #try to get it from the plugins
                 foundPluginController = False
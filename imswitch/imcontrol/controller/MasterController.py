@@ -1,13 +1,11 @@
-from imswitch.imcommon.model import VFileItem, initLogger
+from imswitch.imcommon.model import VFileItem, initLogger, startupProfiler
 
 import pkg_resources
         
 from imswitch.imcontrol.model import (
     DetectorsManager, LasersManager, MultiManager, PositionersManager,
-    RecordingManager, RS232sManager, SLMManager, SIMManager, DPCManager, LEDMatrixsManager, MCTManager, ROIScanManager, MockXXManager, WebRTCManager, HyphaManager,
-    ISMManager, UC2ConfigManager, AutofocusManager, HistoScanManager, PixelCalibrationManager, LightsheetManager, NidaqManager, FOVLockManager,
-    StandManager, RotatorsManager, JetsonNanoManager, LEDsManager, ScanManagerBase, ScanManagerPointScan, ScanManagerMoNaLISA, FlatfieldManager, 
-    FlowStopManager
+    RecordingManager, RS232sManager, LEDMatrixsManager, NidaqManager, RotatorsManager, LEDsManager,
+    managerRegistry
 )
 
 
@@ -17,6 +15,29 @@ class MasterController:
     using the managers for each hardware set.
     """
 
+    _optionalManagers = [
+        # (attribute name, manager name, setup info field, widget name)
+        ('slmManager', 'SLMManager', 'slm', 'SLM'),
+        ('UC2ConfigManager', 'UC2ConfigManager', 'uc2Config', 'UC2Config'),
+        ('simManager', 'SIMManager', 'sim', 'SIM'),
+        ('dpcManager', 'DPCManager', 'dpc', 'DPC'),
+        ('mctManager', 'MCTManager', 'mct', 'MCT'),
+        ('roiscanManager', 'ROIScanManager', 'roiscan', 'ROIScan'),
+        ('lightsheetManager', 'LightsheetManager', 'lightsheet', 'Lightsheet'),
+        ('webrtcManager', 'WebRTCManager', 'webrtc', 'WebRTC'),
+        ('hyphaManager', 'HyphaManager', 'hypha', 'Hypha'),
+        ('MockXXManager', 'MockXXManager', 'mockxx', 'MockXX'),
+        ('jetsonnanoManager', 'JetsonNanoManager', 'jetsonnano', 'JetsonNano'),
+        ('HistoScanManager', 'HistoScanManager', 'HistoScan', 'HistoScan'),
+        ('FlowStopManager', 'FlowStopManager', 'FlowStop', 'FlowStop'),
+        ('FlatfieldManager', 'FlatfieldManager', 'Flatfield', 'Flatfield'),
+        ('PixelCalibrationManager', 'PixelCalibrationManager', 'PixelCalibration',
+         'PixelCalibration'),
+        ('AutoFocusManager', 'AutofocusManager', 'autofocus', 'Autofocus'),
+        ('FOVLockManager', 'FOVLockManager', 'fovLock', 'FOVLock'),
+        ('ismManager', 'ISMManager', 'ism', 'ISM'),
+    ]
+
     def __init__(self, setupInfo, commChannel, moduleCommChannel):
         self.__logger = initLogger(self)
         self.__setupInfo = setupInfo
@@ -46,25 +67,29 @@ class MasterController:
         self.LEDsManager = LEDsManager(self.__setupInfo.LEDs)
         #self.scanManager = ScanManager(self.__setupInfo)
         self.recordingManager = RecordingManager(self.detectorsManager)
-        self.slmManager = SLMManager(self.__setupInfo.slm)
-        self.UC2ConfigManager = UC2ConfigManager(self.__setupInfo.uc2Config, lowLevelManagers)
-        self.simManager = SIMManager(self.__setupInfo.sim)
-        self.dpcManager = DPCManager(self.__setupInfo.dpc)
-        self.mctManager = MCTManager(self.__setupInfo.mct)
         self.nidaqManager = NidaqManager(self.__setupInfo.nidaq)
-        self.roiscanManager = ROIScanManager(self.__setupInfo.roiscan)
-        self.lightsheetManager = LightsheetManager(self.__setupInfo.lightsheet)
-        self.webrtcManager = WebRTCManager(self.__setupInfo.webrtc)
-        self.hyphaManager = HyphaManager(self.__setupInfo.hypha)
-        self.MockXXManager = MockXXManager(self.__setupInfo.mockxx)
-        self.jetsonnanoManager = JetsonNanoManager(self.__setupInfo.jetsonnano)
-        self.HistoScanManager = HistoScanManager(self.__setupInfo.HistoScan)
-        self.FlowStopManager = FlowStopManager(self.__setupInfo.FlowStop)
-        self.FlatfieldManager = FlatfieldManager(self.__setupInfo.Flatfield)
-        self.PixelCalibrationManager = PixelCalibrationManager(self.__setupInfo.PixelCalibration)
-        self.AutoFocusManager = AutofocusManager(self.__setupInfo.autofocus)
-        self.FOVLockManager = FOVLockManager(self.__setupInfo.fovLock)
-        self.ismManager = ISMManager(self.__setupInfo.ism)
+
+        # The managers of optional functionality are only imported and
+        # created if the setup defines their settings or enables their widget
+        hasWidget = getattr(self.__setupInfo, 'hasWidget', lambda widget: False)
+        for attrName, managerName, infoName, widgetName in self._optionalManagers:
+            info = getattr(self.__setupInfo, infoName)
+            if info is None and not hasWidget(widgetName):
+                continue
+
+            try:
+                managerClass = managerRegistry.load(managerName)
+            except ModuleNotFoundError as e:
+                self.__logger.warning(f'{managerName} not available: {e}')
+                continue
+
+            with startupProfiler.measure('init', managerName):
+                if managerName == 'UC2ConfigManager':
+                    manager = managerClass(info, lowLevelManagers)
+                else:
+                    manager = managerClass(info)
+            setattr(self, attrName, manager)
+
         # load all implugin-related managers and add them to the class
         # try to get it from the plugins
         # If there is a imswitch_sim_manager, we want to add this as self.imswitch_sim_widget to the 
@@ -91,17 +116,18 @@ class MasterController:
             self.__logger.error(e)
             
         if self.__setupInfo.microscopeStand:
+            StandManager = managerRegistry.load('StandManager')
             self.standManager = StandManager(self.__setupInfo.microscopeStand,
                                              **lowLevelManagers)
 
         # Generate scanManager type according to setupInfo
         if self.__setupInfo.scan:
             if self.__setupInfo.scan.scanWidgetType == "PointScan":
-                self.scanManager = ScanManagerPointScan(self.__setupInfo)
+                self.scanManager = managerRegistry.load('ScanManagerPointScan')(self.__setupInfo)
             elif self.__setupInfo.scan.scanWidgetType == "Base":
-                self.scanManager = ScanManagerBase(self.__setupInfo)
+                self.scanManager = managerRegistry.load('ScanManagerBase')(self.__setupInfo)
             elif self.__setupInfo.scan.scanWidgetType == "MoNaLISA":
-                self.scanManager = ScanManagerMoNaLISA(self.__setupInfo)
+                self.scanManager = managerRegistry.load('ScanManagerMoNaLISA')(self.__setupInfo)
             else:
                 self.__logger.error(
                     'ScanWidgetType in SetupInfo["scan"] not recognized, choose one of the following:'
@@ -124,12 +150,15 @@ class MasterController:
         self.recordingManager.sigRecordingEnded.connect(cc.sigRecordingEnded)
         self.recordingManager.sigRecordingFrameNumUpdated.connect(cc.sigUpdateRecFrameNum)
         self.recordingManager.sigRecordingTimeUpdated.connect(cc.sigUpdateRecTime)
+        self.recordingManager.sigRecordingFramesDropped.connect(cc.sigUpdateRecFramesDropped)
+        self.recordingManager.sigRecordingFramesQueued.connect(cc.sigUpdateRecFramesQueued)
         self.recordingManager.sigMemorySnapAvailable.connect(cc.sigMemorySnapAvailable)
         self.recordingManager.sigMemoryRecordingAvailable.connect(cc.sigMemoryRecordingAvailable)
 
         self.recordingManager.sigMemoryRecordingAvailable.connect(self.memoryRecordingAvailable) 
             
-        self.slmManager.sigSLMMaskUpdated.connect(cc.sigSLMMaskUpdated)
+        if hasattr(self, 'slmManager'):
+            self.slmManager.sigSLMMaskUpdated.connect(cc.sigSLMMaskUpdated)
 
         self.rotatorsManager.sigRotatorPositionUpdated.connect(cc.sigRotatorPositionUpdated)
 
@@ -37,11 +37,28 @@ class LiveUpdatedController(ImConWidgetController):
     upcoming frame from the camera.  Should be either active or not, and have
     an update function. """
 
+    liveViewMaxRate = None  # Max. number of frames per second passed to update, None for all
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.active = False
-
-    def update(self, detectorName, im, init, isCurrentDetector):
+        self._liveViewSubscription = None
+
+    def subscribeLiveView(self):
+        """ Has update called with new frames of the live view, at most
+        liveViewMaxRate times per second. Frames that arrive while update is
+        still running are skipped. """
+        if self._liveViewSubscription is None:
+            self._liveViewSubscription = self._master.detectorsManager.subscribeLiveView(
+                self.update, maxRate=self.liveViewMaxRate
+            )
+
+    def unsubscribeLiveView(self):
+        if self._liveViewSubscription is not None:
+            self._master.detectorsManager.unsubscribeLiveView(self._liveViewSubscription)
+            self._liveViewSubscription = None
+
+    def update(self, detectorName, im, init, scale, isCurrentDetector):
         raise NotImplementedError
 
 
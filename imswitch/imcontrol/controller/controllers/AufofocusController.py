@@ -33,6 +33,7 @@ class AutofocusController(ImConWidgetController):
 
 
         self.isAutofusRunning = False
+        self.lastFocusResult = None
 
         if self._setupInfo.autofocus is not None:
             self.cameraName = self._setupInfo.autofocus.camera
@@ -81,6 +82,122 @@ class AutofocusController(ImConWidgetController):
                                                 daemon=True)
         self._AutofocusThead.start()
 
+    @APIExport(runOnUIThread=True)
+    def autoFocusFast(self, rangez: float = 100, speed: float = None, metric: str = 'laplacian',
+                      method: str = 'continuous', refine: bool = True, tolerance: float = 1,
+                      cropSize: int = 512, frameDelay: float = 0):
+        '''
+        Fast autofocus within -rangez...+rangez around the current position.
+        method 'continuous' sweeps the stage at constant speed (default speed of
+        the stage if None) while streaming frames, assigns every frame the
+        position interpolated at its timestamp and, if refine, sweeps again
+        slower around the peak. method 'golden' does a golden-section search
+        down to tolerance with single moves, for stages that cannot report
+        their position while moving. metric is 'laplacian', 'brenner' or
+        'tenengrad', computed on a central crop of cropSize pixels.
+        '''
+        FocusMetrics.get(metric)
+        if method not in ('continuous', 'golden'):
+            raise ValueError(f'Unknown autofocus method "{method}"')
+        self.isAutofusRunning = True
+        self._AutofocusThead = threading.Thread(
+            target=self.doAutofocusFast,
+            args=(rangez, speed, metric, method, refine, tolerance, cropSize, frameDelay),
+            daemon=True
+        )
+        self._AutofocusThead.start()
+
+    @APIExport()
+    def getAutofocusResult(self) -> dict:
+        ''' Returns the best position and the focus curve of the last fast autofocus. '''
+        return self.lastFocusResult
+
+    def doAutofocusFast(self, rangez=100, speed=None, metric='laplacian', method='continuous',
+                        refine=True, tolerance=1, cropSize=512, frameDelay=0):
+        self._commChannel.sigAutoFocusRunning.emit(True)  # inidicate that we are running the autofocus
+        metricFunction = FocusMetrics.get(metric)
+        initialPosition = self.stages.getPosition()[gAxis]
+        bestPosition = None
+        allPositions, allValues = [], []
+        try:
+            if method == 'golden':
+                def evaluate(position):
+                    if not self.isAutofusRunning:
+                        raise InterruptedError
+                    self.stages.move(value=position, axis=gAxis, is_absolute=True, is_blocking=True)
+                    crop = FrameProcessor.extract(self.grabFrameAfterMove(), cropSize)
+                    return float(metricFunction(crop))
+
+                bestPosition, evaluations = goldenSectionSearch(
+                    evaluate, initialPosition - abs(rangez), initialPosition + abs(rangez), tolerance
+                )
+                allPositions, allValues = map(list, zip(*sorted(evaluations)))
+            else:
+                sweep = FocusSweep(self.camera, self.stages, cropSize=cropSize,
+                                   frameDelay=frameDelay)
+                positions, crops = sweep.run(initialPosition - abs(rangez),
+                                             initialPosition + abs(rangez), speed)
+                if not crops:
+                    raise RuntimeError('No frames were captured while the stage moved')
+                values = metricFunction(np.stack(crops))
+                bestPosition = findFocusPeak(positions, values)
+                allPositions, allValues = list(positions), list(values)
+
+                if refine and self.isAutofusRunning and len(positions) > 1:
+                    spacing = np.median(np.diff(positions))
+                    fineRange = max(4 * spacing, 2 * tolerance)
+                    positions, crops = sweep.run(bestPosition - fineRange, bestPosition + fineRange,
+                                                 None if speed is None else speed / 4)
+                    if len(crops) > 2:
+                        values = metricFunction(np.stack(crops))
+                        bestPosition = findFocusPeak(positions, values)
+                        allPositions += list(positions)
+                        allValues += list(values)
+        except InterruptedError:
+            bestPosition = None
+        except Exception as e:
+            self.__logger.error(f'Fast autofocus failed: {e}')
+            bestPosition = None
+
+        if bestPosition is not None and self.isAutofusRunning:
+            self.stages.move(value=bestPosition, axis=gAxis, is_absolute=True, is_blocking=True)
+            order = np.argsort(allPositions)
+            self.lastFocusResult = {
+                'bestPosition': float(bestPosition),
+                'positions': np.array(allPositions)[order].tolist(),
+                'values': np.array(allValues)[order].tolist(),
+                'metric': metric, 'method': method
+            }
+            if not IS_HEADLESS:
+                self._widget.focusPlotCurve.setData(self.lastFocusResult['positions'],
+                                                    self.lastFocusResult['values'])
+        else:
+            # Return to the initial absolute position
+            self.stages.move(value=initialPosition, axis=gAxis, is_absolute=True, is_blocking=True)
+
+        # We are done!
+        self._commChannel.sigAutoFocusRunning.emit(False)
+        self.isAutofusRunning = False
+        if not IS_HEADLESS:
+            self._widget.focusButton.setText('Autofocus')
+        return bestPosition
+
+    def grabFrameAfterMove(self, timeout=1):
+        ''' Returns the first frame that was fully exposed after the stage
+        stopped, i.e. the second new frame from the frame buffer. Raises a
+        TimeoutError if it does not arrive within timeout seconds, instead of
+        returning a frame taken before the move. '''
+        frameBuffer = self.camera.getFrameBuffer()
+        if frameBuffer is None:
+            time.sleep(T_DEBOUNCE)
+            return self.grabCameraFrame()
+        # skip the frame that was being exposed while the stage stopped
+        frame = frameBuffer.waitForNewFrame(frameBuffer.frameCount + 1, timeout=timeout)
+        if frame is None:
+            self.__logger.warning(f'No new frame arrived within {timeout} s after the move')
+            raise TimeoutError(f'No new frame arrived within {timeout} s after the move')
+        return frame
+
     @APIExport(runOnUIThread=True)
     def stopAutofocus(self):
         self.isAutofusRunning = False
@@ -258,6 +375,215 @@ class FrameProcessor:
     def getAllProcessedSlices(self):
         return np.array(self.allLaplace)
 
+class FocusMetrics:
+    """ Vectorized focus metrics of an image or a stack of images (the last
+    two axes), higher is sharper. """
+
+    @staticmethod
+    def laplacianVariance(images):
+        """ Variance of the 4-neighbour Laplacian. """
+        images = np.asarray(images, dtype=np.float32)
+        laplacian = (images[..., 1:-1, :-2] + images[..., 1:-1, 2:] +
+                     images[..., :-2, 1:-1] + images[..., 2:, 1:-1] -
+                     4 * images[..., 1:-1, 1:-1])
+        return laplacian.var(axis=(-2, -1))
+
+    @staticmethod
+    def brenner(images):
+        """ Mean squared difference of pixels two columns apart. """
+        images = np.asarray(images, dtype=np.float32)
+        difference = images[..., :, 2:] - images[..., :, :-2]
+        return (difference ** 2).mean(axis=(-2, -1))
+
+    @staticmethod
+    def tenengrad(images):
+        """ Mean squared magnitude of the Sobel gradient. """
+        images = np.asarray(images, dtype=np.float32)
+        rows = images[..., :-2, :] + 2 * images[..., 1:-1, :] + images[..., 2:, :]
+        columns = images[..., :, :-2] + 2 * images[..., :, 1:-1] + images[..., :, 2:]
+        gradientX = rows[..., :, 2:] - rows[..., :, :-2]
+        gradientY = columns[..., 2:, :] - columns[..., :-2, :]
+        return (gradientX ** 2 + gradientY ** 2).mean(axis=(-2, -1))
+
+    @classmethod
+    def get(cls, name):
+        metrics = {'laplacian': cls.laplacianVariance, 'brenner': cls.brenner,
+                   'tenengrad': cls.tenengrad}
+        if name not in metrics:
+            raise ValueError(f'Unknown focus metric "{name}", expected one of {list(metrics)}')
+        return metrics[name]
+
+
+class FocusSweep:
+    """ Moves the stage at constant speed between two positions while
+    collecting the frames of the camera and samples of the stage position,
+    and assigns every frame the position interpolated at its timestamp.
+
+    Frames are taken from the camera's frame buffer as they arrive if it has
+    one (only a central crop is kept), otherwise the camera is polled. The
+    position is polled in a separate thread; if it does not change during
+    the move (stages that report only the target), the position is modelled
+    as moving linearly from start to stop during the blocking move.
+    frameDelay (in seconds) is subtracted from the frame timestamps, e.g.
+    half the exposure time plus the readout time. """
+
+    def __init__(self, camera, stage, axis=gAxis, cropSize=512, positionInterval=0.005,
+                 frameDelay=0):
+        self.camera = camera
+        self.stage = stage
+        self.axis = axis
+        self.cropSize = cropSize
+        self.positionInterval = positionInterval
+        self.frameDelay = frameDelay
+
+        self._frameBuffer = camera.getFrameBuffer()
+        self._collecting = threading.Event()
+        self._frames = []
+        self._frameTimes = []
+        self._sampleTimes = []
+        self._samplePositions = []
+
+    def run(self, start, stop, speed=None):
+        """ Sweeps from start to stop (absolute positions) and returns the
+        interpolated positions of the frames and their central crops, sorted
+        by position. """
+        self._move(start)
+        time.sleep(T_DEBOUNCE)
+        self._frames, self._frameTimes = [], []
+        self._sampleTimes, self._samplePositions = [], []
+
+        self._collecting.set()
+        if self._frameBuffer is not None:
+            self._frameBuffer.addNewFrameCallback(self._onNewFrame)
+            frameThread = None
+        else:
+            frameThread = threading.Thread(target=self._pollFrames, daemon=True)
+            frameThread.start()
+        positionThread = threading.Thread(target=self._pollPositions, daemon=True)
+        positionThread.start()
+
+        try:
+            moveStart = time.time()
+            self._move(stop, speed)
+            moveStop = time.time()
+        finally:
+            self._collecting.clear()
+            if self._frameBuffer is not None:
+                self._frameBuffer.removeNewFrameCallback(self._onNewFrame)
+            else:
+                frameThread.join()
+            positionThread.join()
+
+        frameTimes = np.array(self._frameTimes) - self.frameDelay
+        inMove = (frameTimes >= moveStart) & (frameTimes <= moveStop)
+        frameTimes = frameTimes[inMove]
+        frames = [frame for frame, keep in zip(self._frames, inMove) if keep]
+
+        sampleTimes, samplePositions = np.array(self._sampleTimes), np.array(self._samplePositions)
+        if len(samplePositions) < 2 or np.ptp(samplePositions) < 0.5 * abs(stop - start):
+            sampleTimes, samplePositions = np.array([moveStart, moveStop]), np.array([start, stop])
+        positions = self.interpolatePositions(frameTimes, sampleTimes, samplePositions)
+
+        order = np.argsort(positions)
+        return positions[order], [frames[i] for i in order]
+
+    @staticmethod
+    def interpolatePositions(frameTimes, sampleTimes, samplePositions):
+        """ Linearly interpolates the stage position at the frame times. """
+        order = np.argsort(sampleTimes)
+        return np.interp(frameTimes, np.asarray(sampleTimes)[order],
+                         np.asarray(samplePositions)[order])
+
+    def _move(self, position, speed=None):
+        kwargs = {} if speed is None else {'speed': speed}
+        self.stage.move(value=position, axis=self.axis, is_absolute=True, is_blocking=True,
+                        **kwargs)
+
+    def _crop(self, frame):
+        frame = np.asarray(frame)
+        if frame.ndim > 2:
+            frame = frame.mean(-1)
+        return np.array(FrameProcessor.extract(frame, self.cropSize), dtype=np.float32)
+
+    def _onNewFrame(self):
+        # called from the acquisition thread right after the frame was pushed
+        if not self._collecting.is_set():
+            return
+        timestamp = time.time()
+        # the crop is a copy, so a view of the buffer's slot is enough
+        frame = self._frameBuffer.getLast(copy=False)
+        if frame is not None:
+            self._frames.append(self._crop(frame))
+            self._frameTimes.append(timestamp)
+
+    def _pollFrames(self):
+        lastFrame = None
+        while self._collecting.is_set():
+            frame = self.camera.getLatestFrame()
+            timestamp = time.time()
+            if frame is None or frame is lastFrame:
+                time.sleep(0.001)
+                continue
+            lastFrame = frame
+            crop = self._crop(frame)
+            if self._frames and np.array_equal(crop, self._frames[-1]):
+                time.sleep(0.001)
+                continue  # same frame as before
+            self._frames.append(crop)
+            self._frameTimes.append(timestamp)
+
+    def _pollPositions(self):
+        while self._collecting.is_set():
+            timeBefore = time.time()
+            position = self.stage.getPosition()[self.axis]
+            self._sampleTimes.append((timeBefore + time.time()) / 2)
+            self._samplePositions.append(position)
+            time.sleep(self.positionInterval)
+
+
+def findFocusPeak(positions, values, numNeighbours=2):
+    """ Returns the position of the maximum of the focus curve, refined by
+    fitting a parabola to the values around the largest one. """
+    positions, values = np.asarray(positions, dtype=float), np.asarray(values, dtype=float)
+    if len(values) == 0:
+        raise ValueError('No focus values')
+    iMax = int(np.argmax(values))
+    lower, upper = max(iMax - numNeighbours, 0), min(iMax + numNeighbours + 1, len(values))
+    if upper - lower < 3 or np.ptp(positions[lower:upper]) == 0:
+        return positions[iMax]
+    a, b, _ = np.polyfit(positions[lower:upper], values[lower:upper], 2)
+    if a >= 0:
+        return positions[iMax]  # not a maximum
+    return float(np.clip(-b / (2 * a), positions[lower], positions[upper - 1]))
+
+
+def goldenSectionSearch(function, lower, upper, tolerance=1., maxEvaluations=50):
+    """ Returns the position of the maximum of a unimodal function between
+    lower and upper, within tolerance, together with all evaluated
+    (position, value) pairs. """
+    invPhi = (np.sqrt(5) - 1) / 2
+    evaluations = []
+
+    def evaluate(position):
+        value = function(position)
+        evaluations.append((position, value))
+        return value
+
+    a, b = lower, upper
+    c, d = b - invPhi * (b - a), a + invPhi * (b - a)
+    valueC, valueD = evaluate(c), evaluate(d)
+    while abs(b - a) > tolerance and len(evaluations) < maxEvaluations:
+        if valueC > valueD:
+            b, d, valueD = d, c, valueC
+            c = b - invPhi * (b - a)
+            valueC = evaluate(c)
+        else:
+            a, c, valueC = c, d, valueD
+            d = a + invPhi * (b - a)
+            valueD = evaluate(d)
+    return (a + b) / 2, evaluations
+
+
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
 #
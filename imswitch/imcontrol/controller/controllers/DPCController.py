@@ -313,15 +313,19 @@ class DPCProcessor(object):
         self.wavelength = .53
         self.rotation = [0, 180, 90, 270]    
         
-        self.dpc_solver_obj = DPCSolver(shape=self.shape, wavelength=self.wavelength, na=self.NA, NAi=self.NAi, pixelsize=self.pixelsize, rotation=self.rotation)
-        #parameters for Tikhonov regurlarization [absorption, phase] ((need to tune this based on SNR)
-        self.dpc_solver_obj.setTikhonovRegularization(reg_u = 1e-1, reg_p = 5e-3)
+        self.createSolver()
         
         # stack to store the individual DPC images
         self.stack = []
+
+    def createSolver(self):
+        self.dpc_solver_obj = DPCSolver(shape=self.shape, wavelength=self.wavelength, na=self.NA, NAi=self.NAi, pixelsize=self.pixelsize, rotation=self.rotation)
+        #parameters for Tikhonov regurlarization [absorption, phase] ((need to tune this based on SNR)
+        self.dpc_solver_obj.setTikhonovRegularization(reg_u = 1e-1, reg_p = 5e-3)
         
     def setParameters(self, dpc_info_dict):
         # uses parameters from GUI
+        previous = (self.pixelsize, self.NA, self.NAi, self.wavelength)
         self.pixelsize = dpc_info_dict["pixelsize"]
         self.NA= dpc_info_dict["NA"]
         self.NAi = dpc_info_dict["NAi"]
@@ -329,6 +333,12 @@ class DPCProcessor(object):
         self.wavelength = dpc_info_dict["wavelength"]
         self.rotation = [0, 180, 90, 270] 
         self.dpc_num = 4
+        if (self.pixelsize, self.NA, self.NAi, self.wavelength) != previous:
+            # the inverse filters of known parameters are taken from the cache
+            self.createSolver()
+
+    def getLatencyStats(self):
+        return self.dpc_solver_obj.getLatencyStats()
         
     def addFrameToStack(self, frame):
         '''
@@ -365,7 +375,8 @@ class DPCProcessor(object):
         # initialize the model
         try:
             self._logger.debug("Processing frames")
-            qdpc_result = self.dpc_solver_obj.solve(dpc_imgs=self.stackToReconstruct)
+            qdpc_result = self.dpc_solver_obj.solveFast(dpc_imgs=self.stackToReconstruct)
+            self._logger.debug(f"Reconstructed in {self.dpc_solver_obj.latencies[-1]*1000:.1f} ms")
 
             # save images eventually
             if isRecording:
@@ -397,13 +408,39 @@ from os import listdir
 from skimage import io
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import numpy as np
+import scipy.fft
+from collections import OrderedDict, deque
 from scipy.ndimage import uniform_filter
 
 class DPCSolver:
-    def __init__(self, shape, wavelength, na, NAi, pixelsize, rotation):
+    """ Tikhonov-regularized qDPC reconstruction of absorption and phase.
+
+    solve() is the reference implementation. solveFast() gives the same
+    result in single precision for live reconstruction: the inverse filters
+    of the Tikhonov solution are computed once per (shape, optics,
+    rotations, regularization) and cached for all solvers, so that a set of
+    images takes one batched rfft2 of all rotations, a multiply-add with the
+    filters and one batched irfft2 for absorption and phase, into work
+    buffers that are reused. The processing time of every set is kept in
+    latencies. """
+
+    maxCachedFilters = 8
+    numFiltersComputed = 0
+    _filters = OrderedDict()
+    _filtersLock = threading.Lock()
+
+    def __init__(self, shape, wavelength, na, NAi, pixelsize, rotation, normalization='local',
+                 workers=-1):
         self.shape = shape
         if self.shape[0] == 0:
             self.shape = (512, 512)
+        self.shape = tuple(self.shape[-2:])
+        # 'local' divides by the mean over half the image size, 'mean' by the image mean
+        self.normalizationMode = normalization
+        self.workers = workers  # FFT threads, -1 for all CPUs
+        self.latencies = deque(maxlen=1000)
+        self.numSolved = 0
+        self._buffers = None
             
         self.wavelength = wavelength
         self.na         = na
@@ -420,6 +457,109 @@ class DPCSolver:
     def setTikhonovRegularization(self, reg_u = 1e-6, reg_p = 1e-6):
         self.reg_u      = reg_u
         self.reg_p      = reg_p
+
+    def getInverseFilters(self):
+        """ Returns the filters that map the spectra of the normalized images
+        to the spectra of absorption and phase, as an array of shape
+        (2, dpc_num, height, width//2+1) on the half spectrum of rfft2. They
+        are made Hermitian, so that only the real part of the solution,
+        which solve() keeps, is computed. """
+        key = (self.shape, float(self.wavelength), float(self.na), float(self.NAi),
+               float(self.pixel_size), tuple(self.rotation), float(self.reg_u), float(self.reg_p))
+        with DPCSolver._filtersLock:
+            filters = DPCSolver._filters.get(key)
+            if filters is not None:
+                DPCSolver._filters.move_to_end(key)
+                return filters
+
+        AHA         = [(self.Hu.conj()*self.Hu).sum(axis=0)+self.reg_u, (self.Hu.conj()*self.Hp).sum(axis=0),
+                       (self.Hp.conj()*self.Hu).sum(axis=0)           , (self.Hp.conj()*self.Hp).sum(axis=0)+self.reg_p]
+        determinant = AHA[0]*AHA[3]-AHA[1]*AHA[2]
+        filters = np.asarray([(AHA[3]*self.Hu.conj()-AHA[1]*self.Hp.conj())/determinant,
+                              (AHA[0]*self.Hp.conj()-AHA[2]*self.Hu.conj())/determinant])
+        # G(-k) in the unshifted layout of the FFT
+        mirrored = np.roll(np.flip(filters, axis=(-2, -1)), 1, axis=(-2, -1))
+        filters = (filters + mirrored.conj()) / 2
+        filters = np.ascontiguousarray(filters[..., :self.shape[1]//2+1], dtype=np.complex64)
+
+        with DPCSolver._filtersLock:
+            DPCSolver.numFiltersComputed += 1
+            DPCSolver._filters[key] = filters
+            while len(DPCSolver._filters) > DPCSolver.maxCachedFilters:
+                DPCSolver._filters.popitem(last=False)
+        return filters
+
+    @classmethod
+    def clearCache(cls):
+        with cls._filtersLock:
+            cls._filters.clear()
+
+    def solveFast(self, dpc_imgs):
+        """ Like solve(), but in single precision with the cached inverse
+        filters. dpc_imgs holds sets of dpc_num images, one per rotation.
+        Returns absorption+1j*phase for every set as complex64. """
+        dpc_imgs = np.asarray(dpc_imgs)
+        if dpc_imgs.shape[-2:] != self.shape:
+            raise ValueError(f'Expected images of shape {self.shape}, got {dpc_imgs.shape[-2:]}')
+        filters = self.getInverseFilters()
+        numSets = dpc_imgs.shape[0]//self.dpc_num
+        dpc_result = np.empty((numSets, *self.shape), dtype=np.complex64)
+        for frame_index in range(numSets):
+            start = time.perf_counter()
+            images = self._normalize(dpc_imgs[frame_index*self.dpc_num:(frame_index+1)*self.dpc_num])
+            spectra = scipy.fft.rfft2(images, workers=self.workers)
+            products = self._buffers['products']
+            np.multiply(filters, spectra[naxis], out=products)
+            absorption, phase = scipy.fft.irfft2(products.sum(axis=1), s=self.shape,
+                                                 overwrite_x=True, workers=self.workers)
+            dpc_result[frame_index].real = absorption
+            dpc_result[frame_index].imag = phase
+            self.latencies.append(time.perf_counter() - start)
+            self.numSolved += 1
+        return dpc_result
+
+    def solveStream(self, frames):
+        """ Reconstructs a stream of frames, e.g. a timelapse, in which every
+        dpc_num consecutive frames are one set of rotations. Yields the
+        result of every set together with its processing time in seconds as
+        soon as its last frame arrived. """
+        dpc_imgs = []
+        for frame in frames:
+            dpc_imgs.append(frame)
+            if len(dpc_imgs) == self.dpc_num:
+                yield self.solveFast(dpc_imgs)[0], self.latencies[-1]
+                dpc_imgs = []
+
+    def getLatencyStats(self):
+        """ Returns statistics of the processing times of the last sets of
+        solveFast(), in milliseconds. """
+        latencies = np.asarray(self.latencies) * 1000
+        return {
+            'numSolved': self.numSolved,
+            'lastLatencyMs': float(latencies[-1]) if len(latencies) else None,
+            'meanLatencyMs': float(latencies.mean()) if len(latencies) else None,
+            'maxLatencyMs': float(latencies.max()) if len(latencies) else None
+        }
+
+    def _normalize(self, images):
+        """ normalization() of one set of images in a reused float32
+        buffer. """
+        if self._buffers is None:
+            height, width = self.shape
+            self._buffers = {
+                'images': np.empty((self.dpc_num, height, width), dtype=np.float32),
+                'background': np.empty((self.dpc_num, height, width), dtype=np.float32),
+                'products': np.empty((2, self.dpc_num, height, width//2+1), dtype=np.complex64)
+            }
+        buffer = self._buffers['images']
+        buffer[...] = images
+        if self.normalizationMode == 'local':
+            size = self.shape[0]//2
+            uniform_filter(buffer, size=(1, size, size), output=self._buffers['background'])
+            buffer /= self._buffers['background']
+        buffer /= buffer.mean(axis=(1, 2), keepdims=True)  # normalize intensity with DC term
+        buffer -= 1.0                                      # subtract the DC term
+        return buffer
         
     def normalization(self):
         for img in self.dpc_imgs:
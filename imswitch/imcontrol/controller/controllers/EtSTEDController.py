@@ -2,7 +2,9 @@ from typing import List, Union
 
 import os
 import sys
-import ctypes
+import json
+import time
+import threading
 import importlib
 import enum
 import h5py
@@ -21,11 +23,13 @@ try:
 except:
     IS_TKINTER = False
 
+from imswitch.imcommon.framework import Signal
 from imswitch.imcommon.model import APIExport
 from imswitch.imcontrol.model import configfiletools
 from imswitch.imcommon.model import dirtools
 from imswitch.imcontrol.view import guitools
 from ..basecontrollers import ImConWidgetController
+from .etsted import EventPipelineWorker, LatencyMetrics
 from imswitch.imcommon.model import initLogger
 from imswitch import IS_HEADLESS
 
@@ -34,36 +38,15 @@ if not IS_HEADLESS:
 _logsDir = os.path.join(dirtools.UserFileDirs.Root, 'recordings', 'logs_etsted')
 
 
-# HIGH-RES TIMING FUNCTIONS FROM https://stackoverflow.com/questions/38319606/how-can-i-get-millisecond-and-microsecond-resolution-timestamps-in-python/38319607#38319607
-def micros():
-    "return a timestamp in microseconds (us)"
-    tics = ctypes.c_int64()
-    freq = ctypes.c_int64()
-
-    #get ticks on the internal ~2MHz QPC clock
-    ctypes.windll.Kernel32.QueryPerformanceCounter(ctypes.byref(tics)) 
-    #get the actual freq. of the internal ~2MHz QPC clock
-    ctypes.windll.Kernel32.QueryPerformanceFrequency(ctypes.byref(freq))  
-    
-    t_us = tics.value*1e6/freq.value
-    return t_us
-    
-def millis():
-    "return a timestamp in milliseconds (ms)"
-    tics = ctypes.c_int64()
-    freq = ctypes.c_int64()
-
-    #get ticks on the internal ~2MHz QPC clock
-    ctypes.windll.Kernel32.QueryPerformanceCounter(ctypes.byref(tics)) 
-    #get the actual freq. of the internal ~2MHz QPC clock 
-    ctypes.windll.Kernel32.QueryPerformanceFrequency(ctypes.byref(freq)) 
-    
-    t_ms = tics.value*1e3/freq.value
-    return t_ms
+class EtSTEDController(ImConWidgetController):
+    """ Linked to EtSTEDWidget.
 
+    The analysis pipeline runs in a worker process (EventPipelineWorker)
+    that always gets the newest frame of the fast modality; its results are
+    handled in handlePipelineResult(). The latencies from a frame to the
+    start of the event scan are kept as histograms in LatencyMetrics. """
 
-class EtSTEDController(ImConWidgetController):
-    """ Linked to EtSTEDWidget."""
+    sigPipelineResult = Signal(object)  # (PipelineResult)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -104,6 +87,7 @@ class EtSTEDController(ImConWidgetController):
         self._widget.setBusyFalseButton.clicked.connect(self.setBusyFalse)
         self._commChannel.sigSendScanParameters.connect(lambda analogParams, digitalParams, positionersScan: self.assignScanParameters(analogParams, digitalParams, positionersScan))
         self._commChannel.sigSendScanFreq.connect(lambda scanFreq: self.logScanFreq(scanFreq))
+        self.sigPipelineResult.connect(self.handlePipelineResult)
 
         # initiate log for each detected event
         self.resetDetLog()
@@ -112,8 +96,6 @@ class EtSTEDController(ImConWidgetController):
         self.__runMode = RunMode.Experiment
         self.__running = False
         self.__validating = False
-        self.__busy = False
-        self.__bkg = None
         self.__prevFrames = deque(maxlen=10)
         self.__prevAnaFrames = deque(maxlen=10)
         self.__binary_mask = None
@@ -122,9 +104,18 @@ class EtSTEDController(ImConWidgetController):
         self.__init_frames = 5
         self.__validationFrames = 0
         self.__frame = 0
-        self.t_call = 0
         self.__maxAnaImgVal = 0
 
+        # pipeline worker process and latency metrics
+        self.__worker = None
+        self.__forwardThread = None
+        self.__stopForwarding = threading.Event()
+        self.__metrics = LatencyMetrics()
+        self.__frameId = 0  # ID of the next frame handed to the worker
+        self.__firstFrameId = 0  # results of earlier frames are from before the last pause
+        self.__frameShape = None
+        self.__scanStartTime = None
+
 
     def initiate(self):
         """ Initiate or stop an etSTED experiment. """
@@ -159,6 +150,8 @@ class EtSTEDController(ImConWidgetController):
             # load selected coordinate transform
             self.loadTransform()
             self.__transformCoeffs = self.__coordTransformHelper.getTransformCoeffs()
+            self.__metrics.reset()
+            self.configurePipelineWorker()
             # connect communication channel signals and turn on wf laser
             self._commChannel.sigUpdateImage.connect(self.runPipeline)
             if self.scanInitiationMode == ScanInitiationMode.ScanWidget:
@@ -188,7 +181,8 @@ class EtSTEDController(ImConWidgetController):
 
     def scanEnded(self):
         """ End an etSTED slow method scan. """
-        self.setDetLogLine("scan_end",datetime.now().strftime('%Ss%fus'))
+        if self.__scanStartTime is not None:
+            self.setDetLogLine("scan_duration_s", time.perf_counter() - self.__scanStartTime)
         if self.scanInitiationMode == ScanInitiationMode.ScanWidget:
             self._commChannel.sigSnapImg.emit()
             frame_period = self.scanInfoDict['scan_samples_frame'] * 10e-6  # length (s) of total scan signal
@@ -205,7 +199,7 @@ class EtSTEDController(ImConWidgetController):
 
     def runSlowScan(self):
         """ Run a scan of the slow method (STED). """
-        self.__detLog[f"scan_start"] = datetime.now().strftime('%Ss%fus')
+        self.__scanStartTime = time.perf_counter()
         if self.scanInitiationMode == ScanInitiationMode.RecordingWidget:
             # Run recording from RecWidget
             self.triggerRecordingWidgetScan()
@@ -214,12 +208,13 @@ class EtSTEDController(ImConWidgetController):
         """ Save an etSTED slow method scan. """
         self.setDetLogLine("pipeline", self.getPipelineName())
         self.logPipelineParamVals()
-        # save log file with temporal info of trigger event
+        self.setDetLogLine("latency_histograms", self.__metrics.summary())
+        # save log file with the coordinates and latencies of the trigger event
         filename = datetime.utcnow().strftime('%Hh%Mm%Ss%fus')
         name = os.path.join(_logsDir, filename) + '_log'
-        log = [f'{key}: {self.__detLog[key]}' for key in self.__detLog]
-        with open(f'{name}.txt', 'w') as f:
-            [f.write(f'{st}\n') for st in log]
+        os.makedirs(_logsDir, exist_ok=True)
+        with open(f'{name}.json', 'w') as f:
+            json.dump(self.__detLog, f, indent=2, default=float)
         self.resetDetLog()
 
     def getTransformName(self):
@@ -248,6 +243,7 @@ class EtSTEDController(ImConWidgetController):
         """ Continue the fast method, after an event scan has been performed. """
         if self._widget.endlessScanCheck.isChecked() and not self.__running:
             # connect communication channel signals
+            self.configurePipelineWorker()
             self._commChannel.sigUpdateImage.connect(self.runPipeline)
             self._master.lasersManager.execOn(self.laserFast, lambda l: l.setEnabled(True))
             
@@ -273,6 +269,8 @@ class EtSTEDController(ImConWidgetController):
         """ Load the selected analysis pipeline, and its parameters into the GUI. """
         self.__pipelinename = self.getPipelineName()
         self.pipeline = getattr(importlib.import_module(f'{self.__pipelinename}'), f'{self.__pipelinename}')
+        # the worker runs the previously loaded pipeline
+        self.stopPipelineWorker()
         self.__pipeline_params = signature(self.pipeline).parameters
         self._widget.initParamFields(self.__pipeline_params)
 
@@ -351,7 +349,8 @@ class EtSTEDController(ImConWidgetController):
         self._master.detectorsManager.setUpdatePeriod(self.__updatePeriod)
 
     def setBusyFalse(self):
-        self.__busy = False
+        """ Restart the pipeline worker, e.g. if the pipeline hangs. """
+        self.stopPipelineWorker()
 
     def assignScanParameters(self, analogParams, digitalParams, positionersScan):
         """ Assign scan parameters from the scanning widget. """
@@ -375,9 +374,7 @@ class EtSTEDController(ImConWidgetController):
         self.__detLog = dict()
         self.__detLog = {
             "pipeline": "",
-            "pipeline_start": "",
-            "pipeline_end": "",
-            "coord_transf_start": "",
+            "latencies_ms": {},
             "fastscan_x_center": 0,
             "fastscan_y_center": 0,
             "slowscan_x_center": 0,
@@ -394,100 +391,152 @@ class EtSTEDController(ImConWidgetController):
         self.__maxAnaImgVal = 0
 
     def runPipeline(self, detectorName, img, init, scale, isCurrentDetector):
-        """ If detector is detectorFast: run the analyis pipeline, called after every fast method frame. """
+        """ If detector is detectorFast: hand the frame to the analysis pipeline worker, called after every fast method frame. """
         if detectorName == self.detectorFast:
-            if not self.__busy:
-                t_sincelastcall = millis() - self.t_call
-                self.t_call = millis()
-                self.setDetLogLine("pipeline_rep_period", str(t_sincelastcall))
-                self.setDetLogLine("pipeline_start", datetime.now().strftime('%Ss%fus'))
-                self.__busy = True
-                t_pre = millis()
-                if self.__runMode == RunMode.Visualize or self.__runMode == RunMode.Validate:
-                    coords_detected, self.__exinfo, img_ana = self.pipeline(img, self.__prevFrames, self.__binary_mask, (self.__runMode==RunMode.Visualize or self.__runMode==RunMode.Validate), self.__exinfo, *self.__param_vals)
-                else:
-                    coords_detected, self.__exinfo = self.pipeline(img, self.__prevFrames, self.__binary_mask, self.__runMode==RunMode.Visualize, self.__exinfo, *self.__param_vals)
-                t_post = millis()
-                self.setDetLogLine("pipeline_end", datetime.now().strftime('%Ss%fus'))
-                #self.__logger.debug(f'Pipeline time: {t_post-t_pre} ms')
-                #self.__logger.debug(coords_detected)
-
-                if self.__frame > self.__init_frames:
-                    # run if the initial frames have passed
-                    #self.__logger.debug(self.__runMode)
-                    if self.__runMode == RunMode.Visualize:
-                        self.updateScatter(coords_detected, clear=True)
-                        self.setAnalysisHelpImg(img_ana, self.__exinfo)
-                    elif self.__runMode == RunMode.Validate:
-                        self.updateScatter(coords_detected, clear=True)
-                        self.setAnalysisHelpImg(img_ana)
-                        if self.__validating:
-                            if self.__validationFrames > 5:
-                                self.saveValidationImages(prev=True, prev_ana=True)
-                                self.pauseFastModality()
-                                self.endRecording()
-                                self.continueFastModality()
-                                self.__frame = 0
-                                self.__validating = False
-                            self.__validationFrames += 1
-                        elif coords_detected.size != 0:
-                            # if some events where detected
-                            if np.size(coords_detected) > 2:
-                                coords_scan = coords_detected[0,:]
-                            else:
-                                coords_scan = coords_detected[0]
-                            # log detected center coordinate
-                            self.setDetLogLine("fastscan_x_center", coords_scan[0])
-                            self.setDetLogLine("fastscan_y_center", coords_scan[1])
-                            # log all detected coordinates
-                            if np.size(coords_detected) > 2:
-                                for i in range(np.size(coords_detected,0)):
-                                    self.setDetLogLine("det_coord_x_", coords_detected[i,0], i)
-                                    self.setDetLogLine("det_coord_y_", coords_detected[i,1], i)
-                            self.__validating = True
-                            self.__validationFrames = 0
-                    elif coords_detected.size != 0:
-                        # if some events were detected
-                        if np.size(coords_detected) > 2:
-                            coords_scan = np.copy(coords_detected[0,:])
-                        else:
-                            coords_scan = np.copy(coords_detected[0])
-                        self.setDetLogLine("prepause", datetime.now().strftime('%Ss%fus'))
-                        coords_scan = np.flip(np.copy(coords_scan))
-                        self.setDetLogLine("fastscan_x_center", coords_scan[0])
-                        self.setDetLogLine("fastscan_y_center", coords_scan[1])
-                        coords_scan[1] = np.shape(img)[0] - coords_scan[1]
+            img = np.asarray(img)
+            if self.__worker is not None and (img.shape != self.__worker.frameShape or
+                                              img.dtype != self.__worker.dtype):
+                self.stopPipelineWorker()
+            if self.__worker is None:
+                self.startPipelineWorker(img.shape, img.dtype)
+            self.__frameShape = img.shape
+            self.__prevFrames.append(img)
+            self.__worker.submit(img, self.__frameId)
+            self.__frameId += 1
+
+    def startPipelineWorker(self, frameShape, dtype):
+        """ Start a worker process that runs the loaded analysis pipeline on frames of the given shape. """
+        self.__worker = EventPipelineWorker(self.__pipelinename,
+                                            [self._widget.analysisDir, self._widget.transformDir],
+                                            frameShape, dtype)
+        self.__worker.start()
+        self.configurePipelineWorker()
+        self.__stopForwarding.clear()
+        self.__forwardThread = threading.Thread(target=self.forwardPipelineResults,
+                                                args=(self.__worker,), daemon=True)
+        self.__forwardThread.start()
+
+    def stopPipelineWorker(self):
+        if self.__worker is None:
+            return
+        self.__stopForwarding.set()
+        self.__forwardThread.join()
+        self.__worker.stop()
+        self.__worker = None
+
+    def configurePipelineWorker(self):
+        """ Pass the current parameters to the pipeline worker, and ignore the results of frames from before. """
+        self.__firstFrameId = self.__frameId
+        self.__frame = 0
+        if self.__worker is not None:
+            testMode = self.__runMode == RunMode.Visualize or self.__runMode == RunMode.Validate
+            self.__worker.reset()
+            self.__worker.configure(self.__binary_mask, testMode, self.__param_vals)
+
+    def forwardPipelineResults(self, worker):
+        """ Record the latencies of the pipeline results and forward them to handlePipelineResult(), runs in a thread. """
+        while not self.__stopForwarding.is_set():
+            result = worker.getResult(timeout=0.1)
+            if result is None:
+                continue
+            if result.error is None:
+                self.__metrics.record('frameArrival', result.startTime - result.putTime)
+                self.__metrics.record('pipeline', result.endTime - result.startTime)
+                self.__metrics.record('resultReturn', time.perf_counter() - result.endTime)
+            self.__metrics.setDroppedFrames(worker.numDropped)
+            self.sigPipelineResult.emit(result)
+
+    def handlePipelineResult(self, result):
+        """ Handle the detected events of a fast method frame. """
+        if result.error is not None:
+            self.__logger.error(f'Analysis pipeline failed on frame {result.frameId}: {result.error}')
+            return
+        if not self.__running or result.frameId < self.__firstFrameId:
+            return
+
+        coords_detected, img_ana = result.coords, result.analysedImage
+        self.__exinfo = result.exinfo
+        latencies = self.__detLog["latencies_ms"]
+        latencies["frameArrival"] = 1e3 * (result.startTime - result.putTime)
+        latencies["pipeline"] = 1e3 * (result.endTime - result.startTime)
+
+        if self.__frame > self.__init_frames:
+            # run if the initial frames have passed
+            if self.__runMode == RunMode.Visualize:
+                self.updateScatter(coords_detected, clear=True)
+                self.setAnalysisHelpImg(img_ana, self.__exinfo)
+            elif self.__runMode == RunMode.Validate:
+                self.updateScatter(coords_detected, clear=True)
+                self.setAnalysisHelpImg(img_ana)
+                if self.__validating:
+                    if self.__validationFrames > 5:
+                        self.saveValidationImages(prev=True, prev_ana=True)
                         self.pauseFastModality()
-                        self.setDetLogLine("coord_transf_start", datetime.now().strftime('%Ss%fus'))
-                        coords_center_scan = self.transform(coords_scan, self.__transformCoeffs)
-                        self.setDetLogLine("slowscan_x_center", coords_center_scan[0])
-                        self.setDetLogLine("slowscan_y_center", coords_center_scan[1])
-                        self.setDetLogLine("scan_initiate", datetime.now().strftime('%Ss%fus'))
-                        # save all detected coordinates in the log
-                        if np.size(coords_detected) > 2:
-                            for i in range(np.size(coords_detected,0)):
-                                self.setDetLogLine("det_coord_x_", coords_scan[0], i)
-                                self.setDetLogLine("det_coord_y_", coords_scan[1], i)
-                        
-                        #self.__logger.debug(coords_scan)
-                        #self.__logger.debug(coords_center_scan)
-                        self.initiateSlowScan(position=coords_center_scan)
-                        self.runSlowScan()
-
-                        # update scatter plot of event coordinates in the shown fast method image
-                        self.updateScatter(np.flip(np.copy(coords_detected)), clear=True)
-
-                        self.__prevFrames.append(img)
-                        self.saveValidationImages(prev=True, prev_ana=False)
-                        self.__exinfo = None
-                        self.__busy = False
-                        return
-                self.__bkg = img
-                self.__prevFrames.append(img)
-                if self.__runMode == RunMode.Validate:
-                    self.__prevAnaFrames.append(img_ana)
-                self.__frame += 1
-                self.setBusyFalse()
+                        self.endRecording()
+                        self.continueFastModality()
+                        self.__frame = 0
+                        self.__validating = False
+                    self.__validationFrames += 1
+                elif coords_detected.size != 0:
+                    # if some events where detected
+                    if np.size(coords_detected) > 2:
+                        coords_scan = coords_detected[0,:]
+                    else:
+                        coords_scan = coords_detected[0]
+                    # log detected center coordinate
+                    self.setDetLogLine("fastscan_x_center", coords_scan[0])
+                    self.setDetLogLine("fastscan_y_center", coords_scan[1])
+                    # log all detected coordinates
+                    if np.size(coords_detected) > 2:
+                        for i in range(np.size(coords_detected,0)):
+                            self.setDetLogLine("det_coord_x_", coords_detected[i,0], i)
+                            self.setDetLogLine("det_coord_y_", coords_detected[i,1], i)
+                    self.__validating = True
+                    self.__validationFrames = 0
+            elif coords_detected.size != 0:
+                # if some events were detected
+                if np.size(coords_detected) > 2:
+                    coords_scan = np.copy(coords_detected[0,:])
+                else:
+                    coords_scan = np.copy(coords_detected[0])
+                coords_scan = np.flip(np.copy(coords_scan))
+                self.setDetLogLine("fastscan_x_center", coords_scan[0])
+                self.setDetLogLine("fastscan_y_center", coords_scan[1])
+                coords_scan[1] = self.__frameShape[0] - coords_scan[1]
+                self.pauseFastModality()
+                t_transform = time.perf_counter()
+                coords_center_scan = self.transform(coords_scan, self.__transformCoeffs)
+                self.__metrics.record('coordTransform', time.perf_counter() - t_transform)
+                latencies["coordTransform"] = 1e3 * (time.perf_counter() - t_transform)
+                self.setDetLogLine("slowscan_x_center", coords_center_scan[0])
+                self.setDetLogLine("slowscan_y_center", coords_center_scan[1])
+                # save all detected coordinates in the log
+                if np.size(coords_detected) > 2:
+                    for i in range(np.size(coords_detected,0)):
+                        self.setDetLogLine("det_coord_x_", coords_scan[0], i)
+                        self.setDetLogLine("det_coord_y_", coords_scan[1], i)
+
+                self.initiateSlowScan(position=coords_center_scan)
+                self.runSlowScan()
+                self.__metrics.record('scanStart', self.__scanStartTime - result.putTime)
+                latencies["scanStart"] = 1e3 * (self.__scanStartTime - result.putTime)
+
+                # update scatter plot of event coordinates in the shown fast method image
+                self.updateScatter(np.flip(np.copy(coords_detected)), clear=True)
+
+                self.saveValidationImages(prev=True, prev_ana=False)
+                self.__exinfo = None
+                return
+        if self.__runMode == RunMode.Validate:
+            self.__prevAnaFrames.append(img_ana)
+        self.__frame += 1
+
+    @APIExport()
+    def getLatencyMetrics(self) -> dict:
+        """ Returns the statistics of the latencies (in ms) of the stages
+        from a fast method frame to the start of the event scan, and the
+        number of frames dropped because the pipeline was busy. """
+        return self.__metrics.summary()
 
     def initiateSlowScan(self, position=[0.0,0.0,0.0]):
         """ Initiate a STED scan. """
@@ -589,7 +638,8 @@ class EtSTEDController(ImConWidgetController):
             self.__running = False
 
     def closeEvent(self):
-        pass
+        if self._setupInfo.etSTED is not None:
+            self.stopPipelineWorker()
 
 
 class EtSTEDCoordTransformHelper():
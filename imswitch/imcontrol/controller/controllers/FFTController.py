@@ -9,6 +9,7 @@ class FFTController(LiveUpdatedController):
     """ Linked to FFTWidget."""
 
     sigImageReceived = Signal()
+    liveViewMaxRate = 10
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -25,9 +26,6 @@ class FFTController(LiveUpdatedController):
         self.sigImageReceived.connect(self.imageComputationWorker.computeFFTImage)
         self.imageComputationThread.start()
 
-        # Connect CommunicationChannel signals
-        self._commChannel.sigUpdateImage.connect(self.update)
-        
         # Connect FFTWidget signals
         self._widget.sigShowToggled.connect(self.setShowFFT)
         self._widget.sigPosToggled.connect(self.setShowPos)
@@ -49,6 +47,10 @@ class FFTController(LiveUpdatedController):
         """ Show or hide FFT. """
         self.active = enabled
         self.init = False
+        if enabled:
+            self.subscribeLiveView()
+        else:
+            self.unsubscribeLiveView()
 
     def setShowPos(self, enabled):
         """ Show or hide lines. """
@@ -20,6 +20,7 @@ import threading
 
 from imswitch.imcommon.framework import Thread, Timer
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.registration import ImageRegistration, registerImages
 from ..basecontrollers import ImConWidgetController
 
 
@@ -247,11 +248,13 @@ class ProcessDataThread(Thread):
         self.fovLockMetric = None
         self.latestimg = None
         self.lastimg = None
+        # the FFT template of the reference frame is computed once per lock
+        self.registration = ImageRegistration(roiSize=512, upsampleFactor=10)
         
     def setInitialFrame(self):
-        detectorManager = self._controller._master.detectorsManager[self._controller.camera]
-        self.latestimg = detectorManager.getLatestFrame()
+        self.grabCameraFrame()
         self.lastimg = self.latestimg.copy()
+        self.registration.setReference(self.lastimg)
         return self.lastimg
 
     def grabCameraFrame(self):
@@ -267,35 +270,18 @@ class ProcessDataThread(Thread):
         self.fovLockMetric = fovlockMetric
 
     def update(self, twoFociVar):
-        def extract(marray, crop_size):
-            if len(marray.shape)==3:
-                marray = np.mean(marray, -1)
-            center_x, center_y = marray.shape[1] // 2, marray.shape[0] // 2
-
-            # Calculate the starting and ending indices for cropping
-            x_start = center_x - crop_size // 2
-            x_end = x_start + crop_size
-            y_start = center_y - crop_size // 2
-            y_end = y_start + crop_size
-
-            # Crop the center region
-            return marray[y_start:y_end, x_start:x_end]
-
-
-        self.latestimg = extract(self.latestimg, 512)
         # Load images
-        if self.lastimg is None:
+        if self.lastimg is None or not self.registration.hasReference:
             self.lastimg = self.latestimg.copy()
+            self.registration.setReference(self.lastimg)
 
         if 0:
             pixelShift = self.find_shift_feature_based(self.lastimg, self.latestimg)
             print(f"Shift (Feature-Based): {pixelShift}")
         elif 1:
-            img1 = np.float32(self.lastimg)
-            img2 = np.float32(self.latestimg)
-
-            # Compute cross correlation
-            (pixelShiftX, pixelShiftY), pixelShift = cv2.phaseCorrelate(img1, img2)
+            # Compute cross correlation of the central crop with the reference
+            result = self.registration.register(self.latestimg)[0]
+            (pixelShiftY, pixelShiftX), pixelShift = result.shift, result.confidence
         else:
             pixelShift = 0
 
@@ -349,7 +335,7 @@ class FOVCalibThread(object):
 
     def calculate_pixel_shift(self, img1, img2):
         self._controller._logger.info('Calculating pixel shift')
-        (pixelShiftX, pixelShiftY), pixelShift = cv2.phaseCorrelate(np.float32(img1), np.float32(img2))    
+        pixelShiftY, pixelShiftX = registerImages(img1, img2).shift
         self._controller._logger.info('Done')
         return pixelShiftX, pixelShiftY
     
@@ -1,6 +1,8 @@
 import json
+import math
 import os
 import base64
+import queue
 from fastapi import FastAPI, Response, HTTPException
 from imswitch import IS_HEADLESS
 from  imswitch.imcontrol.controller.controllers.camera_stage_mapping import OFMStageMapping
@@ -14,7 +16,6 @@ import cv2
 import numpy as np
 from skimage.io import imsave
 from scipy.ndimage import gaussian_filter
-from collections import deque
 import ast
 import skimage.transform
 import skimage.util
@@ -30,6 +31,9 @@ from pydantic import BaseModel
 from typing import List, Optional, Union
 from PIL import Image
 import io
+import zarr
+from ome_zarr.writer import write_multiscales_metadata
+from ome_zarr.format import format_from_version
             
 try:
     from ashlar.scripts.ashlar import process_images
@@ -59,6 +63,8 @@ class HistoScanController(LiveUpdatedController):
     
         self.histoscanTask = None
         self.histoscanStack = np.ones((1,1,1))
+        self.histoStitcher = None  # stitcher of the last scan, serves the canvas tiles
+        self._stitchedImagePNG = (None, None)  # (stack, encoded) for getLastStitchedImage
 
         # read offset between cam and microscope from config file in µm
         self.offsetCamMicroscopeX = -2500 #  self._master.HistoScanManager.offsetCamMicroscopeX
@@ -709,22 +715,21 @@ class HistoScanController(LiveUpdatedController):
 
     @APIExport()
     def getLastStitchedImage(self) -> Response:
-        histoscanStack = self.histoscanStack.copy()
+        histoscanStack = self.histoscanStack
         if histoscanStack is not None and len(histoscanStack.shape)>1:
-            #_, buffer = cv2.imencode('.png', histoscanStack)
-            #image_base64 = base64.b64encode(buffer).decode('utf-8')
-            #return image_base64
-            
-            # using an in-memory image
-            im = Image.fromarray(histoscanStack)
-            
-            # save image to an in-memory bytes buffer
-            # save image to an in-memory bytes buffer
-            with io.BytesIO() as buf:
-                im = im.convert('L')  # convert image to 'L' mode
-                im.save(buf, format='PNG')
-                im_bytes = buf.getvalue()
-                
+            # the result only changes at the end of a scan, so it is encoded only once
+            lastStack, im_bytes = self._stitchedImagePNG
+            if lastStack is not histoscanStack:
+                # using an in-memory image
+                im = Image.fromarray(histoscanStack)
+
+                # save image to an in-memory bytes buffer
+                with io.BytesIO() as buf:
+                    im = im.convert('L')  # convert image to 'L' mode
+                    im.save(buf, format='PNG')
+                    im_bytes = buf.getvalue()
+                self._stitchedImagePNG = (histoscanStack, im_bytes)
+
             headers = {'Content-Disposition': 'inline; filename="histo.png"'}
             return Response(im_bytes, headers=headers, media_type='image/png')
 
@@ -732,7 +737,52 @@ class HistoScanController(LiveUpdatedController):
         else:
             raise HTTPException(status_code=404, detail="No image found")
 
-                
+    def _getCanvas(self):
+        if self.histoStitcher is None or self.histoStitcher.canvas is None:
+            raise HTTPException(status_code=404, detail="No stitching canvas found")
+        return self.histoStitcher.canvas
+
+    def _encodeCanvasImage(self, image, maxValue):
+        # stretch to 8 bit with the brightest value of all tiles, so that tiles match
+        image = np.uint8(np.clip(image.astype(np.float32) * (255 / max(maxValue, 1)), 0, 255))
+        _, buffer = cv2.imencode('.png', image)
+        return Response(buffer.tobytes(), media_type='image/png')
+
+    @APIExport()
+    def getStitchedCanvasInfo(self) -> dict:
+        """ Returns the layout of the multiscale canvas of the last (or current)
+        scan: the shape of every level, the tile size and the number of tiles
+        stitched so far. """
+        canvas = self._getCanvas()
+        return {"path": canvas.path, "numLevels": canvas.numLevels,
+                "levelShapes": [list(canvas.levelShape(level)) for level in range(canvas.numLevels)],
+                "tileSize": canvas.tileSize, "pixelSize": canvas.pixelSize,
+                "numTiles": canvas.numTiles, "maxValue": canvas.maxValue}
+
+    @APIExport()
+    def getStitchedTile(self, level: int = 0, row: int = 0, column: int = 0) -> Response:
+        """ Returns one tile of the canvas' tile grid at the given level as
+        8 bit PNG; only the chunks of the tile are read. """
+        canvas = self._getCanvas()
+        if not 0 <= level < canvas.numLevels:
+            raise HTTPException(status_code=400, detail=f"Level has to be in 0..{canvas.numLevels - 1}")
+        return self._encodeCanvasImage(canvas.getTile(level, row, column), canvas.maxValue)
+
+    @APIExport()
+    def getStitchedViewport(self, x: int = 0, y: int = 0, width: int = 1024, height: int = 1024,
+                            maxSize: int = 1024) -> Response:
+        """ Returns the region (in pixels of full resolution) of the canvas as
+        8 bit PNG, read from the coarsest level that still has at least
+        maxSize pixels along the longer side of the region. """
+        canvas = self._getCanvas()
+        if width <= 0 or height <= 0:
+            raise HTTPException(status_code=400, detail="Width and height have to be positive")
+        level = canvas.levelForScale(maxSize / max(width, height))
+        factor = 2 ** level
+        region = canvas.getRegion(level, y // factor, x // factor,
+                                  max(1, height // factor), max(1, width // factor))
+        return self._encodeCanvasImage(region, canvas.maxValue)
+
     def histoscanThread(self, minPosX, maxPosX, minPosY, maxPosY, overlap=0.75, nTimes=1, 
                         tPeriod=0, positionList=None,
                         flipX=False, flipY=False, tSettle=0.05, 
@@ -791,6 +841,7 @@ class HistoScanController(LiveUpdatedController):
                                      nChannels=nChannels, file_name=file_name, extension=extension, flatfieldImage=flatfieldImage,
                                      flipX=flipX, flipY=flipY, isStitchAshlar=isStitchAshlar, pixel_size=self.microscopeDetector.pixelSizeUm[0], 
                                      resolution_scale=resizeFactor)
+            self.histoStitcher = stitcher
             
             # move to the first position
             self.stages.move(value=positionList[0], axis="XY", is_absolute=True, is_blocking=True, acceleration=(self.acceleration,self.acceleration))
@@ -867,7 +918,8 @@ class HistoScanController(LiveUpdatedController):
                         iPosPix = (posX_pix_value, posY_pix_value)
                         #stitcher._place_on_canvas(np.copy(mFrame), np.copy(iPosPix))
                         stitcher.add_image(np.copy(mFrame), np.copy(iPosPix), metadata.copy())
-                    threading.Thread(target=addImage, args=(mFrame,iPos)).start()
+                    # only queues the frame, the stitcher writes it in its own thread
+                    addImage(mFrame, iPos)
 
                 except Exception as e:
                     self._logger.error(e)
@@ -950,6 +1002,160 @@ class HistoScanController(LiveUpdatedController):
 
 
 
+class PyramidCanvas:
+    """ Stitching canvas stored as a chunked OME-NGFF (Zarr) multiscale
+    image, so that its size is limited by the disk instead of the RAM.
+
+    Level 0 has the full resolution, every further level half the size of
+    the previous one, down to the first level that fits in one tile (or
+    down to level minLevels - 1 if that is further). Tiles
+    are added with addTile() and written by a single background thread,
+    which blends them into level 0 and updates only the affected region of
+    the lower resolution levels, so the pyramid is always up to date.
+    getRegion() reads only the chunks of the requested region and level.
+
+    blending is 'feather' (linear cross-fade over blendWidth pixels from
+    the tile edges into what is already on the canvas), 'max' or
+    'overwrite'. """
+
+    def __init__(self, path, shape, tileSize=512, numLevels=None, minLevels=1, dtype=np.uint16,
+                 pixelSize=1., blending='feather', blendWidth=None):
+        if blending not in ('feather', 'max', 'overwrite'):
+            raise ValueError(f'Unknown blending "{blending}"')
+        self.path = path
+        self.shape = tuple(int(length) for length in shape[:2])
+        self.tileSize = tileSize
+        self.dtype = np.dtype(dtype)
+        self.pixelSize = pixelSize
+        self.blending = blending
+        self.blendWidth = blendWidth
+        if numLevels is None:
+            numLevels = 1
+            while max(self.shape) / 2 ** (numLevels - 1) > tileSize or numLevels < minLevels:
+                numLevels += 1
+        self.numLevels = numLevels
+        self.numTiles = 0
+        self.maxValue = 0
+        self.__logger = initLogger(self, tryInheritParent=False)
+
+        root = zarr.group(store=zarr.storage.DirectoryStore(path), overwrite=True)
+        self.levels = []
+        datasets = []
+        for level in range(numLevels):
+            levelShape = tuple(max(1, math.ceil(length / 2 ** level)) for length in self.shape)
+            self.levels.append(root.zeros(str(level), shape=levelShape,
+                                          chunks=(tileSize, tileSize), dtype=self.dtype,
+                                          write_empty_chunks=False))
+            scale = float(pixelSize * 2 ** level)
+            datasets.append({'path': str(level),
+                             'coordinateTransformations': [{'type': 'scale',
+                                                            'scale': [scale, scale]}]})
+        write_multiscales_metadata(root, datasets, format_from_version('0.4'),
+                                   axes=[{'name': 'y', 'type': 'space', 'unit': 'micrometer'},
+                                         {'name': 'x', 'type': 'space', 'unit': 'micrometer'}],
+                                   name='stitched')
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='PyramidCanvas', daemon=True)
+        self._thread.start()
+
+    def addTile(self, image, position):
+        """ Queues a 2D tile for writing at position (y, x), the top left
+        corner in pixels of level 0. """
+        self._queue.put((image, position))
+
+    def flush(self):
+        """ Waits until all queued tiles are written. """
+        self._queue.join()
+
+    def close(self):
+        """ Writes the queued tiles and stops the writer thread. """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def levelShape(self, level):
+        return self.levels[level].shape
+
+    def levelForScale(self, scale):
+        """ Returns the coarsest level with at least the given scale
+        relative to level 0. """
+        if scale >= 1:
+            return 0
+        return int(np.clip(math.floor(math.log2(1 / scale)), 0, self.numLevels - 1))
+
+    def getRegion(self, level, y, x, height, width):
+        """ Returns the region of the level, with zeros outside the
+        canvas. """
+        array = self.levels[level]
+        region = np.zeros((height, width), dtype=self.dtype)
+        y0, x0 = max(y, 0), max(x, 0)
+        y1, x1 = min(y + height, array.shape[0]), min(x + width, array.shape[1])
+        if y1 > y0 and x1 > x0:
+            region[y0 - y:y1 - y, x0 - x:x1 - x] = array[y0:y1, x0:x1]
+        return region
+
+    def getTile(self, level, row, column):
+        """ Returns the tile in the given row and column of the level's tile
+        grid. """
+        return self.getRegion(level, row * self.tileSize, column * self.tileSize,
+                              self.tileSize, self.tileSize)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._writeTile(*item)
+            except Exception as e:
+                self.__logger.error(f"Failed to write tile to stitching canvas: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _writeTile(self, image, position):
+        image = np.asarray(image)
+        y, x = int(round(position[0])), int(round(position[1]))
+        y0, x0 = max(y, 0), max(x, 0)
+        y1 = min(y + image.shape[0], self.shape[0])
+        x1 = min(x + image.shape[1], self.shape[1])
+        if y1 <= y0 or x1 <= x0:
+            return
+        tile = image[y0 - y:y1 - y, x0 - x:x1 - x]
+
+        if self.blending == 'overwrite':
+            blended = tile
+        else:
+            existing = self.levels[0][y0:y1, x0:x1]
+            if self.blending == 'max':
+                blended = np.maximum(existing, tile)
+            else:
+                alpha = self._featherWeights(image.shape)[y0 - y:y1 - y, x0 - x:x1 - x]
+                alpha = np.where(existing > 0, alpha, 1)
+                blended = existing * (1 - alpha) + tile * alpha
+        blended = blended.astype(self.dtype, copy=False)
+        self.levels[0][y0:y1, x0:x1] = blended
+        self.maxValue = max(self.maxValue, int(tile.max()))
+        self.numTiles += 1
+
+        # update the region of the tile in the lower resolution levels
+        for level in range(1, self.numLevels):
+            y0, x0 = y0 // 2, x0 // 2
+            y1, x1 = math.ceil(y1 / 2), math.ceil(x1 / 2)
+            finer = self.levels[level - 1][2 * y0:2 * y1, 2 * x0:2 * x1]
+            if finer.shape[0] % 2 or finer.shape[1] % 2:
+                finer = np.pad(finer, ((0, finer.shape[0] % 2), (0, finer.shape[1] % 2)),
+                               mode='edge')
+            coarser = finer.reshape(finer.shape[0] // 2, 2, finer.shape[1] // 2, 2).mean(axis=(1, 3))
+            self.levels[level][y0:y1, x0:x1] = coarser.astype(self.dtype)
+
+    def _featherWeights(self, shape):
+        blendWidth = self.blendWidth or max(1, min(shape[:2]) // 10)
+        distanceY = np.minimum(np.arange(shape[0]) + 1, shape[0] - np.arange(shape[0]))
+        distanceX = np.minimum(np.arange(shape[1]) + 1, shape[1] - np.arange(shape[1]))
+        return np.clip(np.minimum(distanceY[:, None], distanceX[None, :]) / blendWidth, 0, 1)
+
+
 class ImageStitcher:
 
     def __init__(self, parent, origin_coords, max_coords,  folder, file_name, extension, 
@@ -967,28 +1173,28 @@ class ImageStitcher:
         self.file_path = os.sep.join([folder, file_name + extension])
             
         # Queue to hold incoming images
-        self.queue = deque()
-
-        # Thread lock for thread safety
-        self.lock = threading.Lock()
+        self.queue = queue.Queue()
 
-        # Start a background thread for processing the queue
-        self.processing_thread = threading.Thread(target=self._process_queue)
-        self.isRunning = True
-        self.processing_thread.start()
-        
-        # differentiate between ASHLAR and simple memory based stitching
+        # differentiate between ASHLAR and the multiscale canvas on disk
+        self.canvas = None
+        self.resolution_scale = resolution_scale
         if self.isStitchAshlar and IS_ASHLAR_AVAILABLE:
             self.ashlarImageList = []
             self.ashlarPositionList = []
         else:
-            self.resolution_scale = resolution_scale
             self.origin_coords = np.int32(np.array(origin_coords))
             image_width, image_height = image_dims[0], image_dims[1]
-            size = np.array((max_coords[1]+image_height,max_coords[0]+image_width))/pixel_size # pixels; Y X
-            mshape = np.int32(np.ceil(size)*self.resolution_scale)
-            self.stitched_image = np.zeros(mshape.T, dtype=np.uint16) 
-            
+            # max_coords in pixels, image_dims in µm; Y X
+            size = np.array((max_coords[1], max_coords[0])) + np.array((image_height, image_width))/pixel_size
+            self.canvas = PyramidCanvas(os.sep.join([folder, file_name + ".zarr"]),
+                                        shape=np.int64(np.ceil(size)), pixelSize=pixel_size,
+                                        minLevels=round(math.log2(1 / resolution_scale)) + 1)
+
+        # Start a background thread for processing the queue
+        self.processing_thread = threading.Thread(target=self._process_queue)
+        self.isRunning = True
+        self.processing_thread.start()
+
 
     def process_ashlar(self, arrays, position_list, pixel_size, output_filename='ashlar_output_numpy.tif', maximum_shift_microns=10, flip_x=False, flip_y=False):
         '''
@@ -1026,46 +1232,41 @@ class ImageStitcher:
                         pixel_size=pixel_size)
 
     def add_image(self, img, coords, metadata):
-        with self.lock:
-            self.queue.append((img, coords, metadata))
+        self.queue.put((img, coords, metadata))
 
     def _process_queue(self):
         with tifffile.TiffWriter(self.file_path, bigtiff=True, append=True) as tif:
-            while self.isRunning:
-                if not self.queue:
-                    time.sleep(.02) # unload CPU
-                    continue
-                img, coords, metadata = self.queue.popleft()
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                img, coords, metadata = item
                 self._place_on_canvas(img, coords, flipX=self.flipX, flipY=self.flipY)
 
                 # write image to disk
                 tif.write(data=img, metadata=metadata)
-            
+
 
     def _place_on_canvas(self, img, coords, flipX=True, flipY=True):
         if self.isStitchAshlar and IS_ASHLAR_AVAILABLE:
             # in case we want to process it with ASHLAR later on
             self.ashlarImageList.append(img)
             self.ashlarPositionList.append(coords)
-        else:            
-            # subsample the image
+        else:
             coords = np.flip(coords) # YX
-            img = skimage.transform.rescale(img, self.resolution_scale, anti_aliasing=False)
-            if len(img.shape)==3: img = np.mean(img, axis=-1)  # RGB
+            if len(img.shape)==3: img = np.mean(img, axis=-1).astype(img.dtype)  # RGB
             if flipX:
                 img = np.fliplr(img)
             if flipY:
                 img = np.flipud(img)
             img = skimage.img_as_uint(img)
-            # Round position so paste will skip the expensive subpixel shift.
-            pos = np.round((coords-self.origin_coords)*self.resolution_scale)
-            utils.paste(self.stitched_image, img, pos, np.maximum)
+            # the canvas blends the tile into all of its levels
+            self.canvas.addTile(img, np.round(coords-self.origin_coords))
 
 
     def get_stitched_image(self):
-        # introduce a little delay to free the queue ? # TODO
-        time.sleep(0.5)
         if self.isStitchAshlar and IS_ASHLAR_AVAILABLE:
+            self.stop()
             # convert the image and positionlist 
             arrays = [np.expand_dims(np.array(self.ashlarImageList),1)]  # (num_images, num_channels, height, width)
             position_list = np.array(self.ashlarPositionList)
@@ -1074,15 +1275,19 @@ class ImageStitcher:
             stitched = tifffile.imread(self.file_path)
             return stitched
         else:
-            # Normalize by the weight image to get the final result
-            stitched = self.stitched_image.copy()
-            '''
-            if len(stitched.shape)>2:
-                stitched = stitched/np.max(stitched)
-                stitched = np.uint8(stitched*255)
-            '''
+            # read the level closest to the requested resolution, never the full canvas
+            self.stop()
+            level = self.canvas.levelForScale(self.resolution_scale)
+            return self.canvas.levels[level][:]
+
+    def stop(self):
+        """ Writes all queued images and stops the processing thread. """
+        if self.isRunning:
             self.isRunning = False
-            return stitched 
+            self.queue.put(None)
+            self.processing_thread.join()
+            if self.canvas is not None:
+                self.canvas.close()
 
     def save_stitched_image(self, filename):
         stitched = self.get_stitched_image()
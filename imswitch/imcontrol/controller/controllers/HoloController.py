@@ -1,4 +1,7 @@
+from collections import OrderedDict
+
 import numpy as np
+import scipy.fft
 
 try:
     import NanoImagingPack as nip
@@ -32,6 +35,10 @@ class HoloController(LiveUpdatedController):
 
     sigImageReceived = Signal()
 
+    # metres of refocus distance per step of the off-axis and inline sliders
+    offAxisDzScale = 1e-4
+    inLineDzScale = 1e-3
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -48,7 +55,6 @@ class HoloController(LiveUpdatedController):
         self.mWavelength = 488*1e-9
         self.NA=.3
         self.k0 = 2*np.pi/(self.mWavelength)
-        self.lastProcessedTime = time.time()
 
         if not isNIP:
             return
@@ -71,9 +77,6 @@ class HoloController(LiveUpdatedController):
         #self.sigImageReceived.connect(self.imageComputationWorker.computeHoloImage)
         self.imageComputationThread.start()
 
-        # Connect CommunicationChannel signals
-        self._commChannel.sigUpdateImage.connect(self.update)
-
         if IS_HEADLESS:
             return
         # Connect HoloWidget signals
@@ -121,15 +124,20 @@ class HoloController(LiveUpdatedController):
         self.imageComputationWorker.set_CCRadius(self.CCRadius)
 
     def offAxisValueChanged(self, magnitude):
-        self.dz = magnitude*1e-4
+        self.dz = magnitude*self.offAxisDzScale
         self.imageComputationWorker.set_dz(self.dz)
 
     def inLineValueChanged(self, magnitude):
         """ Change magnitude. """
-        self.dz = magnitude*1e-3
+        self.dz = magnitude*self.inLineDzScale
         self.imageComputationWorker.set_dz(self.dz)
 
+    def closeEvent(self):
+        self.unsubscribeLiveView()
+        self.imageComputationWorker.stop()
+
     def __del__(self):
+        self.imageComputationWorker.stop()
         self.imageComputationThread.quit()
         self.imageComputationThread.wait()
         if hasattr(super(), '__del__'):
@@ -146,6 +154,7 @@ class HoloController(LiveUpdatedController):
         self.reconstructionMode = self.availableReconstructionModes[1]
         self.imageComputationWorker.setReconstructionMode(self.reconstructionMode)
         self.imageComputationWorker.setActive(enabled)
+        self.setLiveViewSubscribed(enabled)
 
         # change visibility of detector layer
         allDetectorNames = self._master.detectorsManager.getAllDeviceNames()
@@ -163,24 +172,31 @@ class HoloController(LiveUpdatedController):
         self.reconstructionMode = self.availableReconstructionModes[2]
         self.imageComputationWorker.setReconstructionMode(self.reconstructionMode)
         self.imageComputationWorker.setActive(enabled)
+        self.setLiveViewSubscribed(enabled)
         self._widget.createPointsLayer()
         allDetectorNames = self._master.detectorsManager.getAllDeviceNames()
         for detectorName in allDetectorNames:
             self._widget.silenceLayer("Live: "+detectorName, not enabled)
 
+    def setLiveViewSubscribed(self, subscribed):
+        """ Receives frames from the live view at no more than updateRate
+        frames per second while a reconstruction is shown. """
+        if subscribed:
+            self.liveViewMaxRate = self.updateRate
+            self.subscribeLiveView()
+        else:
+            self.unsubscribeLiveView()
+
     def update(self, detectorName, im, init, scale, isCurrentDetector):
         """ Update with new detector frame. """
 
         if  not self.active or not isNIP:# or not isCurrentDetector:
             return
 
-        if time.time()-self.lastProcessedTime<1/self.updateRate:
-            return
         if self.it == self.updateRate:
             self.it = 0
             self.imageComputationWorker.prepareForNewImage(im)
             self.sigImageReceived.emit()
-            self.lastProcessedTime = time.time()
         else:
             self.it += 1
 
@@ -190,7 +206,7 @@ class HoloController(LiveUpdatedController):
 
     def displayImage(self, im, name):
         """ Displays the image in the view. """
-        if im.dtype=="complex":
+        if np.iscomplexobj(im):
             self._widget.setImage(np.abs(im), name+"_abs")
             self._widget.setImage(np.angle(im), name+"_angle")
         else:
@@ -204,6 +220,29 @@ class HoloController(LiveUpdatedController):
             updateRate = 1
         self.updateRate = updateRate
         self.it = 0
+        if self._liveViewSubscription is not None:
+            self._liveViewSubscription.maxRate = updateRate
+
+    @APIExport(runOnUIThread=False)
+    def computeRefocusStack(self, dzStart: float, dzStop: float, numSteps: int = 10) -> dict:
+        """ Numerically refocuses the last frame to numSteps distances from
+        dzStart to dzStop in one batch and shows the amplitudes as a stack.
+        The distances are slider values of the current reconstruction mode,
+        converted like the slider does. Returns the distances (as slider
+        values), the sharpness (variance of the amplitude) of every plane
+        and the sharpest distance. """
+        worker = self.imageComputationWorker
+        image = worker._image
+        if image is None:
+            raise ValueError('No frame has been received yet')
+        dzs = np.linspace(dzStart, dzStop, numSteps)
+        scale = self.offAxisDzScale if worker.reconstructionMode == "offaxis" else self.inLineDzScale
+        amplitudes = np.abs(worker.computeRefocusStack(image, dzs * scale))
+        if self._widget is not None:
+            self.imageComputationWorker.sigHoloImageComputed.emit(amplitudes, "Refocus stack")
+        sharpness = amplitudes.var(axis=(1, 2))
+        return {'dz': dzs.tolist(), 'sharpness': sharpness.tolist(),
+                'bestDz': float(dzs[np.argmax(sharpness)])}
 
     class HoloImageComputationWorker(Worker):
         sigHoloImageComputed = Signal(np.ndarray, str)
@@ -220,6 +259,11 @@ class HoloController(LiveUpdatedController):
             self.CCCenter = None
             self.CCRadius = 100
             self.isBusy = False
+            self.propagator = HoloPropagator()
+            self._image = None
+            self._newImageEvent = threading.Event()
+            self._stopEvent = threading.Event()
+            self._computeThread = None
 
         def set_CCCenter(self, CCCenter):
             self.CCCenter = CCCenter
@@ -229,49 +273,28 @@ class HoloController(LiveUpdatedController):
 
         def setActive(self, active):
             self.active = active
+            if not active:
+                self.stop()
 
         def setReconstructionMode(self, mode):
             self.reconstructionMode = mode
 
         def reconholo(self, mimage, PSFpara, N_subroi=1024, pixelsize=1e-3, dz=50e-3):
-            '''
-            Main.xs = [1, 2, 3]
-            Main.mimage = mimage
-            print(Main.eval("sin.(xs)"))
-            print(Main.eval("sin.(mimage)"))
-            '''
-            # FIXME: @Aaron, you can change this code to have yours instead
+            """ Reconstructs the hologram in the current mode and propagates
+            it by dz with the cached kernels of the propagator. Returns the
+            complex field and, in off-axis mode, the spectrum of the
+            hologram. """
             if self.reconstructionMode == "offaxis" and self.CCCenter is not None:
-                mimage = np.sqrt(nip.image(mimage.copy()))  # get e-field
-                mpupil = nip.ft(mimage.copy())             # bring to FT space
-                mpupil = nip.extract(mpupil, ROIsize=(int(self.CCRadius),int(self.CCRadius)), centerpos=(int(self.CCCenter[0]), int(self.CCCenter[1])), checkComplex=False) # cut out CC-term
-
-                mimage = np.squeeze(nip.ift(mpupil))        # this is still complex
-                if self.dz != 0:
-                    mimage.pixelsize=(pixelsize, pixelsize)
-                    cos_alpha, sin_alpha = nip.cosSinAlpha(mimage, PSFpara)
-                    defocus = self.dz * 0.1 #  defocus factor
-                    PhaseMap = nip.defocusPhase(cos_alpha, defocus, PSFpara)
-                    propagated = np.exp(1j * PhaseMap)*mimage
-                    return propagated
-                else:
-                    return mimage
+                return self.propagator.reconstructOffAxis(
+                    mimage, pixelsize, dz * 0.1, PSFpara.wavelength, self.CCCenter,
+                    self.CCRadius, NA=PSFpara.NA, returnSpectrum=True
+                )
             elif self.reconstructionMode == "inline":
-                if self.dz != 0:
-                    mimage = nip.image(np.sqrt(mimage.copy()))
-                    mimage = nip.extract(mimage, [N_subroi,N_subroi], checkComplex=False)
-                    mimage.pixelsize=(pixelsize, pixelsize)
-                    mpupil = nip.ft(mimage)
-                    #nip.__make_propagator__(mpupil, PSFpara, doDampPupil=True, shape=mpupil.shape, distZ=dz)
-                    cos_alpha, sin_alpha = nip.cosSinAlpha(mimage, PSFpara)
-                    defocus = self.dz #  defocus factor
-                    PhaseMap = nip.defocusPhase(cos_alpha, defocus, PSFpara)
-                    propagated = nip.ft2d((np.exp(1j * PhaseMap))*mpupil)
-                    return np.squeeze(propagated)
-                else:
-                    return np.squeeze(mimage)
+                return self.propagator.reconstructInline(
+                    mimage, pixelsize, dz, PSFpara.wavelength, roiSize=N_subroi, NA=PSFpara.NA
+                ), None
             else:
-                return np.squeeze(np.zeros_like(mimage))
+                return np.zeros(np.shape(mimage)), None
 
         def reconHoloAaron(self, mimage, PSFpara, N_subroi=1024, pixelsize=1e-3, dz=50e-3):
             # do some calculation based on the mimage and return something
@@ -282,28 +305,63 @@ class HoloController(LiveUpdatedController):
             """ Compute Holo of an image. """
             self.isBusy = True
             try:
-                if 0:
-                    holorecon = np.flip(self.reconholo(mHologram, PSFpara=self.PSFpara, N_subroi=1024, pixelsize=self.pixelsize, dz=self.dz),1)
-                else:
-                    # here comes Aarons code
-                    holorecon = self.reconHoloAaron(mHologram, PSFpara=self.PSFpara, N_subroi=1024, pixelsize=self.pixelsize, dz=self.dz)
-
-                self.sigHoloImageComputed.emit(np.array(holorecon), "Hologram")
-                if self.reconstructionMode == "offaxis":
-                    mFT = nip.ft2d(mHologram)
-                    self.sigHoloImageComputed.emit(np.abs(np.array(np.log(1+mFT))), "FFT")
+                holorecon, spectrum = self.reconholo(mHologram, PSFpara=self.PSFpara,
+                                                     N_subroi=1024, pixelsize=self.pixelsize,
+                                                     dz=self.dz)
+                self.sigHoloImageComputed.emit(holorecon, "Hologram")
+                if spectrum is not None:
+                    self.sigHoloImageComputed.emit(np.log1p(np.abs(spectrum)), "FFT")
             except Exception as e:
                 self._logger.error(f"Error in computeHoloImage: {e}")
             self.isBusy = False
 
+        def computeRefocusStack(self, mHologram, dzs):
+            """ Propagates the reconstructed field of the hologram to all
+            distances in dzs at once and returns the stack of fields. """
+            if self.reconstructionMode == "offaxis" and self.CCCenter is not None:
+                field, pixelsize = self.propagator.extractOffAxisField(
+                    mHologram, self.pixelsize, self.CCCenter, self.CCRadius
+                )
+                dzs = np.asarray(dzs) * 0.1
+            else:
+                field = self.propagator.extractInlineField(mHologram, roiSize=1024)
+                pixelsize = self.pixelsize
+            return self.propagator.propagateStack(field, pixelsize, dzs,
+                                                  self.PSFpara.wavelength, NA=self.PSFpara.NA)
+
         def prepareForNewImage(self, image):
-            """ Must always be called before the worker receives a new image. """
+            """ Must always be called before the worker receives a new image.
+            The image replaces one that is still waiting to be processed. """
             self._image = image
-            if self.active and not self.isBusy:
-                self.isBusy = True
-                mThread = threading.Thread(target=self.computeHoloImage, args=(self._image,))
-                mThread.start()
-
+            if not self.active:
+                return
+            if self._computeThread is None:
+                self._stopEvent.clear()
+                self._computeThread = threading.Thread(target=self._computeLoop,
+                                                       name='HoloImageComputation', daemon=True)
+                self._computeThread.start()
+            self._newImageEvent.set()
+
+        def _computeLoop(self):
+            # one long-lived thread that always processes the newest image
+            while True:
+                self._newImageEvent.wait()
+                self._newImageEvent.clear()
+                if self._stopEvent.is_set():
+                    return
+                if self.active:
+                    self.computeHoloImage(self._image)
+
+        def stop(self):
+            """ Stops the computation thread after the image it is working
+            on; it is started again by the next image. """
+            if self._computeThread is None:
+                return
+            self._stopEvent.set()
+            self._newImageEvent.set()
+            if self._computeThread is not threading.current_thread():
+                self._computeThread.join()
+            self._computeThread = None
 
         def set_dz(self, dz):
             self.dz = dz
@@ -315,6 +373,142 @@ class HoloController(LiveUpdatedController):
             self.pixelsize = pixelsize
 
 
+class HoloPropagator:
+    """ Angular spectrum propagation of holograms for the live
+    reconstruction.
+
+    The transfer functions are cached by (shape, pixel size, dz, wavelength,
+    NA) and the least recently used ones are evicted once more than
+    maxCachedKernels are stored, so refocusing back and forth between a few
+    distances does not recompute them. The FFTs run with scipy.fft, which
+    keeps the plans of the recent shapes, into work buffers that are reused
+    for every frame of the same shape. propagateStack refocuses to many
+    distances with one forward FFT and one batched inverse FFT. """
+
+    def __init__(self, maxCachedKernels=16, workers=-1):
+        self.maxCachedKernels = maxCachedKernels
+        self.workers = workers  # FFT threads, -1 for all CPUs
+        self.numKernelsComputed = 0
+        self._kernels = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()  # FFT work buffers of each thread
+
+    def getKernel(self, shape, pixelsize, dz, wavelength, NA=None):
+        """ Returns the transfer function that propagates a field of the
+        given shape by dz, in the unshifted layout of the FFT. Spatial
+        frequencies that are evanescent or outside the NA are cut off. """
+        key = (tuple(shape), float(pixelsize), float(dz), float(wavelength),
+               None if NA is None else float(NA))
+        with self._lock:
+            kernel = self._kernels.get(key)
+            if kernel is not None:
+                self._kernels.move_to_end(key)
+                return kernel
+
+        fy = scipy.fft.fftfreq(shape[0], d=pixelsize)[:, np.newaxis]
+        fx = scipy.fft.fftfreq(shape[1], d=pixelsize)[np.newaxis, :]
+        fSquared = fx ** 2 + fy ** 2
+        fzSquared = 1 / wavelength ** 2 - fSquared
+        passband = fzSquared > 0
+        if NA is not None:
+            passband &= fSquared <= (NA / wavelength) ** 2
+        phase = 2 * np.pi * dz * np.sqrt(np.where(passband, fzSquared, 0))
+        kernel = np.where(passband, np.exp(1j * phase), 0).astype(np.complex64)
+
+        with self._lock:
+            self.numKernelsComputed += 1
+            self._kernels[key] = kernel
+            while len(self._kernels) > self.maxCachedKernels:
+                self._kernels.popitem(last=False)
+        return kernel
+
+    def clearCache(self):
+        with self._lock:
+            self._kernels.clear()
+        self._local = threading.local()
+
+    def propagate(self, field, pixelsize, dz, wavelength, NA=None):
+        """ Propagates the complex field by dz and returns a new array. """
+        if dz == 0:
+            return np.array(field, dtype=np.complex64)
+        spectrum = self._forward(field)
+        spectrum *= self.getKernel(field.shape, pixelsize, dz, wavelength, NA)
+        return scipy.fft.ifft2(spectrum, workers=self.workers)
+
+    def propagateStack(self, field, pixelsize, dzs, wavelength, NA=None):
+        """ Propagates the complex field to every distance in dzs and returns
+        the fields as a stack of shape (len(dzs), *field.shape). """
+        spectrum = self._forward(field)
+        stack = np.empty((len(dzs), *field.shape), dtype=np.complex64)
+        for i, dz in enumerate(dzs):
+            np.multiply(spectrum, self.getKernel(field.shape, pixelsize, dz, wavelength, NA),
+                        out=stack[i])
+        return scipy.fft.ifft2(stack, axes=(-2, -1), overwrite_x=True, workers=self.workers)
+
+    def extractInlineField(self, hologram, roiSize=None):
+        """ Returns the amplitude of the inline hologram as a field, cropped
+        to its central roiSize x roiSize pixels. """
+        field = np.sqrt(np.asarray(hologram, dtype=np.float32))
+        if roiSize is not None:
+            field = _cropCenter(field, (roiSize, roiSize), field.shape)
+        return field
+
+    def getSpectrum(self, hologram):
+        """ Returns the centered spectrum of the amplitude of the hologram. """
+        return scipy.fft.fftshift(self._forward(np.sqrt(np.asarray(hologram, dtype=np.float32))))
+
+    def extractOffAxisField(self, hologram, pixelsize, ccCenter, ccRadius, spectrum=None):
+        """ Returns the complex field of the off-axis hologram, cut out of its
+        spectrum as the ccRadius x ccRadius region around the cross
+        correlation term at ccCenter (row, column), and the pixel size of the
+        field. spectrum is computed with getSpectrum if not given. """
+        if spectrum is None:
+            spectrum = self.getSpectrum(hologram)
+        sideband = _cropCenter(spectrum, (int(ccRadius), int(ccRadius)),
+                               (2 * int(ccCenter[0]), 2 * int(ccCenter[1])))
+        field = scipy.fft.ifft2(scipy.fft.ifftshift(sideband), workers=self.workers)
+        # the field is sampled more coarsely than the hologram by the cropping of its spectrum
+        return field, pixelsize * hologram.shape[0] / sideband.shape[0]
+
+    def reconstructInline(self, hologram, pixelsize, dz, wavelength, roiSize=None, NA=None):
+        """ Reconstructs the field of an inline hologram at distance dz. """
+        field = self.extractInlineField(hologram, roiSize)
+        return self.propagate(field, pixelsize, dz, wavelength, NA)
+
+    def reconstructOffAxis(self, hologram, pixelsize, dz, wavelength, ccCenter, ccRadius,
+                           NA=None, returnSpectrum=False):
+        """ Reconstructs the field of an off-axis hologram at distance dz.
+        With returnSpectrum, the centered spectrum of the hologram is
+        returned as well. """
+        spectrum = self.getSpectrum(hologram)
+        field, fieldPixelsize = self.extractOffAxisField(hologram, pixelsize, ccCenter, ccRadius,
+                                                         spectrum)
+        field = self.propagate(field, fieldPixelsize, dz, wavelength, NA)
+        if returnSpectrum:
+            return field, spectrum
+        return field
+
+    def _forward(self, field):
+        # FFT into a work buffer that is reused for all fields of this shape
+        buffers = self._local.__dict__.setdefault('buffers', {})
+        buffer = buffers.get(field.shape)
+        if buffer is None:
+            buffer = buffers[field.shape] = np.empty(field.shape, dtype=np.complex64)
+        buffer[...] = field
+        return scipy.fft.fft2(buffer, overwrite_x=True, workers=self.workers)
+
+
+def _cropCenter(image, size, doubleCenter):
+    """ Crops image to size around the center given in doubled coordinates
+    (so that the center of even sizes can be given), clipped to the image. """
+    slices = []
+    for length, cropLength, doubleCenterPos in zip(image.shape, size, doubleCenter):
+        cropLength = min(cropLength, length)
+        start = min(max((doubleCenterPos - cropLength) // 2, 0), length - cropLength)
+        slices.append(slice(start, start + cropLength))
+    return image[tuple(slices)]
+
+
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -1,11 +1,13 @@
 import json
 import os
+import queue
 
 import numpy as np
 import time
 import tifffile as tif
 import threading
 from datetime import datetime
+from scipy import ndimage
 
 
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
@@ -39,6 +41,13 @@ class ISMController(LiveUpdatedController):
 
         self.tUnshake = .1
 
+        # frames that arrive after a pattern was applied and are discarded,
+        # as they may have been exposed while the pattern changed
+        self.numSkipFrames = 1
+        self.frameTimeout = 1  # seconds to wait for a frame after a pattern
+
+        self.nPatterns = 16*16
+
         if self._setupInfo.ism is None:
             self._widget.replaceWithError('ISM is not configured in your setup file.')
             return
@@ -51,6 +60,7 @@ class ISMController(LiveUpdatedController):
         self._widget.ISMShowSinglePatternButton.clicked.connect(self.initFilter)
 
         self._widget.sigSliderLaser1ValueChanged.connect(self.valueLaser1Changed)
+        self.sigImageReceived.connect(self.displayReconstruction)
 
         # select detectors
         allDetectorNames = self._master.detectorsManager.getAllDeviceNames()
@@ -164,10 +174,25 @@ class ISMController(LiveUpdatedController):
         except  Exception as e:
             self._logger.error(e)
 
+        try:
+            self._widget.setImage(self.ISMReconstructionLast, colormap="gray", name="ISM")
+        except Exception as e:
+            self._logger.error(e)
+
     def displayStack(self, im):
         """ Displays the image in the view. """
         self._widget.setImage(im)
 
+    def displayReconstruction(self):
+        """ Displays the ISM reconstruction of the patterns acquired so
+        far. """
+        ismReconstructor = self.ismReconstructor
+        if ismReconstructor is None:
+            return
+        # a copy, the acquisition thread keeps adding frames to the reconstruction
+        self._widget.setImage(ismReconstructor.getISM(), colormap="gray", name="ISM")
+        self._widget.setText(str(self.nImages))
+
 
 
 
@@ -177,26 +202,52 @@ class ISMController(LiveUpdatedController):
 
         # reserve and free space for displayed stacks
         self.LastStackLaser1 = []
-
-        for iISMimage in range(16*16):
-            # 1: Display ISM Frame
-            ismPatternIndex = self.getISMFrame(nFrame=iISMimage)
-            self._widget.setText("Displaying pattern # "+str(iISMimage))
-            self.laser.sendScannerPattern(ismPatternIndex, scannernFrames=10,
-                scannerLaserVal=32000,
-                scannerExposure=500, scannerDelay=500, isBlocking=False)
-            filePath = self.getSaveFilePath(date=self.ISMDate, filename=f'{self.ISMFilename}_{iISMimage}', extension=".tif")
-            time.sleep(self.tUnshake) # wait for display
-            lastFrame = self.detector.getLatestFrame()
-            self.LastStackLaser1.append(lastFrame)
-            tif.imwrite(filePath, lastFrame, append=True)
-
-            self.nImages += 1
-            self._widget.setText(self.nImages)
+        frameBuffer = self.detector.getFrameBuffer()
+        self.ismReconstructor = None
+        writer = ISMStackWriter(self.getSaveFilePath(date=self.ISMDate, filename=self.ISMFilename,
+                                                     extension="tif"))
+        try:
+            for iISMimage in range(self.nPatterns):
+                if not self.isISMrunning:
+                    break
+
+                # 1: Display ISM Frame, the call returns once the pattern is applied
+                ismPatternIndex = self.getISMFrame(nFrame=iISMimage)
+                self.laser.sendScannerPattern(ismPatternIndex, scannernFrames=10,
+                    scannerLaserVal=32000,
+                    scannerExposure=500, scannerDelay=500, isBlocking=True)
+
+                # 2: Take the first frame that was exposed with the new pattern
+                if frameBuffer is None:
+                    time.sleep(self.tUnshake) # wait for display
+                    lastFrame = np.array(self.detector.getLatestFrame())
+                else:
+                    lastFrame = frameBuffer.waitForNewFrame(frameBuffer.frameCount + self.numSkipFrames,
+                                                            timeout=self.frameTimeout)
+                    if lastFrame is None:
+                        self._logger.warning(f'No frame arrived within {self.frameTimeout} s'
+                                             f' after pattern {iISMimage}, skipping it')
+                        continue
+                self.LastStackLaser1.append(lastFrame)
+                writer.append(lastFrame)
+
+                # 3: Reassign the pixels of the frame into the ISM image
+                if self.ismReconstructor is None:
+                    self.ismReconstructor = ISMReconstructor(lastFrame.shape)
+                self.ismReconstructor.add(lastFrame)
+
+                self.nImages += 1
+                if self.nImages % self.updateRate == 0:
+                    self.sigImageReceived.emit()
+        finally:
+            writer.close()
 
         self.isISMrunning = False
 
         self.LastStackLaser1ArrayLast = np.array(self.LastStackLaser1)
+        if self.ismReconstructor is not None:
+            self.ISMReconstructionLast = self.ismReconstructor.getISM()
+            self.sigImageReceived.emit()
         self._widget.ISMShowLastButton.setEnabled(True)
         self._widget.ISMStartButton.setEnabled(True)
 
@@ -243,6 +294,142 @@ class ISMController(LiveUpdatedController):
         return newPath
 
 
+class ISMReconstructor:
+    """ Incremental multi-spot ISM reconstruction by pixel reassignment.
+
+    Every frame shows the emission excited by a sparse lattice of
+    illumination spots. add() takes the pixels within pinholeRadius of every
+    spot (which must be less than half the distance of the spots) and moves them towards the spot by reassignmentFactor (0.5 for
+    equal excitation and emission PSFs), i.e. to the most likely position
+    of the emitter, and sums them into the ism image, which is sampled
+    upsampling times finer than the camera. The images are complete once
+    the spots of all patterns have covered the field of view, but can be
+    shown after every frame.
+
+    The spot positions are detected in every frame as local maxima unless
+    they are passed to add(), e.g. from a calibration of the scanner. """
+
+    def __init__(self, frameShape, pinholeRadius=4, reassignmentFactor=0.5, upsampling=2,
+                 minSpotDistance=4, threshold=0.2):
+        self.frameShape = tuple(frameShape[:2])
+        self.pinholeRadius = pinholeRadius
+        self.reassignmentFactor = reassignmentFactor
+        self.upsampling = upsampling
+        self.minSpotDistance = minSpotDistance  # in pixels, for detecting the spots
+        self.threshold = threshold  # relative to the range of the frame, for detecting the spots
+
+        offsets = np.mgrid[-pinholeRadius:pinholeRadius + 1,
+                           -pinholeRadius:pinholeRadius + 1].reshape(2, -1).T
+        self._offsets = offsets[(offsets ** 2).sum(axis=1) <= pinholeRadius ** 2]
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Clears the images. """
+        with self._lock:
+            self.numFrames = 0
+            self.widefield = np.zeros(self.frameShape, dtype=np.float32)
+            self.confocal = np.zeros(self.frameShape, dtype=np.float32)  # pinholed intensity at the spots
+            self.ism = np.zeros(tuple(length * self.upsampling for length in self.frameShape),
+                                dtype=np.float32)
+
+    def getISM(self):
+        """ Returns a copy of the ism image that is not changed by frames
+        added meanwhile. """
+        with self._lock:
+            return self.ism.copy()
+
+    def findSpots(self, frame):
+        """ Returns the sub-pixel positions (row, column) of the
+        illumination spots in the frame as an array of shape (n, 2). """
+        frame = np.asarray(frame, dtype=np.float32)
+        low, high = frame.min(), frame.max()
+        maxima = ((ndimage.maximum_filter(frame, size=2 * self.minSpotDistance + 1) == frame) &
+                  (frame > low + self.threshold * (high - low)))
+        rows, columns = np.nonzero(maxima)
+        rows = np.clip(rows, 1, self.frameShape[0] - 2)
+        columns = np.clip(columns, 1, self.frameShape[1] - 2)
+
+        # center of mass of the 3x3 neighbourhood above its minimum
+        dy, dx = np.mgrid[-1:2, -1:2].reshape(2, -1)
+        neighbourhoods = frame[rows[:, np.newaxis] + dy, columns[:, np.newaxis] + dx]
+        weights = neighbourhoods - neighbourhoods.min(axis=1, keepdims=True)
+        total = weights.sum(axis=1)
+        total[total == 0] = 1
+        return np.stack([rows + (weights * dy).sum(axis=1) / total,
+                         columns + (weights * dx).sum(axis=1) / total], axis=1)
+
+    def add(self, frame, spots=None):
+        """ Adds a frame, with the positions (row, column) of its
+        illumination spots if they are known. """
+        frame = np.asarray(frame, dtype=np.float32)
+        if frame.shape != self.frameShape:
+            raise ValueError(f'Expected a frame of shape {self.frameShape}, got {frame.shape}')
+        spots = self.findSpots(frame) if spots is None else np.asarray(spots, dtype=float).reshape(-1, 2)
+
+        shape = np.array(self.frameShape)
+        centers = np.round(spots).astype(np.int64)
+        pixels = centers[:, np.newaxis, :] + self._offsets  # (spots, pinhole pixels, 2)
+        inside = np.all((pixels >= 0) & (pixels < shape), axis=2)
+        pixels, spotIndices = pixels[inside], np.nonzero(inside)[0]
+        values = frame[pixels[:, 0], pixels[:, 1]]
+        centerInside = np.all((centers >= 0) & (centers < shape), axis=1)
+        spotPositions = spots[spotIndices]
+        reassigned = spotPositions + (pixels - spotPositions) * self.reassignmentFactor
+        targets = np.floor((reassigned + 0.5) * self.upsampling).astype(np.int64)
+        valid = np.all((targets >= 0) & (targets < shape * self.upsampling), axis=1)
+
+        with self._lock:
+            self.widefield += frame
+            self.numFrames += 1
+            np.add.at(self.confocal, tuple(centers[centerInside].T),
+                      np.bincount(spotIndices, values, minlength=len(spots))[centerInside])
+            np.add.at(self.ism, tuple(targets[valid].T), values[valid])
+
+
+class ISMStackWriter:
+    """ Writes the frames of an ISM acquisition into one TIFF stack. append()
+    hands the frame to a background thread, so the acquisition does not wait
+    for the disk. """
+
+    maxQueuedFrames = 64  # frames waiting for the writer before append blocks
+
+    def __init__(self, filePath):
+        self.__logger = initLogger(self)
+        self.filePath = filePath
+        self._queue = queue.Queue(maxsize=self.maxQueuedFrames)
+        self._writeError = None
+        self._tiff = tif.TiffWriter(filePath, bigtiff=True)
+        self._writerThread = threading.Thread(target=self._writeLoop, name='ISMStackWriter',
+                                              daemon=True)
+        self._writerThread.start()
+
+    def append(self, frame):
+        if self._writeError is not None:
+            raise self._writeError
+        self._queue.put(frame)
+
+    def close(self):
+        """ Writes all queued frames and closes the file. """
+        self._queue.put(None)
+        self._writerThread.join()
+
+    def _writeLoop(self):
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is None:
+                    break
+                if self._writeError is None:
+                    try:
+                        self._tiff.write(frame, contiguous=True)
+                    except Exception as e:
+                        self.__logger.error(f'Failed to write to {self.filePath}: {e}')
+                        self._writeError = e
+        finally:
+            self._tiff.close()
+
+
 
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
@@ -1,5 +1,6 @@
 
 import os
+import queue
 import threading
 from datetime import datetime
 import time
@@ -15,7 +16,9 @@ from typing import Optional
 
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
-from skimage.registration import phase_cross_correlation
+from imswitch.imcontrol.model import Compression
+from imswitch.imcontrol.model.managers.RecordingManager import getHDF5CompressionFilter
+from imswitch.imcontrol.model.registration import registerImages
 from ..basecontrollers import ImConWidgetController
 from imswitch import IS_HEADLESS
 
@@ -369,7 +372,13 @@ class MCTController(ImConWidgetController):
             max_dims = (None, 3, nZStack, None, None)  # Allow unlimited time points and z slices
         
         self.h5File = HDF5File(filename=self.MCTFilePath, init_dims=init_dims, max_dims=max_dims, isRGB=self.isRGB)
+        try:
+            self.runTimelapse(tperiod, nImagesToCapture)
+        finally:
+            # writes the remaining data and closes the file
+            self.h5File.close()
 
+    def runTimelapse(self, tperiod, nImagesToCapture):
         # run as long as the MCT is active
         while(self.isMCTrunning):
             # stop measurement once done
@@ -709,47 +718,116 @@ class MCTController(ImConWidgetController):
 
 
 class HDF5File(object):
-    def __init__(self, filename, init_dims, max_dims=None, isRGB=False):
+    """ Writes the timelapse into an HDF5 file that stays open until close()
+    is called. append_data hands the data to a background thread that
+    compresses and writes it and flushes the file periodically, so the
+    acquisition does not wait for the disk. The positions of all timepoints
+    are stored in one extensible table. """
+
+    flushInterval = 5  # seconds between flushes of the file to disk
+    maxQueuedAppends = 4  # appends waiting for the writer before append_data blocks
+    targetChunkBytes = 4 * 1024 ** 2
+
+    def __init__(self, filename, init_dims, max_dims=None, isRGB=False,
+                 compression=Compression.BLOSC_LZ4):
+        self.__logger = initLogger(self)
         self.filename = filename
         self.init_dims = init_dims # time, channels, z, y, x
         self.max_dims = max_dims # time, channels, z, y, x
         self.isRGB=isRGB
+        self.compression = compression
+        self._queue = queue.Queue(maxsize=self.maxQueuedAppends)
+        self._writeError = None
         self.create_dataset()
+        self._writerThread = threading.Thread(target=self._writeLoop, name='MCTHDF5Writer',
+                                              daemon=True)
+        self._writerThread.start()
+
+    def getChunkShape(self):
+        """ One chunk per channel and z plane, split along y if a plane is
+        larger than targetChunkBytes. """
+        frameShape = self.init_dims[3:]
+        rowBytes = int(np.prod(frameShape[1:])) * np.dtype(np.uint16).itemsize
+        chunkRows = int(min(frameShape[0], max(1, self.targetChunkBytes // rowBytes)))
+        return (1, 1, 1, chunkRows, *frameShape[1:])
 
     def create_dataset(self):
-        with h5py.File(self.filename, 'w') as file:
-            # Create a resizable dataset for the image data
-            dset = file.create_dataset('ImageData', shape=self.init_dims, maxshape=self.max_dims, dtype='uint16', compression="gzip")
-            
-            # Initialize a group for storing metadata
-            meta_group = file.create_group('Metadata')
+        # Blosc-LZ4 is much faster than gzip, which is only used if hdf5plugin is missing
+        compressionArgs = getHDF5CompressionFilter(self.compression) or {'compression': 'gzip'}
+        self._file = h5py.File(self.filename, 'w')
+        # Create a resizable dataset for the image data
+        self._dset = self._file.create_dataset('ImageData', shape=(0, *self.init_dims[1:]),
+                                               maxshape=self.max_dims or (None, *self.init_dims[1:]),
+                                               dtype='uint16',
+                                               chunks=self.getChunkShape(), **compressionArgs)
+
+        # Initialize a group for storing metadata
+        meta_group = self._file.create_group('Metadata')
+        self._positions = meta_group.create_dataset('Positions', shape=(0, 5), maxshape=(None, 5),
+                                                    dtype='float32', chunks=(1024, 5))
+        self._positions.attrs['columns'] = ['timepoint', 'index', 'x', 'y', 'z']
 
     def append_data(self, timepoint, frame_data, xyz_coordinates):
-        with h5py.File(self.filename, 'a') as file:
-            dset = file['ImageData']
-            meta_group = file['Metadata']
-            
-            # Resize the dataset to accommodate the new timepoint
-            current_size = dset.shape[0]
-            dset.resize(current_size + 1, axis=0)
-            
-            # Add the new frame data
-            try:
-                if self.isRGB:
-                    dset[current_size, :, :, :, :, :] = np.uint16(frame_data)
-                else:
-                    dset[current_size, :, :, :, :] = np.uint16(frame_data)
-            except:
-                # in case X/Y are swapped 
-                if self.isRGB:
-                    dset[current_size, :, :, :, :, :] = np.transpose(np.uint16(frame_data), (0,1,2,4,3))
-                else:
-                    dset[current_size, :, :, :, :] = np.transpose(np.uint16(frame_data), (0,1,3,2))
-                            
-            # Add metadata for the new frame
-            for channel, xyz in enumerate(xyz_coordinates):
-                meta_group.create_dataset(f'Time_{timepoint}_Channel_{channel}', data=np.float32(xyz))
+        if self._writeError is not None:
+            raise self._writeError
 
+        frame_data = np.uint16(frame_data)
+        if frame_data.shape != tuple(self.init_dims[1:]):
+            # in case X/Y are swapped
+            if self.isRGB:
+                frame_data = np.transpose(frame_data, (0,1,2,4,3))
+            else:
+                frame_data = np.transpose(frame_data, (0,1,3,2))
+            if frame_data.shape != tuple(self.init_dims[1:]):
+                raise ValueError(f'Frames of shape {frame_data.shape} do not fit into the'
+                                 f' dataset of shape {self.init_dims[1:]}')
+
+        self._queue.put((timepoint, frame_data, np.float32(xyz_coordinates)))
+
+    def close(self):
+        """ Writes all queued data and closes the file. """
+        self._queue.put(None)
+        self._writerThread.join()
+
+    def _writeLoop(self):
+        lastFlush = time.time()
+        try:
+            while True:
+                try:
+                    entry = self._queue.get(timeout=self.flushInterval)
+                except queue.Empty:
+                    entry = ()
+                if entry is None:
+                    break
+
+                if entry and self._writeError is None:
+                    try:
+                        self._write(*entry)
+                    except Exception as e:
+                        self.__logger.error(f'Failed to write to {self.filename}: {e}')
+                        self._writeError = e
+
+                if time.time() - lastFlush >= self.flushInterval:
+                    self._file.flush()
+                    lastFlush = time.time()
+        finally:
+            self._file.close()
+
+    def _write(self, timepoint, frame_data, xyz_coordinates):
+        # Add the new frame data
+        index = self._dset.shape[0]
+        self._dset.resize(index + 1, axis=0)
+        self._dset[index] = frame_data
+
+        # Add the positions of the new frames to the table
+        xyz_coordinates = xyz_coordinates.reshape(len(xyz_coordinates), -1)
+        numPositions = len(xyz_coordinates)
+        if numPositions > 0:
+            rows = np.column_stack([np.full(numPositions, timepoint), np.arange(numPositions),
+                                    xyz_coordinates])
+            start = self._positions.shape[0]
+            self._positions.resize(start + numPositions, axis=0)
+            self._positions[start:] = rows
 
 
 '''
@@ -801,7 +879,7 @@ Crosscolleration based drift correction
 
                         #image2 = scipy.ndimage.gaussian_filter(image2, sigma=10)
                         if self.nImagesTaken > 0:
-                            shift, error, diffphase = phase_cross_correlation(image1, image2)
+                            shift = -registerImages(image1, image2).shift  # to register image2 to image1
                             iShift += (shift)
 
                             # Shift image2 to align with image1
@@ -1,11 +1,14 @@
 import os
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from collections import defaultdict
 from functools import partial
 import numpy as np
 
+from scipy.fft import rfft, irfft
 from scipy.fftpack import fft, ifft
 from scipy.interpolate import interp1d
 import tifffile as tif
@@ -14,7 +17,7 @@ from skimage.transform import radon
 from imswitch.imcontrol.view import guitools as guitools
 from typing import Tuple, List, Callable, Dict
 from ..basecontrollers import ImConWidgetController
-from imswitch.imcommon.model import initLogger, dirtools
+from imswitch.imcommon.model import APIExport, initLogger, dirtools
 from imswitch.imcommon.framework import Signal, Thread, Worker
 from imswitch.imcommon.externals.tomopy import shepp3d
 
@@ -129,6 +132,7 @@ class ScanOPTWorker(Worker):
     sigNewStabilityTrace = Signal(object, object)   # (list: steps, list[list]: stabilityTraces)
     sigNewSinogramDataPoint = Signal(int)     # (int: sinogramGenerationStep)
     sigNewLiveRecon = Signal(np.ndarray, int)  # (reconstruction, step of reconstruction)
+    sigNewReconVolume = Signal(np.ndarray)  # (reconstructed volume)
     sigScanDone = Signal()
     sigUpdateReconIdx = Signal(int)  # triggers change of live-recon index
 
@@ -152,6 +156,9 @@ class ScanOPTWorker(Worker):
         self.isOPTScanRunning = False         # OPT scan running flag, default to False
         self.noRAM = False                    # Stack not saved to RAM and Viewwer to save memory
         self.isLiveRecon = False              # OPT live reconstruction flag, default to False
+        self.isVolumeRecon = False            # reconstruct a band of rows around reconIdx instead of reconIdx only
+        self.reconBand = 32                   # number of rows of the volume recon, 0 for all
+        self.maxVolumeBytes = 2 ** 31         # memory limit of the volume recon, the band is narrowed to fit
         self.isInterruptionRequested = False  # interruption request flag, set from the main thread; defaults to False
         self.frameStack = None                # OPT stack memory buffer
 
@@ -265,7 +272,10 @@ class ScanOPTWorker(Worker):
         # live reconstruction processsing
         if self.isLiveRecon:
             self.timeMonitor.addStamp('live-recon', self.currentStep, 'beg')
-            self.computeLiveReconstruction(frame)
+            if self.isVolumeRecon:
+                self.computeVolumeReconstruction(frame)
+            else:
+                self.computeLiveReconstruction(frame)
             self.sigNewLiveRecon.emit(self.currentLiveRecon.recon,
                                       self.currentLiveRecon.step)
             self.timeMonitor.addStamp('live-recon', self.currentStep, 'end')
@@ -397,8 +407,10 @@ class ScanOPTWorker(Worker):
         Ends the requested OPT scan. The scan can either naturally end,
         or the user may trigger the stop via the user interface.
         """
-        self.timeMonitor.addFinish()
         self.master.detectorsManager[self.detectorName].stopAcquisition()
+        if isinstance(self.currentLiveRecon, FBPVolumeRecon):
+            self.finishVolumeReconstruction()
+        self.timeMonitor.addFinish()
         self.isOPTScanRunning = False
         self.timeMonitor.makeReport()
         self.sigScanDone.emit()
@@ -431,6 +443,78 @@ class ScanOPTWorker(Worker):
                 len(self.optSteps),
                 )
 
+    def computeVolumeReconstruction(self, frame: np.ndarray):
+        """
+        Updates the volumetric live reconstruction, FBPVolumeRecon class,
+        with the band of reconBand rows centered on the reconstruction
+        index. In the first step, creates a new Recon object. The row shown
+        in the live reconstruction plot is the reconstruction index.
+
+        Args:
+            frame (np.ndarray): camera frame.
+        """
+        if self.currentStep == 0:
+            self.validateReconIdx(frame)
+            rows = self.getReconRows(frame.shape)
+            self.__logger.info(
+                f'Creating a new volume reconstruction of rows {rows}.',
+                )
+            self.currentLiveRecon = FBPVolumeRecon(
+                frame,
+                len(self.optSteps),
+                rows=rows,
+                displayRow=self.reconIdx,
+                )
+        else:
+            self.currentLiveRecon.update_recon(frame, self.currentStep)
+
+    def finishVolumeReconstruction(self) -> None:
+        """
+        Waits for the last projections of the volume reconstruction,
+        emits the volume and saves it if saving is enabled.
+        """
+        self.timeMonitor.addStamp('volume-recon', self.currentStep, 'beg')
+        volume = self.currentLiveRecon.finish()
+        self.timeMonitor.addStamp('volume-recon', self.currentStep, 'end')
+        self.sigNewLiveRecon.emit(self.currentLiveRecon.recon,
+                                  self.currentLiveRecon.step)
+        self.sigNewReconVolume.emit(volume)
+        if self.saveOpt:
+            filePath = self.getSaveFilePath(subfolder=self.saveSubfolder,
+                                            filename='recon',
+                                            extension='tiff')
+            tif.imwrite(filePath, volume, append=False)
+
+    def getReconRows(self, frameShape: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Returns the band of rows of the volume reconstruction, reconBand
+        rows centered on the reconstruction index and clipped to the frame.
+        The band is narrowed if the volume would exceed maxVolumeBytes.
+
+        Args:
+            frameShape (Tuple[int, int]): shape of the camera frame.
+
+        Returns:
+            Tuple[int, int]: first and last (exclusive) row.
+        """
+        numRows, numColumns = frameShape
+        band = self.reconBand if self.reconBand else numRows
+        rowBytes = numColumns ** 2 * np.dtype(np.float32).itemsize
+        maxBand = max(1, self.maxVolumeBytes // rowBytes)
+        if band > maxBand:
+            self.__logger.warning(
+                f'Volume reconstruction of {band} rows would need '
+                f'{band * rowBytes / 2 ** 30:.1f} GiB, reconstructing '
+                f'{maxBand} rows instead.',
+            )
+            band = maxBand
+        band = min(band, numRows)
+
+        # the index is validated asynchronously, fall back to the middle row
+        center = self.reconIdx if 0 <= self.reconIdx < numRows else numRows // 2
+        first = min(max(0, center - band // 2), numRows - band)
+        return first, first + band
+
     def validateReconIdx(self, frame: np.ndarray) -> None:
         """
         Check if reconstruction index is within the 
@@ -550,6 +634,7 @@ class OptController(ImConWidgetController):
         self._widget.scanPar['GetDark'].clicked.connect(self.execDarkFieldCorrection)  # noqa
         self._widget.scanPar['GetFlat'].clicked.connect(self.execFlatFieldCorrection) # noqa
         self._widget.scanPar['LiveReconButton'].clicked.connect(self.updateLiveReconFlag) # noqa
+        self._widget.scanPar['LiveReconVolumeButton'].clicked.connect(self.updateLiveReconFlag) # noqa
         self._widget.scanPar['OptStepsEdit'].valueChanged.connect(self.updateOptSteps) # noqa
 
         # Scan loop control
@@ -570,6 +655,9 @@ class OptController(ImConWidgetController):
         # to put all flags to the worker no?)
         self._widget.scanPar['LiveReconIdxEdit'].valueChanged.connect(
                                                     self.getLiveReconIdx)
+        self._widget.scanPar['LiveReconBandEdit'].valueChanged.connect(
+                                                    self.getLiveReconBand)
+        self.getLiveReconBand()
 
         # noRAM flag
         self._widget.scanPar['noRamButton'].clicked.connect(self.updateRamFlag)
@@ -593,6 +681,7 @@ class OptController(ImConWidgetController):
                                         self.checkSinogramProgress)
         self.optWorker.sigUpdateReconIdx.connect(self.setLiveReconIdx)
         self.optWorker.sigNewLiveRecon.connect(self.updateLiveReconPlot)
+        self.optWorker.sigNewReconVolume.connect(self.displayReconVolume)
 
         # Thread signals connection
         self.optThread.started.connect(lambda: self.optWorker.preStart(
@@ -655,6 +744,8 @@ class OptController(ImConWidgetController):
 
         # live reconstruction
         self.setSharedAttr('scan', 'liveRecon', self.optWorker.isLiveRecon)
+        self.setSharedAttr('scan', 'liveReconVolume', self.optWorker.isVolumeRecon)
+        self.setSharedAttr('scan', 'liveReconBand', self.optWorker.reconBand)
         if self.optWorker.isLiveRecon:
             self.getLiveReconIdx()
 
@@ -793,6 +884,20 @@ class OptController(ImConWidgetController):
         self._widget.liveReconPlot.setImage(image)
         self._widget.updateCurrentReconStep(step + 1)
 
+    def displayReconVolume(self, volume: np.ndarray) -> None:
+        """
+        Display the volume of the live reconstruction in the napari viewer.
+
+        Args:
+            volume (np.ndarray): FBP reconstruction, (rows, x, y)
+        """
+        self._widget.setImage(volume,
+                              colormap="gray",
+                              name=f'{self.detectorName}: FBP volume',
+                              pixelsize=(1, 1),
+                              translation=(0, 0),
+                              )
+
     def plotReport(self):
         """Display an extra time monitor report plot in a separate widget.
         """
@@ -854,6 +959,9 @@ class OptController(ImConWidgetController):
 
         self._widget.scanPar['LiveReconButton'].setEnabled(value)
         self._widget.scanPar['LiveReconIdxEdit'].setEnabled(value)
+        self._widget.scanPar['LiveReconVolumeButton'].setEnabled(value)
+        self._widget.scanPar['LiveReconBandEdit'].setEnabled(
+            value and self.optWorker.isVolumeRecon)
 
         self._widget.scanPar['SaveButton'].setEnabled(value)
         self._widget.scanPar['noRamButton'].setEnabled(value)
@@ -910,10 +1018,19 @@ class OptController(ImConWidgetController):
         """ Update live reconstruction flag based on the widget value """
         self.optWorker.isLiveRecon = self._widget.scanPar[
                                         'LiveReconButton'].isChecked()
+        self.optWorker.isVolumeRecon = self._widget.scanPar[
+                                        'LiveReconVolumeButton'].isChecked()
         # enable/disable live-recon index
         self._widget.scanPar['LiveReconIdxEdit'].setEnabled(
                                         self.optWorker.isLiveRecon,
                                         )
+        self._widget.scanPar['LiveReconVolumeButton'].setEnabled(
+                                        self.optWorker.isLiveRecon,
+                                        )
+        self._widget.scanPar['LiveReconBandEdit'].setEnabled(
+                                        self.optWorker.isLiveRecon
+                                        and self.optWorker.isVolumeRecon,
+                                        )
 
     def updateSaveFlag(self):
         """ Update saving flag from the widget value """
@@ -937,6 +1054,21 @@ class OptController(ImConWidgetController):
         """ Get camera line index for the live reconstruction. """
         self.optWorker.reconIdx = self._widget.getLiveReconIdx()
 
+    def getLiveReconBand(self) -> None:
+        """ Get number of camera lines of the volume reconstruction. """
+        self.optWorker.reconBand = self._widget.getLiveReconBand()
+
+    @APIExport(runOnUIThread=True)
+    def setLiveReconBand(self, value: int) -> None:
+        """ Set number of camera lines of the volume reconstruction,
+        centered on the reconstruction index, 0 for all lines.
+
+        Args:
+            value (int): number of camera lines
+        """
+        # triggers getLiveReconBand via valueChange
+        self._widget.setLiveReconBand(value)
+
     def setLiveReconIdx(self, value: int):
         """ Set camera line index for the live reconstruction
 
@@ -1240,6 +1372,10 @@ class FBPliveRecon():
         self.theta = np.deg2rad(
                         np.linspace(0., 360., self.n_steps, endpoint=False)
                         )
+        self.cos_theta = np.cos(self.theta)
+        self.sin_theta = np.sin(self.theta)
+        self.fourier_filter = self._get_fourier_filter(
+                                    self.projection_size_padded)
         self.update_recon(self.line, 0)
 
     def update_recon(self, line_in: np.ndarray,
@@ -1261,7 +1397,6 @@ class FBPliveRecon():
         """
         self.line = line_in
         self.step = step
-        fourier_filter = self._get_fourier_filter(self.projection_size_padded)
         # padding line
         if self.line.ndim > 1:  # 3D reconstruction
             raise ValueError('Input data can be only 1D array')
@@ -1270,37 +1405,28 @@ class FBPliveRecon():
         line[self.offset:len(line_in)+self.offset] = line_in
 
         # fft filtering of the line
-        projection = fft(line) * fourier_filter
+        projection = fft(line) * self.fourier_filter
         radon_filtered = np.real(ifft(projection)[:self.radon_img_shape])
 
         # rotational transformation fo the projections
-        t = (self.ypr * np.cos(self.theta[step]) -
-             self.xpr * np.sin(self.theta[step]))
+        t = (self.ypr * self.cos_theta[step] -
+             self.xpr * self.sin_theta[step])
 
         # interpolation on the circle
         if interp_mode == 'cubic':
             interpolant = interp1d(self.x, radon_filtered, kind='cubic',
                                    bounds_error=False, fill_value=0)
+            backprojection = interpolant(t)
         else:  # default interpolation is linear
-            interpolant = interp1d(self.x, radon_filtered, kind='linear',
-                                   bounds_error=False, fill_value=0)
+            backprojection = np.interp(t, self.x, radon_filtered,
+                                       left=0, right=0)
 
         # superimposing onto previous projections
-        self.recon += interpolant(t) * (np.pi/(2*self.n_steps))
+        self.recon += backprojection * (np.pi/(2*self.n_steps))
 
     def _get_fourier_filter(self, size: int) -> np.ndarray:
         """ size needs to be even. Only ramp filter implemented """
-        n = np.concatenate((np.arange(1, size / 2 + 1, 2, dtype=int),
-                            np.arange(size / 2 - 1, 0, -2, dtype=int)))
-        f = np.zeros(size)
-        f[0] = 0.25
-        f[1::2] = -1 / (np.pi * n) ** 2
-
-        # Computing the ramp filter from the fourier transform of its
-        # frequency domain representation lessens artifacts and removes a
-        # small bias as explained in [1], Chap 3. Equation 61
-        fourier_filter = 2 * np.real(fft(f))         # ramp filter
-        return fourier_filter
+        return _get_ramp_filter(size)
 
     def _sinogram_circle_to_square(self, sinogram: np.ndarray) -> np.ndarray:
         """
@@ -1322,6 +1448,168 @@ class FBPliveRecon():
         return np.pad(sinogram, pad_width, mode='constant', constant_values=0)
 
 
+class FBPVolumeRecon():
+    def __init__(self, frame: np.ndarray, steps: int,
+                 rows: Tuple[int, int] = None,
+                 displayRow: int = None,
+                 numWorkers: int = None,
+                 ) -> None:
+        """Live filtered backprojection of a band of detector rows,
+        i.e. of a volume of slices. Like FBPliveRecon it is created with
+        the first projection, here the full camera frame, and updated
+        with every following one.
+
+        The ramp filter, the padding and the rotated coordinate grid are
+        computed once. Per projection the interpolation indices and weights
+        are computed once for all rows, the rows are filtered and
+        backprojected in chunks on a pool of threads. update_recon() returns
+        as soon as the work is queued, so that the backprojection runs while
+        the rotator moves; call finish() to wait for it.
+
+        Args:
+            frame (np.ndarray): first projection, shape (rows, columns).
+            steps (int): number of total OPT steps.
+            rows (Tuple[int, int], optional): first and last (exclusive)
+                detector row to reconstruct. Defaults to all rows.
+            displayRow (int, optional): detector row returned by `recon`.
+                Defaults to the middle of the band.
+            numWorkers (int, optional): number of threads. Defaults to
+                the number of CPUs.
+
+        Raises:
+            ValueError: if the frame is not 2D or the rows are out of range.
+        """
+        frame = np.asarray(frame)
+        if frame.ndim != 2:
+            raise ValueError('Input data has to be a 2D frame')
+        if rows is None:
+            rows = (0, frame.shape[0])
+        if not 0 <= rows[0] < rows[1] <= frame.shape[0]:
+            raise ValueError(f'Invalid rows {rows} for frame of shape {frame.shape}')
+
+        self.rows = tuple(rows)
+        self.n_steps = steps
+        self.step = 0
+        self.displayRow = (rows[0] + rows[1]) // 2 if displayRow is None else displayRow
+        if not rows[0] <= self.displayRow < rows[1]:
+            self.displayRow = (rows[0] + rows[1]) // 2
+
+        # geometry, the same as for FBPliveRecon
+        self.recon_dim = frame.shape[1]
+        self.radon_img_shape = int(np.ceil(np.sqrt(2) * self.recon_dim))
+        self.offset = (self.radon_img_shape - self.recon_dim) // 2
+        self.projection_size_padded = max(
+                64,
+                int(2 ** np.ceil(np.log2(2 * self.radon_img_shape))))
+        radius = self.recon_dim // 2
+        xpr, ypr = np.mgrid[:self.recon_dim, :self.recon_dim] - radius
+        self.xpr = xpr.ravel().astype(np.float32)
+        self.ypr = ypr.ravel().astype(np.float32)
+        self.center = self.radon_img_shape // 2
+
+        theta = np.deg2rad(np.linspace(0., 360., self.n_steps, endpoint=False))
+        self.cos_theta = np.cos(theta).astype(np.float32)
+        self.sin_theta = np.sin(theta).astype(np.float32)
+        self.rfourier_filter = _get_ramp_filter(
+            self.projection_size_padded)[:self.projection_size_padded // 2 + 1]
+        self.scale = np.pi / (2 * self.n_steps)
+
+        numRows = rows[1] - rows[0]
+        self.volume = np.zeros((numRows, self.recon_dim, self.recon_dim),
+                               dtype=np.float32)
+
+        # chunks of rows small enough to keep the interpolated values in cache-
+        # friendly sizes, but at least one per worker
+        self.numWorkers = numWorkers or os.cpu_count() or 1
+        rowsPerChunk = max(1, min(int(np.ceil(numRows / self.numWorkers)),
+                                  (1 << 22) // self.recon_dim ** 2))
+        self._chunks = [slice(start, min(start + rowsPerChunk, numRows))
+                        for start in range(0, numRows, rowsPerChunk)]
+        self._chunkLocks = [threading.Lock() for _ in self._chunks]
+        self._executor = ThreadPoolExecutor(max_workers=self.numWorkers,
+                                            thread_name_prefix='FBPVolumeRecon')
+        self._futures = []
+        self.update_recon(frame, 0)
+
+    @property
+    def recon(self) -> np.ndarray:
+        """ Current reconstruction of the display row. """
+        return self.volume[self.displayRow - self.rows[0]].copy()
+
+    def update_recon(self, frame: np.ndarray, step: int) -> None:
+        """
+        Queues the backprojection of the rows of a new projection.
+
+        Args:
+            frame (np.ndarray): camera frame of the projection.
+            step (int): the current step in the reconstruction process.
+        """
+        self.step = step
+        # copy, the frame may be a buffer slot the camera keeps overwriting
+        lines = np.array(np.asarray(frame)[self.rows[0]:self.rows[1]],
+                         dtype=np.float32)
+
+        # interpolation indices and weights, shared by all rows; out of range
+        # positions point to the two zero columns appended to the projections
+        t = (self.ypr * self.cos_theta[step] - self.xpr * self.sin_theta[step]
+             + self.center)
+        index = np.floor(t).astype(np.int32)
+        weight = (t - index).astype(np.float32)
+        outside = (index < 0) | (index >= self.radon_img_shape - 1)
+        index[outside] = self.radon_img_shape
+        weight[outside] = 0
+
+        # raise the errors of finished backprojections instead of dropping them
+        for future in self._futures:
+            if future.done():
+                future.result()
+        self._futures = [future for future in self._futures if not future.done()]
+        for chunk, lock in zip(self._chunks, self._chunkLocks):
+            self._futures.append(self._executor.submit(
+                self._backprojectChunk, lines[chunk], chunk, lock, index, weight,
+            ))
+
+    def finish(self) -> np.ndarray:
+        """ Waits for all queued projections and returns the volume. """
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        self._executor.shutdown(wait=True)
+        return self.volume
+
+    def _backprojectChunk(self, lines, chunk, lock, index, weight):
+        # ramp filtering of the zero padded lines
+        padded = np.zeros((len(lines), self.projection_size_padded), dtype=np.float32)
+        padded[:, self.offset:self.offset + self.recon_dim] = lines
+        filtered = np.zeros((len(lines), self.radon_img_shape + 2), dtype=np.float32)
+        filtered[:, :self.radon_img_shape] = irfft(
+            rfft(padded, axis=1) * self.rfourier_filter,
+            n=self.projection_size_padded, axis=1,
+        )[:, :self.radon_img_shape]
+
+        # linear interpolation on the rotated grid
+        values = filtered[:, index] * (1 - weight)
+        values += filtered[:, index + 1] * weight
+        values *= self.scale
+        with lock:
+            self.volume[chunk] += values.reshape(-1, self.recon_dim, self.recon_dim)
+
+
+def _get_ramp_filter(size: int) -> np.ndarray:
+    """ Ramp filter in Fourier space for projections padded to size, which
+    needs to be even. """
+    n = np.concatenate((np.arange(1, size / 2 + 1, 2, dtype=int),
+                        np.arange(size / 2 - 1, 0, -2, dtype=int)))
+    f = np.zeros(size)
+    f[0] = 0.25
+    f[1::2] = -1 / (np.pi * n) ** 2
+
+    # Computing the ramp filter from the fourier transform of its
+    # frequency domain representation lessens artifacts and removes a
+    # small bias as explained in [1], Chap 3. Equation 61
+    return 2 * np.real(fft(f))
+
+
 # These functions are adapted from tomopy package
 # https://tomopy.readthedocs.io/en/stable/
 
@@ -1,18 +1,22 @@
+import asyncio
 import os
 import time
 from typing import Optional, Union, List
 import numpy as np
 import datetime
 from fastapi.responses import StreamingResponse
-from fastapi import FastAPI, Response, HTTPException
+from fastapi import FastAPI, Response, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 import cv2
 from PIL import Image
 import io
 from imswitch import IS_HEADLESS
 from imswitch.imcommon.framework import Timer
 from imswitch.imcommon.model import ostools, APIExport, initLogger, dirtools
-from imswitch.imcontrol.model import RecMode, SaveMode, SaveFormat
+from imswitch.imcontrol.model import RecMode, SaveMode, SaveFormat, Compression
+from imswitch.imcontrol.model.managers.RecordingManager import cropAndBinFrame, encodeFrame
 from ..basecontrollers import ImConWidgetController
+from ..server import LiveStreamer
 
 
 class RecordingController(ImConWidgetController):
@@ -32,8 +36,11 @@ class RecordingController(ImConWidgetController):
         self.endedRecording = False
         self.lapseCurrent = -1
         self.lapseTotal = 0
+        self.compression = Compression.DEFAULT
+        self.compressionLevel = None
         
-        self.streamstarted = False
+        # Shared by all MJPEG and WebSocket stream clients
+        self.liveStreamer = LiveStreamer(self._master.detectorsManager)
 
         # Connect CommunicationChannel signals
         self._commChannel.sigRecordingStarted.connect(self.recordingStarted)
@@ -90,6 +97,9 @@ class RecordingController(ImConWidgetController):
         self._widget.sigSnapRequested.connect(self.snap)
         self._widget.sigRecToggled.connect(self.toggleREC)
 
+    def closeEvent(self):
+        self.liveStreamer.stop()
+
     def openFolder(self):
         """ Opens current folder in File Explorer. """
         folder = self._widget.getRecFolder()
@@ -136,7 +146,9 @@ class RecordingController(ImConWidgetController):
                                            savename,
                                            saveMode,
                                            mSaveFormat,
-                                           attrs)
+                                           attrs,
+                                           compression=self.compression,
+                                           compressionLevel=self.compressionLevel)
 
     def snapNumpy(self):
         self.updateRecAttrs(isSnapping=True)
@@ -200,7 +212,9 @@ class RecordingController(ImConWidgetController):
                 'attrs': {detectorName: self._commChannel.sharedAttrs.getHDF5Attributes()
                           for detectorName in detectorsBeingCaptured},
                 'singleMultiDetectorFile': (len(detectorsBeingCaptured) > 1 and
-                                            self._widget.getMultiDetectorSingleFile())
+                                            self._widget.getMultiDetectorSingleFile()),
+                'compression': self.compression,
+                'compressionLevel': self.compressionLevel
             }
 
             if self.recMode == RecMode.SpecFrames:
@@ -414,70 +428,77 @@ class RecordingController(ImConWidgetController):
         return self._widget.getTimelapseFreq()
 
 
-    def stop_stream(self):
-        self.streamRunning = False
-        self.streamstarted = False
-        self.manager = None
-        
-    def start_stream(self):
-        '''
-        return a generator that converts frames into jpeg's reads to stream
-        '''
-        detectorManager = self._master.detectorsManager
-        detectorNum1Name = detectorManager.getAllDeviceNames()[0]
-        detectorNum1 = detectorManager[detectorNum1Name]
-        detectorNum1.startAcquisition()
-        
-        self.fx = self.fy = .1
-        
+    def mjpegFrames(self, client):
+        """ Yields the frames for the given stream client as parts of a
+        multipart MJPEG stream until the client is removed. """
         try:
-            while self.streamRunning:
-                output_frame = detectorNum1.getLatestFrame()
-                if output_frame is None:
-                    continue
-                try:
-                    # adaptive resize: Keep them below 640x480
-                    if output_frame.shape[0] > 640 or output_frame.shape[1] > 480:
-                        self.fx = self.fy = min(640/output_frame.shape[0], 480/output_frame.shape[1])
-                    else:
-                        self.fx = self.fy = 1
-                    output_frame = cv2.resize(output_frame, dsize=None, fx=self.fx,fy=self.fx)
-                except: 
-                    output_frame = np.zeros((640,460))
-                (flag, encodedImage) = cv2.imencode(".jpg", output_frame)
-                if not flag:
+            while not client.closed:
+                encodedImage, _ = client.nextFrame(timeout=1)
+                if encodedImage is None:
                     continue
-                self.manager.put(encodedImage)
-        except:
-            self.streamRunning = False
-                
-    def streamer(self):
-        from multiprocessing import Queue
-        if not self.streamstarted:
-            import threading
-            self.manager = Queue(maxsize=10)
-            self.streamRunning = True
-            threading.Thread(target=self.start_stream).start()
-        try:
-
-            while self.manager:
                 yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' +
-                    bytearray(self.manager.get()) + b'\r\n')
+                       encodedImage + b'\r\n')
         except GeneratorExit:
             self.__logger.debug("cancelled")
-
+        finally:
+            client.close()
 
     @APIExport(runOnUIThread=False)
-    def video_feeder(self, startStream: bool = True) -> StreamingResponse:
+    def video_feeder(self, startStream: bool = True, quality: int = LiveStreamer.defaultQuality,
+                     maxWidth: int = LiveStreamer.defaultMaxWidth,
+                     maxHeight: int = LiveStreamer.defaultMaxHeight) -> StreamingResponse:
         '''
-        return a generator that converts frames into jpeg's reads to stream
+        return an MJPEG stream of the live view, scaled down to maxWidth x
+        maxHeight and encoded with the given JPEG quality. All clients share
+        one live view and every frame is encoded only once per quality and
+        size. startStream=False disconnects all clients.
         '''
         if startStream:
-            return StreamingResponse(self.streamer(), media_type="multipart/x-mixed-replace;boundary=frame")
+            client = self.liveStreamer.addClient(quality, maxWidth, maxHeight)
+            return StreamingResponse(self.mjpegFrames(client),
+                                     media_type="multipart/x-mixed-replace;boundary=frame")
         else:
-            self.stop_stream()
+            self.liveStreamer.stop()
             return "stream stopped"
 
+    @APIExport(webSocket=True)
+    async def video_socket(self, websocket: WebSocket,
+                           quality: int = LiveStreamer.defaultQuality,
+                           maxWidth: int = LiveStreamer.defaultMaxWidth,
+                           maxHeight: int = LiveStreamer.defaultMaxHeight):
+        '''
+        stream the live view over a WebSocket, one binary JPEG message per
+        frame. The client may change its settings at any time by sending a
+        JSON text message such as {"quality": 50, "maxWidth": 320}.
+        '''
+        await websocket.accept()
+        client = self.liveStreamer.addClient(quality, maxWidth, maxHeight)
+
+        async def receiveSettings():
+            while True:
+                settings = await websocket.receive_json()
+                client.configure(settings.get('quality'), settings.get('maxWidth'),
+                                 settings.get('maxHeight'))
+
+        receiveTask = asyncio.ensure_future(receiveSettings())
+        try:
+            while not client.closed and not receiveTask.done():
+                encodedImage, _ = await run_in_threadpool(client.nextFrame, 0.5)
+                if encodedImage is not None:
+                    await websocket.send_bytes(encodedImage)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiveTask.cancel()
+            client.close()
+
+    @APIExport(runOnUIThread=False)
+    def getStreamStats(self) -> dict:
+        """ Returns the number of stream clients, the number of frames
+        received, encoded, sent and skipped, the CPU time spent encoding and
+        the latency between the arrival of a frame and sending it. """
+        return self.liveStreamer.getStats()
+
     #@app.post("/execute-function/")
     ''' TODO: Maybe a little bit of a security risk, but it's a nice feature
     @APIExport(runOnUIThread=False)
@@ -565,10 +586,75 @@ class RecordingController(ImConWidgetController):
         headers = {'Content-Disposition': 'inline; filename="test.png"'}
         return Response(im_bytes, headers=headers, media_type='image/png')
 
+    @APIExport(runOnUIThread=False)
+    def snapNumpyBinary(self, detectorName: str = None, x: int = None, y: int = None,
+                        width: int = None, height: int = None, binning: int = 1,
+                        compression: int = Compression.DEFAULT.value,
+                        compressionLevel: Optional[int] = None, timeout: float = 5) -> Response:
+        '''
+        Return a new frame at full bit depth as raw bytes in C order,
+        without saving it. The dtype (numpy notation, e.g. "<u2"), the shape
+        and the compression are given in the X-Image-Dtype, X-Image-Shape and
+        X-Image-Compression headers, see decodeFrame.
+        detectorName: the detector to read from, the current detector if None.
+        x, y, width, height: crop to this region of interest (in pixels of the full frame).
+        binning: average blocks of binning x binning pixels.
+        compression: a Compression value, e.g. 3 for LZ4 or 4 for Zstd; 0 sends the raw bytes.
+        timeout: seconds to wait for a frame that arrives after the request.
+        '''
+        detectorsManager = self._master.detectorsManager
+        if detectorName is None:
+            detectorName = detectorsManager.getCurrentDetectorName()
+        if detectorName not in detectorsManager.getAllDeviceNames():
+            raise HTTPException(status_code=404, detail=f'Detector "{detectorName}" not found')
+        if binning < 1:
+            raise HTTPException(status_code=400, detail=f'Binning must be at least 1, got {binning}')
+
+        # does not restart the acquisition if it is running already, e.g. for the live view
+        detector = detectorsManager[detectorName]
+        frameBuffer = detector.getFrameBuffer()
+        frameCount = frameBuffer.frameCount if frameBuffer is not None else None
+        acqHandle = detectorsManager.startAcquisition()
+        try:
+            if frameBuffer is not None:
+                # wait for a frame that arrived after the request rather than taking the one
+                # left from the last acquisition
+                frame = frameBuffer.waitForNewFrame(frameCount, timeout=timeout)
+            else:
+                frame = detector.getLatestFrame()
+        finally:
+            detectorsManager.stopAcquisition(acqHandle)
+        if frame is None:
+            raise HTTPException(status_code=503, detail=f'No frame from detector "{detectorName}"')
+
+        roi = None
+        if width is not None or height is not None or x is not None or y is not None:
+            roi = (x or 0, y or 0,
+                   width if width is not None else frame.shape[1] - (x or 0),
+                   height if height is not None else frame.shape[0] - (y or 0))
+        try:
+            # raises for a ROI outside of the frame, which would give an empty frame
+            frame = cropAndBinFrame(np.asarray(frame), roi, binning)
+            data, compression = encodeFrame(frame, compression, compressionLevel)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        headers = {
+            'X-Image-Detector': detectorName,
+            'X-Image-Dtype': frame.dtype.str,
+            'X-Image-Shape': ','.join(str(size) for size in frame.shape),
+            'X-Image-Compression': compression.name
+        }
+        return Response(data, headers=headers, media_type='application/octet-stream')
+
     @APIExport(runOnUIThread=True)
-    def startRecording(self, mSaveFormat: int = SaveFormat.TIFF) -> None:
-        """ Starts recording with the set settings to the set file path. """
+    def startRecording(self, mSaveFormat: int = SaveFormat.TIFF,
+                       mCompression: int = Compression.DEFAULT) -> None:
+        """ Starts recording with the set settings to the set file path.
+        mCompression selects the lossless compression codec
+        (0: format default, 1: Blosc-LZ4, 2: Blosc-Zstd, 3: LZ4, 4: Zstd). """
         mSaveFormat = SaveFormat(mSaveFormat)
+        self.compression = Compression(mCompression)
         if not IS_HEADLESS:
             self._widget.setRecButtonChecked(True)
         else:
@@ -593,6 +679,8 @@ class RecordingController(ImConWidgetController):
                 'saveFormat': mSaveFormat, # TIFF
                 'attrs': {detectorName: self._commChannel.sharedAttrs.getHDF5Attributes()
                           for detectorName in detectorsBeingCaptured},
+                'compression': self.compression,
+                'compressionLevel': self.compressionLevel
             }
             self._master.recordingManager.startRecording(**self.recordingArgs)
             self.recording = True
@@ -612,6 +700,24 @@ class RecordingController(ImConWidgetController):
                 self._commChannel.sigAbortScan.emit()
             self._master.recordingManager.endRecording()            
 
+    @APIExport(runOnUIThread=True)
+    def setRecCompression(self, compression: int, compressionLevel: Optional[int] = None) -> None:
+        """ Sets the lossless compression codec of the following recordings
+        and snaps (0: format default, 1: Blosc-LZ4, 2: Blosc-Zstd, 3: LZ4,
+        4: Zstd) and optionally its compression level. """
+        self.compression = Compression(compression)
+        self.compressionLevel = compressionLevel
+
+    @APIExport(runOnUIThread=False)
+    def benchmarkCompression(self, detectorName: Optional[str] = None, numFrames: int = 10) -> dict:
+        """ Compresses frames of the detector with every available codec and
+        returns the compression ratio and throughput (MB/s) per codec. """
+        if detectorName is None:
+            detectorName = self.getDetectorNamesToCapture()[0]
+        return self._master.recordingManager.benchmarkCompression(
+            detectorName, numFrames=numFrames, compressionLevel=self.compressionLevel
+        )
+
     @APIExport(runOnUIThread=True)
     def setRecModeSpecFrames(self, numFrames: int) -> None:
         """ Sets the recording mode to record a specific number of frames. """
@@ -1,13 +1,16 @@
 import numpy as np
 import time
+import threading
 import tifffile as tif
 import os
 from datetime import datetime
 
+from imswitch import IS_HEADLESS
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex
 from imswitch.imcontrol.view import guitools
 from imswitch.imcommon.model import initLogger, dirtools
 from ..basecontrollers import LiveUpdatedController
+from .smlm import HistogramRenderer, LocalizationStore, SMLMLocalizer
 
 from imswitch.imcommon.model import APIExport
 
@@ -36,9 +39,9 @@ class STORMReconController(LiveUpdatedController):
         self.it = 0
         self.showPos = False
         self.threshold = 0.2
+        self.active = False
 
         # reconstruction related settings
-        #TODO: Make parameters adaptable from Plugin
         # Prepare image computation worker
         self.imageComputationWorker = self.STORMReconImageComputationWorker()
         self.imageComputationWorker.sigSTORMReconImageComputed.connect(self.displayImage)
@@ -47,16 +50,14 @@ class STORMReconController(LiveUpdatedController):
         allDetectorNames = self._master.detectorsManager.getAllDeviceNames()
         self.detector = self._master.detectorsManager[allDetectorNames[0]]
 
+        self.imageComputationThread = Thread()
+        self.imageComputationWorker.moveToThread(self.imageComputationThread)
+        self.sigImageReceived.connect(self.imageComputationWorker.computeSTORMReconImage)
+        self.imageComputationThread.start()
 
-        if isMicroEye:
-            self.imageComputationThread = Thread()
-            self.imageComputationWorker.moveToThread(self.imageComputationThread)
-            self.sigImageReceived.connect(self.imageComputationWorker.computeSTORMReconImage)
-            self.imageComputationThread.start()
-
-            # Connect CommunicationChannel signals
-            self._commChannel.sigUpdateImage.connect(self.update)
-
+        # the built-in localizer is used unless microEye and its widgets are available
+        self.imageComputationWorker.setUseMicroEye(isMicroEye and not IS_HEADLESS)
+        if isMicroEye and not IS_HEADLESS:
             # Connect STORMReconWidget signals
             self._widget.sigShowToggled.connect(self.setShowSTORMRecon)
             self._widget.sigUpdateRateChanged.connect(self.changeRate)
@@ -102,18 +103,27 @@ class STORMReconController(LiveUpdatedController):
         self.imageComputationWorker.setThreshold(threshold)
         self.imageComputationWorker.setFitRoiSize(fit_roi_size)
         self.imageComputationWorker.setFittingMethod(fitting_method)
+        self.imageComputationWorker.setPixelSizes(self._widget.px_size.value(),
+                                                  self._widget.super_px_size.value())
         
+        self.setActive(enabled)
+
+    def setActive(self, enabled):
+        """ Starts or stops the live reconstruction. Stopping saves the
+        rendered image and the localizations. """
         self.active = enabled
         
         # if it will be deactivated, trigger an image-save operation
         if not self.active:
-            self.imageComputationWorker.saveImage()
+            self.unsubscribeLiveView()
+            self.imageComputationWorker.setActive(False)
+            return self.imageComputationWorker.saveImage()
         else:
-            # this will activate/deactivate the live reconstruction
             self.imageComputationWorker.setActive(enabled)
+            self.subscribeLiveView()
             
 
-    def update(self, detectorName, im, init, isCurrentDetector):
+    def update(self, detectorName, im, init, scale, isCurrentDetector):
         """ Update with new detector frame. """
         if not isCurrentDetector or not self.active:
             return
@@ -127,7 +137,8 @@ class STORMReconController(LiveUpdatedController):
 
     def displayImage(self, im):
         """ Displays the image in the view. """
-        self._widget.setImage(im)
+        if self._widget is not None:
+            self._widget.setImage(im)
 
     def changeRate(self, updateRate):
         """ Change update rate. """
@@ -140,24 +151,77 @@ class STORMReconController(LiveUpdatedController):
         if frame is None:
             frame = self.detector.getLatestFrame()
         self.imageComputationWorker.reconSTORMFrame(frame=frame)
+
+    @APIExport(runOnUIThread=False)
+    def startSTORMRecon(self, threshold: float = 0.2, roiSize: int = 7,
+                        method: str = 'phasor', renderPixelSize: float = 10,
+                        pixelSize: float = None) -> None:
+        """ Starts the live localization with the built-in localizer.
+        threshold: detection threshold, relative to the brightest spot if below 1.
+        roiSize: size of the fitted region around every spot in pixels.
+        method: 'phasor' or 'gaussian' (maximum likelihood fit).
+        renderPixelSize: pixel size of the rendered image in nm.
+        pixelSize: camera pixel size in the sample in nm, taken from the detector if not given. """
+        if pixelSize is None:
+            pixelSize = self.detector.pixelSizeUm[-1] * 1000
+        self.imageComputationWorker.setUseMicroEye(False)
+        self.imageComputationWorker.setThreshold(threshold)
+        self.imageComputationWorker.setFitRoiSize(roiSize)
+        self.imageComputationWorker.setFittingMethod(method)
+        self.imageComputationWorker.setPixelSizes(pixelSize, renderPixelSize)
+        self.setActive(True)
+
+    @APIExport(runOnUIThread=False)
+    def stopSTORMRecon(self) -> dict:
+        """ Stops the live localization and saves the rendered image and the
+        localizations. Returns the paths of the saved files. """
+        return self.setActive(False)
+
+    @APIExport(runOnUIThread=False)
+    def getSTORMReconStats(self) -> dict:
+        """ Returns the number of frames and localizations so far and the
+        number of frames skipped because the localizer was busy. """
+        return self.imageComputationWorker.getStats()
+
+    @APIExport(runOnUIThread=False)
+    def setSTORMReconRenderPixelSize(self, renderPixelSize: float) -> None:
+        """ Renders all localizations again with the given pixel size in
+        nm. """
+        self.imageComputationWorker.setRenderPixelSize(renderPixelSize)
                 
 
     class STORMReconImageComputationWorker(Worker):
         sigSTORMReconImageComputed = Signal(np.ndarray)
 
+        renderInterval = 0.2  # Shortest time between two rendered images in seconds
+        flushEvery = 100000  # Localizations to collect before they are written to disk
+
         def __init__(self):
             super().__init__()
             
             self.threshold = 0.2 # default threshold
             self.fit_roi_size = 13 # default roi size
+            self.fittingMethod = 'phasor'
+            self.pixelSize = 100  # camera pixel size in nm
+            self.renderPixelSize = 10  # super-resolution pixel size in nm
+            self.useMicroEye = False
             
             self._logger = initLogger(self, tryInheritParent=False)
             self._numQueuedImages = 0
             self._numQueuedImagesMutex = Mutex()
             
-            # store the sum of all reconstructed frames
+            # all localizations of the current acquisition and their render
+            self.localizations = LocalizationStore()
+            self.renderer = None
             self.sumReconstruction = None
-            self.allParameters = []
+            self.localizer = None
+            self.numFrames = 0
+            self.numSkipped = 0
+            self._pending = []
+            self._storeLock = threading.Lock()
+            self._lastRenderTime = 0
+            self._localizationsPath = None
+            self._numFlushed = 0
             
             self.active = False
 
@@ -165,6 +229,14 @@ class STORMReconController(LiveUpdatedController):
         def reconSTORMFrame(self, frame, preFilter=None, peakDetector=None,
                             rel_threshold=0.4, PSFparam=np.array([1.5]), 
                             roiSize=13, method=None):
+            """ Localizes the molecules in the frame. Returns the frame with the
+            localized pixels set to 1 and the localizations as a dict of
+            columns, see LocalizationStore. """
+            if not self.useMicroEye:
+                localizer = self.localizer or SMLMLocalizer(rel_threshold, roiSize)
+                localizations = localizer.localize(frame, self.numFrames)
+                return self._renderFrame(frame, localizations), localizations
+
             # tune parameters
             if method is None: # avoid error when microeye is not installed..
                 method = FittingMethod._2D_Phasor_CPU
@@ -193,45 +265,118 @@ class STORMReconController(LiveUpdatedController):
                         roiSize,
                         method)
 
+            numLocalizations = 0 if params is None else len(params)
+            unknown = np.full(numLocalizations, np.nan)
+            localizations = {
+                'frame': np.full(numLocalizations, self.numFrames),
+                'x': params[:, 0] if numLocalizations else unknown,
+                'y': params[:, 1] if numLocalizations else unknown,
+                'photons': params[:, 3] if numLocalizations else unknown,
+                'background': params[:, 2] if numLocalizations else unknown,
+                'sigma': unknown,
+                'crlb': (np.sqrt(crlbs[:, :2]).mean(axis=1)
+                         if numLocalizations and crlbs is not None else unknown)
+            }
+            return self._renderFrame(frame, localizations), localizations
+
+        def _renderFrame(self, frame, localizations):
             # create a simple render
             frameLocalized = np.zeros(frame.shape)
             try:
-                allX = np.int32(params[:,0])
-                allY = np.int32(params[:,1])
+                allX = np.int32(localizations['x'])
+                allY = np.int32(localizations['y'])
                 frameLocalized[(allY, allX)] = 1
             except Exception as e:
                 pass
-
-            return frameLocalized, params
+            return frameLocalized
 
         def setThreshold(self, threshold):
             self.threshold = threshold
             
         def setFitRoiSize(self, roiSize):
             self.fit_roi_size = roiSize
+
+        def setPixelSizes(self, pixelSize, renderPixelSize):
+            """ Sets the camera pixel size in the sample and the pixel size of
+            the rendered image, both in nm. """
+            self.pixelSize = pixelSize
+            self.renderPixelSize = renderPixelSize
+
+        def setRenderPixelSize(self, renderPixelSize):
+            """ Changes the pixel size of the rendered image and renders all
+            localizations again. """
+            self.renderPixelSize = renderPixelSize
+            with self._storeLock:
+                if self.renderer is None:
+                    return
+                self.renderer.setRenderPixelSize(renderPixelSize)
+                image = np.array(self.renderer.render(self.localizations))
+            self.sigSTORMReconImageComputed.emit(image)
+
+        def setUseMicroEye(self, useMicroEye):
+            self.useMicroEye = useMicroEye
             
         def computeSTORMReconImage(self):
             """ Compute STORMRecon of an image. """
             try:
-                if self._numQueuedImages > 1 or not self.active:
+                if not self.active:
+                    return
+                if not self.useMicroEye:
+                    self._submitFrame(self._image)
+                    return
+                if self._numQueuedImages > 1:
+                    self.numSkipped += 1
                     return  # Skip this frame in order to catch up
-                STORMReconrecon, params = self.reconSTORMFrame(frame=self._image, 
-                                                               preFilter=self.preFilter, 
-                                                               peakDetector=self.peakDetector, 
-                                                               rel_threshold=self.threshold, 
-                                                               roiSize=self.fit_roi_size)
-                self.allParameters.append(params)
-                
-                if self.sumReconstruction is None:
-                    self.sumReconstruction = STORMReconrecon
-                else:
-                    self.sumReconstruction += STORMReconrecon
-                self.sigSTORMReconImageComputed.emit(np.array(self.sumReconstruction))
+                _, localizations = self.reconSTORMFrame(frame=self._image,
+                                                        preFilter=self.preFilter,
+                                                        peakDetector=self.peakDetector,
+                                                        rel_threshold=self.threshold,
+                                                        roiSize=self.fit_roi_size)
+                self._addLocalizations(self._image.shape, localizations)
+                self.numFrames += 1
             finally:
                 self._numQueuedImagesMutex.lock()
                 self._numQueuedImages -= 1
                 self._numQueuedImagesMutex.unlock()
 
+        def _submitFrame(self, frame):
+            # localize in the worker pool, skipping frames while all workers are busy
+            self._pending = [future for future in self._pending if not future.done()]
+            if len(self._pending) >= 2 * self.localizer.numWorkers:
+                self.numSkipped += 1
+                return
+            future = self.localizer.submit(frame, self.numFrames)
+            future.add_done_callback(
+                lambda future, shape=frame.shape: self._onFrameLocalized(shape, future)
+            )
+            self._pending.append(future)
+            self.numFrames += 1
+
+        def _onFrameLocalized(self, frameShape, future):
+            try:
+                self._addLocalizations(frameShape, future.result())
+            except Exception as e:
+                self._logger.error(f'Failed to localize frame: {e}')
+
+        def _addLocalizations(self, frameShape, localizations):
+            with self._storeLock:
+                if self.renderer is None:
+                    self.renderer = HistogramRenderer(frameShape, self.pixelSize,
+                                                      self.renderPixelSize)
+                self.localizations.append(localizations)
+                self.renderer.add(localizations['x'], localizations['y'])
+                if len(self.localizations) - self._numFlushed >= self.flushEvery:
+                    self.localizations.flushHDF5(self._localizationsPath)
+                    self._numFlushed = len(self.localizations)
+
+                now = time.perf_counter()
+                if now - self._lastRenderTime < self.renderInterval:
+                    return
+                self._lastRenderTime = now
+                self.sumReconstruction = self.renderer.image
+                image = np.array(self.sumReconstruction)
+            self.sigSTORMReconImageComputed.emit(image)
+
         def prepareForNewImage(self, image):
             """ Must always be called before the worker receives a new image. """
             self._image = image
@@ -239,6 +384,10 @@ class STORMReconController(LiveUpdatedController):
             self._numQueuedImages += 1
             self._numQueuedImagesMutex.unlock()
 
+        def getStats(self):
+            return {'frames': self.numFrames, 'localizations': len(self.localizations),
+                    'skippedFrames': self.numSkipped}
+
         def setFittingMethod(self, method):
             self.fittingMethod = method
         def setFilter(self, filter):
@@ -251,25 +400,37 @@ class STORMReconController(LiveUpdatedController):
             self.peakDetector = detector
             
         def saveImage(self, filename="STORMRecon", fileExtension="tif"):
-            if self.sumReconstruction is None:
+            """ Saves the rendered image and the remaining localizations and
+            resets them. Returns the paths of the files. """
+            if self.sumReconstruction is None and len(self.localizations) == 0:
                 return
             
             # wait to finish all queued images
             while self._numQueuedImages > 0:
                 time.sleep(0.1)
+            for future in self._pending:
+                future.exception()
+            self._pending = []
                 
-            Ntime = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")            
-            filePath = self.getSaveFilePath(date=Ntime, 
-                                filename=filename, 
-                                extension=fileExtension)
-            
-            # self.switchOffIllumination()
-            self._logger.debug(filePath)
-            tif.imwrite(filePath, self.sumReconstruction, append=False)
-            
-            # Reset sumReconstruction
-            self.sumReconstruction *= 0
-            self.allParameters = []
+            with self._storeLock:
+                if self.renderer is not None:
+                    self.sumReconstruction = self.renderer.image
+                filePath = self._localizationsPath[:-len('_localizations.h5')] + \
+                    f"_{filename}.{fileExtension}"
+                self._logger.debug(filePath)
+                if self.sumReconstruction is not None:
+                    tif.imwrite(filePath, self.sumReconstruction, append=False)
+                self.localizations.flushHDF5(self._localizationsPath)
+                paths = {'image': filePath, 'localizations': self._localizationsPath}
+
+                # Reset the reconstruction
+                self.localizations.clear()
+                self.renderer = None
+                self.sumReconstruction = None
+                self.numFrames = 0
+                self.numSkipped = 0
+                self._numFlushed = 0
+            return paths
             
         def getSaveFilePath(self, date, filename, extension):
             mFilename =  f"{date}_{filename}.{extension}"
@@ -283,7 +444,19 @@ class STORMReconController(LiveUpdatedController):
             return newPath
         
         def setActive(self, enabled):
+            if enabled and not self.active:
+                Ntime = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")
+                self._localizationsPath = self.getSaveFilePath(date=Ntime,
+                                                               filename="localizations",
+                                                               extension="h5")
+                if not self.useMicroEye:
+                    method = self.fittingMethod if self.fittingMethod in SMLMLocalizer.methods \
+                        else 'phasor'
+                    self.localizer = SMLMLocalizer(threshold=self.threshold,
+                                                   roiSize=self.fit_roi_size, method=method)
             self.active = enabled
+            if not enabled and self.localizer is not None:
+                self.localizer.shutdown(wait=True)
 
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
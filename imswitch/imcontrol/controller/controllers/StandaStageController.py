@@ -3,7 +3,7 @@ from typing import Dict, List
 from imswitch.imcommon.model import APIExport
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.model import initLogger
-from imswitch.imcontrol.controller.controllers import PositionerController
+from .PositionerController import PositionerController
 
 class StandaStageController(ImConWidgetController):
     """ Linked to StandaStageWidget."""
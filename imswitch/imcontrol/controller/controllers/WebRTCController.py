@@ -17,6 +17,7 @@ import logging
 import os
 import asyncio
 import threading
+import time
 from aiohttp import web
 
 from aiohttp import web
@@ -39,13 +40,13 @@ class WebRTCController(LiveUpdatedController):
     """ Linked to WebRTCWidget."""
 
     sigImageReceived = Signal()
+    liveViewMaxRate = 15
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__logger = initLogger(self)
         self.frame = np.zeros((150, 300, 3)).astype('uint8')
-        self.updateRate = 10
-        self.it = 0
+        self.frameNumber = 0
         self.init = False
         self.showPos = False
 
@@ -79,7 +80,9 @@ class WebRTCController(LiveUpdatedController):
 
         t = threading.Thread(target=run_server, args=(aiohttp_server(),))
         t.start()
-        self.sigImageReceived.connect(self.displayImage)
+
+        # the video tracks send the newest frame of the live view
+        self.subscribeLiveView()
         
 
     async def on_shutdown(self, app):
@@ -89,17 +92,13 @@ class WebRTCController(LiveUpdatedController):
         self.pcs.clear()
 
 
-    def update(self, detectorName, im, init, isCurrentDetector):
+    def update(self, detectorName, im, init, scale, isCurrentDetector):
         """ Update with new detector frame. """
-        if not isCurrentDetector or not self.active:
+        if not isCurrentDetector:
             return
 
-        if self.it == self.updateRate:
-            self.it = 0
-            self.imageComputationWorker.prepareForNewImage(im)
-            self.sigImageReceived.emit()
-        else:
-            self.it += 1
+        self.frame = im
+        self.frameNumber += 1
 
     def displayImage(self, im):
         """ Displays the image in the view. """
@@ -139,10 +138,7 @@ class WebRTCController(LiveUpdatedController):
 
         # open media source
         video = VideoTransformTrack()
-        detectorManager = self._master.detectorsManager
-        detectorNum1Name = detectorManager.getAllDeviceNames()[0]
-        detector =  detectorManager[detectorNum1Name]
-        video.setDetector(detector)
+        video.setFrameSource(self)
         video_sender = pc.addTrack(video)
         self.force_codec(pc, video_sender, "video/H264")
         
@@ -174,16 +170,28 @@ class VideoTransformTrack(MediaStreamTrack):
 
     kind = "video"
 
+    # longest time to wait for a new frame before the last one is sent again
+    maxFrameInterval = 1
+
     def __init__(self):
         super().__init__()  # don't forget this!
         self.count = 0
+        self.lastFrameNumber = None
     
-    def setDetector(self, detector):
-        self.detector = detector
+    def setFrameSource(self, controller):
+        """ Sends the frames that the controller receives from the live
+        view. """
+        self.controller = controller
 
     async def recv(self):
         # frame = await self.track.recv()
-        img = self.detector.getLatestFrame().astype('uint8')
+        # wait for a frame that has not been sent yet instead of reading the camera
+        waitStart = time.perf_counter()
+        while (self.controller.frameNumber == self.lastFrameNumber and
+               time.perf_counter() - waitStart < self.maxFrameInterval):
+            await asyncio.sleep(0.005)
+        self.lastFrameNumber = self.controller.frameNumber
+        img = self.controller.frame.astype('uint8')
         if img is not None:
             if len(img.shape)<3:
                 img = np.array((img,img,img))
@@ -1,64 +1,74 @@
-from .AlignAverageController import AlignAverageController
-from .AlignmentLineController import AlignmentLineController
-from .AlignOptController import AlignOptController
-from .AlignXYController import AlignXYController
-from .AufofocusController import AutofocusController
-from .BeadRecController import BeadRecController
-from .ConsoleController import ConsoleController
-from .EtSTEDController import EtSTEDController
-from .FFTController import FFTController
-from .HoloController import HoloController
-from .JoystickController import JoystickController
-from .HistogrammController import HistogrammController
-from .STORMReconController import STORMReconController
-from .HoliSheetController import HoliSheetController
-from .FlowStopController import FlowStopController
-from .ObjectiveRevolverController import ObjectiveRevolverController
-from .TemperatureController import TemperatureController
-from .SquidStageScanController import SquidStageScanController
-from .FocusLockController import FocusLockController
-from .FOVLockController import FOVLockController
-from .ImageController import ImageController
-from .LaserController import LaserController
-from .MotCorrController import MotCorrController
-from .OptController import OptController
-from .LEDController import LEDController
-from .PositionerController import PositionerController
-from .StandaPositionerController import StandaPositionerController
-from .StandaStageController import StandaStageController
-from .RecordingController import RecordingController
-from .WellPlateController import WellPlateController
-from .LEDMatrixController import LEDMatrixController
-from .SLMController import SLMController
-from .ScanControllerBase import ScanControllerBase
-from .ScanControllerMoNaLISA import ScanControllerMoNaLISA
-from .ScanControllerPointScan import ScanControllerPointScan
-from .RotationScanController import RotationScanController
-from .RotatorController import RotatorController
-from .UC2ConfigController import UC2ConfigController
-from .SIMController import SIMController
-from .DPCController import DPCController
-from .MCTController import MCTController
-from .ROIScanController import ROIScanController
-from .RotationScanController import RotationScanController
-from .LightsheetController import LightsheetController
-from .WebRTCController import WebRTCController
-from .HyphaController import HyphaController
-from .JetsonNanoController import JetsonNanoController
-from .HistoScanController import HistoScanController
-from .FlatfieldController import FlatfieldController
-from .PixelCalibrationController import PixelCalibrationController
-from .ISMController import ISMController
-from .SettingsController import SettingsController
-from .SLMController import SLMController
-from .TilingController import TilingController
-from .ULensesController import ULensesController
-from .ViewController import ViewController
-from .TilingController import TilingController
-from .WatcherController import WatcherController
-from .hypha import hypha_storage
-from .hypha import hypha_executor
-from .camera_stage_mapping import camera_stage_calibration_1d
-from .camera_stage_mapping import camera_stage_calibration_2d
-from .camera_stage_mapping import camera_stage_tracker
-from .camera_stage_mapping import correlation_image_tracking
+"""
+The widget controllers of imcontrol. The controller modules are imported
+lazily: :py:data:`controllerRegistry` maps each controller name to its module,
+which is only imported once the controller is loaded, i.e. when the setup
+enables its widget.
+"""
+
+from imswitch.imcommon.model import LazyRegistry
+
+controllerRegistry = LazyRegistry(__name__, {
+    'AlignAverageController': 'AlignAverageController',
+    'AlignmentLineController': 'AlignmentLineController',
+    'AlignOptController': 'AlignOptController',
+    'AlignXYController': 'AlignXYController',
+    'AutofocusController': 'AufofocusController',
+    'BeadRecController': 'BeadRecController',
+    'ConsoleController': 'ConsoleController',
+    'EtSTEDController': 'EtSTEDController',
+    'FFTController': 'FFTController',
+    'HoloController': 'HoloController',
+    'JoystickController': 'JoystickController',
+    'HistogrammController': 'HistogrammController',
+    'STORMReconController': 'STORMReconController',
+    'HoliSheetController': 'HoliSheetController',
+    'FlowStopController': 'FlowStopController',
+    'ObjectiveRevolverController': 'ObjectiveRevolverController',
+    'TemperatureController': 'TemperatureController',
+    'SquidStageScanController': 'SquidStageScanController',
+    'FocusLockController': 'FocusLockController',
+    'FOVLockController': 'FOVLockController',
+    'ImageController': 'ImageController',
+    'LaserController': 'LaserController',
+    'MotCorrController': 'MotCorrController',
+    'OptController': 'OptController',
+    'LEDController': 'LEDController',
+    'PositionerController': 'PositionerController',
+    'StandaPositionerController': 'StandaPositionerController',
+    'StandaStageController': 'StandaStageController',
+    'RecordingController': 'RecordingController',
+    'WellPlateController': 'WellPlateController',
+    'LEDMatrixController': 'LEDMatrixController',
+    'SLMController': 'SLMController',
+    'ScanControllerBase': 'ScanControllerBase',
+    'ScanControllerMoNaLISA': 'ScanControllerMoNaLISA',
+    'ScanControllerPointScan': 'ScanControllerPointScan',
+    'RotationScanController': 'RotationScanController',
+    'RotatorController': 'RotatorController',
+    'UC2ConfigController': 'UC2ConfigController',
+    'SIMController': 'SIMController',
+    'DPCController': 'DPCController',
+    'MCTController': 'MCTController',
+    'ROIScanController': 'ROIScanController',
+    'LightsheetController': 'LightsheetController',
+    'WebRTCController': 'WebRTCController',
+    'HyphaController': 'HyphaController',
+    'JetsonNanoController': 'JetsonNanoController',
+    'HistoScanController': 'HistoScanController',
+    'FlatfieldController': 'FlatfieldController',
+    'PixelCalibrationController': 'PixelCalibrationController',
+    'ISMController': 'ISMController',
+    'SettingsController': 'SettingsController',
+    'TilingController': 'TilingController',
+    'ULensesController': 'ULensesController',
+    'ViewController': 'ViewController',
+    'WatcherController': 'WatcherController',
+    'hypha_storage': 'hypha.hypha_storage',
+    'hypha_executor': 'hypha.hypha_executor',
+    'camera_stage_calibration_1d': 'camera_stage_mapping.camera_stage_calibration_1d',
+    'camera_stage_calibration_2d': 'camera_stage_mapping.camera_stage_calibration_2d',
+    'camera_stage_tracker': 'camera_stage_mapping.camera_stage_tracker',
+    'correlation_image_tracking': 'camera_stage_mapping.correlation_image_tracking',
+})
+
+__getattr__ = controllerRegistry.moduleGetattr
@@ -147,7 +147,7 @@ class OFMStageScanClass(object):
         current_position = get_position()
         move = LoggingMoveWrapper(move,current_position)  # log positions and times for stage calibration
 
-        tracker = Tracker(grab_image, get_position, settle=wait)
+        tracker = Tracker(grab_image, get_position, settle=wait, method="registration")
 
         result = calibrate_backlash_1d(tracker, move, direction, self.getIsStop)#, return_backlash_data=return_backlash_data, nMultipliers=nMultipliers)
         result["move_history"] = move.history
@@ -213,7 +213,7 @@ class OFMStageScanClass(object):
         """Move by a given number of pixels on the camera, using the camera as an encoder."""
         grab_image, get_position, move, wait = self.camera_stage_functions()
 
-        tracker = Tracker(grab_image, get_position, settle=wait)
+        tracker = Tracker(grab_image, get_position, settle=wait, method="registration")
         tracker.acquire_template()
         closed_loop_move(tracker, self.move_in_image_coordinates, displacement_in_pixels, **kwargs)
 
@@ -238,7 +238,7 @@ class OFMStageScanClass(object):
         """
         grab_image, get_position, move, wait = self.camera_stage_functions()
 
-        tracker = Tracker(grab_image, get_position, settle=wait)
+        tracker = Tracker(grab_image, get_position, settle=wait, method="registration")
         tracker.acquire_template()
 
         return closed_loop_scan(tracker, self.move_in_image_coordinates, move, np.array(scan_path), **kwargs)
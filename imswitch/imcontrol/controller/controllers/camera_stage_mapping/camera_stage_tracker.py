@@ -30,6 +30,11 @@ try:
 except:
     logging.info("camera_stage_tracker won't be able to use the `direct` method as it failed to import")
     # TODO: find a neat way to disable/enable these warnings before import?
+try:
+    from imswitch.imcontrol.model.registration import ImageRegistration
+    available_tracking_methods.append("registration")
+except:
+    logging.info("camera_stage_tracker won't be able to use the `registration` method as it failed to import")
 if len(available_tracking_methods) == 0:
     raise ImportError(
         "camera_stage_tracker can't set up any tracking methods, so it will "
@@ -120,7 +125,7 @@ class Tracker():
             A function called before grabbing an image to ensure the image is
             fresh (most often, this waits a short time, or grabs and discards
             a frame from the camera).
-        method : ["fft", "direct"], optional
+        method : ["fft", "direct", "registration"], optional
             The tracking method to use (see below)
         
         Additional keyword arguments are passed to the tracking method.
@@ -142,6 +147,10 @@ class Tracker():
                         standard deviation is given in pixels, but is applied
                         in the Fourier domain (with appropriate transformation).
                         The value of sigma does not affect computation speed.
+            * **"registration":** uses the shared ImageRegistration of ImSwitch, which
+                also estimates sub-pixel shifts. It accepts the keyword arguments
+                **pad** and **sigma** like "fft", and **upsample_factor**
+                (`int`, default=`20`) - the inverse of the sub-pixel precision.
             NB the "direct" method depends on `opencv` and `scipy` and so it
             may fail to load.  Specifying "direct" will lead to an exception
             if this is the case; these are optional dependencies.  To see
@@ -255,6 +264,12 @@ class Tracker():
         if self.method == "fft":
             kwargs = {k: v for k, v in self.kwargs.items() if k in ["pad", "sigma"]}
             return high_pass_fft_template(image, calculate_peak=True, **kwargs)
+        if self.method == "registration":
+            # the registration object keeps the FFT template of the image
+            pad = self.kwargs.get("pad", True)
+            return ImageRegistration(image, highPassSigma=self.kwargs.get("sigma", 10),
+                                     upsampleFactor=self.kwargs.get("upsample_factor", 20),
+                                     pad=pad, window=not pad)
 
         
     @property
@@ -269,6 +284,9 @@ class Tracker():
             # the image in x, and half in y - so we return half the image size.  If we are zero
             # padding, then both these dimensions double, and we return the image size.
             disp = np.array(self.template.shape) // np.array([2,1])
+        if self.method == "registration":
+            # zero padding extends the unambiguous range from half an image to a whole image
+            disp = np.array(self.image_shape[:2]) // (1 if self.template.pad else 2)
         return disp + self._template_position
     
     @property
@@ -316,6 +334,12 @@ class Tracker():
         if self.method=="fft":
             kwargs = {k: v for k, v in self.kwargs.items() if k in ["pad", "fractional_threshold", "error_threshold"]}
             return -displacement_from_fft_template(self.template, image, **kwargs) + self._template_position
+        if self.method=="registration":
+            result = self.template.register(image)[0]
+            error_threshold = self.kwargs.get("error_threshold", 0)
+            if result.confidence < error_threshold:
+                raise TrackingError("The correlation signal dropped below the threshold set.")
+            return -result.shift + self._template_position
     
     def append_point(self, settle=True, image=None):
         """Find the current position using both stage and image, and remember it
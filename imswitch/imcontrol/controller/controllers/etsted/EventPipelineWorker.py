@@ -0,0 +1,283 @@
+import importlib
+import multiprocessing
+import queue
+import sys
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Optional
+
+import numpy as np
+
+# Processes are spawned rather than forked, as forking a process with Qt
+# and camera threads is not safe. time.perf_counter() is a system-wide
+# clock, so that times taken in the worker and in the controller can be
+# compared.
+_context = multiprocessing.get_context('spawn')
+
+
+class LatestFrameSlot:
+    """ Shared-memory slot that holds the newest frame for a worker process.
+
+    put() copies a frame into the slot and overwrites a frame that the
+    worker has not taken yet, so the worker always gets the newest frame
+    and never works through a backlog. Overwritten frames are counted in
+    numDropped. The slot can be passed to a process on its creation. """
+
+    def __init__(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._shm = SharedMemory(create=True,
+                                 size=max(int(np.prod(self.shape)) * self.dtype.itemsize, 1))
+        self._condition = _context.Condition()
+        # sequence, frame ID, put time, number of commands, sequence taken
+        self._header = _context.RawArray('d', 5)
+        self._numDropped = _context.RawValue('q', 0)
+        self._closed = _context.RawValue('b', 0)
+        self._frame = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_frame']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._frame = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    @property
+    def numDropped(self):
+        return self._numDropped.value
+
+    @property
+    def closed(self):
+        return bool(self._closed.value)
+
+    def put(self, frame, frameId, numCommands=0):
+        """ Copies the frame into the slot and wakes up the worker.
+        numCommands is the number of commands that were sent to the worker
+        before the frame and have to be applied before it is processed. """
+        frame = np.asarray(frame)
+        if frame.shape != self.shape or frame.dtype != self.dtype:
+            raise ValueError(f'Expected a frame of shape {self.shape} and type {self.dtype},'
+                             f' got {frame.shape} and {frame.dtype}')
+        with self._condition:
+            if self._header[0] > self._header[4]:
+                self._numDropped.value += 1
+            self._frame[...] = frame
+            self._header[0] += 1
+            self._header[1] = frameId
+            self._header[2] = time.perf_counter()
+            self._header[3] = numCommands
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        """ Waits for a frame that was not taken yet and returns a copy of
+        it, its frame ID, the time it was put into the slot and the number of
+        commands sent before it. Returns None if there is none within timeout
+        seconds or the slot is closed. """
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._header[0] > self._header[4] or self._closed.value, timeout):
+                return None
+            if self._closed.value:
+                return None
+            self._header[4] = self._header[0]
+            return self._frame.copy(), int(self._header[1]), self._header[2], int(self._header[3])
+
+    def close(self):
+        """ Wakes up a waiting worker, which then gets None from take(). """
+        with self._condition:
+            self._closed.value = 1
+            self._condition.notify_all()
+
+    def release(self):
+        """ Frees the shared memory; only called by the process that created
+        the slot, after the worker has stopped. """
+        self._frame = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+@dataclass
+class PipelineResult:
+    """ The output of the analysis pipeline for one frame. """
+
+    frameId: int
+    coords: Optional[np.ndarray] = None
+    """ Detected event coordinates as returned by the pipeline. """
+
+    exinfo: Any = None
+    """ Extra information that the pipeline passes on to the next frame. """
+
+    analysedImage: Optional[np.ndarray] = None
+    """ The preprocessed image, only returned in the test modes. """
+
+    putTime: float = 0.0
+    startTime: float = 0.0
+    endTime: float = 0.0
+    """ perf_counter() times of the frame being handed to the worker and of
+    the start and end of the pipeline. """
+
+    error: Optional[str] = None
+
+
+class EventPipelineWorker:
+    """ Runs an etSTED analysis pipeline in a separate process, so that its
+    compute time and jitter do not block the GUI or the acquisition.
+
+    Frames are handed over with submit() through a LatestFrameSlot in shared
+    memory; if the pipeline is still busy with the previous frame, the
+    waiting frame is replaced by the new one. The results come back as
+    PipelineResult through a queue, see getResult().
+
+    The pipeline is the function of the same name in the module
+    pipelineName, imported from pipelinePaths, with the signature
+    pipeline(img, prevFrames, binary_mask, testmode, exinfo, *params). It
+    returns the detected coordinates and exinfo, and in test mode also the
+    preprocessed image. The worker keeps the previous frames and exinfo
+    between calls, as the pipelines expect. """
+
+    def __init__(self, pipelineName, pipelinePaths, frameShape, dtype):
+        self.pipelineName = pipelineName
+        self.pipelinePaths = list(pipelinePaths)
+        self.frameShape = tuple(frameShape)
+        self.dtype = np.dtype(dtype)
+        self._slot = None
+        self._commands = None
+        self._results = None
+        self._process = None
+        self._numCommands = 0
+
+    @property
+    def isRunning(self):
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def numDropped(self):
+        """ Number of frames that were replaced before the pipeline got to
+        them. """
+        return self._slot.numDropped if self._slot is not None else 0
+
+    def start(self):
+        """ Starts the worker process. It takes a moment to import the
+        pipeline; frames submitted meanwhile replace each other. """
+        self._slot = LatestFrameSlot(self.frameShape, self.dtype)
+        self._numCommands = 0
+        self._commands = _context.Queue()
+        self._results = _context.Queue()
+        self._process = _context.Process(
+            target=_runWorker, name=f'etSTED-{self.pipelineName}', daemon=True,
+            args=(self._slot, self._commands, self._results, self.pipelineName,
+                  self.pipelinePaths)
+        )
+        self._process.start()
+
+    def configure(self, binaryMask, testMode, params):
+        """ Sets the binary mask, the test mode flag and the further
+        parameters that are passed to the pipeline. """
+        self._sendCommand('configure', binaryMask, testMode, list(params))
+
+    def reset(self):
+        """ Clears the previous frames and exinfo, e.g. after an event. """
+        self._sendCommand('reset')
+
+    def submit(self, frame, frameId):
+        self._slot.put(frame, frameId, self._numCommands)
+
+    def getResult(self, timeout=None):
+        """ Returns the next PipelineResult, or None if there is none within
+        timeout seconds. """
+        try:
+            return self._results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _sendCommand(self, command, *args):
+        # the commands take another way than the frames, the worker waits for
+        # those that were sent before a frame before processing it
+        self._commands.put((command, args))
+        self._numCommands += 1
+
+    def stop(self, timeout=5):
+        """ Stops the worker process and frees the shared memory. """
+        if self._process is None:
+            return
+        self._slot.close()
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._process = None
+        self._slot.release()
+        self._slot = None
+        for processQueue in (self._commands, self._results):
+            processQueue.cancel_join_thread()
+            processQueue.close()
+
+
+def _runWorker(slot, commands, results, pipelineName, pipelinePaths):
+    """ The main function of the worker process. """
+    sys.path.extend(path for path in pipelinePaths if path not in sys.path)
+    try:
+        pipeline = getattr(importlib.import_module(pipelineName), pipelineName)
+    except Exception:
+        results.put(PipelineResult(-1, error=traceback.format_exc()))
+        return
+
+    binaryMask, testMode, params = None, False, []
+    prevFrames = deque(maxlen=10)
+    exinfo = None
+    numCommandsApplied = 0
+    while True:
+        taken = slot.take(timeout=0.1)
+        if taken is None:
+            if slot.closed:
+                return
+            continue
+
+        frame, frameId, putTime, numCommands = taken
+        while numCommandsApplied < numCommands:
+            command, args = commands.get()
+            numCommandsApplied += 1
+            if command == 'configure':
+                binaryMask, testMode, params = args
+            elif command == 'reset':
+                prevFrames.clear()
+                exinfo = None
+        startTime = time.perf_counter()
+        try:
+            output = pipeline(frame, prevFrames, binaryMask, testMode, exinfo, *params)
+        except Exception:
+            results.put(PipelineResult(frameId, putTime=putTime, startTime=startTime,
+                                       endTime=time.perf_counter(), error=traceback.format_exc()))
+            continue
+        endTime = time.perf_counter()
+
+        coords, exinfo = output[0], output[1]
+        analysedImage = output[2] if testMode and len(output) > 2 else None
+        prevFrames.append(frame)
+        results.put(PipelineResult(frameId, np.asarray(coords), exinfo, analysedImage,
+                                   putTime, startTime, endTime))
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,110 @@
+import threading
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """ Histogram of latencies in seconds, with 20 logarithmic bins per decade
+    from 10 µs to 100 s. Quantiles are read from the histogram, i.e. they are
+    accurate to about 12 %, while the count, mean, min and max are exact. """
+
+    edges = np.logspace(-5, 2, 141)
+
+    def __init__(self):
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = 0.0
+
+    def record(self, latency):
+        self.counts[np.searchsorted(self.edges, latency, side='right')] += 1
+        self.count += 1
+        self.total += latency
+        self.min = min(self.min, latency)
+        self.max = max(self.max, latency)
+
+    def quantile(self, q):
+        """ Returns the upper edge of the bin that holds the q-quantile,
+        clipped to the recorded range. """
+        if self.count == 0:
+            return np.nan
+        index = np.searchsorted(np.cumsum(self.counts), q * self.count)
+        upperEdges = np.append(self.edges, np.inf)
+        return float(np.clip(upperEdges[index], self.min, self.max))
+
+    def summary(self):
+        """ Returns the count and the statistics of the latencies in ms. """
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'meanMs': 1e3 * self.total / self.count,
+            'minMs': 1e3 * self.min,
+            'p50Ms': 1e3 * self.quantile(0.5),
+            'p90Ms': 1e3 * self.quantile(0.9),
+            'p99Ms': 1e3 * self.quantile(0.99),
+            'maxMs': 1e3 * self.max
+        }
+
+
+class LatencyMetrics:
+    """ Latency histograms of the stages from a frame of the fast modality to
+    the start of the event scan:
+
+    - frameArrival: from handing the frame to the pipeline worker to the
+      start of the pipeline
+    - pipeline: the analysis pipeline
+    - resultReturn: from the end of the pipeline to the detections arriving
+      in the controller
+    - coordTransform: the transform of the event coordinates to scan
+      coordinates
+    - scanStart: from handing the frame to the worker to the start of the
+      event scan, i.e. the total event-to-scan latency
+
+    Stages can be recorded from any thread. """
+
+    stages = ('frameArrival', 'pipeline', 'resultReturn', 'coordTransform', 'scanStart')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {stage: LatencyHistogram() for stage in self.stages}
+            self.numDroppedFrames = 0
+
+    def record(self, stage, latency):
+        """ Records the latency of the stage in seconds. """
+        with self._lock:
+            self.histograms[stage].record(latency)
+
+    def setDroppedFrames(self, numDroppedFrames):
+        with self._lock:
+            self.numDroppedFrames = numDroppedFrames
+
+    def summary(self):
+        """ Returns the statistics of all stages and the number of frames
+        that were dropped because the pipeline was busy. """
+        with self._lock:
+            summary = {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+            summary['droppedFrames'] = self.numDroppedFrames
+        return summary
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
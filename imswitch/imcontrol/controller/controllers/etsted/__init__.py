@@ -0,0 +1,10 @@
+"""
+Event detection for :py:class:`EtSTEDController`:
+:py:class:`EventPipelineWorker` runs the analysis pipeline on the frames of
+the fast modality in a separate process, which gets the newest frame through
+a :py:class:`LatestFrameSlot` in shared memory, and :py:class:`LatencyMetrics`
+keeps latency histograms of the stages from a frame to the event scan.
+"""
+
+from .EventPipelineWorker import EventPipelineWorker, LatestFrameSlot, PipelineResult
+from .LatencyMetrics import LatencyHistogram, LatencyMetrics
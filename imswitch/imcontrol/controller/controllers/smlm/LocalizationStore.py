@@ -0,0 +1,166 @@
+import threading
+
+import h5py
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class LocalizationStore:
+    """ Append-only columnar store of localizations.
+
+    Every column is one preallocated NumPy array that grows by doubling, so
+    appending the localizations of a frame is a handful of slice
+    assignments. flushHDF5() and flushParquet() append the rows that were
+    added since their last call to a file, so that long acquisitions can be
+    written out while they run. """
+
+    columns = {'frame': np.int64, 'x': np.float32, 'y': np.float32, 'photons': np.float32,
+               'background': np.float32, 'sigma': np.float32, 'crlb': np.float32}
+
+    def __init__(self, capacity=65536):
+        self._data = {name: np.empty(capacity, dtype=dtype)
+                      for name, dtype in self.columns.items()}
+        self._length = 0
+        self._numFlushedHDF5 = 0
+        self._numFlushedParquet = 0
+        self._parquetWriter = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, name):
+        """ Returns a read-only view of the column. """
+        view = self._data[name][:self._length]
+        view.flags.writeable = False
+        return view
+
+    def append(self, localizations):
+        """ Appends localizations given as a dict of equally long columns. """
+        numRows = len(localizations['x'])
+        with self._lock:
+            if self._length + numRows > len(self._data['x']):
+                capacity = max(2 * len(self._data['x']), self._length + numRows)
+                for name, column in self._data.items():
+                    grown = np.empty(capacity, dtype=column.dtype)
+                    grown[:self._length] = column[:self._length]
+                    self._data[name] = grown
+            for name, column in self._data.items():
+                column[self._length:self._length + numRows] = localizations[name]
+            self._length += numRows
+
+    def clear(self):
+        """ Removes all localizations and closes the Parquet file. """
+        with self._lock:
+            self._length = 0
+            self._numFlushedHDF5 = 0
+            self._numFlushedParquet = 0
+        self.closeParquet()
+
+    def flushHDF5(self, filePath, groupName='localizations'):
+        """ Appends the rows that were not flushed yet to one resizable dataset
+        per column in the given group of the HDF5 file. Returns the number of
+        rows written. """
+        with self._lock:
+            start, stop = self._numFlushedHDF5, self._length
+            self._numFlushedHDF5 = stop
+        if stop == start:
+            return 0
+
+        with h5py.File(filePath, 'a') as file:
+            group = file.require_group(groupName)
+            for name, column in self._data.items():
+                if name not in group:
+                    group.create_dataset(name, shape=(0,), maxshape=(None,),
+                                         dtype=column.dtype, chunks=(65536,))
+                dataset = group[name]
+                dataset.resize((dataset.shape[0] + stop - start,))
+                dataset[-(stop - start):] = column[start:stop]
+        return stop - start
+
+    def flushParquet(self, filePath):
+        """ Appends the rows that were not flushed yet as a row group to the
+        Parquet file, which stays open until closeParquet() is called.
+        Returns the number of rows written. Requires pyarrow. """
+        if pyarrow is None:
+            raise ImportError('Writing Parquet files requires pyarrow')
+
+        with self._lock:
+            start, stop = self._numFlushedParquet, self._length
+            self._numFlushedParquet = stop
+        if stop == start:
+            return 0
+
+        table = pyarrow.table({name: column[start:stop] for name, column in self._data.items()})
+        if self._parquetWriter is None:
+            self._parquetWriter = pyarrow.parquet.ParquetWriter(filePath, table.schema)
+        self._parquetWriter.write_table(table)
+        return stop - start
+
+    def closeParquet(self):
+        if self._parquetWriter is not None:
+            self._parquetWriter.close()
+            self._parquetWriter = None
+
+
+class HistogramRenderer:
+    """ Renders localizations as a 2D histogram with a super-resolution pixel
+    size, i.e. the number of localizations per pixel. Localizations are
+    added incrementally as they arrive; changing the pixel size requires
+    rendering all of them again with render(). """
+
+    def __init__(self, frameShape, pixelSize, renderPixelSize):
+        self.frameShape = tuple(frameShape[:2])
+        self.pixelSize = pixelSize
+        self.renderPixelSize = renderPixelSize
+        self.image = None
+        self.setRenderPixelSize(renderPixelSize)
+
+    @property
+    def magnification(self):
+        return self.pixelSize / self.renderPixelSize
+
+    def setRenderPixelSize(self, renderPixelSize):
+        """ Sets the pixel size of the rendered image, in the unit of the
+        camera pixel size, and clears it. """
+        if renderPixelSize <= 0:
+            raise ValueError(f'Invalid render pixel size {renderPixelSize}')
+        self.renderPixelSize = renderPixelSize
+        shape = tuple(int(np.ceil(length * self.magnification)) for length in self.frameShape)
+        self.image = np.zeros(shape, dtype=np.uint32)
+
+    def add(self, x, y):
+        """ Adds localizations with positions in camera pixels. """
+        columns = np.floor((np.asarray(x) + 0.5) * self.magnification).astype(np.int64)
+        rows = np.floor((np.asarray(y) + 0.5) * self.magnification).astype(np.int64)
+        inside = ((rows >= 0) & (rows < self.image.shape[0]) &
+                  (columns >= 0) & (columns < self.image.shape[1]))
+        np.add.at(self.image, (rows[inside], columns[inside]), 1)
+
+    def render(self, store):
+        """ Clears the image and renders all localizations of the store. """
+        self.image[...] = 0
+        self.add(store['x'], store['y'])
+        return self.image
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
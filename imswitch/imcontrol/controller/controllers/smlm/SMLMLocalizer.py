@@ -0,0 +1,232 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.ndimage import gaussian_filter, maximum_filter
+from scipy.special import erf
+
+
+class SMLMLocalizer:
+    """ Detects and localizes single molecules in camera frames.
+
+    Candidates are the local maxima of a difference of Gaussians filtered
+    frame above threshold (relative to the maximum of the filtered frame if
+    below 1, absolute otherwise). A roiSize x roiSize region around every
+    candidate is fitted, all regions of a frame at once:
+
+    - 'phasor' estimates the position from the phase of the first Fourier
+      coefficients and the width from their magnitude, which is fast and
+      does not iterate;
+    - 'gaussian' fits an integrated symmetric Gaussian with background by
+      maximum likelihood for Poisson noise, starting from the phasor
+      estimate.
+
+    For both, the Cramér-Rao lower bound of the position is computed from
+    the Fisher information of the fitted model. Pixel values are converted to
+    photons with (value - offset) / gain. Frames can be localized in a pool
+    of worker threads with submit(); the filters and array operations
+    release the GIL, so frames are processed in parallel. """
+
+    methods = ['phasor', 'gaussian']
+    columns = ['frame', 'x', 'y', 'photons', 'background', 'sigma', 'crlb']
+
+    def __init__(self, threshold=0.2, roiSize=7, psfSigma=1.5, method='phasor', gain=1,
+                 offset=0, numIterations=10, numWorkers=None):
+        if method not in self.methods:
+            raise ValueError(f'Unknown fitting method "{method}", expected one of {self.methods}')
+        if roiSize < 3:
+            raise ValueError(f'roiSize must be at least 3, got {roiSize}')
+
+        self.threshold = threshold
+        self.roiSize = roiSize // 2 * 2 + 1  # Odd, so that the candidate is in the center
+        self.psfSigma = psfSigma
+        self.method = method
+        self.gain = gain
+        self.offset = offset
+        self.numIterations = numIterations
+        self.numWorkers = numWorkers or os.cpu_count() or 1
+        self._executor = None
+
+    def submit(self, frame, frameIndex):
+        """ Localizes the frame in the worker pool. Returns a future of the
+        result of localize(). """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.numWorkers,
+                                                thread_name_prefix='SMLMLocalizer')
+        return self._executor.submit(self.localize, frame, frameIndex)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def localize(self, frame, frameIndex=0):
+        """ Returns the localizations in the frame as a dict of columns, see
+        columns. Positions are in pixels, photons and background (per pixel)
+        in photons, sigma and crlb (the mean standard deviation of x and y)
+        in pixels. """
+        image = (np.asarray(frame, dtype=np.float32) - self.offset) / self.gain
+        ys, xs = self.detect(image)
+        rois = self.extractRois(image, ys, xs)
+
+        if self.method == 'gaussian':
+            params = self.fitGaussian(rois)
+        else:
+            params = self.fitPhasor(rois)
+        crlb = self.computeCRLB(rois.shape[1], params)
+
+        half = self.roiSize // 2
+        x, y, photons, background, sigma = params.T
+        valid = (np.all(np.isfinite(params), axis=1) & np.isfinite(crlb) & (photons > 0) &
+                 (x >= -0.5) & (x <= self.roiSize - 0.5) & (y >= -0.5) & (y <= self.roiSize - 0.5))
+        return {
+            'frame': np.full(np.count_nonzero(valid), frameIndex, dtype=np.int64),
+            'x': (xs[valid] - half + x[valid]).astype(np.float32),
+            'y': (ys[valid] - half + y[valid]).astype(np.float32),
+            'photons': photons[valid].astype(np.float32),
+            'background': background[valid].astype(np.float32),
+            'sigma': sigma[valid].astype(np.float32),
+            'crlb': crlb[valid].astype(np.float32)
+        }
+
+    def detect(self, image):
+        """ Returns the row and column indices of the candidates that are far
+        enough from the border to cut out their regions. """
+        filtered = (gaussian_filter(image, self.psfSigma) -
+                    gaussian_filter(image, 2.5 * self.psfSigma))
+        isPeak = filtered == maximum_filter(filtered, size=self.roiSize // 2 + 1)
+        threshold = self.threshold * filtered.max() if self.threshold < 1 else self.threshold
+        isPeak &= filtered > threshold
+
+        half = self.roiSize // 2
+        isPeak[:half] = isPeak[-half:] = False
+        isPeak[:, :half] = isPeak[:, -half:] = False
+        return np.nonzero(isPeak)
+
+    def extractRois(self, image, ys, xs):
+        """ Returns the regions around the candidates as an array of shape
+        (n, roiSize, roiSize). """
+        offsets = np.arange(self.roiSize) - self.roiSize // 2
+        return image[ys[:, None, None] + offsets[None, :, None],
+                     xs[:, None, None] + offsets[None, None, :]]
+
+    def fitPhasor(self, rois):
+        """ Returns the parameters (x, y, photons, background, sigma) of the
+        spots in the regions, with positions relative to the regions. """
+        size = rois.shape[1] if len(rois) else self.roiSize
+        border = np.concatenate([rois[:, 0], rois[:, -1], rois[:, 1:-1, 0], rois[:, 1:-1, -1]],
+                                axis=1) if len(rois) else np.empty((0, 1))
+        background = np.median(border, axis=1)
+        signal = rois - background[:, None, None]
+        photons = signal.sum(axis=(1, 2))
+
+        k = 2 * np.pi / size
+        phasor = np.exp(-1j * k * np.arange(size))
+        firstX = signal.sum(axis=1) @ phasor
+        firstY = signal.sum(axis=2) @ phasor
+        x = (-np.angle(firstX) % (2 * np.pi)) / k
+        y = (-np.angle(firstY) % (2 * np.pi)) / k
+
+        # the magnitude of the first coefficient falls off with the width of a Gaussian spot
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.clip((np.abs(firstX) + np.abs(firstY)) / (2 * photons), 1e-6, 1 - 1e-6)
+            sigma = np.sqrt(-2 * np.log(ratio)) / k
+        return np.stack([x, y, photons, background, sigma], axis=1)
+
+    def fitGaussian(self, rois):
+        """ Like fitPhasor, but refines the parameters by maximum likelihood
+        estimation with Fisher scoring and Levenberg-Marquardt damping. """
+        params = self.fitPhasor(rois)
+        params[:, 2] = np.maximum(params[:, 2], 1)
+        params[:, 3] = np.maximum(params[:, 3], 1e-3)
+        params[:, 4] = np.where(np.isfinite(params[:, 4]), params[:, 4], self.psfSigma)
+        params[:, 4] = np.clip(params[:, 4], 0.5, self.roiSize / 2)
+        if len(rois) == 0:
+            return params
+
+        data = rois.reshape(len(rois), -1)
+        damping = np.full(len(rois), 1e-3)
+        for _ in range(self.numIterations):
+            model, jacobian = self._gaussianModel(rois.shape[1], params)
+            weights = 1 / model
+            fisher = np.einsum('npi,np,npj->nij', jacobian, weights, jacobian)
+            gradient = np.einsum('npi,np->ni', jacobian, (data - model) * weights)
+            diagonal = fisher[:, np.arange(5), np.arange(5)]
+            fisher[:, np.arange(5), np.arange(5)] += damping[:, None] * diagonal
+            try:
+                step = np.linalg.solve(fisher, gradient[..., None])[..., 0]
+            except np.linalg.LinAlgError:
+                break
+            params = params + step
+            params[:, 2] = np.maximum(params[:, 2], 1)
+            params[:, 3] = np.maximum(params[:, 3], 1e-3)
+            params[:, 4] = np.clip(params[:, 4], 0.3, self.roiSize / 2)
+        return params
+
+    def computeCRLB(self, size, params):
+        """ Returns the Cramér-Rao lower bound of the position (the mean of
+        the standard deviations of x and y) for the given parameters. """
+        crlb = np.full(len(params), np.nan)
+        if len(params) == 0:
+            return crlb
+        positive = params.copy()
+        positive[:, 3] = np.maximum(positive[:, 3], 1e-3)
+        model, jacobian = self._gaussianModel(size, positive)
+        fisher = np.einsum('npi,np,npj->nij', jacobian, 1 / model, jacobian)
+        invertible = np.abs(np.linalg.det(fisher)) > 1e-30
+        if np.any(invertible):
+            variances = np.linalg.inv(fisher[invertible])[:, [0, 1], [0, 1]]
+            with np.errstate(invalid='ignore'):
+                crlb[invertible] = np.sqrt(variances).mean(axis=1)
+        return crlb
+
+    @staticmethod
+    def _gaussianModel(size, params):
+        """ Returns the expected photons per pixel of integrated Gaussian
+        spots on a constant background, flattened to shape (n, size²), and
+        its Jacobian with respect to the parameters, shape (n, size², 5). """
+        x, y, photons, background, sigma = (params[:, i, None] for i in range(5))
+        pixels = np.arange(size)[None, :]
+        norm = 1 / (np.sqrt(2) * sigma)
+
+        def integrated(position):
+            upper, lower = pixels - position + 0.5, pixels - position - 0.5
+            gaussUpper = np.exp(-upper ** 2 / (2 * sigma ** 2))
+            gaussLower = np.exp(-lower ** 2 / (2 * sigma ** 2))
+            value = 0.5 * (erf(upper * norm) - erf(lower * norm))
+            dPosition = (gaussLower - gaussUpper) / (np.sqrt(2 * np.pi) * sigma)
+            dSigma = (lower * gaussLower - upper * gaussUpper) / (np.sqrt(2 * np.pi) * sigma ** 2)
+            return value, dPosition, dSigma
+
+        ex, dexdx, dexds = integrated(x)  # (n, size), along columns
+        ey, deydy, deyds = integrated(y)  # (n, size), along rows
+        spot = ey[:, :, None] * ex[:, None, :]
+        model = background[:, :, None] + photons[:, :, None] * spot
+
+        photons = photons[:, :, None]
+        jacobian = np.stack([
+            photons * ey[:, :, None] * dexdx[:, None, :],
+            photons * deydy[:, :, None] * ex[:, None, :],
+            spot,
+            np.ones_like(spot),
+            photons * (deyds[:, :, None] * ex[:, None, :] + ey[:, :, None] * dexds[:, None, :])
+        ], axis=-1)
+        n = len(params)
+        return model.reshape(n, -1), jacobian.reshape(n, -1, 5)
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
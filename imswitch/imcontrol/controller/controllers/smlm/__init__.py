@@ -0,0 +1,10 @@
+"""
+Single-molecule localization for the live reconstruction of
+:py:class:`STORMReconController`: :py:class:`SMLMLocalizer` detects and fits
+the molecules in camera frames, :py:class:`LocalizationStore` collects the
+localizations column by column and writes them to HDF5 or Parquet files and
+:py:class:`HistogramRenderer` renders them at a super-resolution pixel size.
+"""
+
+from .LocalizationStore import HistogramRenderer, LocalizationStore
+from .SMLMLocalizer import SMLMLocalizer
@@ -185,6 +185,9 @@ class ImSwitchServer(Worker):
         functions = api_dict.keys()
 
         def includeAPI(str, func):
+            if getattr(func, '_APIWebSocket', False):
+                app.add_api_websocket_route(str, func)
+                return func
             if hasattr(func, '._APIAsyncExecution') and func._APIAsyncExecution:
                 @app.get(str) # TODO: Perhaps we want POST instead?
                 @wraps(func)
@@ -0,0 +1,263 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from imswitch.imcommon.model import initLogger
+
+
+class LiveStreamer:
+    """ Streams the live view of the current detector as JPEG frames to any
+    number of clients, e.g. browsers watching an MJPEG or WebSocket stream.
+
+    Frames come from a live view subscription, so nothing is done while
+    there is no new frame. Each frame is encoded at most once per
+    combination of quality and output size, by the first client that asks
+    for it; all other clients with the same settings get the same bytes.
+    Clients never get the same frame twice and skip the frames that arrive
+    while they are still busy with the previous one. The acquisition runs
+    while at least one client is connected. """
+
+    defaultQuality = 80
+    defaultMaxWidth = 640
+    defaultMaxHeight = 480
+
+    def __init__(self, detectorsManager):
+        self.__logger = initLogger(self)
+        self._detectorsManager = detectorsManager
+        self._clients = []
+        self._subscription = None
+        self._acqHandle = None
+        self._clientsLock = threading.Lock()
+
+        # The newest frame and its encodings, guarded by _frameCondition
+        self._frameCondition = threading.Condition()
+        self._frame = None
+        self._frameNumber = 0
+        self._frameTime = None
+        self._encoded = {}
+        self._encodeLocks = {}
+
+        self._stats = _StreamStats()
+
+    @property
+    def numClients(self):
+        return len(self._clients)
+
+    def addClient(self, quality=None, maxWidth=None, maxHeight=None):
+        """ Adds a client and starts the live view if it is the first one.
+        Returns the StreamClient to get frames from. """
+        client = StreamClient(self, quality, maxWidth, maxHeight)
+        with self._clientsLock:
+            self._clients.append(client)
+            if self._subscription is None:
+                self._subscription = self._detectorsManager.subscribeLiveView(
+                    self._onLiveViewImage, direct=True
+                )
+                self._acqHandle = self._detectorsManager.startAcquisition(liveView=True)
+                self.__logger.debug('Started live stream')
+        return client
+
+    def removeClient(self, client):
+        """ Removes a client and stops the live view if it was the last
+        one. """
+        with self._clientsLock:
+            if client not in self._clients:
+                return
+            self._clients.remove(client)
+            client.closed = True
+            if not self._clients:
+                self._stopLiveView()
+        with self._frameCondition:
+            self._frameCondition.notify_all()
+
+    def stop(self):
+        """ Disconnects all clients. """
+        with self._clientsLock:
+            for client in self._clients:
+                client.closed = True
+            self._clients = []
+            self._stopLiveView()
+        with self._frameCondition:
+            self._frameCondition.notify_all()
+
+    def getStats(self):
+        """ Returns the number of clients and frames, the CPU time spent
+        encoding and the latency between the arrival of a frame and its
+        handover to a client. """
+        with self._frameCondition:
+            stats = self._stats.asDict()
+        stats['clients'] = self.numClients
+        return stats
+
+    def _stopLiveView(self):
+        if self._subscription is None:
+            return
+        self._detectorsManager.unsubscribeLiveView(self._subscription)
+        self._detectorsManager.stopAcquisition(self._acqHandle, liveView=True)
+        self._subscription = None
+        self._acqHandle = None
+        self.__logger.debug('Stopped live stream')
+
+    def _onLiveViewImage(self, detectorName, image, init, scale, isCurrentDetector):
+        if not isCurrentDetector:
+            return
+        with self._frameCondition:
+            self._frame = image
+            self._frameNumber += 1
+            self._frameTime = time.perf_counter()
+            self._encoded = {}
+            self._stats.framesReceived += 1
+            self._frameCondition.notify_all()
+
+    def _waitForFrame(self, client, timeout):
+        """ Returns the JPEG bytes and number of the newest frame that the
+        client has not got yet, or (None, None) if there is none within
+        timeout seconds or the client was removed. """
+        with self._frameCondition:
+            if not self._frameCondition.wait_for(
+                lambda: client.closed or self._frameNumber > client.lastFrameNumber,
+                timeout=timeout
+            ) or client.closed:
+                return None, None
+            frame, frameNumber, frameTime = self._frame, self._frameNumber, self._frameTime
+
+        key = self._getEncodingKey(frame.shape, client)
+        encoded = self._getEncoded(frame, frameNumber, key)
+        if encoded is None:
+            return None, None
+
+        with self._frameCondition:
+            if client.lastFrameNumber > 0:
+                self._stats.framesSkipped += frameNumber - client.lastFrameNumber - 1
+            self._stats.addSent(time.perf_counter() - frameTime)
+        client.lastFrameNumber = frameNumber
+        return encoded, frameNumber
+
+    def _getEncoded(self, frame, frameNumber, key):
+        # one lock per encoding, so that clients with other settings do not wait for each other
+        with self._frameCondition:
+            encodeLock = self._encodeLocks.setdefault(key, threading.Lock())
+
+        with encodeLock:
+            with self._frameCondition:
+                if frameNumber == self._frameNumber and key in self._encoded:
+                    return self._encoded[key]
+
+            cpuStart = time.thread_time()
+            encoded = self._encode(frame, *key)
+            cpuTime = time.thread_time() - cpuStart
+
+            with self._frameCondition:
+                self._stats.addEncoded(cpuTime)
+                if frameNumber == self._frameNumber:
+                    self._encoded[key] = encoded
+            return encoded
+
+    def _encode(self, frame, quality, width, height):
+        if frame.dtype != np.uint8:
+            frame = self._toUint8(frame)
+        if (frame.shape[1], frame.shape[0]) != (width, height):
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        success, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not success:
+            self.__logger.warning(f'Failed to encode frame of shape {frame.shape}')
+            return None
+        return encoded.tobytes()
+
+    @staticmethod
+    def _getEncodingKey(shape, client):
+        height, width = shape[:2]
+        scale = min(1, client.maxWidth / width, client.maxHeight / height)
+        return client.quality, max(1, round(width * scale)), max(1, round(height * scale))
+
+    @staticmethod
+    def _toUint8(frame):
+        minValue, maxValue = np.min(frame), np.max(frame)
+        if maxValue <= minValue:
+            return np.zeros(frame.shape, dtype=np.uint8)
+        return ((frame - minValue) * (255 / (maxValue - minValue))).astype(np.uint8)
+
+
+class StreamClient:
+    """ A client of a LiveStreamer, see LiveStreamer.addClient. """
+
+    def __init__(self, streamer, quality=None, maxWidth=None, maxHeight=None):
+        self.lastFrameNumber = 0
+        self.closed = False
+        self._streamer = streamer
+        self.quality = streamer.defaultQuality
+        self.maxWidth = streamer.defaultMaxWidth
+        self.maxHeight = streamer.defaultMaxHeight
+        self.configure(quality, maxWidth, maxHeight)
+
+    def configure(self, quality=None, maxWidth=None, maxHeight=None):
+        """ Sets the JPEG quality (1-100) and the largest size that frames
+        are scaled down to. None keeps the current setting. """
+        if quality is not None:
+            self.quality = int(min(max(quality, 1), 100))
+        if maxWidth is not None:
+            self.maxWidth = max(int(maxWidth), 1)
+        if maxHeight is not None:
+            self.maxHeight = max(int(maxHeight), 1)
+
+    def nextFrame(self, timeout=1):
+        """ Waits for a frame that this client has not got yet and returns its
+        JPEG bytes and number, or (None, None) if there is none within
+        timeout seconds. """
+        return self._streamer._waitForFrame(self, timeout)
+
+    def close(self):
+        self._streamer.removeClient(self)
+
+
+class _StreamStats:
+    def __init__(self):
+        self.framesReceived = 0
+        self.framesEncoded = 0
+        self.framesSent = 0
+        self.framesSkipped = 0  # Frames that a client missed because it was busy
+        self.encoderCPUTime = 0
+        self.latencySum = 0
+        self.latencyMax = 0
+
+    def addEncoded(self, cpuTime):
+        self.framesEncoded += 1
+        self.encoderCPUTime += cpuTime
+
+    def addSent(self, latency):
+        self.framesSent += 1
+        self.latencySum += latency
+        self.latencyMax = max(self.latencyMax, latency)
+
+    def asDict(self):
+        return {
+            'framesReceived': self.framesReceived,
+            'framesEncoded': self.framesEncoded,
+            'framesSent': self.framesSent,
+            'framesSkipped': self.framesSkipped,
+            'encoderCPUTimeS': self.encoderCPUTime,
+            'meanEncodeTimeMs': (1000 * self.encoderCPUTime / self.framesEncoded
+                                 if self.framesEncoded else None),
+            'meanLatencyMs': (1000 * self.latencySum / self.framesSent
+                              if self.framesSent else None),
+            'maxLatencyMs': 1000 * self.latencyMax
+        }
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
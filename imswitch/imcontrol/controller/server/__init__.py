@@ -1 +1,2 @@
 from .ImSwitchServer import ImSwitchServer
+from .LiveStreamer import LiveStreamer, StreamClient
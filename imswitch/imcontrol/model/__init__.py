@@ -2,8 +2,11 @@ from .Options import Options
 from .SetupInfo import DeviceInfo, DetectorInfo, LaserInfo, PositionerInfo, ScanInfo, SetupInfo
 from .errors import *
 from .managers import *
+from .managers import managerRegistry
 from .signaldesigners import SignalDesignerFactory
 import sys
 
 sys.modules['visa'] = 'pyvisa'
 
+__getattr__ = managerRegistry.moduleGetattr
+
@@ -3,7 +3,7 @@ import numpy as np
 import time
 import cv2
 from imswitch.imcommon.model import initLogger
-import collections
+from imswitch.imcontrol.model.interfaces.framebuffer import FrameRingBuffer
 
 class TriggerMode:
     SOFTWARE = 'Software Trigger'
@@ -22,6 +22,10 @@ class CameraWebcam:
         self.is_connected = False
         self.is_streaming = False
 
+        # frames read since the last chunk was taken
+        self.NBuffer = 10
+        self.frameBuffer = FrameRingBuffer(self.NBuffer)
+
         #%% starting the camera thread
         self.camera = None
 
@@ -91,19 +95,19 @@ class CameraWebcam:
 
     def getLast(self, is_resize=True):
         # only return fresh frames
-        self.frame = self.camera.read()[1]
-        self.frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        frame = self.camera.read()[1]
+        self.frameBuffer.push(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        self.frame = self.frameBuffer.getLast()
         return self.frame
 
     def flushBuffer(self):
-        return 
+        self.frameBuffer.flush()
     
     def getLastChunk(self):
         # get frames from camera'S buffer => e.g. for Hdf5 saving
-        frame = self.camera.read()
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        chunk = np.expand_dims(frame, 0)
-        
+        if self.frameBuffer.numPending == 0:
+            self.getLast()
+        chunk, _, _ = self.frameBuffer.getChunk()
         return chunk
     
     def setROI(self,hpos=None,vpos=None,hsize=None,vsize=None):
@@ -1,3 +1,4 @@
+from .framebuffer import FrameRingBuffer
 from .hamamatsu import HamamatsuCamera, HamamatsuCameraMR
 from .hamamatsu_mock import MockHamamatsu
 from .lantzlasers import LantzLaser
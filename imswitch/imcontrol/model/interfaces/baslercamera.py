@@ -2,6 +2,7 @@ import numpy as np
 import time
 import cv2
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.interfaces.framebuffer import FrameRingBuffer
 
 import threading
 from pypylon import pylon
@@ -27,10 +28,13 @@ class CameraBasler:
         self.preview_height = 600
         self.frameNumber = 0
 
+        # reserve some space for the framebuffer
+        self.NBuffer = 10
+        self.frameBuffer = FrameRingBuffer(self.NBuffer)
+
         #%% starting the camera thread
         self.camera = None
         self._init_cam()
-        self.last_frame = np.zeros((self.preview_height,self.preview_width))
         
 
     def _init_cam(self):
@@ -82,10 +86,10 @@ class CameraBasler:
             
                 # Image grabbed successfully?
                 if grabResult.GrabSucceeded():
-                    # Access the image data.
-                    img = grabResult.Array
-                    self.last_frame = img
+                    # Access the image data without a copy, it is copied into the ring buffer
                     self.frameNumber = grabResult.ImageNumber
+                    with grabResult.GetArrayZeroCopy() as img:
+                        self.frameBuffer.push(img, self.frameNumber)
 
                 else:
                     self.__logger.error("Error: ", grabResult.ErrorCode, grabResult.ErrorDescription)
@@ -173,9 +177,11 @@ class CameraBasler:
 
     def getLast(self, is_resize=True):
         # get frame and save
+        last_frame = self.frameBuffer.getLast()
+        if last_frame is None:
+            return np.zeros((self.preview_height,self.preview_width))
+        self.last_frame_preview = last_frame
         try:
-            self.last_frame_preview = self.last_frame
-            
             minHeight = int(self.SensorHeight//2-self.roi_size//2)
             maxHeight = int(self.SensorHeight//2+self.roi_size//2)
             minWidth = int(self.SensorWidth//2-self.roi_size//2)
@@ -189,8 +195,12 @@ class CameraBasler:
             pass # TODO: What if the very first frame is corrupt?
         return self.last_frame_preview 
 
+    def flushBuffer(self):
+        self.frameBuffer.flush()
+
     def getLastChunk(self):
-        return self.getLast(is_resize=False)
+        chunk, _, _ = self.frameBuffer.getChunk()
+        return chunk
 
     def setROI(self,hpos=None,vpos=None,hsize=None,vsize=None):
         #hsize = max(hsize, 25)*10  # minimum ROI size
@@ -0,0 +1,192 @@
+import threading
+import time
+
+import numpy as np
+
+
+class FrameRingBuffer:
+    """ Preallocated ring buffer for the frames of a camera.
+
+    The acquisition thread copies every frame into the next slot of one
+    contiguous array with push(), together with its frame ID and timestamp.
+    getLast() returns a copy of the newest frame, and getChunk() a read-only
+    view of all frames pushed since the last call. A view stays valid until
+    the slot is overwritten, i.e. until capacity further frames have been
+    pushed, so consumers that keep frames around longer have to copy them.
+    Consumers that copy or reduce the newest frame right away can get a view
+    of it with getLast(copy=False).
+
+    If the consumer does not call getChunk() often enough, the oldest unread
+    frames are overwritten and counted in numOverflowed. The array is
+    reallocated (and all frames discarded) when the shape or dtype of the
+    pushed frames changes, e.g. after a change of ROI or binning.
+
+    Callbacks added with addNewFrameCallback() are called from the
+    acquisition thread after every push, so that e.g. the live view can wait
+    for new frames instead of polling. They must return quickly.
+    """
+
+    def __init__(self, capacity, shape=None, dtype=None):
+        if capacity < 1:
+            raise ValueError(f'Capacity must be at least 1, got {capacity}')
+
+        self.capacity = capacity
+        self.numOverflowed = 0  # Unread frames that were overwritten
+        self.frameCount = 0  # Frames pushed in total, also across reallocations
+        self._newFrameCallbacks = []
+        self._frames = None
+        self._frameIds = np.zeros(capacity, dtype=np.int64)
+        self._timestamps = np.zeros(capacity)
+        self._numWritten = 0
+        self._numRead = 0
+        self._lock = threading.Lock()
+        if shape is not None:
+            self._allocate(tuple(shape), np.dtype(dtype or np.uint16))
+
+    @property
+    def numPushed(self):
+        """ Number of frames pushed since the buffer was created or
+        reallocated. """
+        return self._numWritten
+
+    @property
+    def numPending(self):
+        """ Number of frames that have not been returned by getChunk()
+        yet. """
+        with self._lock:
+            return self._numWritten - self._numRead
+
+    @property
+    def frameShape(self):
+        return self._frames.shape[1:] if self._frames is not None else None
+
+    def push(self, frame, frameId=None, timestamp=None):
+        """ Copies a frame into the next slot. The frame ID defaults to the
+        number of frames pushed before, the timestamp to the current time. """
+        frame = np.asarray(frame)
+        with self._lock:
+            if (self._frames is None or self._frames.shape[1:] != frame.shape
+                    or self._frames.dtype != frame.dtype):
+                self._allocate(frame.shape, frame.dtype)
+
+            if self._numWritten - self._numRead >= self.capacity:
+                # the consumer is too slow, the oldest unread frame gets overwritten
+                self._numRead += 1
+                self.numOverflowed += 1
+
+            slot = self._numWritten % self.capacity
+            self._frames[slot] = frame
+            self._frameIds[slot] = self._numWritten if frameId is None else frameId
+            self._timestamps[slot] = time.time() if timestamp is None else timestamp
+            self._numWritten += 1
+            self.frameCount += 1
+
+        for callback in self._newFrameCallbacks:
+            callback()
+
+    def addNewFrameCallback(self, callback):
+        """ Adds a function without arguments that is called after every
+        push. """
+        self._newFrameCallbacks = self._newFrameCallbacks + [callback]
+
+    def removeNewFrameCallback(self, callback):
+        self._newFrameCallbacks = [c for c in self._newFrameCallbacks if c != callback]
+
+    def getLast(self, returnFrameId=False, copy=True):
+        """ Returns a copy of the newest frame, or None if no frame has been
+        pushed. If copy is False, a read-only view of the frame's slot is
+        returned, which changes once the slot is overwritten. """
+        with self._lock:
+            if self._numWritten == 0:
+                frame, frameId = None, None
+            else:
+                slot = (self._numWritten - 1) % self.capacity
+                frame = self._frames[slot].copy() if copy else self._readOnly(self._frames[slot])
+                frameId = int(self._frameIds[slot])
+        if returnFrameId:
+            return frame, frameId
+        return frame
+
+    def waitForLast(self, timeout=1, returnFrameId=False, copy=True, pollInterval=0.005):
+        """ Like getLast(), but waits up to timeout seconds for the first
+        frame to be pushed. """
+        deadline = time.time() + timeout
+        while self._numWritten == 0 and time.time() < deadline:
+            time.sleep(pollInterval)
+        return self.getLast(returnFrameId=returnFrameId, copy=copy)
+
+    def waitForNewFrame(self, frameCount, timeout=1, returnFrameId=False, copy=True):
+        """ Like getLast(), but waits up to timeout seconds until more than
+        frameCount frames have been pushed in total (see frameCount), e.g. for
+        a frame that was exposed after the acquisition was started. Returns
+        None if that does not happen in time. """
+        arrived = threading.Event()
+
+        def onNewFrame():
+            if self.frameCount > frameCount:
+                arrived.set()
+
+        self.addNewFrameCallback(onNewFrame)
+        try:
+            if self.frameCount > frameCount or arrived.wait(timeout):
+                return self.getLast(returnFrameId=returnFrameId, copy=copy)
+        finally:
+            self.removeNewFrameCallback(onNewFrame)
+        return (None, None) if returnFrameId else None
+
+    def getChunk(self):
+        """ Returns the frames pushed since the last call as an array of shape
+        (n, *frameShape), oldest first, together with their frame IDs and
+        timestamps. The frames are a read-only view into the buffer unless
+        they wrap around its end, in which case the two parts are joined into
+        a new array. """
+        with self._lock:
+            if self._frames is None:
+                return (np.empty((0, 0, 0), dtype=np.uint16),
+                        np.empty(0, dtype=np.int64), np.empty(0))
+
+            start = self._numRead % self.capacity
+            numFrames = self._numWritten - self._numRead
+            self._numRead = self._numWritten
+            if start + numFrames <= self.capacity:
+                slots = slice(start, start + numFrames)
+                return (self._readOnly(self._frames[slots]), self._frameIds[slots].copy(),
+                        self._timestamps[slots].copy())
+
+            end = start + numFrames - self.capacity
+            return (np.concatenate((self._frames[start:], self._frames[:end])),
+                    np.concatenate((self._frameIds[start:], self._frameIds[:end])),
+                    np.concatenate((self._timestamps[start:], self._timestamps[:end])))
+
+    def flush(self):
+        """ Marks all frames as read. """
+        with self._lock:
+            self._numRead = self._numWritten
+
+    def _allocate(self, shape, dtype):
+        self._frames = np.empty((self.capacity, *shape), dtype=dtype)
+        self._numWritten = 0
+        self._numRead = 0
+
+    @staticmethod
+    def _readOnly(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
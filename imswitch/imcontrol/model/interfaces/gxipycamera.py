@@ -7,7 +7,7 @@ from PIL import Image
 
 from skimage.filters import gaussian, median
 import imswitch.imcontrol.model.interfaces.gxipy as gx
-import collections
+from imswitch.imcontrol.model.interfaces.framebuffer import FrameRingBuffer
 
 class TriggerMode:
     SOFTWARE = 'Software Trigger'
@@ -41,13 +41,11 @@ class CameraGXIPY:
 
         # reserve some space for the framebuffer
         self.NBuffer = 10
-        self.frame_buffer = collections.deque(maxlen=self.NBuffer)
-        self.frameid_buffer = collections.deque(maxlen=self.NBuffer)
+        self.frameBuffer = FrameRingBuffer(self.NBuffer)
         self.flatfieldImage = None
         self.isFlatfielding = False
         self.lastFrameId = -1
         self.frameNumber = -1
-        self.frame = None
         
         # For RGB
         self.contrast_lut = None        
@@ -220,31 +218,25 @@ class CameraGXIPY:
         self.binning = binning
 
     def getLast(self, is_resize=True, returnFrameNumber=False, timeout=1):
-        # get frame and save
-        # only return fresh frames
-        # print(self.lastFrameId, self.frameNumber)
-        cTime = time.time()
-        while(self.lastFrameId > self.frameNumber and self.frame is None):
-            time.sleep(.01) # wait for fresh frame
-            if time.time()-cTime > timeout:
-                self.__logger.warning("Timeout in getLast")
-                if returnFrameNumber:
-                    return None, -1
+        # a copy, as the grab thread keeps overwriting the slots of the buffer
+        frame, frameNumber = self.frameBuffer.waitForLast(timeout=timeout, returnFrameId=True)
+        if frame is None:
+            self.__logger.warning("Timeout in getLast")
+            if returnFrameNumber:
+                return None, -1
+            return None
         if self.isFlatfielding and self.flatfieldImage is not None:
-            self.frame = self.frame/self.flatfieldImage
-        self.lastFrameId = self.frameNumber
+            frame = frame/self.flatfieldImage
+        self.lastFrameId = frameNumber
         if returnFrameNumber:
-            return self.frame, self.frameNumber
-        return self.frame
+            return frame, frameNumber
+        return frame
 
     def flushBuffer(self):
-        self.frameid_buffer.clear()
-        self.frame_buffer.clear()
+        self.frameBuffer.flush()
 
     def getLastChunk(self):
-        chunk = np.array(self.frame_buffer)
-        frameids = np.array(self.frameid_buffer)
-        self.flushBuffer()
+        chunk, frameids, _ = self.frameBuffer.getChunk()
         self.__logger.debug("Buffer: "+str(chunk.shape)+" IDs: " + str(frameids))
         return chunk
 
@@ -435,14 +427,13 @@ class CameraGXIPY:
         if numpy_image is None:
             self.__logger.error("Got a None frame")
             return
-        self.frame = numpy_image.copy()
         self.frameNumber = frame.get_frame_id()
         self.timestamp = time.time()
 
         #if self.binning > 1:
         #    numpy_image = cv2.resize(numpy_image, dsize=None, fx=1/self.binning, fy=1/self.binning, interpolation=cv2.INTER_AREA)
-        self.frame_buffer.append(numpy_image)
-        self.frameid_buffer.append(self.frameNumber)
+        # the ring buffer keeps its own copy of the frame
+        self.frameBuffer.push(numpy_image, self.frameNumber, self.timestamp)
 
     def recordFlatfieldImage(self, nFrames=10, nGauss=5, nMedian=5):
         # record a flatfield image and save it in the flatfield variable
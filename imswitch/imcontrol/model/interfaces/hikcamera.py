@@ -8,7 +8,7 @@ from skimage.filters import gaussian, median
 import sys
 import threading
 from ctypes import *
-import collections
+from imswitch.imcontrol.model.interfaces.framebuffer import FrameRingBuffer
 
 from sys import platform
 try:
@@ -56,8 +56,7 @@ class CameraHIK:
 
         # reserve some space for the framebuffer
         self.NBuffer = 1
-        self.frame_buffer = collections.deque(maxlen=self.NBuffer)
-        self.frameid_buffer = collections.deque(maxlen=self.NBuffer)
+        self.frameBuffer = FrameRingBuffer(self.NBuffer)
         self.flatfieldImage = None
         #%% starting the camera thread
         self.camera = None
@@ -284,25 +283,17 @@ class CameraHIK:
         self.lastFrameId = self.frameNumber
         print(self.frameNumber)
         '''
-        cTime = time.time()
-        while len(self.frame_buffer)==0:
-            time.sleep(0.02)
-            if time.time() - cTime > timeout:
-                return None
-        frame = self.frame_buffer[-1]
-        frameNumber = self.frameid_buffer[-1]
+        # a copy, as the grab thread keeps overwriting the slots of the buffer
+        frame, frameNumber = self.frameBuffer.waitForLast(timeout=timeout, returnFrameId=True)
         if returnFrameNumber:
-            return np.array(frame), frameNumber
-        return np.array(frame)
+            return frame, frameNumber
+        return frame
 
     def flushBuffer(self):
-        self.frameid_buffer.clear()
-        self.frame_buffer.clear()
+        self.frameBuffer.flush()
 
     def getLastChunk(self):
-        chunk = np.array(self.frame_buffer)
-        frameids = np.array(self.frameid_buffer)
-        self.flushBuffer()
+        chunk, frameids, _ = self.frameBuffer.getChunk()
         self.__logger.debug("Buffer: "+str(chunk.shape)+" IDs: " + str(frameids))
         return chunk
 
@@ -454,8 +445,7 @@ class CameraHIK:
                             self.SensorHeight, self.SensorWidth = self.frame.shape[0], self.frame.shape[1] #stOutFrame.stFrameInfo.nHeight, stOutFrame.stFrameInfo.nWidth
                             self.frameNumber = stOutFrame.stFrameInfo.nFrameNum
                             self.timestamp = time.time()
-                            self.frame_buffer.append(self.frame)
-                            self.frameid_buffer.append(self.frameNumber)
+                            self.frameBuffer.push(self.frame, self.frameNumber, self.timestamp)
 
                         except Exception as e:
                             self.__logger.error(e)
@@ -481,8 +471,7 @@ class CameraHIK:
                         self.SensorHeight, self.SensorWidth = self.frame.shape[0], self.frame.shape[1] #stOutFrame.stFrameInfo.nHeight, stOutFrame.stFrameInfo.nWidth
                         self.frameNumber = stOutFrame.stFrameInfo.nFrameNum
                         self.timestamp = time.time()
-                        self.frame_buffer.append(self.frame)
-                        self.frameid_buffer.append(self.lastFrameId)
+                        self.frameBuffer.push(self.frame, self.frameNumber, self.timestamp)
                     else:
                         pass
                     if self.g_bExit == True:
@@ -552,8 +541,7 @@ class CameraHIK:
                 self.SensorHeight, self.SensorWidth = stDeviceList.nWidth, stDeviceList.nHeight
                 self.frameNumber = stDeviceList.nFrameNum
                 self.timestamp = time.time()
-                self.frame_buffer.append(self.frame)
-                self.frameid_buffer.append(self.lastFrameId)
+                self.frameBuffer.push(self.frame, self.frameNumber, self.timestamp)
 
                 if self.g_bExit == True:
                     break
@@ -564,7 +552,7 @@ class CameraHIK:
         for iFrame in range(nFrames):
             frame = self.getLast()
             if iFrame == 0:
-                flatfield = frame
+                flatfield = frame.astype(np.float32)
             else:
                 flatfield += frame
         # normalize and smooth using scikit image
@@ -1,5 +1,6 @@
 import numpy as np
 from imswitch.imcommon.model import initLogger
+from .framebuffer import FrameRingBuffer
 from .pyicic import IC_ImagingControl
 
 
@@ -24,6 +25,10 @@ class CameraTIS:
         self.roi_filter = self.cam.create_frame_filter('ROI')
         self.cam.add_frame_filter_to_device(self.roi_filter)
 
+        # frames grabbed since the last chunk was read
+        self.NBuffer = 10
+        self.frameBuffer = FrameRingBuffer(self.NBuffer)
+
     def start_live(self):
         self.cam.start_live()  # start imaging
 
@@ -45,7 +50,19 @@ class CameraTIS:
         #       3D array and taking the first plane of that
         frame = np.reshape(frame, (height, width, depth))[:, :, 0]
         frame = np.transpose(frame)
-        return frame
+        self.frameBuffer.push(frame)
+        return self.frameBuffer.getLast()
+
+    def getLastChunk(self):
+        """ Returns the frames grabbed since the last call, grabbing a new
+        frame if there are none. """
+        if self.frameBuffer.numPending == 0:
+            self.grabFrame()
+        chunk, _, _ = self.frameBuffer.getChunk()
+        return chunk
+
+    def flushBuffer(self):
+        self.frameBuffer.flush()
 
     def setROI(self, hpos, vpos, hsize, vsize):
         hsize = max(hsize, 256)  # minimum ROI size
@@ -1,8 +1,9 @@
-from time import sleep
+from time import perf_counter, sleep
 import threading
 import numpy as np
 from imswitch import IS_HEADLESS
-from imswitch.imcommon.framework import Mutex, Signal, SignalInterface, Thread, Timer, Worker
+from imswitch.imcommon.framework import Mutex, Signal, SignalInterface
+from imswitch.imcommon.model import initLogger
 from .MultiManager import MultiManager
 
 
@@ -46,24 +47,12 @@ class DetectorsManager(MultiManager, SignalInterface):
             if self._currentDetectorName is None:
                 self._currentDetectorName = detectorName
 
-        # A timer will collect the new frame and update it through the communication channel
-        if IS_HEADLESS:
-            self._lvWorker = LVWorkerNOQT(self, updatePeriod)
-            self._thread = threading.Thread(target=self._lvWorker.run)
-        else:
-            # A timer will collect the new frame and update it through the communication channel
-            self._lvWorker = LVWorker(self, updatePeriod)
-            self._thread = Thread()
-            self._lvWorker.moveToThread(self._thread)
-            self._thread.started.connect(self._lvWorker.run)
-            self._thread.finished.connect(self._lvWorker.stop)
+        # The dispatcher collects new frames and passes them on to the live view consumers
+        self._liveViewSubscriptions = []
+        self._lvDispatcher = LiveViewDispatcher(self, updatePeriod)
 
     def __del__(self):
-        if IS_HEADLESS:
-            self._lvWorker.stop()
-        else:
-            self._thread.quit()
-            self._thread.wait()
+        self._lvDispatcher.stop()
         if hasattr(super(), '__del__'):
             super().__del__()
 
@@ -92,7 +81,7 @@ class DetectorsManager(MultiManager, SignalInterface):
         self._currentDetectorName = detectorName
         self.sigDetectorSwitched.emit(detectorName, oldDetectorName)
 
-        if self._thread.isRunning():
+        if self._lvDispatcher.isRunning():
             self.execOnCurrent(lambda c: c.updateLatestFrame(True))
 
     def execOnCurrent(self, func):
@@ -131,7 +120,7 @@ class DetectorsManager(MultiManager, SignalInterface):
             self.sigAcquisitionStarted.emit()
         if enableLV:
             sleep(0.3)
-            self._thread.start()
+            self._lvDispatcher.start()
             self.sigLiveStarted.emit()
 
         return handle
@@ -161,8 +150,7 @@ class DetectorsManager(MultiManager, SignalInterface):
 
         # Do actual disabling
         if disableLV:
-            self._thread.quit()
-            self._thread.wait()
+            self._lvDispatcher.stop()
             self.sigLiveStopped.emit()
         if disableAcq:
             self.execOnAll(lambda c: c.stopAcquisition(), condition=lambda c: c.forAcquisition)
@@ -180,86 +168,212 @@ class DetectorsManager(MultiManager, SignalInterface):
             return False
     
     def setUpdatePeriod(self, updatePeriod):
-        self._lvWorker.setUpdatePeriod(updatePeriod)
-        self._thread.quit()
-        self._thread.wait()
-        self._thread.start()
+        """ Sets the shortest interval in milliseconds between two live view
+        updates, which is also the polling interval for detectors without a
+        frame buffer. """
+        self._lvDispatcher.setUpdatePeriod(updatePeriod)
+
+    def subscribeLiveView(self, callback, maxRate=None, direct=False):
+        """ Subscribes a consumer to the live view. callback is called with
+        (detectorName, image, init, scale, isCurrentDetector) for new frames
+        of the detectors for acquisition, at most maxRate times per second
+        (every frame if None). Frames that arrive while the previous call has
+        not returned yet are skipped. By default, callback is called in the
+        thread that subscribed; if direct is True (always when headless), it
+        is called in a thread of the subscription, which suits thread-safe
+        callbacks and consumers in threads without an event loop. Either way a
+        slow consumer does not hold up the others. Returns a
+        LiveViewSubscription that can be passed to unsubscribeLiveView. """
+        subscription = LiveViewSubscription(callback, maxRate, direct)
+        self._liveViewSubscriptions = self._liveViewSubscriptions + [subscription]
+        return subscription
+
+    def unsubscribeLiveView(self, subscription):
+        """ Stops passing live view frames to the given subscription. """
+        self._liveViewSubscriptions = [s for s in self._liveViewSubscriptions
+                                       if s is not subscription]
+        subscription.close()
+
+    def _offerToSubscribers(self, detectorName, image, init, scale):
+        isCurrentDetector = detectorName == self._currentDetectorName
+        for subscription in self._liveViewSubscriptions:
+            subscription.offer(detectorName, image, init, scale, isCurrentDetector)
+
+
+class LiveViewSubscription(SignalInterface):
+    """ A consumer of the live view, see DetectorsManager.subscribeLiveView.
+    """
 
-class LVWorkerNOQT(Worker):
-    def __init__(self, detectorsManager, updatePeriod):
+    sigImageUpdated = Signal(
+        str, np.ndarray, bool, list, bool
+    )  # (detectorName, image, init, scale, isCurrentDetector)
+
+    def __init__(self, callback, maxRate=None, direct=False):
         super().__init__()
-        self._detectorsManager = detectorsManager
-        self._updatePeriod = updatePeriod
-        self._stop_event = threading.Event()
+        self.__logger = initLogger(self)
+        self.maxRate = maxRate
+        self.numDelivered = 0
+        self.numSkipped = 0  # Frames skipped because of maxRate or a busy consumer
+        self._callback = callback
+        self._direct = direct or IS_HEADLESS
+        self._busy = False
+        self._closed = False
+        self._lastDeliveryTime = None
+        # Direct subscriptions: the frame waiting for the delivery thread
+        self._pending = None
+        self._pendingEvent = threading.Event()
+        self._thread = None
+        if not self._direct:
+            # Queued to the thread of the consumer, which stays busy until the callback returns
+            self.sigImageUpdated.connect(self._deliver)
+
+    def offer(self, detectorName, image, init, scale, isCurrentDetector):
+        """ Passes a frame on to the consumer unless it is still busy with the
+        previous one or maxRate would be exceeded. Returns whether the frame
+        was passed on. """
+        now = perf_counter()
+        if self._closed:
+            return False
+        if self._busy or (self.maxRate and self._lastDeliveryTime is not None
+                          and now - self._lastDeliveryTime < 1 / self.maxRate):
+            self.numSkipped += 1
+            return False
 
-    def moveToThread(self, thread) -> None:
-        return super().moveToThread(thread)
-    
-    def run(self):
-        while not self._stop_event.is_set():
-            self._detectorsManager.execOnAll(
-                lambda c: c.updateLatestFrame(True),
-                condition=lambda c: c.forAcquisition
-            )
-            sleep(self._updatePeriod / 1000.0)
+        self._busy = True
+        self._lastDeliveryTime = now
+        if not image.flags.writeable:
+            # a view into the camera's frame buffer, which the consumer may keep for longer
+            # than the buffer does
+            image = np.array(image)
+        if self._direct:
+            # Signals are shared between instances without Qt, so headless consumers get a
+            # thread of their own, which stays busy until the callback returns
+            self._pending = (detectorName, image, init, scale, isCurrentDetector)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='LiveViewSubscription',
+                                                daemon=True)
+                self._thread.start()
+            self._pendingEvent.set()
+        else:
+            self.sigImageUpdated.emit(detectorName, image, init, scale, isCurrentDetector)
+        return True
+
+    def close(self):
+        """ Stops passing frames on; the thread of a direct subscription ends
+        once the current call of the callback has returned. """
+        self._closed = True
+        self._pendingEvent.set()
+
+    def _run(self):
+        while True:
+            self._pendingEvent.wait()
+            self._pendingEvent.clear()
+            if self._closed:
+                return
+            args, self._pending = self._pending, None
+            if args is None:
+                continue
+            try:
+                self._deliver(*args)
+            except Exception as e:
+                self.__logger.error(f'Live view consumer failed: {e}')
 
-    def stop(self):
-        self._stop_event.set()
+    def _deliver(self, *args):
+        try:
+            self._callback(*args)
+        finally:
+            self.numDelivered += 1
+            self._busy = False
+
+
+class LiveViewDispatcher:
+    """ Updates the latest frames of the detectors for acquisition in a
+    background thread and passes them on to the live view and its
+    subscribers. Detectors with a frame buffer wake the dispatcher when a new
+    frame arrives and are skipped as long as they have no new frame; all
+    other detectors are polled every update period. The update period (in
+    milliseconds) is also the shortest interval between two updates. """
 
-    def setUpdatePeriod(self, updatePeriod):
-        self._updatePeriod = updatePeriod
-        
-class LVWorker(Worker):
     def __init__(self, detectorsManager, updatePeriod):
-        super().__init__()
+        self.__logger = initLogger(self, tryInheritParent=True)
         self._detectorsManager = detectorsManager
         self._updatePeriod = updatePeriod
-        self._vtimer = None
-
-    def run(self):
-        self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(False),
-                                         condition=lambda c: c.forAcquisition)
-        self._vtimer = Timer()
-        self._vtimer.timeout.connect(
-            lambda: self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(True),
-                                                     condition=lambda c: c.forAcquisition)
-        )
-        self._vtimer.start(self._updatePeriod)
+        self._newFrameEvent = threading.Event()
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self._frameBuffers = {}
+        self._lastFrameCounts = {}
+
+    def start(self):
+        if self.isRunning():
+            return
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name='LiveViewDispatcher',
+                                        daemon=True)
+        self._thread.start()
 
     def stop(self):
-        if self._vtimer is not None:
-            self._vtimer.stop()
+        if not self.isRunning():
+            return
+        self._stopEvent.set()
+        self._newFrameEvent.set()
+        self._thread.join()
+
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
 
     def setUpdatePeriod(self, updatePeriod):
         self._updatePeriod = updatePeriod
+        self._newFrameEvent.set()
 
-class LVWorker_old(Worker):
-    def __init__(self, detectorsManager, updatePeriod):
-        super().__init__()
-        self._detectorsManager = detectorsManager
-        self._updatePeriod = updatePeriod
-        self._vtimer = None
-
-    def run(self):
-        self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(False),
-                                         condition=lambda c: c.forAcquisition)
-        self._vtimer = Timer()
-        self._vtimer.timeout.connect(
-            lambda: self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(True),
+    def _run(self):
+        detectors = self._detectorsManager.execOnAll(lambda c: c,
                                                      condition=lambda c: c.forAcquisition)
-        )
-        self._vtimer.start(self._updatePeriod)
+        self._frameBuffers = {}
+        for detectorName, detector in detectors.items():
+            frameBuffer = detector.getFrameBuffer()
+            if frameBuffer is not None:
+                frameBuffer.addNewFrameCallback(self._newFrameEvent.set)
+                self._frameBuffers[detectorName] = frameBuffer
+        self._lastFrameCounts = {}
 
-    def stop(self):
-        if self._vtimer is not None:
-            self._vtimer.stop()
+        try:
+            self._update(detectors, init=False)
+            pollAll = len(self._frameBuffers) < len(detectors)
+            while not self._stopEvent.is_set():
+                lastUpdate = perf_counter()
+                # wait for a new frame, or until the next poll if a detector has no frame buffer
+                self._newFrameEvent.wait(
+                    timeout=self._updatePeriod / 1000 if pollAll else 1
+                )
+                self._newFrameEvent.clear()
+                # and never update more often than once per update period
+                remaining = lastUpdate + self._updatePeriod / 1000 - perf_counter()
+                if self._stopEvent.wait(max(remaining, 0)):
+                    break
+                self._update(detectors, init=True)
+        finally:
+            for frameBuffer in self._frameBuffers.values():
+                frameBuffer.removeNewFrameCallback(self._newFrameEvent.set)
+
+    def _update(self, detectors, init):
+        for detectorName, detector in detectors.items():
+            frameBuffer = self._frameBuffers.get(detectorName)
+            if frameBuffer is not None:
+                frameCount = frameBuffer.frameCount
+                if frameCount == self._lastFrameCounts.get(detectorName):
+                    continue  # no new frame since the last update
+                self._lastFrameCounts[detectorName] = frameCount
+
+            try:
+                image = detector.updateLatestFrame(init)
+                if image is not None:
+                    self._detectorsManager._offerToSubscribers(detectorName, image, init,
+                                                               detector.scale)
+            except Exception as e:
+                self.__logger.error(f'Failed to update the live view of {detectorName}: {e}')
 
-    def setUpdatePeriod(self, updatePeriod):
-        self._updatePeriod = updatePeriod
 
-    def moveToThread(self):
-        # Implementieren Sie die Methode hier
-        pass
 class NoDetectorsError(RuntimeError):
     """ Error raised when a function related to the current detector is called
     if the DetectorsManager doesn't manage any detectors (i.e. the manager is
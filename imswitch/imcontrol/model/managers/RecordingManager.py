@@ -1,6 +1,10 @@
 import enum
 import os
+import struct
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from typing import Dict, Optional, Type, List
 import h5py
@@ -8,6 +12,14 @@ try:
     import zarr
 except:
     pass
+try:
+    import numcodecs
+except ImportError:
+    numcodecs = None
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
 import numpy as np
 import tifffile as tiff
 import cv2
@@ -40,11 +52,166 @@ class AsTemporayFile(object):
         os.rename(self.tmp_path, self.path)
 
 
+class Compression(enum.Enum):
+    """ Lossless compression applied to recorded frames. DEFAULT keeps the
+    default of the save format, i.e. no compression for HDF5 and TIFF and the
+    default compressor of zarr. """
+    DEFAULT = 0
+    BLOSC_LZ4 = 1
+    BLOSC_ZSTD = 2
+    LZ4 = 3
+    ZSTD = 4
+
+
+def getCompressionCodec(compression, level=None):
+    """ Returns the numcodecs codec for the given compression, or None if the
+    format default should be used or numcodecs is not installed. """
+    compression = Compression(compression)
+    if compression == Compression.DEFAULT:
+        return None
+    if numcodecs is None:
+        logger.warning(f'Compression {compression.name} requires numcodecs, which is not'
+                       f' installed; falling back to the default compression')
+        return None
+
+    if compression in [Compression.BLOSC_LZ4, Compression.BLOSC_ZSTD]:
+        cname = 'lz4' if compression == Compression.BLOSC_LZ4 else 'zstd'
+        return numcodecs.Blosc(cname=cname, clevel=5 if level is None else level,
+                               shuffle=numcodecs.Blosc.SHUFFLE)
+    elif compression == Compression.LZ4:
+        return numcodecs.LZ4(acceleration=1 if level is None else level)
+    else:
+        return numcodecs.Zstd(level=3 if level is None else level)
+
+
+def getHDF5CompressionFilter(compression, level=None):
+    """ Returns the create_dataset keyword arguments for the HDF5 filter of the
+    given compression. The filters are registered by hdf5plugin; an empty dict
+    (no compression) is returned if it is not installed. """
+    compression = Compression(compression)
+    if compression == Compression.DEFAULT:
+        return {}
+    if hdf5plugin is None:
+        logger.warning(f'Compression {compression.name} in HDF5 files requires hdf5plugin,'
+                       f' which is not installed; writing uncompressed data')
+        return {}
+
+    if compression in [Compression.BLOSC_LZ4, Compression.BLOSC_ZSTD]:
+        cname = 'lz4' if compression == Compression.BLOSC_LZ4 else 'zstd'
+        return dict(hdf5plugin.Blosc(cname=cname, clevel=5 if level is None else level,
+                                     shuffle=hdf5plugin.Blosc.SHUFFLE))
+    elif compression == Compression.LZ4:
+        return dict(hdf5plugin.LZ4())
+    else:
+        return dict(hdf5plugin.Zstd(clevel=3 if level is None else level))
+
+
+def getTiffCompressionArgs(compression, level=None, numWorkers=None):
+    """ Returns the tifffile.imwrite keyword arguments for the given
+    compression. Of the available codecs, TIFF only supports zstd. """
+    compression = Compression(compression)
+    if compression == Compression.DEFAULT:
+        return {}
+    if compression not in [Compression.BLOSC_ZSTD, Compression.ZSTD]:
+        logger.warning(f'Compression {compression.name} is not supported in TIFF files;'
+                       f' writing uncompressed data')
+        return {}
+    return {'compression': ('zstd', 3 if level is None else level),
+            'maxworkers': numWorkers or os.cpu_count() or 1}
+
+
+def encodeHDF5Chunk(codec, compression, chunk):
+    """ Encodes a chunk so that it can be written with write_direct_chunk into
+    a dataset that uses the filter of getHDF5CompressionFilter. """
+    chunk = np.ascontiguousarray(chunk)
+    data = codec.encode(chunk)
+    if Compression(compression) != Compression.LZ4:
+        return data
+
+    # The HDF5 LZ4 filter frames the LZ4 block with the big-endian total size,
+    # block size and compressed block size; numcodecs only prefixes the size.
+    block = bytes(data)[4:]
+    if len(block) >= chunk.nbytes:
+        block = chunk.tobytes()  # Stored uncompressed, flagged by equal sizes
+    return struct.pack('>qii', chunk.nbytes, chunk.nbytes, len(block)) + block
+
+
+def cropAndBinFrame(frame, roi=None, binning=1):
+    """ Crops the frame to roi, given as (x, y, width, height) in pixels of
+    the full frame, and bins it by averaging binning x binning blocks of
+    pixels, so that the dtype is kept. Rows and columns that do not fill a
+    whole block are dropped. A ROI that extends beyond the frame is clipped
+    to it; one that starts outside of it raises a ValueError. """
+    if binning < 1:
+        raise ValueError(f'Binning must be at least 1, got {binning}')
+    if roi is not None:
+        x, y, width, height = roi
+        if x < 0 or y < 0 or width < 1 or height < 1:
+            raise ValueError(f'Invalid ROI {roi}')
+        if x >= frame.shape[1] or y >= frame.shape[0]:
+            raise ValueError(f'ROI {roi} is outside of the frame of shape {frame.shape}')
+        frame = frame[y:y + height, x:x + width]
+    if binning > 1:
+        height, width = (frame.shape[0] // binning, frame.shape[1] // binning)
+        if height < 1 or width < 1:
+            raise ValueError(f'Binning {binning} is larger than the frame of shape {frame.shape}')
+        blocks = frame[:height * binning, :width * binning].reshape(
+            height, binning, width, binning, *frame.shape[2:]
+        )
+        binned = blocks.mean(axis=(1, 3))
+        if np.issubdtype(frame.dtype, np.integer):
+            binned = np.rint(binned)
+        frame = binned.astype(frame.dtype)
+    return frame
+
+
+def encodeFrame(frame, compression=Compression.DEFAULT, level=None):
+    """ Returns the raw bytes of the frame in C order, compressed with the
+    given compression, and the compression that was actually applied.
+    DEFAULT (or a missing numcodecs) means no compression. """
+    frame = np.ascontiguousarray(frame)
+    codec = getCompressionCodec(compression, level)
+    if codec is None:
+        return frame.tobytes(), Compression.DEFAULT
+    return bytes(codec.encode(frame)), Compression(compression)
+
+
+def decodeFrame(data, dtype, shape, compression=Compression.DEFAULT):
+    """ Inverse of encodeFrame. compression may also be given by its name,
+    as in the X-Image-Compression header of the binary snapshot endpoint. """
+    if isinstance(compression, str):
+        compression = Compression[compression]
+    codec = getCompressionCodec(compression)
+    if codec is not None:
+        data = codec.decode(data)
+    return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+
+class CompressorPool:
+    """ Thread pool that compresses recorded chunks. The numcodecs codecs
+    release the GIL while compressing, so chunks are compressed in parallel. """
+
+    def __init__(self, codec, numWorkers=None):
+        self.codec = codec
+        self.numWorkers = numWorkers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self.numWorkers,
+                                            thread_name_prefix='RecordingCompressor')
+
+    def submit(self, func, *args):
+        return self._executor.submit(func, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
 class Storer(abc.ABC):
     """ Base class for storing data"""
-    def __init__(self, filepath, detectorManager):
+    def __init__(self, filepath, detectorManager, compression=Compression.DEFAULT,
+                 compressionLevel=None):
         self.filepath = filepath
         self.detectorManager: DetectorsManager = detectorManager
+        self.compression = Compression(compression)
+        self.compressionLevel = compressionLevel
 
     def snap(self, images: Dict[str, np.ndarray], attrs: Dict[str, str] = None):
         """ Stores images and attributes according to the spec of the storer """
@@ -65,8 +232,10 @@ class ZarrStorer(Storer):
 
             for channel, image in images.items():
                 shape = self.detectorManager[channel].shape
+                codec = getCompressionCodec(self.compression, self.compressionLevel)
                 root.create_dataset(channel, data=image, shape=tuple(reversed(shape)),
-                                        chunks=(512, 512), dtype='i2') #TODO: why not dynamic chunking?
+                                        chunks=(512, 512), dtype='i2', #TODO: why not dynamic chunking?
+                                        **({'compressor': codec} if codec is not None else {}))
 
                 datasets.append({"path": channel, "transformation": None})
             write_multiscales_metadata(root, datasets, format_from_version("0.2"), shape, **attrs)
@@ -80,7 +249,9 @@ class HDF5Storer(Storer):
             with AsTemporayFile(f'{self.filepath}_{channel}.h5') as path:
                 file = h5py.File(path, 'w')
                 shape = self.detectorManager[channel].shape
-                dataset = file.create_dataset('data', tuple(reversed(shape)), dtype='i2')
+                dataset = file.create_dataset('data', tuple(reversed(shape)), dtype='i2',
+                                              **getHDF5CompressionFilter(self.compression,
+                                                                         self.compressionLevel))
                 for key, value in attrs[channel].items():
                     try:
                         dataset.attrs[key] = value
@@ -110,7 +281,8 @@ class TiffStorer(Storer):
         for channel, image in images.items():
             with AsTemporayFile(f'{self.filepath}_{channel}.tiff') as path:
                 if hasattr(image, "shape"):
-                    tiff.imwrite(path, image,) # TODO: Parse metadata to tiff meta data
+                    tiff.imwrite(path, image,  # TODO: Parse metadata to tiff meta data
+                                 **getTiffCompressionArgs(self.compression, self.compressionLevel))
                     logger.info(f"Saved image to tiff file {path}")
                 else:
                     logger.error(f"Could not save image to tiff file {path}")
@@ -183,6 +355,8 @@ class RecordingManager(SignalInterface):
     sigRecordingEnded = Signal()
     sigRecordingFrameNumUpdated = Signal(int)  # (frameNumber)
     sigRecordingTimeUpdated = Signal(int)  # (recTime)
+    sigRecordingFramesDropped = Signal(int)  # (numDroppedFrames)
+    sigRecordingFramesQueued = Signal(int)  # (numQueuedFrames)
     sigMemorySnapAvailable = Signal(
         str, np.ndarray, object, bool
     )  # (name, image, filePath, savedToDisk)
@@ -218,12 +392,14 @@ class RecordingManager(SignalInterface):
 
     def startRecording(self, detectorNames, recMode, savename, saveMode, attrs,
                        saveFormat=SaveFormat.HDF5, singleMultiDetectorFile=False, singleLapseFile=False,
-                       recFrames=None, recTime=None):
+                       recFrames=None, recTime=None, compression=Compression.DEFAULT,
+                       compressionLevel=None):
         """ Starts a recording with the specified detectors, recording mode,
         file name prefix and attributes to save to the recording per detector.
         In SpecFrames mode, recFrames (the number of frames) must be specified,
         and in SpecTime mode, recTime (the recording time in seconds) must be
-        specified. """
+        specified. compression selects the lossless codec that the frames are
+        compressed with on a pool of threads. """
 
         self.__logger.info('Starting recording')
         self.__record = True
@@ -237,6 +413,8 @@ class RecordingManager(SignalInterface):
         self.__recordingWorker.recTime = recTime
         self.__recordingWorker.singleMultiDetectorFile = singleMultiDetectorFile
         self.__recordingWorker.singleLapseFile = singleLapseFile
+        self.__recordingWorker.compression = Compression(compression)
+        self.__recordingWorker.compressionLevel = compressionLevel
         self.__detectorsManager.execOnAll(lambda c: c.flushBuffers(),
                                           condition=lambda c: c.forAcquisition)
         self._thread.start()
@@ -258,10 +436,18 @@ class RecordingManager(SignalInterface):
         if wait:
             self._thread.wait()
 
-    def snap(self, detectorNames=None, savename="", saveMode=SaveMode.Disk, saveFormat=SaveFormat.TIFF, attrs=None):
+    def getRecordingStats(self):
+        """ Returns the number of grabbed, written and dropped frames, the
+        peak queue length and the latencies of the grab, queue and write
+        stages of the current or last recording, per detector. Latencies are
+        given per chunk of frames in milliseconds. """
+        return self.__recordingWorker.getStats()
+
+    def snap(self, detectorNames=None, savename="", saveMode=SaveMode.Disk, saveFormat=SaveFormat.TIFF, attrs=None,
+             compression=Compression.DEFAULT, compressionLevel=None):
         """ Saves an image with the specified detectors to a file
-        with the specified name prefix, save mode, file format and attributes
-        to save to the capture per detector. """
+        with the specified name prefix, save mode, file format, compression
+        (and level) and attributes to save to the capture per detector. """
         acqHandle = self.__detectorsManager.startAcquisition()
 
         if detectorNames is None:
@@ -280,7 +466,8 @@ class RecordingManager(SignalInterface):
 
                 if saveMode == SaveMode.Disk or saveMode == SaveMode.DiskAndRAM:
                     # Save images to disk
-                    store = storer(savename, self.__detectorsManager)
+                    store = storer(savename, self.__detectorsManager, compression,
+                                   compressionLevel)
                     store.snap(images, attrs)
 
                 if saveMode == SaveMode.RAM or saveMode == SaveMode.DiskAndRAM:
@@ -297,6 +484,76 @@ class RecordingManager(SignalInterface):
                 return images
 
 
+    def benchmarkCompression(self, detectorName=None, numFrames=10, compressions=None,
+                             compressionLevel=None, timeout=5):
+        """ Compresses numFrames distinct frames of the given detector (the
+        current one by default) with each codec on a CompressorPool, in the
+        chunks that a recording would use. Returns the compression ratio and
+        throughput per codec. Waits up to timeout seconds for every frame;
+        raises a RuntimeError if the detector delivers no frames. """
+        if detectorName is None:
+            detectorName = self.__detectorsManager.getCurrentDetectorName()
+        if compressions is None:
+            compressions = [c for c in Compression if c != Compression.DEFAULT]
+
+        detector = self.__detectorsManager[detectorName]
+        frameBuffer = detector.getFrameBuffer()
+        frames = []
+        acqHandle = self.__detectorsManager.startAcquisition()
+        try:
+            if frameBuffer is None:
+                # repeated frames compress unrealistically well
+                self.__logger.warning(f'Detector {detectorName} has no frame buffer, the'
+                                      f' benchmark may compress the same frame repeatedly')
+                frames = [np.array(detector.getLatestFrame()) for _ in range(numFrames)]
+            else:
+                frameCount = frameBuffer.frameCount
+                while len(frames) < numFrames:
+                    frame = frameBuffer.waitForNewFrame(frameCount, timeout=timeout)
+                    if frame is None:
+                        break
+                    # only frames pushed after this one count as new
+                    frameCount = frameBuffer.frameCount
+                    frames.append(frame)
+        finally:
+            self.__detectorsManager.stopAcquisition(acqHandle)
+
+        if not frames:
+            raise RuntimeError(f'Detector {detectorName} delivered no frames within {timeout} s')
+        if len(frames) < numFrames:
+            self.__logger.warning(f'Only {len(frames)} of {numFrames} frames arrived within'
+                                  f' {timeout} s, benchmarking these')
+        frames = np.array(frames)
+
+        framesPerChunk = ChunkedStreamWriter.getChunkShape(frames.shape[1:], frames.dtype)[0]
+        chunks = [frames[i:i + framesPerChunk] for i in range(0, len(frames), framesPerChunk)]
+
+        results = {}
+        for compression in compressions:
+            compression = Compression(compression)
+            codec = getCompressionCodec(compression, compressionLevel)
+            if codec is None:
+                continue
+
+            pool = CompressorPool(codec)
+            try:
+                start = time.perf_counter()
+                encoded = [future.result() for future in
+                           [pool.submit(codec.encode, chunk) for chunk in chunks]]
+                elapsed = time.perf_counter() - start
+            finally:
+                pool.shutdown()
+
+            compressedBytes = sum([len(memoryview(data).cast('B')) for data in encoded])
+            results[compression.name] = {
+                'ratio': frames.nbytes / max(compressedBytes, 1),
+                'throughputMBps': frames.nbytes / 1e6 / max(elapsed, 1e-9),
+                'numWorkers': pool.numWorkers
+            }
+            self.__logger.info(f'{compression.name}: ratio {results[compression.name]["ratio"]:.2f},'
+                               f' {results[compression.name]["throughputMBps"]:.0f} MB/s')
+        return results
+
     def snapImagePrev(self, detectorName, savename, saveFormat, image, attrs):
         """ Saves a previously taken image to a file with the specified name prefix,
         file format and attributes to save to the capture per detector. """
@@ -363,12 +620,287 @@ class RecordingManager(SignalInterface):
 
 
 
+class ChunkedStreamWriter:
+    """ Streams frames into a chunked HDF5 or Zarr dataset. The dataset is
+    created on the first write with the shape and dtype of the incoming
+    frames, preallocated for the expected number of frames, and written one
+    whole chunk at a time at chunk-aligned offsets. The dataset is only
+    resized when the preallocation runs out and once more on close() to trim
+    it to the number of frames that were actually written.
+
+    If a compression and a CompressorPool are passed, chunks are compressed
+    on the pool while the next ones are being buffered. HDF5 chunks are then
+    written pre-compressed with write_direct_chunk. """
+
+    targetChunkBytes = 4 * 1024 ** 2  # Frames are grouped along time into chunks of about this size
+    initialChunks = 16  # Chunks preallocated when the number of frames is not known
+
+    def __init__(self, group, name, attrs=None, fallbackShape=None, expectedFrames=None,
+                 recTime=None, compression=Compression.DEFAULT, compressionLevel=None,
+                 pool=None):
+        self.group = group
+        self.name = name
+        self.dataset = None
+        self._attrs = attrs or {}
+        self._fallbackShape = fallbackShape
+        self._expectedFrames = expectedFrames
+        self._recTime = recTime
+        self._isHDF5 = isinstance(group, (h5py.File, h5py.Group))
+        self._compression = Compression(compression)
+        self._codec = getCompressionCodec(compression, compressionLevel)
+        self._filter = {}
+        if self._isHDF5 and self._codec is not None:
+            self._filter = getHDF5CompressionFilter(compression, compressionLevel)
+            if not self._filter:
+                self._codec = None  # Without the HDF5 filter the chunks could not be read back
+        self._pool = pool if self._codec is not None else None
+        self._pending = deque()
+        self._buffer = None
+        self._numBuffered = 0
+        self._numWritten = 0
+        self._capacity = 0
+        self._startTime = None
+
+    @classmethod
+    def getChunkShape(cls, frameShape, dtype):
+        """ Returns a chunk shape that holds whole frames and groups as many of
+        them along time as fit in targetChunkBytes. """
+        frameBytes = int(np.prod(frameShape)) * np.dtype(dtype).itemsize
+        framesPerChunk = int(max(1, cls.targetChunkBytes // max(frameBytes, 1)))
+        return (framesPerChunk, *frameShape)
+
+    @property
+    def numFrames(self):
+        return self._numWritten + self._numBuffered
+
+    def write(self, frames):
+        if self.dataset is None:
+            self._startTime = time.time()
+            self._createDataset(frames.shape[1:], frames.dtype)
+
+        framesPerChunk = self._buffer.shape[0]
+        i = 0
+        while i < len(frames):
+            if self._numBuffered == 0 and len(frames) - i >= framesPerChunk:
+                # Whole chunks are written straight from the incoming frames
+                numChunkFrames = (len(frames) - i) // framesPerChunk * framesPerChunk
+                self._writeChunks(frames[i:i + numChunkFrames])
+                i += numChunkFrames
+                continue
+
+            n = min(framesPerChunk - self._numBuffered, len(frames) - i)
+            self._buffer[self._numBuffered:self._numBuffered + n] = frames[i:i + n]
+            self._numBuffered += n
+            i += n
+            if self._numBuffered == framesPerChunk:
+                self._writeChunks(self._buffer, fromBuffer=True)
+                self._numBuffered = 0
+
+    def close(self):
+        """ Writes the partially filled last chunk and trims the dataset. """
+        if self.dataset is None:
+            if self._fallbackShape is None:
+                return
+            self._createDataset(tuple(self._fallbackShape), 'i2')
+
+        if self._numBuffered > 0:
+            self._writeChunks(self._buffer[:self._numBuffered], fromBuffer=True)
+            self._numBuffered = 0
+        self._finishPending()
+        self._resize(self._numWritten)
+        self.dataset.attrs['writing'] = False
+
+    def _createDataset(self, frameShape, dtype):
+        chunks = self.getChunkShape(frameShape, dtype)
+        framesPerChunk = chunks[0]
+        capacity = self._expectedFrames or framesPerChunk * self.initialChunks
+        capacity = int(np.ceil(capacity / framesPerChunk)) * framesPerChunk
+        if self._isHDF5:
+            self.dataset = self.group.create_dataset(
+                self.name, (capacity, *frameShape), maxshape=(None, *frameShape),
+                chunks=chunks, dtype=dtype, **self._filter
+            )
+        else:
+            self.dataset = self.group.create_dataset(
+                self.name, shape=(capacity, *frameShape), chunks=chunks, dtype=dtype,
+                **({'compressor': self._codec} if self._codec is not None else {})
+            )
+        self._capacity = capacity
+        self._buffer = np.empty(chunks, dtype=dtype)
+
+        for key, value in self._attrs.items():
+            try:
+                self.dataset.attrs[key] = value
+            except Exception:
+                logger.debug(f'Could not put key:value pair {key}:{value} in dataset metadata.')
+        self.dataset.attrs['writing'] = True
+
+    def _writeChunks(self, frames, fromBuffer=False):
+        end = self._numWritten + len(frames)
+        if end > self._capacity:
+            self._finishPending()
+            self._grow(end)
+
+        if self._pool is None:
+            self.dataset[self._numWritten:end] = frames
+        else:
+            framesPerChunk = self._buffer.shape[0]
+            for start in range(0, len(frames), framesPerChunk):
+                chunk = frames[start:start + framesPerChunk]
+                if fromBuffer:
+                    chunk = chunk.copy()  # The buffer is refilled while the chunk is compressed
+                self._pending.append(
+                    self._pool.submit(self._compressChunk, self._numWritten + start, chunk)
+                )
+
+            # Bound the number of chunks held in memory while waiting for compression
+            while len(self._pending) > 2 * self._pool.numWorkers:
+                self._finishOldest()
+        self._numWritten = end
+
+    def _compressChunk(self, offset, chunk):
+        if not self._isHDF5:
+            # Zarr compresses on assignment; chunk-aligned writes never touch the same chunk
+            self.dataset[offset:offset + len(chunk)] = chunk
+            return offset, None
+
+        if len(chunk) < self._buffer.shape[0]:
+            # Direct chunk writes need whole chunks, the padding is trimmed on close
+            padded = np.zeros(self._buffer.shape, dtype=chunk.dtype)
+            padded[:len(chunk)] = chunk
+            chunk = padded
+        return offset, encodeHDF5Chunk(self._codec, self._compression, chunk)
+
+    def _finishOldest(self):
+        offset, data = self._pending.popleft().result()
+        if data is not None:
+            self.dataset.id.write_direct_chunk((offset, *([0] * (self.dataset.ndim - 1))), data)
+
+    def _finishPending(self):
+        while len(self._pending) > 0:
+            self._finishOldest()
+
+    def _grow(self, minCapacity):
+        framesPerChunk = self._buffer.shape[0]
+        capacity = max(minCapacity, self._capacity * 2)
+        elapsed = time.time() - self._startTime
+        if self._recTime is not None and elapsed > 0:
+            # Extrapolate the total number of frames from the rate observed so far
+            estimate = int(1.1 * self._recTime * self._numWritten / elapsed)
+            if estimate >= minCapacity:
+                capacity = estimate
+        self._capacity = int(np.ceil(capacity / framesPerChunk)) * framesPerChunk
+        self._resize(self._capacity)
+
+    def _resize(self, numFrames):
+        if isinstance(self.dataset, h5py.Dataset):
+            self.dataset.resize(numFrames, axis=0)
+        else:
+            self.dataset.resize((numFrames, *self.dataset.shape[1:]))
+
+
+class LatencyStats:
+    """ Running count, mean and maximum of the latencies of one stage of the
+    recording pipeline. """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def asDict(self):
+        return {'count': self.count, 'meanMs': self.mean * 1000, 'maxMs': self.max * 1000}
+
+
+class FrameQueue:
+    """ Bounded FIFO of frame chunks between the recording grabber and a
+    writer thread. When the queue is full, put() waits up to timeout seconds
+    for the writer to catch up (backpressure) and drops the chunk if it is
+    still full, so a stalled disk can never block acquisition indefinitely. """
+
+    def __init__(self, maxBytes=1024 ** 3, timeout=0.5):
+        self._chunks = deque()
+        self._maxBytes = maxBytes
+        self._timeout = timeout
+        self._condition = threading.Condition()
+        self._closed = False
+        self._numBytes = 0
+        self.numQueued = 0  # Frames currently waiting to be written
+        self.numDropped = 0  # Frames discarded because the queue was full
+        self.peakQueued = 0  # Highest number of frames that were waiting at once
+        self.waitLatency = LatencyStats()  # Time chunks spent waiting in the queue
+
+    def put(self, frames) -> bool:
+        """ Adds a chunk of frames to the queue. Returns False if the chunk was
+        dropped. """
+        with self._condition:
+            # An empty queue always accepts a chunk, even if it is larger than maxBytes
+            fits = lambda: self._numBytes == 0 or self._numBytes + frames.nbytes <= self._maxBytes
+            if not self._condition.wait_for(lambda: fits() or self._closed,
+                                            timeout=self._timeout) or self._closed:
+                self.numDropped += len(frames)
+                return False
+
+            self._chunks.append((frames, time.perf_counter()))
+            self._numBytes += frames.nbytes
+            self.numQueued += len(frames)
+            self.peakQueued = max(self.peakQueued, self.numQueued)
+            self._condition.notify_all()
+            return True
+
+    def get(self) -> Optional[np.ndarray]:
+        """ Returns the oldest chunk of frames, waiting for one if necessary.
+        Returns None once the queue has been closed and fully drained. """
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._chunks) > 0 or self._closed)
+            if len(self._chunks) < 1:
+                return None
+
+            frames, queuedAt = self._chunks.popleft()
+            self.waitLatency.add(time.perf_counter() - queuedAt)
+            self._numBytes -= frames.nbytes
+            self.numQueued -= len(frames)
+            self._condition.notify_all()
+            return frames
+
+    def close(self):
+        """ Stops accepting new chunks. Chunks already in the queue are still
+        returned by get(). """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
 class RecordingWorker(Worker):
+    """ Records frames in a staged pipeline: the worker thread grabs new
+    frames from the detectors and pushes them into one bounded FrameQueue per
+    detector, from which a dedicated writer thread per detector stores them.
+    Slow disk writes therefore no longer stall frame acquisition. """
+
+    minIdleSleep = 0.0001  # Seconds to sleep when no detector had new frames
+    maxIdleSleep = 0.005  # Upper bound of the idle sleep, which doubles while idle
+
     def __init__(self, recordingManager):
         super().__init__()
         self.__logger = initLogger(self)
         self.__recordingManager = recordingManager
-        self.__logger = initLogger(self)
+        self.maxQueueBytes = 1024 ** 3
+        self.compression = Compression.DEFAULT
+        self.compressionLevel = None
+        self._queues = {}
+        self._numGrabbed = {}
+        self._currentFrame = {}
+        self._grabLatency = {}
+        self._writeLatency = {}
 
     def run(self):
         acqHandle = self.__recordingManager.detectorsManager.startAcquisition()
@@ -385,9 +917,23 @@ class RecordingWorker(Worker):
         shapes = {detectorName: self.__recordingManager.detectorsManager[detectorName].shape
                   for detectorName in self.detectorNames}
 
-        currentFrame = {}
-        datasets = {}
-        filenames = {}
+        self._currentFrame = {}
+        self._numGrabbed = {detectorName: 0 for detectorName in self.detectorNames}
+        self._grabLatency = {detectorName: LatencyStats() for detectorName in self.detectorNames}
+        self._writeLatency = {detectorName: LatencyStats() for detectorName in self.detectorNames}
+        self._streams = {}
+        self._filenames = {}
+        self._tiffCompressionArgs = {}
+        self._compressorPool = None
+        codec = getCompressionCodec(self.compression, self.compressionLevel)
+        if codec is not None and self.saveFormat in [SaveFormat.HDF5, SaveFormat.ZARR]:
+            self._compressorPool = CompressorPool(codec)
+        elif self.saveFormat == SaveFormat.TIFF:
+            self._tiffCompressionArgs = getTiffCompressionArgs(self.compression,
+                                                               self.compressionLevel)
+        currentFrame = self._currentFrame
+        streams = self._streams
+        filenames = self._filenames
 
         for detectorName in self.detectorNames:
             currentFrame[detectorName] = 0
@@ -402,207 +948,99 @@ class RecordingWorker(Worker):
                     datasetNameWithScan = f'{datasetName}_scan{scanNum}'
                 datasetName = datasetNameWithScan
 
-            # Initial number of frames must not be 0; otherwise, too much disk space may get
-            # allocated. We remove this default frame later on if no frames are captured.
             shape = shapes[detectorName]
             if len(shape) > 2:
                 shape = shape[-2:]
 
-            if self.saveFormat == SaveFormat.HDF5:
-                # Initial number of frames must not be 0; otherwise, too much disk space may get
-                # allocated. We remove this default frame later on if no frames are captured.
-                datasets[detectorName] = files[detectorName].create_dataset(
-                    datasetName, (1, *reversed(shape)),
-                    maxshape=(None, *reversed(shape)),
-                    dtype='i2'
-                )
-
-                for key, value in self.attrs[detectorName].items():
-                    datasets[detectorName].attrs[key] = value
-
-                datasets[detectorName].attrs['detector_name'] = detectorName
-
+            if self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
+                attrs = {}
+                if self.saveFormat == SaveFormat.HDF5:
+                    attrs.update(self.attrs[detectorName])
+                attrs['detector_name'] = detectorName
                 # For ImageJ compatibility
-                datasets[detectorName].attrs['element_size_um'] \
+                attrs['element_size_um'] \
                     = self.__recordingManager.detectorsManager[detectorName].pixelSizeUm
-                datasets[detectorName].attrs['writing'] = True
+
+                # The dataset is created with the shape and dtype of the first frames
+                streams[detectorName] = ChunkedStreamWriter(
+                    files[detectorName], datasetName, attrs,
+                    fallbackShape=tuple(reversed(shape)),
+                    expectedFrames=(self.recFrames if self.recMode in [RecMode.SpecFrames,
+                                                                        RecMode.ScanOnce,
+                                                                        RecMode.ScanLapse]
+                                    else None),
+                    recTime=self.recTime if self.recMode == RecMode.SpecTime else None,
+                    compression=self.compression,
+                    compressionLevel=self.compressionLevel,
+                    pool=self._compressorPool
+                )
+
+                if self.saveFormat == SaveFormat.ZARR:
+                    info: List[dict] = [{"path": datasetName, "transformation": None}]
+                    write_multiscales_metadata(files[detectorName], info, format_from_version("0.2"), shape, **self.attrs[detectorName])
 
             elif self.saveFormat == SaveFormat.TIFF:
                 fileExtension = str(self.saveFormat.name).lower()
                 filenames[detectorName] = self.__recordingManager.getSaveFilePath(
                     f'{self.savename}_{detectorName}.{fileExtension}', False, False)
 
-            elif self.saveFormat == SaveFormat.ZARR:
-                datasets[detectorName] = files[detectorName].create_dataset(datasetName, shape=(1, *reversed(shape)),
-                                                                            dtype='i2', chunks=(1, 512, 512)
-                                                                            )
-                datasets[detectorName].attrs['detector_name'] = detectorName
-                # For ImageJ compatibility
-                datasets[detectorName].attrs['element_size_um'] \
-                    = self.__recordingManager.detectorsManager[detectorName].pixelSizeUm
-                datasets[detectorName].attrs['writing'] = True
-                info: List[dict] = [{"path": datasetName, "transformation": None}]
-                write_multiscales_metadata(files[detectorName], info, format_from_version("0.2"), shape, **self.attrs[detectorName])
+        queues = {detectorName: FrameQueue(maxBytes=self.maxQueueBytes)
+                  for detectorName in self.detectorNames}
+        self._queues = queues
+        writers = {detectorName: threading.Thread(target=self._writeFrames,
+                                                  args=(detectorName, queues[detectorName]),
+                                                  name=f'RecordingWriter-{detectorName}',
+                                                  daemon=True)
+                   for detectorName in self.detectorNames}
+        self._lastNumDropped, self._lastNumQueued = 0, 0
 
         self.__recordingManager.sigRecordingStarted.emit()
         try:
             if len(self.detectorNames) < 1:
                 raise ValueError('No detectors to record specified')
 
+            for writer in writers.values():
+                writer.start()
+
             if self.recMode in [RecMode.SpecFrames, RecMode.ScanOnce, RecMode.ScanLapse]:
                 recFrames = self.recFrames
                 if recFrames is None:
                     raise ValueError('recFrames must be specified in SpecFrames, ScanOnce or'
                                      ' ScanLapse mode')
 
-                while (self.__recordingManager.record and
-                       any([currentFrame[detectorName] < recFrames
-                            for detectorName in self.detectorNames])):
-                    for detectorName in self.detectorNames:
-                        if currentFrame[detectorName] >= recFrames:
-                            continue  # Reached requested number of frames with this detector, skip
-
-                        newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-
-                        if n > 0:
-                            it = currentFrame[detectorName]
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-                            elif self.saveFormat == SaveFormat.HDF5:
-                                dataset = datasets[detectorName]
-                                if (it + n) <= recFrames:
-                                    dataset.resize(n + it, axis=0)
-                                    dataset[it:it + n, :, :] = newFrames
-                                    currentFrame[detectorName] += n
-                                else:
-                                    dataset.resize(recFrames, axis=0)
-                                    dataset[it:recFrames, :, :] = newFrames[0:recFrames - it]
-                                    currentFrame[detectorName] = recFrames
-                            elif self.saveFormat == SaveFormat.ZARR:
-                                dataset = datasets[detectorName]
-                                if it == 0:
-                                    dataset[0, :, :] = newFrames[0, :, :]
-                                    if n > 0:
-                                        dataset.append(newFrames[1:n, :, :])
-                                else:
-                                    dataset.append(newFrames)
-                                currentFrame[detectorName] += n
-
-                            # Things get a bit weird if we have multiple detectors when we report
-                            # the current frame number, since the detectors may not be synchronized.
-                            # For now, we will report the lowest number.
-                            self.__recordingManager.sigRecordingFrameNumUpdated.emit(
-                                min(list(currentFrame.values()))
-                            )
-                    time.sleep(0.0001)  # Prevents freezing for some reason
-
-                self.__recordingManager.sigRecordingFrameNumUpdated.emit(0)
+                self._grabFrames(queues, recFrames=recFrames)
             elif self.recMode == RecMode.SpecTime:
                 recTime = self.recTime
                 if recTime is None:
                     raise ValueError('recTime must be specified in SpecTime mode')
 
-                start = time.time()
-                currentRecTime = 0
-                shouldStop = False
-                while True:
-                    for detectorName in self.detectorNames:
-                        newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-                        if n > 0:
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-                            elif self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                dataset.resize(n + it, axis=0)
-                                dataset[it:it + n, :, :] = newFrames
-                            currentFrame[detectorName] += n
-                            self.__recordingManager.sigRecordingTimeUpdated.emit(
-                                np.around(currentRecTime, decimals=2)
-                            )
-                            currentRecTime = time.time() - start
-
-                    if shouldStop:
-                        break  # Enter loop one final time, then stop
-
-                    if not self.__recordingManager.record or currentRecTime >= recTime:
-                        shouldStop = True
-
-                    time.sleep(0.0001)  # Prevents freezing for some reason
-
-                self.__recordingManager.sigRecordingTimeUpdated.emit(0)
+                self._grabFrames(queues, recTime=recTime)
             elif self.recMode == RecMode.UntilStop:
-                shouldStop = False
-                while True:
-                    for detectorName in self.detectorNames:
-                        newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-                        if n > 0:
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-
-                            elif self.saveFormat == SaveFormat.HDF5:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                dataset.resize(n + it, axis=0)
-                                dataset[it:it + n, :, :] = newFrames
-
-                            elif self.saveFormat == SaveFormat.ZARR:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                if it == 0:
-                                    dataset[0, :, :] = newFrames[0, :, :]
-                                    if n > 0:
-                                        dataset.append(newFrames[1:n, :, :])
-                                else:
-                                    dataset.append(newFrames)
-
-                            currentFrame[detectorName] += n
-
-                    if shouldStop:
-                        break
-
-                    if not self.__recordingManager.record:
-                        shouldStop = True  # Enter loop one final time, then stop
-
-                    time.sleep(0.0001)  # Prevents freezing for some reason
+                self._grabFrames(queues)
             else:
                 raise ValueError('Unsupported recording mode specified')
         finally:
+            # Let the writers drain their queues before the files are closed
+            for queue in queues.values():
+                queue.close()
+            for writer in writers.values():
+                if writer.ident is not None:
+                    writer.join()
+            self._emitQueueStats(queues)
+
+            if self.recMode in [RecMode.SpecFrames, RecMode.ScanOnce, RecMode.ScanLapse]:
+                self.__recordingManager.sigRecordingFrameNumUpdated.emit(0)
+            elif self.recMode == RecMode.SpecTime:
+                self.__recordingManager.sigRecordingTimeUpdated.emit(0)
 
             if self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
-                for detectorName, file in files.items():
-                    # Remove default frame if no frames have been captured
-                    if currentFrame[detectorName] < 1:
-                        if self.saveFormat == SaveFormat.HDF5:
-                            datasets[detectorName].resize(0, axis=0)
+                # Write the last partial chunks and trim the preallocated datasets
+                for stream in streams.values():
+                    stream.close()
+                if self._compressorPool is not None:
+                    self._compressorPool.shutdown()
 
+                for detectorName, file in files.items():
                     # Handle memory recordings
                     if self.saveMode == SaveMode.RAM or self.saveMode == SaveMode.DiskAndRAM:
                         filePath = filePaths[detectorName]
@@ -618,7 +1056,6 @@ class RecordingWorker(Worker):
                                 name, file, filePath, True
                             )
                     else:
-                        datasets[detectorName].attrs['writing'] = False
                         if self.saveFormat == SaveFormat.HDF5:
                             file.close()
                         else:
@@ -628,6 +1065,135 @@ class RecordingWorker(Worker):
                 emitSignal = False
             self.__recordingManager.endRecording(emitSignal=emitSignal, wait=False)
 
+    def _grabFrames(self, queues, recFrames=None, recTime=None):
+        """ Grabber stage of the pipeline. Polls all detectors for new frames
+        and hands them to the writer queues until recFrames frames have been
+        queued per detector, recTime seconds have passed or the recording is
+        stopped. """
+        grabbed = self._numGrabbed
+        start = time.time()
+        currentRecTime = 0
+        idleSleep = self.minIdleSleep
+        shouldStop = False
+        while True:
+            if recFrames is not None and (
+                    not self.__recordingManager.record or
+                    all([grabbed[detectorName] >= recFrames
+                         for detectorName in self.detectorNames])):
+                break
+
+            gotFrames = False
+            for detectorName in self.detectorNames:
+                if recFrames is not None and grabbed[detectorName] >= recFrames:
+                    continue  # Reached requested number of frames with this detector, skip
+
+                grabStart = time.perf_counter()
+                newFrames = self._getNewFrames(detectorName)
+                if len(newFrames) < 1:
+                    continue
+                self._grabLatency[detectorName].add(time.perf_counter() - grabStart)
+
+                gotFrames = True
+                if recFrames is not None:
+                    newFrames = newFrames[:recFrames - grabbed[detectorName]]
+                if queues[detectorName].put(newFrames):
+                    grabbed[detectorName] += len(newFrames)
+
+                if recTime is not None:
+                    self.__recordingManager.sigRecordingTimeUpdated.emit(
+                        np.around(currentRecTime, decimals=2)
+                    )
+                    currentRecTime = time.time() - start
+
+            self._emitQueueStats(queues)
+
+            if shouldStop:
+                break  # Enter loop one final time, then stop
+
+            if recFrames is None and (not self.__recordingManager.record or
+                                      (recTime is not None and currentRecTime >= recTime)):
+                shouldStop = True
+                continue
+
+            # Back off while the detectors have nothing new instead of spinning
+            if gotFrames:
+                idleSleep = self.minIdleSleep
+            else:
+                time.sleep(idleSleep)
+                idleSleep = min(idleSleep * 2, self.maxIdleSleep)
+                if recTime is not None:
+                    currentRecTime = time.time() - start
+
+    def _emitQueueStats(self, queues):
+        numDropped = sum([queue.numDropped for queue in queues.values()])
+        numQueued = sum([queue.numQueued for queue in queues.values()])
+        if numDropped != self._lastNumDropped:
+            self.__logger.warning(f'Recording dropped {numDropped} frames, writing to disk is'
+                                  f' not keeping up with acquisition')
+            self.__recordingManager.sigRecordingFramesDropped.emit(numDropped)
+        if numQueued != self._lastNumQueued:
+            self.__recordingManager.sigRecordingFramesQueued.emit(numQueued)
+        self._lastNumDropped, self._lastNumQueued = numDropped, numQueued
+
+    def getStats(self):
+        """ Returns frame counts and per-stage latencies of the current or
+        last recording, per detector. """
+        stats = {}
+        for detectorName, queue in self._queues.items():
+            stats[detectorName] = {
+                'framesGrabbed': self._numGrabbed.get(detectorName, 0),
+                'framesWritten': self._currentFrame.get(detectorName, 0),
+                'framesDropped': queue.numDropped,
+                'peakQueued': queue.peakQueued,
+                'latency': {
+                    'grab': self._grabLatency[detectorName].asDict(),
+                    'queue': queue.waitLatency.asDict(),
+                    'write': self._writeLatency[detectorName].asDict()
+                }
+            }
+        return stats
+
+    def _writeFrames(self, detectorName, queue):
+        """ Writer stage of the pipeline. Stores the chunks from the queue of
+        one detector until the queue is closed and drained. """
+        while True:
+            newFrames = queue.get()
+            if newFrames is None:
+                return
+
+            try:
+                writeStart = time.perf_counter()
+                self._storeFrames(detectorName, newFrames)
+                self._writeLatency[detectorName].add(time.perf_counter() - writeStart)
+            except Exception as e:
+                self.__logger.error(f'Failed to write frames of detector {detectorName}: {e}')
+                continue
+
+            self._currentFrame[detectorName] += len(newFrames)
+
+            # Things get a bit weird if we have multiple detectors when we report
+            # the current frame number, since the detectors may not be synchronized.
+            # For now, we will report the lowest number.
+            if self.recMode in [RecMode.SpecFrames, RecMode.ScanOnce, RecMode.ScanLapse]:
+                self.__recordingManager.sigRecordingFrameNumUpdated.emit(
+                    min(list(self._currentFrame.values()))
+                )
+
+    def _storeFrames(self, detectorName, newFrames):
+        if self.saveFormat == SaveFormat.TIFF:
+            try:
+                tiff.imwrite(self._filenames[detectorName], newFrames, append=True,
+                             **self._tiffCompressionArgs)
+            except ValueError:
+                self.__logger.error("TIFF File exceeded 4GB.")
+                fileExtension = str(self.saveFormat.name).lower()
+                self._filenames[detectorName] = self.__recordingManager.getSaveFilePath(
+                    f'{self.savename}_{detectorName}.{fileExtension}', False, False)
+                tiff.imwrite(self._filenames[detectorName], newFrames, append=True,
+                             **self._tiffCompressionArgs)
+        elif self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
+            self._streams[detectorName].write(newFrames)
+
     def _getFiles(self):
         singleMultiDetectorFile = self.singleMultiDetectorFile
         singleLapseFile = self.recMode == RecMode.ScanLapse and self.singleLapseFile
@@ -1,7 +1,12 @@
-import warnings
+"""
+The managers of imcontrol. The managers of the core devices are always
+imported, those of optional functionality are imported lazily:
+:py:data:`managerRegistry` maps their names to their modules, which are only
+imported once the manager is loaded, i.e. when the setup uses it.
+"""
+
+from imswitch.imcommon.model import LazyRegistry
 
-from .AutofocusManager import AutofocusManager
-from .FOVLockManager import FOVLockManager
 from .DetectorsManager import DetectorsManager, NoDetectorsError
 from .LasersManager import LasersManager
 from .LEDsManager import LEDsManager
@@ -10,29 +15,33 @@ from .MultiManager import MultiManager
 from .NidaqManager import NidaqManager
 from .PositionersManager import PositionersManager
 from .RS232sManager import RS232sManager
-from .OFMsManager import OFMsManager
-from .RecordingManager import RecordingManager, RecMode, SaveMode, SaveFormat
-from .SLMManager import SLMManager
-from .ScanManagerPointScan import ScanManagerPointScan
-from .ScanManagerBase import ScanManagerBase
-from .ScanManagerMoNaLISA import ScanManagerMoNaLISA
-from .StandManager import StandManager
+from .RecordingManager import RecordingManager, RecMode, SaveMode, SaveFormat, Compression
 from .RotatorsManager import RotatorsManager
-try:
-    from .UC2ConfigManager import UC2ConfigManager
-except ModuleNotFoundError:
-    warnings.warn("UC2ConfigManager not available; please install uc2rest module")
-from .SIMManager import SIMManager
-from .DPCManager import DPCManager
-from .MCTManager import MCTManager
-from .ROIScanManager import ROIScanManager
-from .LightsheetManager import LightsheetManager
-from .WebRTCManager import WebRTCManager
-from .HyphaManager import HyphaManager
-from .MockXXManager import MockXXManager
-from .JetsonNanoManager import JetsonNanoManager
-from .HistoScanManager import HistoScanManager
-from .FlowStopManager import FlowStopManager
-from .FlatfieldManager import FlatfieldManager
-from .PixelCalibrationManager import PixelCalibrationManager
-from .ISMManager import ISMManager
+
+managerRegistry = LazyRegistry(__name__, {
+    'AutofocusManager': 'AutofocusManager',
+    'FOVLockManager': 'FOVLockManager',
+    'OFMsManager': 'OFMsManager',
+    'SLMManager': 'SLMManager',
+    'ScanManagerPointScan': 'ScanManagerPointScan',
+    'ScanManagerBase': 'ScanManagerBase',
+    'ScanManagerMoNaLISA': 'ScanManagerMoNaLISA',
+    'StandManager': 'StandManager',
+    'UC2ConfigManager': 'UC2ConfigManager',
+    'SIMManager': 'SIMManager',
+    'DPCManager': 'DPCManager',
+    'MCTManager': 'MCTManager',
+    'ROIScanManager': 'ROIScanManager',
+    'LightsheetManager': 'LightsheetManager',
+    'WebRTCManager': 'WebRTCManager',
+    'HyphaManager': 'HyphaManager',
+    'MockXXManager': 'MockXXManager',
+    'JetsonNanoManager': 'JetsonNanoManager',
+    'HistoScanManager': 'HistoScanManager',
+    'FlowStopManager': 'FlowStopManager',
+    'FlatfieldManager': 'FlatfieldManager',
+    'PixelCalibrationManager': 'PixelCalibrationManager',
+    'ISMManager': 'ISMManager',
+})
+
+__getattr__ = managerRegistry.moduleGetattr
@@ -95,7 +95,7 @@ class BaslerManager(DetectorManager):
 
     def getLatestFrame(self, is_save=False):
         if is_save:
-            return self._camera.getLastChunk()
+            return self._camera.getLast(is_resize=False)
         else:
             return self._camera.getLast()
 
@@ -130,12 +130,16 @@ class BaslerManager(DetectorManager):
 
     def getChunk(self):
         try:
-            return np.expand_dims(self._camera.getLastChunk(),0)
+            return self._camera.getLastChunk()
         except:
             return None
 
+    def getFrameBuffer(self):
+        # the mock camera has no frame buffer
+        return getattr(self._camera, 'frameBuffer', None)
+
     def flushBuffers(self):
-        pass
+        self._camera.flushBuffer()
 
     def startAcquisition(self):
         if not self._running:
@@ -150,9 +150,11 @@ class DetectorManager(SignalInterface):
             self.__image = self.getLatestFrame()
         except Exception:
             self.__logger.error(traceback.format_exc())
+            return None
         else:
             if self.__image is not None:
                 self.sigImageUpdated.emit(self.__image, init, self.scale)
+            return self.__image
 
     def setParameter(self, name: str, value: Any) -> Dict[str, DetectorParameter]:
         """ Sets a parameter value and returns the updated list of parameters.
@@ -295,6 +297,13 @@ class DetectorManager(SignalInterface):
         (numFrames, height, width). """
         pass
 
+    def getFrameBuffer(self):
+        """ Returns the FrameRingBuffer that the camera pushes its frames into
+        as they arrive, so that the live view can wait for new frames instead
+        of polling the detector. Returns None (the default) for detectors
+        whose frames are only read on request. """
+        return None
+
     @abstractmethod
     def flushBuffers(self) -> None:
         """ Flushes the detector buffers so that getChunk starts at the last
@@ -237,6 +237,10 @@ class GXPIPYManager(DetectorManager):
         except:
             return None
 
+    def getFrameBuffer(self):
+        # the mock camera has no frame buffer
+        return getattr(self._camera, 'frameBuffer', None)
+
     def flushBuffers(self):
         self._camera.flushBuffer()
 
@@ -136,6 +136,10 @@ class HikCamManager(DetectorManager):
         except:
             return None
 
+    def getFrameBuffer(self):
+        # the mock camera has no frame buffer
+        return getattr(self._camera, 'frameBuffer', None)
+
     def flushBuffers(self):
         self._camera.flushBuffer()
 
@@ -124,10 +124,10 @@ class TISManager(DetectorManager):
         super().setBinning(binning)
 
     def getChunk(self):
-        return self._camera.grabFrame()[np.newaxis, :, :]
+        return self._camera.getLastChunk()
 
     def flushBuffers(self):
-        pass
+        self._camera.flushBuffer()
 
     def startAcquisition(self):
         if not self._running:
@@ -1,7 +1,7 @@
 import numpy as np
 
 from imswitch.imcommon.model import initLogger
-from .DetectorManager import DetectorManager, DetectorAction, DetectorNumberParameter, DetectorListParameter, DetectorBooleanParameter
+from .DetectorManager import DetectorManager, DetectorAction, DetectorNumberParameter, DetectorListParameter, DetectorBooleanParameter, ExposureTimeToUs
 
 
 class VirtualCameraManager(DetectorManager):
@@ -26,6 +26,7 @@ class VirtualCameraManager(DetectorManager):
         pixelSize = self._camera.PixelSize
         model = self._camera.model
         self._running = True
+        self._lastDroppedFrames = 0
 
         # Prepare parameters
         parameters = {
@@ -66,6 +67,16 @@ class VirtualCameraManager(DetectorManager):
                          model=model, parameters=parameters, actions=None, croppable=False)
 
 
+    def getExposure(self) -> int:
+        """ Get camera exposure time in microseconds. This
+        manager uses milliseconds as the unit for exposure time.
+
+        Returns:
+            int: exposure time in microseconds
+        """
+        exposure = self.parameters['exposure'].value
+        return ExposureTimeToUs.convert(exposure, 'ms')
+
     def _updatePropertiesFromCamera(self):
         self.setParameter('Real exposure time', self._camera.getPropertyValue('exposure_time')[0])
         self.setParameter('Internal frame interval',
@@ -129,16 +140,30 @@ class VirtualCameraManager(DetectorManager):
 
     def getChunk(self):
         try:
-            return self._camera.getLastChunk()
+            chunk = self._camera.getLastChunk()
         except Exception as e:
             self.__logger.error(f'Error getting chunk: {e}')
             return None
 
+        droppedFrames = self._camera.droppedFrames
+        if droppedFrames > self._lastDroppedFrames:
+            self.__logger.warning(f'{droppedFrames - self._lastDroppedFrames} frames were dropped'
+                                  f' from the camera buffer since they were not read in time'
+                                  f' ({droppedFrames} in total)')
+            self._lastDroppedFrames = droppedFrames
+        return chunk
+
+    @property
+    def droppedFrames(self):
+        """ Number of frames that were overwritten in the camera's ring buffer
+        before getChunk could read them. """
+        return self._camera.droppedFrames
+
     def startAcquisition(self, liveView=False):
-        pass 
-    
+        self._camera.start_live()
+
     def stopAcquisition(self):
-        pass
+        self._camera.stop_live()
     
     def stopAcquisitionForROIChange(self):
         pass
@@ -163,8 +188,11 @@ class VirtualCameraManager(DetectorManager):
     def closeEvent(self):
         pass
         
+    def getFrameBuffer(self):
+        return self._camera.frameBuffer
+
     def flushBuffers(self):
-        pass
+        self._camera.flushBuffer()
     
     def crop(self, hpos, vpos, hsize, vsize):
         pass
@@ -6,55 +6,122 @@ from imswitch.imcommon.model import APIExport, generateAPI, initLogger
 import threading
 
 class VirtualStageManager(PositionerManager):
+    """ PositionerManager for the stage of the virtual microscope. Moves
+    follow trapezoidal velocity profiles, see Positioner, whose speed,
+    acceleration and limits can be set per axis with the manager properties
+    ``maxSpeed``, ``acceleration`` and ``limits`` (``{axis: [min, max]}``). """
+
     def __init__(self, positionerInfo, name, **lowLevelManagers):
         super().__init__(positionerInfo, name, initialPosition={axis: 0 for axis in positionerInfo.axes})
         self.__logger = initLogger(self, instanceName=name)
         self._commChannel = lowLevelManagers['commChannel']
+        self._updateTimers = {}  # pending GUI update per moving axis, shared by the axes of a move
+        self._updateLock = threading.RLock()
         try:
             self.VirtualMicroscope = lowLevelManagers["rs232sManager"]["VirtualMicroscope"]
         except:
             return
         # assign the camera from the Virtual Microscope
         self._positioner = self.VirtualMicroscope._positioner
+        properties = positionerInfo.managerProperties
+        for axis, limits in properties.get("limits", {}).items():
+            self._positioner.limits[axis] = tuple(limits)
+        for propertyName, values in (("maxSpeed", self._positioner.maxSpeed),
+                                     ("acceleration", self._positioner.acceleration)):
+            value = properties.get(propertyName)
+            if isinstance(value, dict):
+                values.update(value)
+            elif value is not None:
+                values.update({axis: value for axis in values})
 
         # get bootup position and write to GUI
         self._position = self.getPosition()
 
-    def move(self, value=0, axis="X", is_absolute=False, is_blocking=True, acceleration=None, speed=None, isEnable=None, timeout=1):
-        if axis == "X":
-            self._positioner.move(x=value, is_absolute=is_absolute)
-        if axis == "Y":
-            self._positioner.move(y=value, is_absolute=is_absolute)
-        if axis == "Z":
-            self._positioner.move(z=value, is_absolute=is_absolute)
-        if axis == "A":
-            self._positioner.move(a=value, is_absolute=is_absolute)
-        if axis == "XYZ":
-            self._positioner.move(x=value[0], y=value[1], z=value[2], is_absolute=is_absolute)
-        if axis == "XY":
-            self._positioner.move(x=value[0], y=value[1], is_absolute=is_absolute)
-        for axes in ["A","X","Y","Z"]:
-            self._position[axes] = self._positioner.position[axes]
-        self._commChannel.sigUpdateMotorPosition.emit() # TODO: This is a hacky workaround to force Imswitch to update the motor positions in the gui..
-
-        
+    def move(self, value=0, axis="X", is_absolute=False, is_blocking=True, acceleration=None, speed=None, isEnable=None, timeout=None):
+        if axis not in ("X", "Y", "Z", "A", "XY", "XYZ"):
+            self.__logger.error('Wrong axis, has to be "A", "X", "Y", "Z", "XY" or "XYZ"')
+            return
+        values = dict(zip(axis, value)) if len(axis) > 1 else {axis: value}
+        if speed is None and len(axis) == 1 and self._speed.get(axis):
+            speed = self._speed[axis]
+        moves = self._positioner.move(**{moveAxis.lower(): axisValue for moveAxis, axisValue in values.items()},
+                                      is_absolute=is_absolute, speed=speed, acceleration=acceleration)
+        for moveAxis, axisMove in moves.items():
+            requested = values[moveAxis] if is_absolute else axisMove.start + values[moveAxis]
+            if axisMove.target != requested:
+                self.__logger.warning(f'Move of axis {moveAxis} to {requested} is clipped to its limits'
+                                      f' {self._positioner.limits[moveAxis]}')
+
+        if is_blocking:
+            # only wait for the moved axes, the others may be moving on their own
+            self._cancelPositionUpdate(moves)
+            deadline = None if timeout is None else time.time() + timeout
+            for moveAxis in moves:
+                remaining = None if deadline is None else max(deadline - time.time(), 0)
+                if not self._positioner.waitForMove(moveAxis, timeout=remaining):
+                    self.__logger.warning(f'Axis {moveAxis} did not reach its target within {timeout} s')
+            self._commChannel.sigUpdateMotorPosition.emit() # TODO: This is a hacky workaround to force Imswitch to update the motor positions in the gui..
+        else:
+            # update the GUI once the stage has arrived
+            delay = max(axisMove.stopTime for axisMove in moves.values()) - time.time()
+            timer = threading.Timer(max(delay, 0), self._emitPositionUpdate)
+            timer.args = (timer,)
+            timer.daemon = True
+            with self._updateLock:
+                self._cancelPositionUpdate(moves)
+                self._updateTimers.update({moveAxis: timer for moveAxis in moves})
+            timer.start()
+
+    def _emitPositionUpdate(self, timer):
+        with self._updateLock:
+            self._updateTimers = {axis: axisTimer for axis, axisTimer in self._updateTimers.items()
+                                  if axisTimer is not timer}
+        self._commChannel.sigUpdateMotorPosition.emit()
+
+    def _cancelPositionUpdate(self, axes=None):
+        """ Drops the pending GUI updates of the given axes, or of all axes,
+        and cancels the timers that no other axis waits for. Returns whether
+        an update was pending. """
+        with self._updateLock:
+            axes = list(self._updateTimers) if axes is None else axes
+            timers = [self._updateTimers.pop(axis) for axis in axes if axis in self._updateTimers]
+            for timer in timers:
+                if timer not in self._updateTimers.values():
+                    timer.cancel()
+        return bool(timers)
 
     def moveForever(self, speed=(0, 0, 0, 0), is_stop=False):
-        pass
+        if is_stop:
+            self.stopAll()
+            return
+        self._positioner.moveForever(dict(zip(("A", "X", "Y", "Z"), speed)))
 
     def setSpeed(self, speed, axis=None):
-        pass
-    
+        if speed is None:
+            return
+        if isinstance(speed, dict):
+            self._speed.update(speed)
+        elif axis is None:
+            self._speed = {speedAxis: speed for speedAxis in self.axes}
+        else:
+            self._speed[axis] = speed
+
     def setPosition(self, value, axis):
-        pass
-    
+        self._positioner.setPosition(axis, value)
+
     def getPosition(self):
-        # load position from device
-        # t,x,y,z
-        allPositionsDict = self._positioner.get_position()
-        self._commChannel.sigUpdateMotorPosition.emit() # TODO: This is a hacky workaround to force Imswitch to update the motor positions in the gui..
+        """ Returns the current position of every axis, which changes during
+        a move. """
+        return self._positioner.get_position()
 
-        return allPositionsDict
+    def getPositionHistory(self, startTime, stopTime, sampleRate=1000):
+        """ Returns the times (in seconds since the epoch) between startTime
+        and stopTime and the positions of all axes at these times, see
+        Positioner.getPositionHistory. """
+        return self._positioner.getPositionHistory(startTime, stopTime, sampleRate)
+
+    def isMoving(self, axis=None):
+        return self._positioner.isMoving(axis)
 
     def forceStop(self, axis):
         if axis=="X":
@@ -68,41 +135,57 @@ class VirtualStageManager(PositionerManager):
         else:
             self.stopAll()
 
+    @property
+    def position(self):
+        """ The current position of each axis, read back from the stage. """
+        return self.getPosition()
+
     def get_abs(self, axis="X"):
-        return self._position[axis]
+        return self._positioner.get_position()[axis]
 
     def stop_x(self):
-        pass
-        
+        self._stopAxes("X")
+
     def stop_y(self):
-        pass 
+        self._stopAxes("Y")
 
     def stop_z(self):
-        pass
+        self._stopAxes("Z")
 
     def stop_a(self):
-        pass
+        self._stopAxes("A")
 
     def stopAll(self):
-        pass
+        self._stopAxes()
+
+    def _stopAxes(self, axis=None):
+        self._positioner.stop(axis)
+        if self._cancelPositionUpdate(None if axis is None else [axis]):
+            self._commChannel.sigUpdateMotorPosition.emit()
+
+    def finalize(self):
+        self._cancelPositionUpdate()
 
     def doHome(self, axis, isBlocking=False):
         if axis == "X": self.home_x(isBlocking)
         if axis == "Y": self.home_y(isBlocking)
         if axis == "Z": self.home_z(isBlocking)
-        
-
-    def home_x(self, isBlocking):
-        self.move(value=0, axis="X", is_absolute=True)
-        self.setPosition(axis="X", value=0)
-        
-    def home_y(self,isBlocking):
-        self.move(value=0, axis="Y", is_absolute=True)
-        self.setPosition(axis="Y", value=0)
-
-    def home_z(self,isBlocking):
-        self.move(value=0, axis="Z", is_absolute=True)
-        self.setPosition(axis="Z", value=0)
+
+    def home_x(self, isBlocking=False):
+        self._moveHome("X", isBlocking)
+
+    def home_y(self, isBlocking=False):
+        self._moveHome("Y", isBlocking)
+
+    def home_z(self, isBlocking=False):
+        self._moveHome("Z", isBlocking)
+
+    def _moveHome(self, axis, isBlocking):
+        # the virtual stage homes by moving to 0; a non-blocking home ends
+        # there by itself, redefining the position would stop the move
+        self.move(value=0, axis=axis, is_absolute=True, is_blocking=isBlocking)
+        if isBlocking:
+            self.setPosition(axis=axis, value=0)
 
     def home_xyz(self):
         if self.homeXenabled and self.homeYenabled and self.homeZenabled:
@@ -4,12 +4,14 @@ import math
 import time
 from imswitch import IS_HEADLESS, __file__
 import threading
+from collections import OrderedDict
 import numpy as np
 import matplotlib.pyplot as plt
 
 from skimage.draw import line
 from scipy.signal import convolve2d
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.interfaces.framebuffer import FrameRingBuffer
 
 try:
     import NanoImagingPack as nip
@@ -61,7 +63,12 @@ class VirtualMicroscopeManager:
             }
             self.__logger.info("Default JSON:" + str(defaultJSON))
 
-        self._virtualMicroscope = VirtualMicroscopy(self._imagePath)
+        self._virtualMicroscope = VirtualMicroscopy(
+            self._imagePath,
+            frameRate=self._settings.get("frameRate", 10),
+            sensorHeight=self._settings.get("sensorHeight", 300),
+            sensorWidth=self._settings.get("sensorWidth", 400),
+        )
         self._positioner = self._virtualMicroscope.positioner
         self._camera = self._virtualMicroscope.camera
         self._illuminator = self._virtualMicroscope.illuminator
@@ -83,7 +90,8 @@ class VirtualMicroscopeManager:
 
 
 class Camera:
-    def __init__(self, parent, filePath="path_to_image.jpeg"):
+    def __init__(self, parent, filePath="path_to_image.jpeg", frameRate=10,
+                 sensorHeight=300, sensorWidth=400):
         self._parent = parent
         self.filePath = filePath
 
@@ -102,57 +110,93 @@ class Camera:
             self.image /= np.max(self.image)
 
         self.lock = threading.Lock()
-        self.SensorHeight = 300  # self.image.shape[1]
-        self.SensorWidth = 400  # self.image.shape[0]
+        self.SensorHeight = sensorHeight
+        self.SensorWidth = sensorWidth
         self.model = "VirtualCamera"
         self.PixelSize = 1.0
         self.isRGB = False
         self.frameNumber = 0
+        # target frame rate in fps, None or <= 0 renders as fast as possible
+        self.frameRate = frameRate
+        self._lastFrameTime = 0
+        # the stage positions during the exposure are averaged for motion blur
+        self.exposureTime = 0.001
+        self.maxBlurSamples = 64
+        self.lastFrameTimestamp = None
         # precompute noise so that we will save energy and trees
         self.noiseStack = np.abs(
-            np.random.randn(self.SensorHeight, self.SensorWidth, 100) * 2
+            np.random.randn(100, self.SensorHeight, self.SensorWidth).astype(np.float32) * 2
         )
+        # preallocated buffers for the sensor window and the intensity scaling
+        self._window = np.empty((self.SensorHeight, self.SensorWidth), dtype=self.image.dtype)
+        self._intensityBuffer = np.empty((self.SensorHeight, self.SensorWidth), dtype=np.float32)
+        self._blurBuffer = np.empty((self.SensorHeight, self.SensorWidth), dtype=np.float32)
+
+        # ring buffer that is filled by the producer thread in streaming mode
+        self.NBuffer = 64
+        self.is_streaming = False
+        self.lastChunkFrameIds = np.empty(0, dtype=np.int64)
+        self.lastChunkTimestamps = np.empty(0)
+        self.frameBuffer = FrameRingBuffer(self.NBuffer)
+        self._stopEvent = threading.Event()
+        self._producerThread = None
+
+    def getWindow(self, x_offset=0, y_offset=0):
+        """Return the part of the sample image that is seen by the sensor at
+        the given stage offsets. This matches rolling the full image by the
+        offsets and cropping its centre, but only copies the sensor window,
+        wrapping around the image edges. The returned buffer is reused."""
+        height, width = self.image.shape[:2]
+        rowStart = (height // 2 - self.SensorHeight // 2 - int(y_offset)) % height
+        colStart = (width // 2 - self.SensorWidth // 2 - int(x_offset)) % width
+        for dstRows, srcRows in wrappedSlices(rowStart, self.SensorHeight, height):
+            for dstCols, srcCols in wrappedSlices(colStart, self.SensorWidth, width):
+                self._window[dstRows, dstCols] = self.image[srcRows, srcCols]
+        return self._window
+
+    def getBlurredWindow(self, offsets):
+        """Return the mean of the windows at the given (x, y) stage offsets,
+        i.e. what the sensor sees while the stage moves along them. The
+        returned buffer is reused."""
+        self._blurBuffer[...] = 0
+        for x_offset, y_offset in offsets:
+            self._blurBuffer += self.getWindow(x_offset, y_offset)
+        self._blurBuffer /= len(offsets)
+        return self._blurBuffer
 
     def produce_frame(
-        self, x_offset=0, y_offset=0, light_intensity=1.0, defocusPSF=None
+        self, x_offset=0, y_offset=0, light_intensity=1.0, defocusPSF=None, motionPath=None
     ):
-        """Generate a frame based on the current settings."""
+        """Generate a frame based on the current settings. motionPath are
+        the (x, y) offsets of the stage during the exposure, if it moved."""
         if self.filePath == "smlm": # There is likely a better way of handling this
             return self.produce_smlm_frame(x_offset, y_offset, light_intensity)
         else:
             with self.lock:
-                # add moise
-                image = self.image.copy()
-                # Adjust image based on offsets
-                image = np.roll(
-                    np.roll(image, int(x_offset), axis=1), int(y_offset), axis=0
-                )
-                image = nip.extract(image, (self.SensorHeight, self.SensorWidth))
+                if motionPath is not None and len(motionPath) > 1:
+                    image = self.getBlurredWindow(motionPath)
+                else:
+                    image = self.getWindow(x_offset, y_offset)
 
                 # do all post-processing on cropped image
                 if IS_NIP and defocusPSF is not None and not defocusPSF.shape == ():
-                    print("Defocus:" + str(defocusPSF.shape))
                     image = np.array(np.real(nip.convolve(image, defocusPSF)))
-                image = (
-                    np.float32(image) / np.max(image) * np.float32(light_intensity)
-                    + self.noiseStack[:, :, np.random.randint(0, 100)]
-                )
 
-                # Adjust illumination
-                image = image.astype(np.uint16)
-                time.sleep(0.1)
-                return np.array(image)
+                # Adjust illumination and add noise
+                maxValue = np.max(image)
+                scale = np.float32(light_intensity) / maxValue if maxValue > 0 else 0
+                np.multiply(image, scale, out=self._intensityBuffer, casting="unsafe")
+                self._intensityBuffer += self.noiseStack[np.random.randint(0, 100)]
+
+                # the frame itself is a new array, consumers may keep it
+                image = self._intensityBuffer.astype(np.uint16)
+            self._waitForNextFrame()
+            return image
 
     def produce_smlm_frame(self, x_offset=0, y_offset=0, light_intensity=5000):
         """Generate a SMLM frame based on the current settings."""
         with self.lock:
-            # add moise
-            image = self.image.copy()
-            # Adjust image based on offsets
-            image = np.roll(
-                np.roll(image, int(x_offset), axis=1), int(y_offset), axis=0
-            )
-            image = nip.extract(image, (self.SensorHeight, self.SensorWidth))
+            image = self.getWindow(x_offset, y_offset)
 
             yc_array, xc_array = binary2locs(image, density=0.05)
             photon_array = np.random.normal(
@@ -187,99 +231,392 @@ class Camera:
                 * np.random.normal(size=(self.SensorHeight, self.SensorWidth))
                 + ADC_offset
             )
-            time.sleep(0.1)
-            return np.array(out)
+        self._waitForNextFrame()
+        return np.array(out)
 
-    def getLast(self, returnFrameNumber=False):
-        position = self._parent.positioner.get_position()
-        defocusPSF = np.squeeze(self._parent.positioner.get_psf())
+    def _waitForNextFrame(self):
+        """Sleep for the remainder of the frame period of the target frame
+        rate, taking the time spent on rendering into account."""
+        if self.frameRate is None or self.frameRate <= 0:
+            return
+        delay = self._lastFrameTime + 1 / self.frameRate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self._lastFrameTime = time.perf_counter()
+
+    def renderFrame(self):
+        """Render a new frame of an exposure that ends now at the stage
+        positions during the exposure and the current illumination and return
+        it together with its frame number. The middle of the exposure is
+        stored in lastFrameTimestamp."""
+        positioner = self._parent.positioner
+        end = time.time()
+        start = end - self.exposureTime
+        xs = positioner.getPositionsAt([start, end], "X")
+        ys = positioner.getPositionsAt([start, end], "Y")
+        # about one sample per pixel travelled
+        numSamples = int(min(self.maxBlurSamples,
+                             max(1, math.ceil(np.hypot(xs[1] - xs[0], ys[1] - ys[0])))))
+        motionPath = None
+        if numSamples > 1:
+            times = np.linspace(start, end, numSamples)
+            motionPath = np.stack([positioner.getPositionsAt(times, "X"),
+                                   positioner.getPositionsAt(times, "Y")], axis=1)
+        self.lastFrameTimestamp = (start + end) / 2
+        position = positioner.get_position(self.lastFrameTimestamp)
+        defocusPSF = np.squeeze(positioner.get_psf(position["Z"]))
         intensity = self._parent.illuminator.get_intensity(1)
+        frame = self.produce_frame(
+            x_offset=position["X"],
+            y_offset=position["Y"],
+            light_intensity=intensity,
+            defocusPSF=defocusPSF,
+            motionPath=motionPath,
+        )
         self.frameNumber += 1
+        return frame, self.frameNumber
+
+    @property
+    def droppedFrames(self):
+        """Number of frames that were overwritten in the ring buffer before
+        they were read."""
+        return self.frameBuffer.numOverflowed
+
+    def getLast(self, returnFrameNumber=False):
+        frame, frameNumber = None, None
+        if self.is_streaming:
+            frame, frameNumber = self.frameBuffer.getLast(returnFrameId=True)
+        if frame is None:
+            # not streaming or nothing produced yet: render on demand
+            frame, frameNumber = self.renderFrame()
         if returnFrameNumber:
-            return (
-                self.produce_frame(
-                    x_offset=position["X"],
-                    y_offset=position["Y"],
-                    light_intensity=intensity,
-                    defocusPSF=defocusPSF,
-                ),
-                self.frameNumber,
-            )
-        else:
-            return self.produce_frame(
-                x_offset=position["X"],
-                y_offset=position["Y"],
-                light_intensity=intensity,
-                defocusPSF=defocusPSF,
-            )
-            
+            return frame, frameNumber
+        return frame
+
     def getLastChunk(self):
-        mFrame = self.getLast()
-        return np.expand_dims(mFrame, axis=2)
+        """Return all frames produced since the last call as an array of
+        shape (n, height, width), oldest first. In streaming mode this is a
+        read-only view into the ring buffer. Their frame numbers and
+        timestamps are stored in lastChunkFrameIds and lastChunkTimestamps."""
+        if not self.is_streaming:
+            frame, frameNumber = self.renderFrame()
+            self.lastChunkFrameIds = np.array([frameNumber])
+            self.lastChunkTimestamps = np.array([self.lastFrameTimestamp])
+            return frame[np.newaxis]
+
+        if self.frameBuffer.frameShape is None:
+            return np.empty((0, self.SensorHeight, self.SensorWidth), dtype=np.uint16)
+        chunk, self.lastChunkFrameIds, self.lastChunkTimestamps = self.frameBuffer.getChunk()
+        return chunk
+
+    def flushBuffer(self):
+        self.frameBuffer.flush()
+
+    def start_live(self):
+        if self.is_streaming:
+            return
+        self._stopEvent.clear()
+        self._producerThread = threading.Thread(
+            target=self._produceFrames, name="VirtualCameraProducer", daemon=True
+        )
+        self.is_streaming = True
+        self._producerThread.start()
+
+    def stop_live(self):
+        if not self.is_streaming:
+            return
+        self._stopEvent.set()
+        self._producerThread.join()
+        self.is_streaming = False
+
+    def _produceFrames(self):
+        """Render frames at the target frame rate into the ring buffer, like
+        the frame buffer of a real camera."""
+        while not self._stopEvent.is_set():
+            frame, frameNumber = self.renderFrame()
+            self.frameBuffer.push(frame, frameId=frameNumber,
+                                  timestamp=self.lastFrameTimestamp)
 
     def setPropertyValue(self, propertyName, propertyValue):
-        pass
+        if propertyName == "frame_rate":
+            self.frameRate = propertyValue
+        elif propertyName == "exposure":
+            self.exposureTime = propertyValue / 1000  # in ms
+        return propertyValue
+
+    def getPropertyValue(self, propertyName):
+        if propertyName == "frame_rate":
+            return self.frameRate
+        elif propertyName == "exposure":
+            return self.exposureTime * 1000
+        return None
+
+
+class TrapezoidalMove:
+    """ Motion of one stage axis from rest to rest with a trapezoidal
+    velocity profile: constant acceleration up to the speed, constant speed
+    and constant deceleration. Moves that are too short to reach the speed
+    have a triangular profile, an infinite acceleration gives a constant
+    speed and an infinite speed a jump. Times are in seconds since the epoch,
+    like the timestamps of the frame buffer. """
+
+    def __init__(self, startTime, start, target, speed=np.inf, acceleration=np.inf):
+        self.startTime = startTime
+        self.start = start
+        self.target = target
+        self._distance = abs(target - start)
+        self._direction = np.sign(target - start)
+        if self._distance == 0 or not np.isfinite(speed):
+            self._accelerationTime, self._cruiseTime = 0.0, 0.0
+            self._acceleration, self._peakSpeed = 0.0, np.inf
+        elif not np.isfinite(acceleration):
+            self._accelerationTime, self._cruiseTime = 0.0, self._distance / speed
+            self._acceleration, self._peakSpeed = 0.0, speed
+        else:
+            self._accelerationTime = min(speed / acceleration,
+                                         math.sqrt(self._distance / acceleration))
+            self._acceleration = acceleration
+            self._peakSpeed = acceleration * self._accelerationTime
+            self._cruiseTime = ((self._distance - acceleration * self._accelerationTime ** 2) /
+                                self._peakSpeed)
+        self.duration = 2 * self._accelerationTime + self._cruiseTime
+        # lowered by stop(), the axis rests at its position at that time
+        self.stopTime = startTime + self.duration
+
+    @property
+    def endPosition(self):
+        return float(self.positionAt(self.stopTime))
+
+    def isMoving(self, time_):
+        return self.startTime <= time_ < self.stopTime
+
+    def stop(self, time_):
+        self.stopTime = min(self.stopTime, max(time_, self.startTime))
+
+    def positionAt(self, times):
+        """ Returns the positions at the given times, scalar or array. """
+        times = np.asarray(times, dtype=float)
+        if self.duration == 0:
+            return np.full(times.shape, float(self.target))
+        t = np.clip(times, self.startTime, self.stopTime) - self.startTime
+        accelerationTime, acceleration = self._accelerationTime, self._acceleration
+        cruiseEnd = accelerationTime + self._cruiseTime
+        distance = np.where(
+            t < accelerationTime,
+            0.5 * acceleration * t ** 2,
+            np.where(t < cruiseEnd,
+                     0.5 * acceleration * accelerationTime ** 2 + self._peakSpeed * (t - accelerationTime),
+                     self._distance - 0.5 * acceleration * (self.duration - t) ** 2)
+        )
+        position = self.start + self._direction * distance
+        if self.stopTime == self.startTime + self.duration:
+            position = np.where(times >= self.stopTime, self.target, position)  # exactly
+        return position
 
 
 class Positioner:
-    def __init__(self, parent):
+    """ Stage of the virtual microscope with a kinematic model. Every move is
+    a TrapezoidalMove per axis with the speed, acceleration and limits of the
+    axis, and is kept in a log of the last historyLength moves per axis, so
+    that the position can be looked up for any time since then, e.g. over
+    the exposure of a frame. A move starts from rest at the position the axis
+    has at that time, stop() halts the axis immediately. """
+
+    axes = ("X", "Y", "Z", "A")
+
+    def __init__(self, parent, historyLength=10000):
         self._parent = parent
-        self.position = {"X": 0, "Y": 0, "Z": 0, "A": 0}
         self.mDimensions = (
             self._parent.camera.SensorHeight,
             self._parent.camera.SensorWidth,
         )
+        # in units per second and units per second squared
+        self.maxSpeed = {"X": 20000, "Y": 20000, "Z": 2000, "A": 20000}
+        self.acceleration = {"X": 200000, "Y": 200000, "Z": 20000, "A": 200000}
+        self.limits = {axis: (-np.inf, np.inf) for axis in self.axes}
+        self.historyLength = historyLength
+        self._moves = {axis: [] for axis in self.axes}
+        self._origin = {axis: 0.0 for axis in self.axes}  # before the first logged move
         self.lock = threading.Lock()
-        if IS_NIP:
-            self.psf = self.compute_psf(dz=0)
-        else:
-            self.psf = None
+        self.__logger = initLogger(self)
+        # PSFs of the last psfCacheSize defoci, quantized to psfStep, so that
+        # a Z move or focus sweep does not recompute the PSF for every frame
+        self.psfStep = 1.0
+        self.psfCacheSize = 16
+        self._psfCache = OrderedDict()
+        self._psfLock = threading.Lock()
+        self.psf = None
+
+    @property
+    def position(self):
+        return self.get_position()
+
+    def move(self, x=None, y=None, z=None, a=None, is_absolute=False, speed=None,
+             acceleration=None):
+        """ Starts moving the given axes, clipped to their limits, and returns
+        the new moves as a dict of TrapezoidalMove per axis. speed and
+        acceleration default to (and are capped by) the values of the
+        axes. """
+        now = time.time()
+        moves = {}
+        with self.lock:
+            for axis, value in zip(self.axes, (x, y, z, a)):
+                if value is None:
+                    continue
+                start = self._positionAt(axis, now)
+                target = value if is_absolute else start + value
+                target = float(np.clip(target, *self.limits[axis]))
+                axisSpeed = min(speed or self.maxSpeed[axis], self.maxSpeed[axis])
+                axisAcceleration = min(acceleration or self.acceleration[axis],
+                                       self.acceleration[axis])
+                current = self._currentMove(axis, now)
+                if current is not None:
+                    current.stop(now)
+                moves[axis] = TrapezoidalMove(now, start, target, axisSpeed, axisAcceleration)
+                self._log(axis, moves[axis])
+        return moves
+
+    def moveForever(self, speed):
+        """ Moves the axes with the given speeds (a dict per axis, the sign
+        is the direction) until stop() is called or a limit is reached. """
+        now = time.time()
+        with self.lock:
+            for axis, axisSpeed in speed.items():
+                if not axisSpeed:
+                    continue
+                start = self._positionAt(axis, now)
+                lower, upper = self.limits[axis]
+                # far enough to be endless in practice if the axis has no limit
+                target = upper if axisSpeed > 0 else lower
+                target = float(np.clip(target, start - 1e12, start + 1e12))
+                current = self._currentMove(axis, now)
+                if current is not None:
+                    current.stop(now)
+                self._log(axis, TrapezoidalMove(now, start, target,
+                                                min(abs(axisSpeed), self.maxSpeed[axis]),
+                                                self.acceleration[axis]))
+
+    def stop(self, axis=None):
+        """ Halts the given axis, or all axes, immediately. """
+        now = time.time()
+        with self.lock:
+            for stopAxis in self.axes if axis is None else [axis]:
+                current = self._currentMove(stopAxis, now)
+                if current is not None:
+                    current.stop(now)
+
+    def setPosition(self, axis, value):
+        """ Redefines the current position of the axis without moving it. """
+        now = time.time()
+        with self.lock:
+            current = self._currentMove(axis, now)
+            if current is not None:
+                current.stop(now)
+            self._log(axis, TrapezoidalMove(now, value, value))
 
-    def move(self, x=None, y=None, z=None, a=None, is_absolute=False):
+    def isMoving(self, axis=None):
+        now = time.time()
         with self.lock:
-            if is_absolute:
-                if x is not None:
-                    self.position["X"] = x
-                if y is not None:
-                    self.position["Y"] = y
-                if z is not None:
-                    self.position["Z"] = z
-                    self.compute_psf(self.position["Z"])
-                if a is not None:
-                    self.position["A"] = a
-            else:
-                if x is not None:
-                    self.position["X"] += x
-                if y is not None:
-                    self.position["Y"] += y
-                if z is not None:
-                    self.position["Z"] += z
-                    self.compute_psf(self.position["Z"])
-                if a is not None:
-                    self.position["A"] += a
-
-    def get_position(self):
+            return any(self._currentMove(moveAxis, now) is not None
+                       for moveAxis in (self.axes if axis is None else [axis]))
+
+    def waitForMove(self, axis=None, timeout=None):
+        """ Blocks until the given axis, or all axes, came to rest. Returns
+        False if that did not happen within the timeout. """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self.lock:
+                endTime = max((moves[-1].stopTime for moveAxis, moves in self._moves.items()
+                               if moves and (axis is None or moveAxis == axis)), default=0)
+            now = time.time()
+            if now >= endTime:
+                return True
+            if deadline is not None and now >= deadline:
+                return False
+            remaining = (endTime if deadline is None else min(endTime, deadline)) - now
+            # wake up regularly, the move may be stopped or replaced meanwhile
+            time.sleep(min(remaining, 0.01))
+
+    def get_position(self, time_=None):
+        """ Returns the position of every axis at the given time (now by
+        default) as a dict. """
+        time_ = time.time() if time_ is None else time_
         with self.lock:
-            return self.position.copy()
+            return {axis: self._positionAt(axis, time_) for axis in self.axes}
+
+    def getPositionsAt(self, times, axis):
+        """ Returns the positions of the axis at the given times as an
+        array. """
+        with self.lock:
+            return self._positionsAt(times, axis)
+
+    def getPositionHistory(self, startTime, stopTime, sampleRate=1000):
+        """ Returns the times between startTime and stopTime sampled with the
+        given rate in Hz and the positions of all axes at these times as a
+        dict of arrays. """
+        times = np.arange(startTime, stopTime, 1 / sampleRate)
+        return times, {axis: self.getPositionsAt(times, axis) for axis in self.axes}
+
+    def _positionAt(self, axis, time_):
+        return float(self._positionsAt(time_, axis))
+
+    def _positionsAt(self, times, axis):
+        times = np.asarray(times, dtype=float)
+        moves = self._moves[axis]
+        if not moves:
+            return np.full(times.shape, self._origin[axis])
+        if np.all(times >= moves[-1].startTime):
+            return moves[-1].positionAt(times)  # the common case of recent times
+        startTimes = np.array([move.startTime for move in moves])
+        indices = np.searchsorted(startTimes, times, side="right") - 1
+        positions = np.full(times.shape, self._origin[axis])
+        for index in np.unique(indices[indices >= 0]):
+            isInMove = indices == index
+            positions[isInMove] = moves[index].positionAt(times[isInMove])
+        return positions
+
+    def _currentMove(self, axis, time_):
+        moves = self._moves[axis]
+        if moves and moves[-1].isMoving(time_):
+            return moves[-1]
+        return None
+
+    def _log(self, axis, move):
+        moves = self._moves[axis]
+        moves.append(move)
+        if len(moves) > self.historyLength:
+            self._origin[axis] = moves.pop(0).endPosition
 
     def compute_psf(self, dz):
+        """ Returns the PSF for the defocus dz, None if it is in focus or
+        NanoImagingPack is not available. """
         dz = np.float32(dz)
-        print("Defocus:" + str(dz))
-        if IS_NIP and dz != 0:
-            obj = nip.image(np.zeros(self.mDimensions))
-            obj.pixelsize = (100.0, 100.0)
-            paraAbber = nip.PSF_PARAMS()
-            # aber_map = nip.xx(obj.shape[-2:]).normalize(1)
-            paraAbber.aberration_types = [paraAbber.aberration_zernikes.spheric]
-            paraAbber.aberration_strength = [np.float32(dz) / 10]
-            psf = nip.psf(obj, paraAbber)
-            self.psf = psf.copy()
-            del psf
-            del obj
-        else:
-            self.psf = None
-
-    def get_psf(self):
+        if not IS_NIP or dz == 0:
+            return None
+        self.__logger.debug(f'Computing the PSF for a defocus of {dz}')
+        obj = nip.image(np.zeros(self.mDimensions))
+        obj.pixelsize = (100.0, 100.0)
+        paraAbber = nip.PSF_PARAMS()
+        # aber_map = nip.xx(obj.shape[-2:]).normalize(1)
+        paraAbber.aberration_types = [paraAbber.aberration_zernikes.spheric]
+        paraAbber.aberration_strength = [dz / 10]
+        return nip.psf(obj, paraAbber)
+
+    def get_psf(self, dz=None):
+        """ Returns the PSF for the defocus dz rounded to psfStep, taken
+        from the cache if possible, or the last returned PSF if dz is
+        None. """
+        if dz is None:
+            return self.psf
+        key = int(round(dz / self.psfStep))
+        with self._psfLock:
+            if key in self._psfCache:
+                self._psfCache.move_to_end(key)
+            else:
+                self._psfCache[key] = self.compute_psf(key * self.psfStep)
+                while len(self._psfCache) > self.psfCacheSize:
+                    self._psfCache.popitem(last=False)
+            self.psf = self._psfCache[key]
         return self.psf
 
 
@@ -299,13 +636,15 @@ class Illuminator:
 
 
 class VirtualMicroscopy:
-    def __init__(self, filePath="path_to_image.jpeg"):
-        self.camera = Camera(self, filePath)
+    def __init__(self, filePath="path_to_image.jpeg", frameRate=10,
+                 sensorHeight=300, sensorWidth=400):
+        self.camera = Camera(self, filePath, frameRate=frameRate,
+                             sensorHeight=sensorHeight, sensorWidth=sensorWidth)
         self.positioner = Positioner(self)
         self.illuminator = Illuminator(self)
 
     def stop(self):
-        pass
+        self.camera.stop_live()
 
 
 @njit(parallel=True)
@@ -370,6 +709,23 @@ def FromLoc2Image_MultiThreaded(
     return Image
 
 
+def wrappedSlices(start, length, size):
+    """
+    Split a window of the given length, starting at start in an axis of the
+    given size, into contiguous pieces that wrap around the end of the axis.
+
+    Returns a list of (destination slice, source slice) tuples.
+    """
+    pieces = []
+    pos = 0
+    while pos < length:
+        src = (start + pos) % size
+        n = min(length - pos, size - src)
+        pieces.append((slice(pos, pos + n), slice(src, src + n)))
+        pos += n
+    return pieces
+
+
 def binary2locs(img: np.ndarray, density: float):
     """
     Selects a subset of locations from a binary image based on a specified density.
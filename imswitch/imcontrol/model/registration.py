@@ -0,0 +1,231 @@
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+import scipy.fft
+
+
+@dataclass
+class RegistrationResult:
+    """ The shift of one region of an image relative to the reference. """
+
+    shift: np.ndarray
+    """ Shift (dy, dx) in pixels, positive if the image content moved down
+    and to the right. """
+
+    confidence: float
+    """ Height of the normalized correlation peak, 1 for an identical image
+    and close to 0 if nothing matches. """
+
+    roi: Tuple[int, int]
+    """ Center (row, column) of the region in the image. """
+
+
+class ImageRegistration:
+    """ Sub-pixel registration of images against a reference, e.g. for
+    drift correction, FOV lock or camera-stage mapping.
+
+    setReference() computes the high-pass filtered FFT template of the
+    reference once, register() then costs one batched rfft2 of the regions
+    of the new image. The regions are given by their centers (rois) and size
+    (roiSize); by default the whole image, or its center if only roiSize is
+    given, is registered. The regions are windowed (Hann) or zero-padded to
+    twice their size, which extends the trackable shift from half a region
+    to a whole region.
+
+    The shift is found coarse to fine: with numLevels > 1 the integer peak
+    is searched in a correlation that is computed from the low frequencies
+    only, downsampled by 2**(numLevels - 1), and refined at full resolution
+    around it. The peak is then located with 1/upsampleFactor pixel
+    precision by evaluating the correlation on an upsampled grid with a
+    matrix DFT (Guizar-Sicairos et al., Opt. Lett. 33, 156 (2008)). With
+    phaseCorrelation, the cross-power spectrum is normalized to unit
+    magnitude, which makes the peak sharp and independent of the brightness
+    but amplifies the noise, so it only suits sharp, bright images. """
+
+    def __init__(self, reference=None, rois=None, roiSize=None, highPassSigma=10,
+                 upsampleFactor=20, numLevels=1, pad=False, window=True,
+                 phaseCorrelation=False, workers=-1):
+        self.rois = None if rois is None else [tuple(int(c) for c in roi) for roi in rois]
+        self.roiSize = None if roiSize is None else tuple(np.broadcast_to(roiSize, 2).astype(int))
+        self.highPassSigma = highPassSigma  # in pixels, None or 0 disables the filter
+        self.upsampleFactor = max(int(upsampleFactor), 1)
+        self.numLevels = max(int(numLevels), 1)
+        self.pad = pad
+        self.window = window
+        self.phaseCorrelation = phaseCorrelation
+        self.workers = workers  # FFT threads, -1 for all CPUs
+
+        self._imageShape = None
+        self._slices = None
+        self._centers = None
+        self._template = None
+        self._referenceEnergies = None
+        if reference is not None:
+            self.setReference(reference)
+
+    @property
+    def hasReference(self):
+        return self._template is not None
+
+    def setReference(self, image):
+        """ Sets the image that following images are registered against. """
+        image = self._toGrayscale(image)
+        self._setupRegions(image.shape)
+        spectra = self._spectra(image)
+        fftShape = self._fftShape
+        mask = self._highPassMask(fftShape)
+        if self.phaseCorrelation:
+            spectra /= np.abs(spectra) + 1e-12
+        self._template = (np.conj(spectra) * mask).astype(np.complex64)
+        self._mask = mask
+        self._referenceEnergies = self._energies(np.abs(spectra) ** 2 * mask)
+
+    def register(self, image):
+        """ Returns a RegistrationResult for every region of the image. """
+        if self._template is None:
+            raise ValueError('The reference has to be set before registering images')
+        image = self._toGrayscale(image)
+        if image.shape != self._imageShape:
+            raise ValueError(f'Expected an image of shape {self._imageShape}, got {image.shape}')
+
+        cross = self._spectra(image)
+        if self.phaseCorrelation:
+            cross /= np.abs(cross) + 1e-12
+        energies = self._energies(np.abs(cross) ** 2 * self._mask)
+        cross *= self._template
+
+        shifts = self._findIntegerPeaks(cross)
+        if self.upsampleFactor > 1:
+            offsets = np.arange(-self.upsampleFactor, self.upsampleFactor + 1) / self.upsampleFactor
+            shifts = self._findPeaksAround(cross, shifts, offsets)
+        peaks = self._correlationAt(cross, shifts[:, :1], shifts[:, 1:])[:, 0, 0]
+        confidences = np.clip(peaks / np.sqrt(self._referenceEnergies * energies + 1e-30), 0, 1)
+        return [RegistrationResult(shift, float(confidence), center)
+                for shift, confidence, center in zip(shifts, confidences, self._centers)]
+
+    def _setupRegions(self, imageShape):
+        height, width = imageShape
+        roiHeight, roiWidth = self.roiSize if self.roiSize is not None else (height, width)
+        roiHeight, roiWidth = min(roiHeight, height), min(roiWidth, width)
+        centers = self.rois if self.rois is not None else [(height // 2, width // 2)]
+        self._slices, self._centers = [], []
+        for row, column in centers:
+            top = int(np.clip(row - roiHeight // 2, 0, height - roiHeight))
+            left = int(np.clip(column - roiWidth // 2, 0, width - roiWidth))
+            self._slices.append((slice(top, top + roiHeight), slice(left, left + roiWidth)))
+            self._centers.append((top + roiHeight // 2, left + roiWidth // 2))
+        self._imageShape = (height, width)
+        self._roiShape = (roiHeight, roiWidth)
+        self._fftShape = (2 * roiHeight, 2 * roiWidth) if self.pad else (roiHeight, roiWidth)
+        self._windowArray = (np.outer(np.hanning(roiHeight), np.hanning(roiWidth)).astype(np.float32)
+                             if self.window else None)
+        # the columns of the half spectrum that stand for two columns of the full spectrum
+        numColumns = self._fftShape[1] // 2 + 1
+        self._columnWeights = np.full(numColumns, 2, dtype=np.float32)
+        self._columnWeights[0] = 1
+        if self._fftShape[1] % 2 == 0:
+            self._columnWeights[-1] = 1
+        self._stack = np.zeros((len(self._slices), *self._fftShape), dtype=np.float32)
+
+    def _spectra(self, image):
+        """ Returns the rfft2 of all preprocessed regions of the image. """
+        roiHeight, roiWidth = self._roiShape
+        regions = self._stack[:, :roiHeight, :roiWidth]
+        for region, (rows, columns) in zip(regions, self._slices):
+            region[...] = image[rows, columns]
+        regions -= regions.mean(axis=(1, 2), keepdims=True)
+        if self._windowArray is not None:
+            regions *= self._windowArray
+        return scipy.fft.rfft2(self._stack, workers=self.workers)
+
+    def _energies(self, weightedPowerSpectra):
+        """ The correlations of the high-pass filtered regions with
+        themselves at zero shift, given their power spectra times the
+        filter. """
+        return ((weightedPowerSpectra * self._columnWeights).sum(axis=(1, 2)) /
+                np.prod(self._fftShape))
+
+    def _highPassMask(self, shape):
+        """ 1 - the transfer function of a Gaussian blur with highPassSigma,
+        on the half spectrum of rfft2. """
+        if not self.highPassSigma:
+            return np.ones((shape[0], shape[1] // 2 + 1), dtype=np.float32)
+        fy = scipy.fft.fftfreq(shape[0])[:, np.newaxis]
+        fx = scipy.fft.rfftfreq(shape[1])[np.newaxis, :]
+        mask = 1 - np.exp(-2 * np.pi ** 2 * self.highPassSigma ** 2 * (fx ** 2 + fy ** 2))
+        return mask.astype(np.float32)
+
+    def _findIntegerPeaks(self, cross):
+        """ Returns the integer shifts of the correlation peaks, searched in
+        a downsampled correlation first if numLevels > 1. """
+        height, width = self._fftShape
+        factor = 2 ** (self.numLevels - 1)
+        coarseShape = (max(height // factor, 2), max(width // factor, 2))
+        factors = np.array([height / coarseShape[0], width / coarseShape[1]])
+        if coarseShape == (height, width):
+            correlation = scipy.fft.irfft2(cross, s=(height, width), workers=self.workers)
+        else:
+            rows = np.r_[0:(coarseShape[0] + 1) // 2, height - coarseShape[0] // 2:height]
+            correlation = scipy.fft.irfft2(cross[:, rows, :coarseShape[1] // 2 + 1],
+                                           s=coarseShape, workers=self.workers)
+        peaks = np.array(np.unravel_index(
+            np.argmax(correlation.reshape(len(cross), -1), axis=1), coarseShape)).T
+        # the upper half of the indices are negative shifts
+        peaks = np.where(peaks > np.array(coarseShape) // 2, peaks - np.array(coarseShape), peaks)
+        shifts = np.round(peaks * factors)
+        if factors.max() > 1:
+            radius = int(np.ceil(factors.max()))
+            shifts = self._findPeaksAround(cross, shifts, np.arange(-radius, radius + 1))
+        return shifts
+
+    def _findPeaksAround(self, cross, shifts, offsets):
+        """ Returns the positions of the maxima of the correlation on the
+        grid of offsets around the given shifts. """
+        correlation = self._correlationAt(cross, shifts[:, :1] + offsets, shifts[:, 1:] + offsets)
+        rows, columns = np.unravel_index(
+            np.argmax(correlation.reshape(len(cross), -1), axis=1), correlation.shape[1:])
+        return shifts + np.stack([offsets[rows], offsets[columns]], axis=1)
+
+    def _correlationAt(self, cross, ys, xs):
+        """ Evaluates the correlation of every region, given by its half
+        cross-power spectrum, on the grid of rows ys (shape (n, a)) and
+        columns xs (shape (n, b)) by a matrix DFT. Returns shape (n, a, b). """
+        height, width = self._fftShape
+        ky = scipy.fft.fftfreq(height, 1 / height)
+        kx = np.arange(cross.shape[-1])
+        rowKernel = np.exp(2j * np.pi / height * ys[:, :, np.newaxis] * ky).astype(np.complex64)
+        columnKernel = (np.exp(2j * np.pi / width * kx[:, np.newaxis] * xs[:, np.newaxis, :]) *
+                        self._columnWeights[:, np.newaxis]).astype(np.complex64)
+        return (rowKernel @ cross @ columnKernel).real / (height * width)
+
+    @staticmethod
+    def _toGrayscale(image):
+        image = np.asarray(image)
+        if image.ndim == 3:
+            image = image.mean(axis=-1)
+        return image
+
+
+def registerImages(reference, image, **kwargs):
+    """ Returns the RegistrationResult of the image against the reference,
+    see ImageRegistration for the keyword arguments. For many images with
+    the same reference, create an ImageRegistration instead. """
+    return ImageRegistration(reference, **kwargs).register(image)[0]
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -78,6 +78,23 @@ class OptWidget(NapariHybridWidget):
         """
         self.scanPar['LiveReconIdxEdit'].setValue(int(value))
 
+    def getLiveReconBand(self) -> int:
+        """ Returns the number of camera frame lines of the volume
+        reconstruction, centered on the live reconstruction index.
+
+        Returns:
+            int: number of lines, 0 for all lines
+        """
+        return self.scanPar['LiveReconBandEdit'].value()
+
+    def setLiveReconBand(self, value: int) -> None:
+        """ Set number of lines of the volume reconstruction.
+
+        Args:
+            value (int): number of lines, 0 for all lines
+        """
+        self.scanPar['LiveReconBandEdit'].setValue(int(value))
+
     def updateHotPixelCount(self, count: int) -> None:
         """ Displays count of the identified hot pixels.
 
@@ -374,6 +391,23 @@ class OptWidget(NapariHybridWidget):
             'Line px of the camera to reconstruct live via FBP',
             )
         self.scanPar['LiveReconIdxLabel'] = QtWidgets.QLabel('Recon Idx')
+        self.scanPar['LiveReconVolumeButton'] = QtWidgets.QCheckBox('Volume')
+        self.scanPar['LiveReconVolumeButton'].setCheckable(True)
+        # tool tip
+        self.scanPar['LiveReconVolumeButton'].setToolTip(
+            'Reconstruct live the band of lines set by Volume lines. The line'
+            ' set by the LiveReconIdxEdit is shown during the scan, the volume'
+            ' is shown (and saved with the data) at the end of the scan.'
+            )
+        self.scanPar['LiveReconBandEdit'] = QtWidgets.QSpinBox()
+        self.scanPar['LiveReconBandEdit'].setRange(0, 10000)  # dflt step 1
+        self.scanPar['LiveReconBandEdit'].setValue(32)
+        self.scanPar['LiveReconBandEdit'].setToolTip(
+            'Number of camera lines around the Recon Idx reconstructed'
+            ' in the volume, 0 for all lines. The memory needed grows with'
+            ' lines x width^2 (4 GiB for 256 lines of 2048 px).',
+            )
+        self.scanPar['LiveReconBandLabel'] = QtWidgets.QLabel('Volume lines')
         self.scanPar['CurrentReconStepLabel'] = QtWidgets.QLabel(
             f'Current Recon: -/{self.getOptSteps()}',
             )
@@ -504,6 +538,12 @@ class OptWidget(NapariHybridWidget):
 
         currentRow += 1
 
+        self.grid5.addWidget(self.scanPar['LiveReconVolumeButton'], currentRow, 0)
+        self.grid5.addWidget(self.scanPar['LiveReconBandEdit'], currentRow, 1)
+        self.grid5.addWidget(self.scanPar['LiveReconBandLabel'], currentRow, 2)
+
+        currentRow += 1
+
         self.grid5.addWidget(self.scanPar['CurrentStepLabel'], currentRow, 0)
         self.grid5.addWidget(self.scanPar['SaveButton'], currentRow, 1)
         self.grid5.addWidget(self.scanPar['noRamButton'], currentRow, 2)
@@ -0,0 +1,74 @@
+import h5py
+import numpy as np
+import pytest
+import tifffile as tiff
+import zarr
+
+from imswitch.imreconstruct.model import DataObj
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 4000, (37, 24, 20), dtype=np.uint16)
+
+
+def writeFile(path, frames, fileFormat):
+    if fileFormat == 'hdf5':
+        with h5py.File(path, 'w') as file:
+            file.create_dataset('cam', data=frames, chunks=(4, 24, 20))
+    elif fileFormat == 'zarr':
+        file = zarr.open(str(path), mode='w')
+        file.create_dataset('cam', data=frames, chunks=(4, 24, 20))
+    elif fileFormat == 'tiff':
+        tiff.imwrite(path, frames)
+    elif fileFormat == 'tiff-appended':
+        # Written in parts like the TIFF recordings, which can not be memory-mapped
+        for start in range(0, len(frames), 10):
+            tiff.imwrite(path, frames[start:start + 10], append=True)
+
+
+@pytest.mark.parametrize('fileFormat', ['hdf5', 'zarr', 'tiff', 'tiff-appended'])
+def test_lazy_frames(tmp_path, frames, fileFormat):
+    extension = fileFormat.split('-')[0]
+    path = str(tmp_path / f'data.{extension}')
+    writeFile(path, frames, fileFormat)
+
+    dataObj = DataObj('data', 'cam' if extension != 'tiff' else None, path=path)
+    dataObj.checkAndLoadData()
+    try:
+        assert dataObj.dataLoaded
+        assert dataObj.numFrames == len(frames)
+        assert dataObj._data is None  # Nothing is loaded into memory up front
+        np.testing.assert_array_equal(dataObj.frames[5], frames[5])
+        np.testing.assert_array_equal(dataObj.frames[3:17], frames[3:17])
+
+        dataObj.maxBlockBytes = 10 * frames[0].nbytes
+        blocks = list(dataObj.iterBlocks())
+        assert len(blocks) > 1
+        assert [start for start, _ in blocks] == list(np.cumsum([0] + [len(b) for _, b in blocks[:-1]]))
+        np.testing.assert_array_equal(np.concatenate([block for _, block in blocks]), frames)
+
+        np.testing.assert_allclose(dataObj.getMeanData(), frames.mean(0), rtol=1e-6)
+        np.testing.assert_allclose(dataObj.getStdData(), frames.std(0), rtol=1e-5)
+        assert dataObj.getDataRange() == (frames.min(), frames.max())
+        assert dataObj._data is None
+
+        np.testing.assert_array_equal(dataObj.data, frames)
+    finally:
+        dataObj.checkAndUnloadData()
+    assert not dataObj.dataLoaded
+
+
+def test_block_alignment(tmp_path, frames):
+    path = str(tmp_path / 'data.hdf5')
+    writeFile(path, frames, 'hdf5')
+
+    dataObj = DataObj('data', 'cam', path=path)
+    dataObj.checkAndLoadData()
+    try:
+        dataObj.maxBlockBytes = 10 * frames[0].nbytes
+        assert [len(block) for _, block in dataObj.iterBlocks()] == [8, 8, 8, 8, 5]
+        assert [len(block) for _, block in dataObj.iterBlocks(blockFrames=20)] == [20, 17]
+    finally:
+        dataObj.checkAndUnloadData()
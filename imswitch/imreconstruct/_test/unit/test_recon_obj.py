@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from imswitch.imreconstruct.model import ReconObj
+
+
+def makeReconObj(steps, unidirectional=True, directions=('pos', 'pos', 'pos')):
+    scanParDict = {
+        'dimensions': ['R-L', 'U-D', 'B-F', 'Timepoints'],
+        'directions': list(directions),
+        'steps': list(steps),
+        'step_sizes': ['35', '35', '35', '1'],
+        'unidirectional': unidirectional
+    }
+    return ReconObj('test', scanParDict, 'R-L', 'U-D', 'B-F', 'Timepoints', 'pos', 'neg')
+
+
+@pytest.mark.parametrize('unidirectional', [True, False])
+def test_coeffs_to_image(unidirectional):
+    reconObj = makeReconObj([2, 2, 1, 1], unidirectional=unidirectional)
+    coeffs = np.arange(4 * 2 * 3, dtype=np.float32).reshape(4, 2, 3)
+
+    im = reconObj.coeffsToImage(coeffs, reconObj.getScanParams())
+
+    assert im.shape == (1, 1, 4, 6)
+    for i in range(4):
+        row, col = divmod(i, 2)
+        if not unidirectional and row % 2 == 1:
+            col = 1 - col  # Every other line is scanned backwards
+        np.testing.assert_array_equal(im[0, 0, row::2, col::2], coeffs[i])
+
+
+def test_coeffs_to_image_negative_direction():
+    reconObj = makeReconObj([3, 2, 1, 1], directions=('neg', 'pos', 'pos'))
+    coeffs = np.random.rand(6, 4, 5).astype(np.float32)
+
+    im = reconObj.coeffsToImage(coeffs, reconObj.getScanParams())
+
+    assert im.shape == (1, 1, 2 * 4, 3 * 5)
+    for i in range(6):
+        row, col = divmod(i, 3)
+        np.testing.assert_array_equal(im[0, 0, row::2, 2 - col::3], coeffs[i])
+
+
+def test_add_coeffs_timepoints():
+    reconObj = makeReconObj([2, 2, 1, 1])
+    assert reconObj.getCoeffs() is None
+
+    allCoeffs = np.random.rand(5, 2, 4, 3, 3).astype(np.float32)
+    for coeffs in allCoeffs:
+        reconObj.addCoeffsTP(coeffs)
+
+    np.testing.assert_array_equal(reconObj.getCoeffs(), allCoeffs)
+
+    reconObj.updateImages()
+    reconstructed = reconObj.getReconstruction()
+    assert reconstructed.shape == (5, 2, 1, 1, 6, 6)
+    np.testing.assert_array_equal(reconstructed[3, 1, 0, 0, 1::2, 0::2], allCoeffs[3, 1, 2])
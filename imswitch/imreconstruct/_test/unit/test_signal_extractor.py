@@ -0,0 +1,69 @@
+import importlib
+
+import numpy as np
+import pytest
+
+from imswitch.imreconstruct.model import SignalExtractor, getPatternGrid
+
+signalExtractorModule = importlib.import_module('imswitch.imreconstruct.model.SignalExtractor')
+
+
+def makePatternData(numFrames, imShape, pattern, sigma, background, seed=0):
+    """ Frames with a Gaussian spot of random amplitude at every point of the
+    pattern on top of a constant background. """
+    rng = np.random.default_rng(seed)
+    rowOffset, colOffset, rowPeriod, colPeriod = pattern
+    centreRows = np.arange(rowOffset, imShape[0], rowPeriod)
+    centreCols = np.arange(colOffset, imShape[1], colPeriod)
+    amplitudes = rng.uniform(100, 1000, (numFrames, len(centreRows), len(centreCols)))
+
+    rows, cols = np.arange(imShape[0]), np.arange(imShape[1])
+    rowProfiles = np.exp(-(rows[None, :] - centreRows[:, None]) ** 2 / (2 * sigma ** 2))
+    colProfiles = np.exp(-(cols[None, :] - centreCols[:, None]) ** 2 / (2 * sigma ** 2))
+    data = np.einsum('fij,ir,jc->frc', amplitudes, rowProfiles, colProfiles) + background
+    return data, amplitudes
+
+
+def test_coeff_grid_size():
+    signalExtractor = SignalExtractor()
+    assert signalExtractor.calcCoeffGridSize(100, 120, [3.5, 14.5, 10, 12]) == (10, 10)
+    assert signalExtractor.calcCoeffGridSize(100, 120, [0, 0, 10, 12]) == (10, 10)
+    assert signalExtractor.calcCoeffGridSize(101, 120, [0, 0, 10, 12]) == (11, 10)
+
+
+def test_pattern_grid():
+    # offsets beyond a period start from the first point inside the image
+    centreRows, centreCols = getPatternGrid(10, 20, [21.5, -3, 2, 4])
+    np.testing.assert_allclose(centreRows, [1.5, 3.5, 5.5, 7.5, 9.5])
+    np.testing.assert_allclose(centreCols, [1, 5, 9, 13, 17])
+    assert SignalExtractor().calcCoeffGridSize(10, 20, [21.5, -3, 2, 4]) == (5, 5)
+
+
+@pytest.mark.parametrize('useNumba', [True, False])
+def test_extract_signal_cpu(monkeypatch, useNumba):
+    if useNumba and not signalExtractorModule.IS_NUMBA:
+        pytest.skip('numba is not installed')
+    monkeypatch.setattr(signalExtractorModule, 'IS_NUMBA', useNumba)
+
+    pattern = [4.3, 5.7, 11.2, 11.2]
+    sigma = 1.3
+    data, amplitudes = makePatternData(6, (90, 112), pattern, sigma, background=50)
+
+    signalExtractor = SignalExtractor()
+    # Gaussian pinhole and constant background, as sent by the reconstruction widget
+    coeffs = signalExtractor.extractSignal(data.astype(np.uint16), [sigma, 9999], pattern, 'cpu')
+
+    assert coeffs.shape == (2, 6, *amplitudes.shape[1:])
+    assert coeffs.dtype == np.float32
+    np.testing.assert_allclose(coeffs[0], amplitudes, rtol=0.02, atol=2)
+    np.testing.assert_allclose(coeffs[1], 50, atol=2)
+
+
+def test_extract_signal_cpu_no_background():
+    pattern = [5, 5, 10, 10]
+    data, amplitudes = makePatternData(2, (60, 60), pattern, 1.2, background=0)
+
+    coeffs = SignalExtractor().extractSignal(data, [1.2, 0], pattern, 'cpu')
+
+    np.testing.assert_allclose(coeffs[0], amplitudes, rtol=1e-3)
+    assert np.all(coeffs[1] == 0)
@@ -1,5 +1,3 @@
-import numpy as np
-
 from .basecontrollers import ImRecWidgetController
 
 
@@ -15,16 +13,16 @@ class DataEditController(ImRecWidgetController):
 
     def setData(self, inDataObj):
         self._dataObj = inDataObj
-        self._meanData = np.array(np.mean(self._dataObj.data, 0), dtype=np.float32)
+        self._meanData = self._dataObj.getMeanData()
         self.showMean()
         self._widget.updateDataProperties(self._dataObj.name, self._dataObj.datasetName,
                                           self._dataObj.numFrames)
 
     def setImgSlice(self, frameNumber):
-        if self._dataObj is None or frameNumber >= len(self._dataObj.data):
+        if self._dataObj is None or frameNumber >= self._dataObj.numFrames:
             return
 
-        self._widget.setImage(self._dataObj.data[frameNumber], autoLevels=False)
+        self._widget.setImage(self._dataObj.frames[frameNumber], autoLevels=False)
 
     def setDarkFrame(self):
         # self.dataObj.data = self.dataObj.data[0:100]
@@ -1,5 +1,6 @@
 import numpy as np
 
+from imswitch.imreconstruct.model import getPatternGrid
 from .DataEditController import DataEditController
 from .basecontrollers import ImRecWidgetController
 
@@ -42,7 +43,7 @@ class DataFrameController(ImRecWidgetController):
         self._widget.setShowPattern(showPattern)
 
     def setImgSlice(self, frame):
-        self._widget.setImage(self._dataObj.data[frame], autoLevels=False)
+        self._widget.setImage(self._dataObj.frames[frame], autoLevels=False)
 
     def unloadData(self):
         self._dataObj = None
@@ -64,7 +65,7 @@ class DataFrameController(ImRecWidgetController):
 
     def currentDataChanged(self, inDataObj):
         self._dataObj = inDataObj
-        self._logger.debug(f'Data shape: {self._dataObj.data.shape}')
+        self._logger.debug(f'Data shape: {self._dataObj.frames.shape}')
         self.showMean()
         self._widget.setNumFrames(self._dataObj.numFrames)
         self._widget.setDataName(self._dataObj.name)
@@ -75,16 +76,11 @@ class DataFrameController(ImRecWidgetController):
         offset is calculated from the upper left corner (0, 0), while the
         scatter plot plots from lower left corner, so a flip has to be made
         in rows."""
-        numCols = np.size(self._dataObj.data, 1)
-        numRows = np.size(self._dataObj.data, 2)
-        numPointsCol = int(1 + np.floor(((numCols - 1) - self._pattern[1]) / self._pattern[3]))
-        numPointsRow = int(1 + np.floor(((numRows - 1) - self._pattern[0]) / self._pattern[2]))
-        colCoords = np.linspace(self._pattern[1],
-                                self._pattern[1] + (numPointsCol - 1) * self._pattern[3],
-                                numPointsCol)
-        rowCoords = np.linspace(self._pattern[0],
-                                self._pattern[0] + (numPointsRow - 1) * self._pattern[2],
-                                numPointsRow)
+        numCols = self._dataObj.frames.shape[1]
+        numRows = self._dataObj.frames.shape[2]
+        # the same grid as the signal extraction
+        rowCoords, colCoords = getPatternGrid(numRows, numCols, self._pattern)
+        numPointsCol, numPointsRow = len(colCoords), len(rowCoords)
         colCoords = np.repeat(colCoords, numPointsRow)
         rowCoords = np.tile(rowCoords, numPointsCol)
 
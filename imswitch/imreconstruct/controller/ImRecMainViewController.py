@@ -295,11 +295,18 @@ class ImRecMainViewController(ImRecWidgetController):
                                         self._widget.p_text,
                                         self._widget.n_text)
 
-                data = dataObj.data
-                if self._widget.bleachBool.value():
-                    data = self.bleachingCorrection(data)
-
-                coeffs = self.extractData(data)
+                # Reconstruct block by block so that the data never has to be
+                # loaded into memory at once
+                blockCoeffs = []
+                referenceEnergy = None
+                for _, data in dataObj.iterBlocks():
+                    if self._widget.bleachBool.value():
+                        if referenceEnergy is None:
+                            referenceEnergy = np.sum(data[0])
+                        data = self.bleachingCorrection(data, referenceEnergy)
+
+                    blockCoeffs.append(self.extractData(data))
+                coeffs = np.concatenate(blockCoeffs, axis=1)
             finally:
                 if not preloaded:
                     dataObj.checkAndUnloadData()
@@ -314,11 +321,15 @@ class ImRecMainViewController(ImRecWidgetController):
             self._widget.addNewData(reconObj, f'{reconObj.name}_multi')
             self._commChannel.sigExecutionFinished.emit(self.reconstructionController.getImage())
 
-    def bleachingCorrection(self, data):
+    def bleachingCorrection(self, data, referenceEnergy=None):
+        """ Scales the frames to compensate for bleaching, relative to the
+        energy of the first frame or referenceEnergy if given. """
         correctedData = data.copy()
         energy = np.sum(data, axis=(1, 2))
+        if referenceEnergy is None:
+            referenceEnergy = energy[0]
         for i in range(data.shape[0]):
-            c = (energy[0] / energy[i]) ** 4
+            c = (referenceEnergy / energy[i]) ** 4
             correctedData[i, :, :] = data[i, :, :] * c
         return correctedData
 
@@ -9,6 +9,13 @@ from imswitch.imcommon.model import initLogger
 
 
 class DataObj:
+    """ A dataset in an HDF5, Zarr or TIFF file. Frames are read lazily
+    through frames and iterBlocks, so that recordings larger than the memory
+    can be viewed and reconstructed. """
+
+    # Upper bound of the size of the blocks of frames returned by iterBlocks
+    maxBlockBytes = 256 * 1024 ** 2
+
     def __init__(self, name, datasetName, *, path=None, file=None):
         self.__logger = initLogger(self, instanceName=f'{name}/{datasetName}')
 
@@ -16,23 +23,41 @@ class DataObj:
         self.dataPath = path
         self.darkFrame = None
         self._meanData = None
+        self._stdData = None
+        self._dataRange = None
         self._file = file
+        self._frames = None
         self._data = None
         self._datasetName = datasetName
         self._attrs = None
         self.__logger = initLogger(self, tryInheritParent=False)
 
     @property
-    def data(self):
-        if self._data is not None:
-            return self._data
+    def frames(self):
+        """ The frames of the dataset as an array-like object of shape
+        (frames, rows, cols) that only reads the frames it is indexed with:
+        an h5py dataset, a zarr array, a memory-mapped TIFF file or, for TIFF
+        files that cannot be memory-mapped, a TiffFrames object. """
+        if self._frames is not None:
+            return self._frames
 
         if isinstance(self._file, h5py.File):
-            self._data = np.array(self._file.get(self._datasetName)[:])
+            self._frames = self._file.get(self._datasetName)
         elif isinstance(self._file, tiff.TiffFile):
-            self._data = self._file.asarray()
+            self._frames = DataObj._openTiffFrames(self._file)
         elif isinstance(self._file, zarr.hierarchy.Group):
-            self._data = np.array(self._file[self._datasetName])
+            self._frames = self._file[self._datasetName]
+        return self._frames
+
+    @property
+    def data(self):
+        """ All frames of the dataset, loaded into memory. Prefer frames or
+        iterBlocks for large datasets. """
+        if self._data is not None:
+            return self._data
+
+        if self.frames is not None:
+            self._data = np.asarray(self.frames[:])
         return self._data
 
     @property
@@ -52,7 +77,7 @@ class DataObj:
 
     @property
     def dataLoaded(self):
-        return self.data is not None
+        return self.frames is not None
 
     @property
     def datasetName(self):
@@ -60,13 +85,13 @@ class DataObj:
 
     @property
     def numFrames(self):
-        return np.shape(self.data)[0] if self.data is not None else None
+        return self.frames.shape[0] if self.frames is not None else None
 
     def checkAndLoadData(self):
         if not self.dataLoaded:
             try:
                 self._file, self._datasetName = DataObj._open(self.dataPath, self._datasetName)
-                if self.data is not None:
+                if self.frames is not None:
                     self.__logger.debug('Data loaded')
             except Exception:
                 pass
@@ -82,16 +107,78 @@ class DataObj:
                 self.__logger.error('Error closing file')
 
         self._file = None
+        self._frames = None
         self._data = None
         self._attrs = None
         self._meanData = None
+        self._stdData = None
+        self._dataRange = None
+
+    def iterBlocks(self, blockFrames=None):
+        """ Yields the index of the first frame and the frames of consecutive
+        blocks of the dataset, reading one block at a time. Unless blockFrames
+        is given, blocks are as large as possible within maxBlockBytes and
+        aligned to the chunks of the dataset. """
+        frames = self.frames
+        numFrames = frames.shape[0]
+        if blockFrames is None:
+            frameBytes = max(1, int(np.prod(frames.shape[1:])) * np.dtype(frames.dtype).itemsize)
+            blockFrames = max(1, self.maxBlockBytes // frameBytes)
+            chunks = getattr(frames, 'chunks', None)
+            if chunks:
+                blockFrames = max(chunks[0], blockFrames // chunks[0] * chunks[0])
+
+        for start in range(0, numFrames, blockFrames):
+            yield start, np.asarray(frames[start:start + blockFrames])
 
     def getMeanData(self):
         if self._meanData is None:
-            self._meanData = np.array(np.mean(self.data, 0), dtype=np.float32)
+            self._computeStatistics()
 
         return self._meanData
 
+    def getStdData(self):
+        """ Returns the standard deviation of every pixel over all frames. """
+        if self._stdData is None:
+            self._computeStatistics()
+
+        return self._stdData
+
+    def getDataRange(self):
+        """ Returns the minimum and maximum value of all frames. """
+        if self._dataRange is None:
+            self._computeStatistics()
+
+        return self._dataRange
+
+    def _computeStatistics(self):
+        """ Computes the per-pixel mean and standard deviation and the value
+        range of the dataset in one pass over blocks of frames. """
+        pixelSum = pixelSqSum = None
+        minValue, maxValue = np.inf, -np.inf
+        for _, block in self.iterBlocks():
+            if len(block) < 1:
+                continue
+            block = block.astype(np.float64)
+            if pixelSum is None:
+                pixelSum = np.zeros(block.shape[1:])
+                pixelSqSum = np.zeros(block.shape[1:])
+            pixelSum += block.sum(0)
+            pixelSqSum += np.square(block).sum(0)
+            minValue = min(minValue, block.min())
+            maxValue = max(maxValue, block.max())
+
+        numFrames = self.numFrames
+        if pixelSum is None:
+            # Empty dataset
+            pixelSum = pixelSqSum = np.full(self.frames.shape[1:], np.nan)
+            numFrames = 1
+        mean = pixelSum / numFrames
+        self._meanData = np.array(mean, dtype=np.float32)
+        self._stdData = np.array(np.sqrt(np.maximum(pixelSqSum / numFrames - np.square(mean), 0)),
+                                 dtype=np.float32)
+        self._dataRange = (minValue, maxValue)
+
     @staticmethod
     def getDatasetNames(path):
         file, _ = DataObj._open(path, allowMultipleDatasets=True)
@@ -136,6 +223,17 @@ class DataObj:
         else:
             raise ValueError(f'Unsupported file extension "{ext}"')
 
+    @staticmethod
+    def _openTiffFrames(file):
+        """ Memory-maps the frames of a TIFF file if its image data is stored
+        uncompressed and contiguously, otherwise reads pages on demand. """
+        if len(file.series) == 1:
+            try:
+                return tiff.memmap(file.filehandle.path, mode='r')
+            except (ValueError, OSError):
+                pass
+        return TiffFrames(file)
+
     def describesSameAs(self, other):  # Don't use __eq__, that makes the class unhashable
         try:
             sameFile = self._file == other._file or self._file.filename == other._file.filename
@@ -152,6 +250,41 @@ class DataObj:
             raise OSError(f'Writing in progress')
 
 
+class TiffFrames:
+    """ Array-like access to the pages of a TIFF file as frames, reading only
+    the pages that are indexed. Used for TIFF files that cannot be
+    memory-mapped, e.g. compressed ones or recordings that were appended to in
+    several parts. """
+
+    def __init__(self, file):
+        self._file = file
+        firstPage = file.pages[0]
+        self.shape = (len(file.pages), *firstPage.shape)
+        self.dtype = firstPage.dtype
+        self.ndim = len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        frameKey, pixelKey = key[0], key[1:]
+
+        if isinstance(frameKey, (int, np.integer)):
+            frameIndex = range(self.shape[0])[frameKey]
+            return self._file.asarray(key=frameIndex)[pixelKey]
+
+        frameIndices = np.arange(self.shape[0])[frameKey]
+        frames = np.empty((len(frameIndices), *self.shape[1:]), dtype=self.dtype)
+        if len(frameIndices) > 0:
+            frames[:] = self._file.asarray(key=frameIndices.tolist()).reshape(frames.shape)
+        return frames[(slice(None), *pixelKey)]
+
+    def __array__(self, dtype=None):
+        return np.asarray(self[:], dtype=dtype)
+
+
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -17,7 +17,10 @@ class ReconObj:
         self.n_tetx = n_text
 
         self.name = name
-        self.coeffs = None
+        self._coeffsBuffer = None
+        self._numCoeffs = 0
+        self._imageIndicesKey = None
+        self._imageIndices = None
         self.reconstructed = None
         self.scanParDict = scanParDict.copy()
 
@@ -40,16 +43,25 @@ class ReconObj:
 
     def addCoeffsTP(self, inCoeffs):
         """ Adds a set of coefficients to the existing set of coefficients. """
-        if self.coeffs is None:
-            # self.__logger.debug(f'In if, shape is: {np.shape(inCoeffs)}')
-            # self.__logger.debug(f'Coeffs are: {inCoeffs}')
-            self.coeffs = np.array([inCoeffs])
-        else:
-            # self.__logger.debug(f'In else, shape self.data is: {np.shape(inCoeffs)}')
-            # self.__logger.debug(f'In else, shape inCoeffs is: {np.shape(inCoeffs)}')
-            self.__logger.debug(f'Max in coeffs: {inCoeffs.max()}')
-            inCoeffs = np.expand_dims(inCoeffs, 0)
-            self.coeffs = np.vstack((self.coeffs, inCoeffs))
+        if self._coeffsBuffer is None:
+            self._coeffsBuffer = np.empty((1, *np.shape(inCoeffs)), dtype=inCoeffs.dtype)
+            self._numCoeffs = 0
+        elif self._numCoeffs >= len(self._coeffsBuffer):
+            # Grow geometrically so that adding many sets stays linear
+            grown = np.empty((2 * len(self._coeffsBuffer), *self._coeffsBuffer.shape[1:]),
+                             dtype=self._coeffsBuffer.dtype)
+            grown[:self._numCoeffs] = self._coeffsBuffer[:self._numCoeffs]
+            self._coeffsBuffer = grown
+
+        self.__logger.debug(f'Max in coeffs: {inCoeffs.max()}')
+        self._coeffsBuffer[self._numCoeffs] = inCoeffs
+        self._numCoeffs += 1
+
+    @property
+    def coeffs(self):
+        if self._coeffsBuffer is None:
+            return None
+        return self._coeffsBuffer[:self._numCoeffs]
 
     def updateScanParams(self, scanParDict):
         self.scanParDict = scanParDict
@@ -69,27 +81,23 @@ class ReconObj:
         else:
             self.__logger.error('Cannot update images without coefficients')
 
-    def addGridOfCoeffs(self, im, coeffs, t, s, r0, c0, pr, pc):
-        # self.__logger.debug(f'Timepoint: {t}')
-        # self.__logger.debug(f'shape if im: {im.shape}')
-        # self.__logger.debug(f'shape if coeffts[i]: {coeffs.shape}')
-        # self.__logger.debug(f'r0: {r0}')
-        # self.__logger.debug(f'c0: {c0}')
-        # self.__logger.debug(f'pr: {pr}')
-        # self.__logger.debug(f'pc: {pc}')
-        im[t, s, r0::pr, c0::pc] = coeffs
+    def getImageIndices(self, frames, gridShape, scanParDict):
+        """Returns the image shape and the flat indices into the image that
+        the coefficients of every frame are placed at, with the same shape as
+        the coefficients (frames, *gridShape). The result is cached for the
+        last scan parameters."""
+        key = (frames, tuple(gridShape), tuple(scanParDict['steps']),
+               tuple(scanParDict['dimensions']), tuple(scanParDict['directions']),
+               bool(scanParDict['unidirectional']))
+        if self._imageIndicesKey == key:
+            return self._imageIndices
 
-    def coeffsToImage(self, coeffs, scanParDict):
-        """Takes the 4d matrix of coefficients from the signal extraction and
-        reshapes into images according to given parameters"""
-        frames = np.shape(coeffs)[0]
         dim0Side = int(scanParDict['steps'][0])
         dim1Side = int(scanParDict['steps'][1])
         dim2Side = int(scanParDict['steps'][2])
         dim3Side = int(scanParDict['steps'][3])  # Always timepoints
         if not frames == dim0Side * dim1Side * dim2Side * dim3Side:
             self.__logger.error('Wrong dimensional data')
-            pass
 
         timepoints = int(
             scanParDict['steps'][scanParDict['dimensions'].index(self.timepoints_text)]
@@ -97,75 +105,65 @@ class ReconObj:
         slices = int(scanParDict['steps'][scanParDict['dimensions'].index(self.b_f_text)])
         sqRows = int(scanParDict['steps'][scanParDict['dimensions'].index(self.u_d_text)])
         sqCols = int(scanParDict['steps'][scanParDict['dimensions'].index(self.r_l_text)])
+        imShape = (timepoints, slices, sqRows * gridShape[0], sqCols * gridShape[1])
 
-        im = np.zeros(
-            [timepoints, slices, sqRows * np.shape(coeffs)[1], sqCols * np.shape(coeffs)[2]],
-            dtype=np.float32
-        )
-        for i in np.arange(np.shape(coeffs)[0]):
-
-            t = int(np.floor(i / (frames / dim3Side)))
-
-            slow = int(np.mod(i, frames / timepoints) / (dim0Side * dim1Side))
-            mid = int(np.mod(i, dim0Side * dim1Side) / dim0Side)
-            fast = np.mod(i, dim0Side)
-
-            if not scanParDict['unidirectional']:
-                oddMidStep = np.mod(mid, 2)
-                fast = (1 - oddMidStep) * fast + oddMidStep * (dim1Side - 1 - fast)
-
-            neg = (int(scanParDict['directions'][0] == 'neg'),
-                   int(scanParDict['directions'][1] == 'neg'),
-                   int(scanParDict['directions'][2] == 'neg'))
-
-            """Adjust for positive or negative direction"""
-            fast = (1 - neg[0]) * fast + neg[0] * (dim0Side - 1 - fast)
-            mid = (1 - neg[1]) * mid + neg[1] * (dim1Side - 1 - mid)
-            slow = (1 - neg[2]) * slow + neg[2] * (dim2Side - 1 - slow)
-
-            """Place dimensions in correct row/col/slice"""
-            if scanParDict['dimensions'][0] == self.r_l_text:
-                if scanParDict['dimensions'][1] == self.u_d_text:
-                    c = fast
-                    pc = dim0Side
-                    r = mid
-                    pr = dim1Side
-                    s = slow
-                else:
-                    c = fast
-                    pc = dim0Side
-                    r = slow
-                    pr = dim2Side
-                    s = mid
-            elif scanParDict['dimensions'][0] == self.u_d_text:
-                if scanParDict['dimensions'][1] == self.r_l_text:
-                    c = mid
-                    pc = dim1Side
-                    r = fast
-                    pr = dim0Side
-                    s = slow
-                else:
-                    c = slow
-                    pc = dim2Side
-                    r = fast
-                    pr = dim0Side
-                    s = mid
+        i = np.arange(frames)
+        t = np.floor(i / (frames / dim3Side)).astype(int)
+
+        slow = (np.mod(i, frames / timepoints) / (dim0Side * dim1Side)).astype(int)
+        mid = np.mod(i, dim0Side * dim1Side) // dim0Side
+        fast = np.mod(i, dim0Side)
+
+        if not scanParDict['unidirectional']:
+            oddMidStep = np.mod(mid, 2)
+            fast = (1 - oddMidStep) * fast + oddMidStep * (dim1Side - 1 - fast)
+
+        neg = (int(scanParDict['directions'][0] == 'neg'),
+               int(scanParDict['directions'][1] == 'neg'),
+               int(scanParDict['directions'][2] == 'neg'))
+
+        """Adjust for positive or negative direction"""
+        fast = (1 - neg[0]) * fast + neg[0] * (dim0Side - 1 - fast)
+        mid = (1 - neg[1]) * mid + neg[1] * (dim1Side - 1 - mid)
+        slow = (1 - neg[2]) * slow + neg[2] * (dim2Side - 1 - slow)
+
+        """Place dimensions in correct row/col/slice"""
+        if scanParDict['dimensions'][0] == self.r_l_text:
+            if scanParDict['dimensions'][1] == self.u_d_text:
+                c, pc, r, pr, s = fast, dim0Side, mid, dim1Side, slow
+            else:
+                c, pc, r, pr, s = fast, dim0Side, slow, dim2Side, mid
+        elif scanParDict['dimensions'][0] == self.u_d_text:
+            if scanParDict['dimensions'][1] == self.r_l_text:
+                c, pc, r, pr, s = mid, dim1Side, fast, dim0Side, slow
+            else:
+                c, pc, r, pr, s = slow, dim2Side, fast, dim0Side, mid
+        else:
+            if scanParDict['dimensions'][1] == self.r_l_text:
+                c, pc, r, pr, s = mid, dim1Side, slow, dim2Side, fast
             else:
-                if scanParDict['dimensions'][1] == self.r_l_text:
-                    c = mid
-                    pc = dim1Side
-                    r = slow
-                    pr = dim2Side
-                    s = fast
-                else:
-                    c = slow
-                    pc = dim2Side
-                    r = mid
-                    pr = dim1Side
-                    s = fast
-
-            self.addGridOfCoeffs(im, coeffs[i], t, s, r, c, pr, pc)
+                c, pc, r, pr, s = slow, dim2Side, mid, dim1Side, fast
+
+        """Every frame fills a grid with steps pr and pc starting at r and c"""
+        rows = r[:, None] + pr * np.arange(gridShape[0])
+        cols = c[:, None] + pc * np.arange(gridShape[1])
+        # Negative timepoints and slices count from the end, as when indexing
+        t = np.where(t < 0, t + imShape[0], t)
+        s = np.where(s < 0, s + imShape[1], s)
+        flatIndices = np.ravel_multi_index(
+            (t[:, None, None], s[:, None, None], rows[:, :, None], cols[:, None, :]), imShape
+        )
+        self._imageIndices = (imShape, flatIndices)
+        self._imageIndicesKey = key
+        return self._imageIndices
 
+    def coeffsToImage(self, coeffs, scanParDict):
+        """Takes the 4d matrix of coefficients from the signal extraction and
+        reshapes into images according to given parameters"""
+        imShape, flatIndices = self.getImageIndices(np.shape(coeffs)[0], np.shape(coeffs)[1:],
+                                                    scanParDict)
+        im = np.zeros(imShape, dtype=np.float32)
+        im.reshape(-1)[flatIndices] = coeffs
         return im
 
 
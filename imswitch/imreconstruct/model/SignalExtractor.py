@@ -6,31 +6,70 @@ import numpy as np
 
 from imswitch.imcommon.model import dirtools, initLogger
 
-IS_WINDOWS = True
-if os.name != 'nt':
-    IS_WINDOWS = False
-    print('This module does unfortunately currently not support non-Windows operating systems.')
+IS_WINDOWS = os.name == 'nt'
+
+# Makes sure code still executes without numba, using the NumPy implementation instead
+try:
+    from numba import njit, prange
+
+    IS_NUMBA = True
+except ModuleNotFoundError:
+    IS_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        def wrapper(func):
+            return func
+
+        return wrapper
+
+
+def getPatternGrid(imRows, imCols, pattern):
+    """Returns the row and column coordinates of the pattern points that lie
+    within an image of the given size, starting from the first point of the
+    pattern inside the image. pattern is [row offset, column offset, row
+    period, column period] in pixels. The signal extraction and the pattern
+    grid shown over the data both use this grid."""
+    rowOffset, colOffset, rowPeriod, colPeriod = pattern
+    firstRow, firstCol = np.mod(rowOffset, rowPeriod), np.mod(colOffset, colPeriod)
+    gridRows = int(np.ceil((imRows - firstRow) / rowPeriod))
+    gridCols = int(np.ceil((imCols - firstCol) / colPeriod))
+    return (firstRow + np.arange(gridRows) * rowPeriod,
+            firstCol + np.arange(gridCols) * colPeriod)
+
 
 class SignalExtractor:
     """ This class takes the raw data together with pre-set
     parameters and recontructs and stores the final images (for the different
     bases).
+
+    On Windows, the extraction runs in GPU_acc_recon.dll. Everywhere else (or
+    if the DLL cannot be loaded) it runs on the CPU: every grid point of the
+    pattern is fitted with one Gaussian per sigma by linear least squares
+    over the pixels of its pattern period, in parallel across frames.
     """
 
+    # Upper bound of the memory used for the gathered pixels of a batch of frames
+    # in the NumPy implementation
+    maxBatchBytes = 256 * 1024 ** 2
+
     def __init__(self):
         self.__logger = initLogger(self)
 
-
-        # TODO: Support non-Windows OS
+        self.ReconstructionDLL = None
         if IS_WINDOWS:
-            # This is needed by the DLL containing CUDA code.
-            # ctypes.cdll.LoadLibrary(os.environ['CUDA_PATH_V9_0'] + '\\bin\\cudart64_90.dll')
-            ctypes.cdll.LoadLibrary(
-                os.path.join(dirtools.DataFileDirs.Libs, 'cudart64_90.dll')
-            )
-            self.ReconstructionDLL = ctypes.cdll.LoadLibrary(
-                os.path.join(dirtools.DataFileDirs.Libs, 'GPU_acc_recon.dll')
-            )
+            try:
+                # This is needed by the DLL containing CUDA code.
+                # ctypes.cdll.LoadLibrary(os.environ['CUDA_PATH_V9_0'] + '\\bin\\cudart64_90.dll')
+                ctypes.cdll.LoadLibrary(
+                    os.path.join(dirtools.DataFileDirs.Libs, 'cudart64_90.dll')
+                )
+                self.ReconstructionDLL = ctypes.cdll.LoadLibrary(
+                    os.path.join(dirtools.DataFileDirs.Libs, 'GPU_acc_recon.dll')
+                )
+            except OSError as e:
+                self.__logger.warning(f'Failed to load the reconstruction DLL ({e}), signal'
+                                      f' extraction will run on the CPU')
 
     def make3dPtrArray(self, inData):
         assert len(np.shape(inData)) == 3, \
@@ -73,7 +112,16 @@ class SignalExtractor:
         Output is a 4D matrix where first dimension is base and last three
         are frame and pixel coordinates."""
 
+        if dev not in ['cpu', 'gpu']:
+            raise ValueError(f'Device must be either "cpu" or "gpu"; {dev} given')
+
         self.__logger.debug(f'Max in data: {data.max()}')
+        if self.ReconstructionDLL is None:
+            if dev == 'gpu':
+                self.__logger.warning('GPU reconstruction is only available on Windows,'
+                                      ' running on the CPU instead')
+            return self.extractSignalCPU(data, sigmas, pattern)
+
         dataPtrArray = self.make3dPtrArray(data)
         p = ctypes.c_float * 4
         # Minus one due to different (1 or 0) indexing in C/Matlab
@@ -102,10 +150,8 @@ class SignalExtractor:
 
         if dev == 'cpu':
             extractionFunction = self.ReconstructionDLL.extract_signal_CPU
-        elif dev == 'gpu':
-            extractionFunction = self.ReconstructionDLL.extract_signal_GPU
         else:
-            raise ValueError(f'Device must be either "cpu" or "gpu"; {dev} given')
+            extractionFunction = self.ReconstructionDLL.extract_signal_GPU
 
         extractionFunction(cImRows, cImCols,
                            cImSlices, ctypes.byref(cPattern),
@@ -116,6 +162,91 @@ class SignalExtractor:
         self.__logger.debug(f'Signal extraction performed in {elapsed} seconds')
         return resCoeffs
 
+    def calcCoeffGridSize(self, imRows, imCols, pattern):
+        """Returns the number of rows and columns of pattern points that lie
+        within an image of the given size, see getPatternGrid."""
+        centreRows, centreCols = getPatternGrid(imRows, imCols, pattern)
+        return len(centreRows), len(centreCols)
+
+    def getExtractionWeights(self, imRows, imCols, sigmas, pattern):
+        """Returns the pixel indices and least-squares weights that turn the
+        pixels around each pattern point into the coefficients of the bases.
+
+        Each point is fitted over the pixels within one pattern period around
+        it, with one Gaussian per sigma centred on the point. A sigma of 0
+        gives a base that is always 0, which is how "No background" is
+        encoded, and very large sigmas give a constant background.
+
+        Returns indices of shape (points, pixels) into the flattened image and
+        weights of shape (points, bases, pixels)."""
+        rowOffset, colOffset, rowPeriod, colPeriod = pattern
+        sigmas = np.atleast_1d(np.array(sigmas, dtype=np.float64))
+
+        # Centres of the pattern points
+        centreRows, centreCols = getPatternGrid(imRows, imCols, pattern)
+        centreRows, centreCols = [c.ravel() for c in np.meshgrid(centreRows, centreCols,
+                                                                   indexing='ij')]
+
+        # Pixels within one period around every point
+        windowRows = int(np.ceil(rowPeriod))
+        windowCols = int(np.ceil(colPeriod))
+        rowSteps, colSteps = [s.ravel() for s in np.meshgrid(np.arange(windowRows),
+                                                             np.arange(windowCols),
+                                                             indexing='ij')]
+        rows = (np.round(centreRows) - windowRows // 2).astype(int)[:, None] + rowSteps
+        cols = (np.round(centreCols) - windowCols // 2).astype(int)[:, None] + colSteps
+        inside = (rows >= 0) & (rows < imRows) & (cols >= 0) & (cols < imCols)
+
+        # Design matrices of the least-squares fits, pixels outside of the image
+        # get zero rows and thereby zero weight
+        sqDists = (rows - centreRows[:, None]) ** 2 + (cols - centreCols[:, None]) ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bases = np.exp(-sqDists[:, :, None] / (2 * sigmas ** 2))
+        bases[:, :, sigmas <= 0] = 0
+        bases[~inside] = 0
+
+        weights = np.linalg.pinv(bases).astype(np.float32)
+        indices = np.where(inside, rows * imCols + cols, 0)
+        return indices, weights
+
+    def extractSignalCPU(self, data, sigmas, pattern):
+        """Extracts the signal of the data like extractSignal, without the
+        reconstruction DLL. Uses numba to run in parallel across frames if it
+        is installed."""
+        t = time.time()
+        numFrames, imRows, imCols = data.shape
+        gridRows, gridCols = self.calcCoeffGridSize(imRows, imCols, pattern)
+        indices, weights = self.getExtractionWeights(imRows, imCols, sigmas, pattern)
+        self.__logger.debug('Coeff grid calculated')
+
+        flatData = np.ascontiguousarray(data).reshape(numFrames, imRows * imCols)
+        resCoeffs = np.zeros((weights.shape[1], numFrames, len(indices)), dtype=np.float32)
+        if IS_NUMBA:
+            extractCoeffs(flatData, indices, weights, resCoeffs)
+        else:
+            batchFrames = max(1, self.maxBatchBytes // (indices.size * 4))
+            for start in range(0, numFrames, batchFrames):
+                stop = min(start + batchFrames, numFrames)
+                pixels = flatData[start:stop][:, indices].astype(np.float32)
+                resCoeffs[:, start:stop] = np.einsum('gbk,fgk->bfg', weights, pixels)
+
+        elapsed = time.time() - t
+        self.__logger.debug(f'Signal extraction performed in {elapsed} seconds')
+        return resCoeffs.reshape(weights.shape[1], numFrames, gridRows, gridCols)
+
+
+@njit(parallel=True)
+def extractCoeffs(flatData, indices, weights, resCoeffs):
+    """Computes the coefficients of all bases at all pattern points, in
+    parallel across frames."""
+    for f in prange(flatData.shape[0]):
+        for g in range(indices.shape[0]):
+            for b in range(weights.shape[1]):
+                coeff = 0.0
+                for k in range(indices.shape[1]):
+                    coeff += weights[g, b, k] * flatData[f, indices[g, k]]
+                resCoeffs[b, f, g] = coeff
+
 
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
@@ -1,4 +1,4 @@
 from .DataObj import DataObj
 from .PatternFinder import PatternFinder
 from .ReconObj import ReconObj
-from .SignalExtractor import SignalExtractor
+from .SignalExtractor import SignalExtractor, getPatternGrid
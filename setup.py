@@ -55,6 +55,9 @@ setup(
         "scikit-image >= 0.19.2",
         "Send2Trash >= 1.8",
         "tifffile >= 2020.11.26",
+        "imagecodecs",
+        "numcodecs >= 0.10",
+        "hdf5plugin >= 4.0",
         "ome_zarr >= 0.6.1",
         "Pyro5 >= 5.14",
         "fastAPI >= 0.86.0",